@@ -13,6 +13,7 @@
   - GY-906：SDA=>SDA(D18), SCL=>SCL(D19)
   
   通訊：Native USB (SerialUSB)
+  協議：預設為文字協議；收到 PROTO,BIN 後改以二進位幀輸出（格式見 通訊協議.md）
   ****************************************************/
 
 #include <SoftwareSerial.h>
@@ -68,9 +69,10 @@ int8_t validHeartRate;
 // ========== 工作模式變數 ==========
 unsigned long workModeStartTime = 0;
 const unsigned long WORK_MODE_TIMEOUT = 45000; // 45秒超時（給足夠時間測量）
+const unsigned long DEFAULT_REPORT_INTERVAL = 1000; // 預設回報間隔 1秒
 const unsigned long DATA_STABLE_TIME = 3000;   // 數據穩定時間 3秒
 const unsigned long FINGER_PLACEMENT_TIME = 3000; // 給用戶時間放置手指 3秒
-const unsigned long STATUS_REPORT_INTERVAL = 1000; // 狀態回報間隔 1秒
+unsigned long statusReportInterval = 1000; // 狀態回報間隔 1秒（RATE,WORKING 可調整，0為不主動回報）
 unsigned long lastValidDataTime = 0;
 unsigned long lastStatusReport = 0;
 bool dataStable = false;
@@ -80,9 +82,62 @@ int noFingerCount = 0;  // 連續沒有手指的次數
 const int MAX_NO_FINGER_COUNT = 60;  // 連續60次沒有手指才退出（約3秒，每次循環50ms）
 int currentFingerprintID = -1;  // 當前觸發工作模式的指紋ID
 
+// ========== 通訊協議 ==========
+bool binaryProtocol = false;    // 收到 PROTO,BIN 後為 true，主機斷開後回到文字協議
+bool hostWasConnected = false;  // 上一次迴圈時主機是否已開啟串口（DTR）
+
+bool stampEnabled = false;      // 收到 STAMP,ON 後每則訊息附加序號與 millis()
+uint16_t txSequence = 0;        // 訊息序號（16 位元回繞，主機用來計算遺失）
+
+// 二進位幀：同步位元組 | 類型 | 長度 | 資料 | CRC16（小端序）
+const uint8_t FRAME_SYNC = 0xA5;
+const uint8_t FRAME_STANDBY = 0x01;
+const uint8_t FRAME_DETECT_USER = 0x02;
+const uint8_t FRAME_WORKING_START = 0x03;
+const uint8_t FRAME_WORKING_STATUS = 0x04;
+const uint8_t FRAME_WORKING_FINAL = 0x05;
+const uint8_t FRAME_WORKING_ERROR = 0x06;
+const uint8_t FRAME_RELAY_OK = 0x07;
+const uint8_t FRAME_RELAY_ERROR = 0x08;
+const uint8_t FRAME_MODE = 0x09;
+const uint8_t FRAME_RATE_OK = 0x0A;
+const uint8_t FRAME_RATE_ERROR = 0x0B;
+const uint8_t FRAME_PPG = 0x0C;
+const uint8_t FRAME_STAMP_FLAG = 0x80;  // 類型最高位元：資料尾端附加序號 (uint16) 與 millis() (uint32)
+const uint8_t VITAL_MEASURING = 0xFF;  // 工作模式狀態中尚在測量的心率/血氧
+
+// 錯誤碼與模式碼
+const uint8_t ERR_NO_FINGER = 1;
+const uint8_t ERR_TIMEOUT = 2;
+const uint8_t ERR_NO_DATA = 3;
+const uint8_t ERR_INVALID_NUMBER = 1;
+const uint8_t ERR_INVALID_COMMAND = 2;
+const uint8_t MODE_CODE_RECEIVE = 1;
+const uint8_t MODE_CODE_STANDBY = 2;
+const uint8_t RATE_CODE_STANDBY = 1;
+const uint8_t RATE_CODE_WORKING = 2;
+const uint8_t RATE_CODE_PPG = 3;
+const uint8_t ERR_INVALID_MODE = 1;
+const uint8_t ERR_INVALID_RATE = 2;
+
 // ========== 待機模式變數 ==========
 unsigned long lastStandbyReport = 0;
-const unsigned long STANDBY_REPORT_INTERVAL = 1000; // 1秒回報一次
+unsigned long standbyReportInterval = 1000; // 1秒回報一次（RATE,STANDBY 可調整，0為不主動回報）
+const float MAX_REPORT_RATE = 10.0;          // 回報頻率上限（Hz）
+
+// ========== PPG 原始波形串流 ==========
+const uint8_t PPG_BATCH = 10;               // 每批樣本數（10 × 8 位元組，二進位幀不超過 255）
+const int PPG_DEFAULT_OUTPUT_RATE = 25;     // 不串流時的感測器輸出頻率（取樣 100Hz、4 次平均）
+const byte MAX30105_STORAGE = 4;            // 感測器程式庫的環形緩衝區大小
+unsigned int ppgRate = 0;                   // 串流取樣頻率（RATE,PPG 設定，0為不串流）
+uint32_t ppgSampleIndex = 0;                // 下一個樣本的編號（主機以此偵測缺口）
+uint32_t ppgRed[PPG_BATCH];
+uint32_t ppgIR[PPG_BATCH];
+uint8_t ppgCount = 0;
+
+// ========== 命令 ==========
+String pendingCommand = "";   // 等待回到待機模式後才處理的命令（如 RELAY）
+bool readRequested = false;   // 收到 READ，下一次迴圈立即回報目前數據
 
 // ========== 初始化 ==========
 void setup() {
@@ -115,6 +170,19 @@ void setup() {
 
 // ========== 主迴圈 ==========
 void loop() {
+  // 主機關閉串口後回到文字協議與預設回報頻率，下一個主機連線時重新協商
+  bool hostConnected = SerialUSB;
+  if (hostWasConnected && !hostConnected) {
+    binaryProtocol = false;
+    stampEnabled = false;
+    standbyReportInterval = DEFAULT_REPORT_INTERVAL;
+    statusReportInterval = DEFAULT_REPORT_INTERVAL;
+    if (ppgRate > 0) {
+      configurePpgStream(0);
+    }
+  }
+  hostWasConnected = hostConnected;
+  
   switch (currentMode) {
     case MODE_STANDBY:
       handleStandbyMode();
@@ -132,14 +200,37 @@ void loop() {
     checkFingerprint();
   }
   
+  // 讀取命令：RATE / READ 與連線協商（PROTO / STAMP）在待機與工作模式下立即處理，其他命令保留到待機模式
+  if (currentMode != MODE_RECEIVE && pendingCommand.length() == 0 && SerialUSB.available() > 0) {
+    String command = SerialUSB.readStringUntil('\n');
+    command.trim();
+    if (!handleTelemetryCommand(command)) {
+      pendingCommand = command;
+    }
+  }
+  
   // 檢查是否進入接收模式（從待機模式切換）
   // 在待機模式下，如果有命令輸入，自動切換到接收模式
-  if (currentMode == MODE_STANDBY && SerialUSB.available() > 0) {
+  if (currentMode == MODE_STANDBY && pendingCommand.length() > 0) {
     currentMode = MODE_RECEIVE;
-    SerialUSB.println("MODE,RECEIVE");
+    sendMode(MODE_CODE_RECEIVE);
   }
   
-  delay(50);
+  waitLoopInterval(50);
+}
+
+// 迴圈間隔：PPG 串流時在等待期間持續讀取感測器 FIFO，避免程式庫緩衝區溢位
+void waitLoopInterval(unsigned long duration) {
+  if (ppgRate == 0) {
+    delay(duration);
+    return;
+  }
+  unsigned long start = millis();
+  while (millis() - start < duration) {
+    pollPpgStream();
+    delay(2);
+  }
+  pollPpgStream();
 }
 
 // ========== 待機模式 ==========
@@ -147,8 +238,9 @@ void handleStandbyMode() {
   unsigned long currentTime = millis();
   
   // 定期回報狀態
-  if (currentTime - lastStandbyReport >= STANDBY_REPORT_INTERVAL) {
+  if (readRequested || (standbyReportInterval > 0 && currentTime - lastStandbyReport >= standbyReportInterval)) {
     lastStandbyReport = currentTime;
+    readRequested = false;
     
     // 讀取 GY906 溫度
     float objectTemp = 0, ambientTemp = 0;
@@ -197,14 +289,7 @@ void handleStandbyMode() {
     }
     
     // 回報狀態：模式,物體溫度,環境溫度,心率,血氧
-    SerialUSB.print("STANDBY,");
-    SerialUSB.print(objectTemp, 2);
-    SerialUSB.print(",");
-    SerialUSB.print(ambientTemp, 2);
-    SerialUSB.print(",");
-    SerialUSB.print(currentHeartRate);
-    SerialUSB.print(",");
-    SerialUSB.println(currentSPO2);
+    sendStandby(objectTemp, ambientTemp, currentHeartRate, currentSPO2);
   }
 }
 
@@ -215,7 +300,7 @@ void handleWorkingMode() {
   
   // 檢查超時
   if (timeSinceStart > WORK_MODE_TIMEOUT) {
-    SerialUSB.println("WORKING,TIMEOUT");
+    sendWorkingError(ERR_TIMEOUT);
     currentMode = MODE_STANDBY;
     noFingerCount = 0;
     dataStable = false;
@@ -305,7 +390,7 @@ void handleWorkingMode() {
         
         // 連續多次沒有手指才退出（避免誤判）
         if (noFingerCount >= MAX_NO_FINGER_COUNT) {
-          SerialUSB.println("WORKING,NO_FINGER");
+          sendWorkingError(ERR_NO_FINGER);
           currentMode = MODE_STANDBY;
           noFingerCount = 0;
           dataStable = false;
@@ -318,30 +403,15 @@ void handleWorkingMode() {
     }
   }
   
-  // 定期輸出狀態（每1秒）
-  if (currentTime - lastStatusReport >= STATUS_REPORT_INTERVAL) {
+  // 定期輸出狀態（預設每1秒），或收到 READ 時立即輸出
+  if (readRequested || (statusReportInterval > 0 && currentTime - lastStatusReport >= statusReportInterval)) {
     lastStatusReport = currentTime;
+    readRequested = false;
     
-    SerialUSB.print("WORKING,");
-    SerialUSB.print(objectTemp, 2);
-    SerialUSB.print(",");
-    SerialUSB.print(ambientTemp, 2);
-    SerialUSB.print(",");
-    
-    // 輸出心率（如果有就輸出，沒有就輸出"感測中"）
-    if (heartRateReady && currentHeartRate > 0) {
-      SerialUSB.print(currentHeartRate);
-    } else {
-      SerialUSB.print("MEASURING");
-    }
-    SerialUSB.print(",");
-    
-    // 輸出血氧（如果有就輸出，沒有就輸出"感測中"）
-    if (spo2Ready && currentSPO2 > 0) {
-      SerialUSB.println(currentSPO2);
-    } else {
-      SerialUSB.println("MEASURING");
-    }
+    // 心率/血氧如果有就輸出，沒有就輸出"感測中"（-1）
+    int reportHeartRate = (heartRateReady && currentHeartRate > 0) ? currentHeartRate : -1;
+    int reportSPO2 = (spo2Ready && currentSPO2 > 0) ? currentSPO2 : -1;
+    sendWorkingStatus(objectTemp, ambientTemp, reportHeartRate, reportSPO2);
   }
   
   // 檢查是否兩個數據都準備好了
@@ -358,16 +428,7 @@ void handleWorkingMode() {
         // 數據已穩定，檢查是否穩定足夠時間
         if (currentTime - lastValidDataTime >= DATA_STABLE_TIME) {
           // 輸出最終結果：指紋ID,物體溫度,環境溫度,心率,血氧
-          SerialUSB.print("WORKING,FINAL,");
-          SerialUSB.print(currentFingerprintID);
-          SerialUSB.print(",");
-          SerialUSB.print(objectTemp, 2);
-          SerialUSB.print(",");
-          SerialUSB.print(ambientTemp, 2);
-          SerialUSB.print(",");
-          SerialUSB.print(currentHeartRate);
-          SerialUSB.print(",");
-          SerialUSB.println(currentSPO2);
+          sendWorkingFinal(currentFingerprintID, objectTemp, ambientTemp, currentHeartRate, currentSPO2);
           
           // 完成後回到待機模式
           currentMode = MODE_STANDBY;
@@ -390,22 +451,21 @@ void handleWorkingMode() {
 
 // ========== 接收模式 ==========
 void handleReceiveMode() {
-  if (SerialUSB.available() > 0) {
-    String command = SerialUSB.readStringUntil('\n');
-    command.trim();
+  if (pendingCommand.length() > 0) {
+    String command = pendingCommand;
+    pendingCommand = "";
     
     // 解析命令格式：RELAY,1 或 RELAY,2 等
     if (command.startsWith("RELAY,")) {
       int relayNum = command.substring(6).toInt();
       if (relayNum >= 1 && relayNum <= 4) {
         activateRelay(relayNum);
-        SerialUSB.print("RELAY_OK,");
-        SerialUSB.println(relayNum);
+        sendRelayOk(relayNum);
       } else {
-        SerialUSB.println("RELAY_ERROR,INVALID_NUMBER");
+        sendRelayError(ERR_INVALID_NUMBER);
       }
     } else {
-      SerialUSB.println("RELAY_ERROR,INVALID_COMMAND");
+      sendRelayError(ERR_INVALID_COMMAND);
     }
     
     // 執行完畢後回到待機模式
@@ -430,8 +490,7 @@ void checkFingerprint() {
       currentFingerprintID = finger.fingerID;  // 保存指紋ID
       
       // 先輸出指紋辨識結果（格式：DETECT,USER1 或 DETECT,USER2 等）
-      SerialUSB.print("DETECT,USER");
-      SerialUSB.println(currentFingerprintID);
+      sendDetectUser(currentFingerprintID);
       
       // 延遲一小段時間確保消息發送完成
       delay(50);
@@ -445,8 +504,382 @@ void checkFingerprint() {
       noFingerCount = 0;  // 重置計數器
       heartRateReady = false;
       spo2Ready = false;
-      SerialUSB.println("WORKING,START");
+      sendWorkingStart();
+    }
+  }
+}
+
+// ========== 遙測與連線協商命令 ==========
+// RATE,STANDBY|WORKING,頻率、RATE,PPG,取樣頻率、READ、PROTO,BIN|TEXT 與 STAMP,ON|OFF，不切換模式；
+// 協商命令也立即處理：主機在工作模式中連線時，若保留到待機模式才回應，主機已超時改用文字協議，
+// 之後輸出卻切換為二進位幀。不是這些命令時返回 false
+bool handleTelemetryCommand(String command) {
+  if (command.length() == 0) {
+    return true;
+  }
+  if (command == "PROTO,BIN") {
+    // 協商回應以文字送出，之後的輸出才改為二進位幀
+    SerialUSB.println("PROTO_OK,BIN");
+    binaryProtocol = true;
+    return true;
+  }
+  if (command == "PROTO,TEXT") {
+    binaryProtocol = false;
+    SerialUSB.println("PROTO_OK,TEXT");
+    return true;
+  }
+  if (command == "STAMP,ON" || command == "STAMP,OFF") {
+    // 回應一定以文字送出（主機在切換二進位協議之前協商）
+    stampEnabled = (command == "STAMP,ON");
+    SerialUSB.print("STAMP_OK,");
+    SerialUSB.println(stampEnabled ? "ON" : "OFF");
+    return true;
+  }
+  if (command == "READ") {
+    readRequested = true;
+    return true;
+  }
+  if (!command.startsWith("RATE,")) {
+    return false;
+  }
+  
+  int comma = command.indexOf(',', 5);
+  String mode = comma > 0 ? command.substring(5, comma) : "";
+  if (mode == "PPG") {
+    float ppgHz = command.substring(comma + 1).toFloat();
+    if (ppgHz != 0 && ppgHz != 50 && ppgHz != 100) {
+      sendRateError(ERR_INVALID_RATE);
+      return true;
     }
+    configurePpgStream((unsigned int)ppgHz);
+    sendRateOk(RATE_CODE_PPG, ppgRate > 0 ? 1000 / ppgRate : 0);
+    return true;
+  }
+  if (mode != "STANDBY" && mode != "WORKING") {
+    sendRateError(ERR_INVALID_MODE);
+    return true;
+  }
+  float hz = command.substring(comma + 1).toFloat();
+  if (hz < 0 || hz > MAX_REPORT_RATE) {
+    sendRateError(ERR_INVALID_RATE);
+    return true;
+  }
+  
+  unsigned long interval = hz > 0 ? (unsigned long)(1000.0 / hz + 0.5) : 0;
+  if (mode == "STANDBY") {
+    standbyReportInterval = interval;
+    sendRateOk(RATE_CODE_STANDBY, interval);
+  } else {
+    statusReportInterval = interval;
+    sendRateOk(RATE_CODE_WORKING, interval);
+  }
+  return true;
+}
+
+// ========== 訊息輸出（文字協議或二進位幀） ==========
+// CRC-16/CCITT-FALSE：多項式 0x1021，初始值 0xFFFF
+uint16_t crc16(const uint8_t *data, uint8_t length, uint16_t crc) {
+  for (uint8_t i = 0; i < length; i++) {
+    crc ^= (uint16_t)data[i] << 8;
+    for (uint8_t bit = 0; bit < 8; bit++) {
+      crc = (crc & 0x8000) ? (crc << 1) ^ 0x1021 : (crc << 1);
+    }
+  }
+  return crc;
+}
+
+// 寫入小端序 16 位元整數
+void putInt16(uint8_t *buffer, int16_t value) {
+  buffer[0] = (uint8_t)(value & 0xFF);
+  buffer[1] = (uint8_t)((value >> 8) & 0xFF);
+}
+
+// 寫入小端序 32 位元整數
+void putUInt32(uint8_t *buffer, uint32_t value) {
+  for (uint8_t i = 0; i < 4; i++) {
+    buffer[i] = (uint8_t)((value >> (8 * i)) & 0xFF);
+  }
+}
+
+void sendFrame(uint8_t type, const uint8_t *data, uint8_t dataLength) {
+  // 開啟時間戳記時在基本欄位之後附加序號與 millis()
+  uint8_t payload[128];  // 最大為 PPG 批次（5 + 10 × 8）加上時間戳記 6
+  uint8_t length = dataLength;
+  if (dataLength > 0) {
+    memcpy(payload, data, dataLength);
+  }
+  if (stampEnabled) {
+    type |= FRAME_STAMP_FLAG;
+    putInt16(payload + length, (int16_t)txSequence++);
+    putUInt32(payload + length + 2, millis());
+    length += 6;
+  }
+  
+  uint8_t header[3] = {FRAME_SYNC, type, length};
+  uint16_t crc = crc16(header + 1, 2, 0xFFFF);
+  crc = crc16(payload, length, crc);
+  uint8_t crcBytes[2] = {(uint8_t)(crc & 0xFF), (uint8_t)(crc >> 8)};
+  SerialUSB.write(header, 3);
+  if (length > 0) {
+    SerialUSB.write(payload, length);
+  }
+  SerialUSB.write(crcBytes, 2);
+}
+
+// 文字訊息結尾：開啟時間戳記時附加 "|序號,millis()"，再換行
+void endLine() {
+  if (stampEnabled) {
+    SerialUSB.print("|");
+    SerialUSB.print(txSequence++);
+    SerialUSB.print(",");
+    SerialUSB.print(millis());
+  }
+  SerialUSB.println();
+}
+
+// 溫度以 0.01°C 為單位
+int16_t toCenti(float temperature) {
+  return (int16_t)lround(temperature * 100.0);
+}
+
+void sendStandby(float objectTemp, float ambientTemp, int heartRateValue, int spo2Value) {
+  if (binaryProtocol) {
+    uint8_t payload[6];
+    putInt16(payload, toCenti(objectTemp));
+    putInt16(payload + 2, toCenti(ambientTemp));
+    payload[4] = (uint8_t)heartRateValue;
+    payload[5] = (uint8_t)spo2Value;
+    sendFrame(FRAME_STANDBY, payload, sizeof(payload));
+    return;
+  }
+  SerialUSB.print("STANDBY,");
+  SerialUSB.print(objectTemp, 2);
+  SerialUSB.print(",");
+  SerialUSB.print(ambientTemp, 2);
+  SerialUSB.print(",");
+  SerialUSB.print(heartRateValue);
+  SerialUSB.print(",");
+  SerialUSB.print(spo2Value);
+  endLine();
+}
+
+// 心率/血氧為 -1 時表示尚在測量
+void sendWorkingStatus(float objectTemp, float ambientTemp, int heartRateValue, int spo2Value) {
+  if (binaryProtocol) {
+    uint8_t payload[6];
+    putInt16(payload, toCenti(objectTemp));
+    putInt16(payload + 2, toCenti(ambientTemp));
+    payload[4] = heartRateValue < 0 ? VITAL_MEASURING : (uint8_t)heartRateValue;
+    payload[5] = spo2Value < 0 ? VITAL_MEASURING : (uint8_t)spo2Value;
+    sendFrame(FRAME_WORKING_STATUS, payload, sizeof(payload));
+    return;
+  }
+  SerialUSB.print("WORKING,");
+  SerialUSB.print(objectTemp, 2);
+  SerialUSB.print(",");
+  SerialUSB.print(ambientTemp, 2);
+  SerialUSB.print(",");
+  if (heartRateValue < 0) {
+    SerialUSB.print("MEASURING");
+  } else {
+    SerialUSB.print(heartRateValue);
+  }
+  SerialUSB.print(",");
+  if (spo2Value < 0) {
+    SerialUSB.print("MEASURING");
+    endLine();
+  } else {
+    SerialUSB.print(spo2Value);
+    endLine();
+  }
+}
+
+void sendWorkingFinal(int fingerprintID, float objectTemp, float ambientTemp, int heartRateValue, int spo2Value) {
+  if (binaryProtocol) {
+    uint8_t payload[8];
+    putInt16(payload, (int16_t)fingerprintID);
+    putInt16(payload + 2, toCenti(objectTemp));
+    putInt16(payload + 4, toCenti(ambientTemp));
+    payload[6] = (uint8_t)heartRateValue;
+    payload[7] = (uint8_t)spo2Value;
+    sendFrame(FRAME_WORKING_FINAL, payload, sizeof(payload));
+    return;
+  }
+  // 輸出最終結果：指紋ID,物體溫度,環境溫度,心率,血氧
+  SerialUSB.print("WORKING,FINAL,");
+  SerialUSB.print(fingerprintID);
+  SerialUSB.print(",");
+  SerialUSB.print(objectTemp, 2);
+  SerialUSB.print(",");
+  SerialUSB.print(ambientTemp, 2);
+  SerialUSB.print(",");
+  SerialUSB.print(heartRateValue);
+  SerialUSB.print(",");
+  SerialUSB.print(spo2Value);
+  endLine();
+}
+
+void sendWorkingError(uint8_t code) {
+  if (binaryProtocol) {
+    sendFrame(FRAME_WORKING_ERROR, &code, 1);
+    return;
+  }
+  switch (code) {
+    case ERR_NO_FINGER: SerialUSB.print("WORKING,NO_FINGER"); break;
+    case ERR_TIMEOUT: SerialUSB.print("WORKING,TIMEOUT"); break;
+    case ERR_NO_DATA: SerialUSB.print("WORKING,NO_DATA"); break;
+  }
+  endLine();
+}
+
+void sendDetectUser(int fingerprintID) {
+  if (binaryProtocol) {
+    uint8_t payload[2];
+    putInt16(payload, (int16_t)fingerprintID);
+    sendFrame(FRAME_DETECT_USER, payload, sizeof(payload));
+    return;
+  }
+  // 格式：DETECT,USER1 或 DETECT,USER2 等
+  SerialUSB.print("DETECT,USER");
+  SerialUSB.print(fingerprintID);
+  endLine();
+}
+
+void sendWorkingStart() {
+  if (binaryProtocol) {
+    sendFrame(FRAME_WORKING_START, NULL, 0);
+    return;
+  }
+  SerialUSB.print("WORKING,START");
+  endLine();
+}
+
+void sendRelayOk(int relayNum) {
+  if (binaryProtocol) {
+    uint8_t payload = (uint8_t)relayNum;
+    sendFrame(FRAME_RELAY_OK, &payload, 1);
+    return;
+  }
+  SerialUSB.print("RELAY_OK,");
+  SerialUSB.print(relayNum);
+  endLine();
+}
+
+void sendRelayError(uint8_t code) {
+  if (binaryProtocol) {
+    sendFrame(FRAME_RELAY_ERROR, &code, 1);
+    return;
+  }
+  if (code == ERR_INVALID_NUMBER) {
+    SerialUSB.print("RELAY_ERROR,INVALID_NUMBER");
+    endLine();
+  } else {
+    SerialUSB.print("RELAY_ERROR,INVALID_COMMAND");
+    endLine();
+  }
+}
+
+void sendMode(uint8_t code) {
+  if (binaryProtocol) {
+    sendFrame(FRAME_MODE, &code, 1);
+    return;
+  }
+  if (code == MODE_CODE_RECEIVE) {
+    SerialUSB.print("MODE,RECEIVE");
+    endLine();
+  } else {
+    SerialUSB.print("MODE,STANDBY");
+    endLine();
+  }
+}
+
+void sendRateOk(uint8_t modeCode, unsigned long interval) {
+  if (binaryProtocol) {
+    uint8_t payload[5];
+    payload[0] = modeCode;
+    putUInt32(payload + 1, interval);
+    sendFrame(FRAME_RATE_OK, payload, sizeof(payload));
+    return;
+  }
+  if (modeCode == RATE_CODE_STANDBY) {
+    SerialUSB.print("RATE_OK,STANDBY,");
+  } else if (modeCode == RATE_CODE_WORKING) {
+    SerialUSB.print("RATE_OK,WORKING,");
+  } else {
+    SerialUSB.print("RATE_OK,PPG,");
+  }
+  SerialUSB.print(interval);
+  endLine();
+}
+
+void sendRateError(uint8_t code) {
+  if (binaryProtocol) {
+    sendFrame(FRAME_RATE_ERROR, &code, 1);
+    return;
+  }
+  SerialUSB.print(code == ERR_INVALID_MODE ? "RATE_ERROR,INVALID_MODE" : "RATE_ERROR,INVALID_RATE");
+  endLine();
+}
+
+// PPG 批次：PPG,第一個樣本編號,紅光,紅外光,...；二進位幀為 uint32 編號、uint8 樣本數與成對的 uint32
+void sendPpgBatch() {
+  if (ppgCount == 0) {
+    return;
+  }
+  if (binaryProtocol) {
+    uint8_t payload[5 + PPG_BATCH * 8];
+    putUInt32(payload, ppgSampleIndex);
+    payload[4] = ppgCount;
+    for (uint8_t i = 0; i < ppgCount; i++) {
+      putUInt32(payload + 5 + i * 8, ppgRed[i]);
+      putUInt32(payload + 9 + i * 8, ppgIR[i]);
+    }
+    sendFrame(FRAME_PPG, payload, 5 + ppgCount * 8);
+  } else {
+    SerialUSB.print("PPG,");
+    SerialUSB.print(ppgSampleIndex);
+    for (uint8_t i = 0; i < ppgCount; i++) {
+      SerialUSB.print(",");
+      SerialUSB.print(ppgRed[i]);
+      SerialUSB.print(",");
+      SerialUSB.print(ppgIR[i]);
+    }
+    endLine();
+  }
+  ppgSampleIndex += ppgCount;
+  ppgCount = 0;
+}
+
+// ========== PPG 串流 ==========
+// 讀出感測器 FIFO 中的新樣本，每滿一批就送出
+void pollPpgStream() {
+  if (ppgRate == 0 || !max30102Ready) {
+    return;
+  }
+  // 程式庫只保留最後 4 個樣本：被覆蓋的樣本以編號跳號告知主機
+  byte pending = (particleSensor.getWritePointer() - particleSensor.getReadPointer()) & 0x1F;
+  if (pending > MAX30105_STORAGE) {
+    sendPpgBatch();
+    ppgSampleIndex += pending - MAX30105_STORAGE;
+  }
+  particleSensor.check();
+  while (particleSensor.available()) {
+    ppgRed[ppgCount] = particleSensor.getFIFORed();
+    ppgIR[ppgCount] = particleSensor.getFIFOIR();
+    particleSensor.nextSample();
+    if (++ppgCount == PPG_BATCH) {
+      sendPpgBatch();
+    }
+  }
+}
+
+// 開始或停止串流（0為停止），並將感測器輸出頻率設為串流頻率
+void configurePpgStream(unsigned int hz) {
+  ppgRate = hz;
+  ppgCount = 0;
+  if (max30102Ready) {
+    configureMAX30102(hz > 0 ? hz : PPG_DEFAULT_OUTPUT_RATE);
+    particleSensor.clearFIFO();
   }
 }
 
@@ -473,13 +906,7 @@ void initGY906() {
 
 void initMAX30102() {
   if (particleSensor.begin(Wire1, I2C_SPEED_FAST)) {
-    byte ledBrightness = 60;
-    byte sampleAverage = 4;
-    byte ledMode = 2;
-    int sampleRate = 100;
-    int pulseWidth = 411;
-    int adcRange = 4096;
-    particleSensor.setup(ledBrightness, sampleAverage, ledMode, sampleRate, pulseWidth, adcRange);
+    configureMAX30102(PPG_DEFAULT_OUTPUT_RATE);
     
     for (byte x = 0; x < RATE_SIZE; x++) {
       rates[x] = 0;
@@ -492,6 +919,17 @@ void initMAX30102() {
   }
 }
 
+// 感測器每 4 個取樣平均輸出一次：取樣率為輸出頻率的 4 倍（25Hz → 100、50Hz → 200、100Hz → 400）
+void configureMAX30102(int outputRate) {
+  byte ledBrightness = 60;
+  byte sampleAverage = 4;
+  byte ledMode = 2;
+  int sampleRate = outputRate * sampleAverage;
+  int pulseWidth = 411;
+  int adcRange = 4096;
+  particleSensor.setup(ledBrightness, sampleAverage, ledMode, sampleRate, pulseWidth, adcRange);
+}
+
 void initFingerprint() {
   mySerial.begin(57600);
   finger.begin(57600);
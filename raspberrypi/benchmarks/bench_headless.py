@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+無介面模式與 Qt 主程式的啟動時間與記憶體比較腳本
+以虛擬BMduino作為數據來源，分別啟動各種模式的程式，記錄：
+
+- 啟動時間：從啟動行程到 API /api/health 回應的時間
+- 記憶體：API 可用時與運行數秒後的常駐記憶體（VmRSS）與峰值（VmHWM）
+
+模式：
+- headless-gateway：program/headless.py --no-flow（只有串口、數據庫與API）
+- headless：program/headless.py --no-cv（流程控制，不導入電腦視覺）
+- headless-cv：program/headless.py（流程控制與電腦視覺檢測）
+- qt：program/main.py（PyQt6 介面，以 offscreen 平台執行，不需要螢幕）
+
+缺少依賴（PyQt6、cv2、mediapipe）的模式會略過
+
+用法: python3 benchmarks/bench_headless.py [--runs 3] [--settle 3] [--mode headless qt]
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+import logging
+from pathlib import Path
+
+# 添加專案根目錄到Python路徑
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from code.bmduino_emulator import BMduinoEmulator
+
+MODES = {
+    'headless-gateway': (['program/headless.py', '--no-flow'], ()),
+    'headless': (['program/headless.py', '--no-cv'], ()),
+    'headless-cv': (['program/headless.py'], ('cv2', 'mediapipe')),
+    'qt': (['program/main.py'], ('PyQt6', 'cv2', 'mediapipe')),
+}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def read_memory(pid: int) -> dict:
+    """讀取行程的 VmRSS 與 VmHWM（MB）"""
+    memory = {}
+    try:
+        with open(f'/proc/{pid}/status', encoding='utf-8') as f:
+            for line in f:
+                if line.startswith(('VmRSS:', 'VmHWM:')):
+                    key, value = line.split()[:2]
+                    memory[key.rstrip(':')] = int(value) / 1024
+    except OSError:
+        pass
+    return memory
+
+
+def prepare_workdir(workdir: Path, link: str, port: int):
+    """
+    建立工作目錄（主程式固定讀取相對路徑 data/config.json，各模式都以工作目錄執行）
+    """
+    data_dir = workdir / 'data'
+    data_dir.mkdir()
+    with open(project_root / 'data' / 'config.json', encoding='utf-8') as f:
+        config = json.load(f)
+    config['serial'].update(port=link, capture_path='', replay_path='')
+    config['database'] = {'path': str(data_dir / 'database.db')}
+    config['api'].update(host='127.0.0.1', port=port)
+    config['ui'] = {'fullscreen': False, 'resolution': {'width': 800, 'height': 480}}
+    with open(data_dir / 'config.json', 'w', encoding='utf-8') as f:
+        json.dump(config, f)
+    shutil.copy(project_root / 'data' / 'user_config.json', data_dir / 'user_config.json')
+
+
+def run_once(command: list, port: int, workdir: Path, settle: float, timeout: float) -> dict:
+    """啟動一次，返回啟動時間與記憶體；API 未在 timeout 內回應時返回None"""
+    env = dict(os.environ, QT_QPA_PLATFORM='offscreen')
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable] + [str(project_root / command[0])] + command[1:],
+                               cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = start + timeout
+        while time.perf_counter() < deadline and process.poll() is None:
+            try:
+                urllib.request.urlopen(f"http://127.0.0.1:{port}/api/health", timeout=1).read()
+                break
+            except Exception:
+                time.sleep(0.01)
+        else:
+            return None
+        ready = time.perf_counter() - start
+        at_ready = read_memory(process.pid)
+        time.sleep(settle)
+        settled = read_memory(process.pid)
+        return {
+            'startup_s': ready,
+            'rss_ready_mb': at_ready.get('VmRSS', 0.0),
+            'rss_mb': settled.get('VmRSS', 0.0),
+            'peak_mb': settled.get('VmHWM', 0.0),
+        }
+    finally:
+        process.terminate()
+        try:
+            process.wait(10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+
+def main():
+    """主函數"""
+    parser = argparse.ArgumentParser(description="無介面模式與 Qt 主程式的啟動時間與記憶體比較")
+    parser.add_argument('--runs', type=int, default=3, help="每種模式啟動次數（取中位數）")
+    parser.add_argument('--settle', type=float, default=3.0, help="API 可用後再等待的秒數（之後記錄記憶體）")
+    parser.add_argument('--timeout', type=float, default=60.0, help="等待 API 可用的最長秒數")
+    parser.add_argument('--mode', nargs='+', choices=tuple(MODES), default=list(MODES))
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    print(f"{'模式':<18}{'啟動秒數':>8}{'就緒RSS':>10}{'運行RSS':>10}{'峰值':>10}")
+
+    with tempfile.TemporaryDirectory(prefix='bench_headless') as tmp:
+        link = str(Path(tmp) / 'ttyBMduino')
+        emulator = BMduinoEmulator(standby_interval=1.0, boot_banner=False, link=link, seed=1)
+        emulator.start()
+        try:
+            for mode in args.mode:
+                command, requires = MODES[mode]
+                missing = [name for name in requires if importlib.util.find_spec(name) is None]
+                if missing:
+                    print(f"{mode:<18}略過（缺少 {', '.join(missing)}）")
+                    continue
+                results = []
+                for run in range(args.runs):
+                    workdir = Path(tmp) / f"{mode}_{run}"
+                    workdir.mkdir()
+                    port = free_port()
+                    prepare_workdir(workdir, link, port)
+                    result = run_once(command, port, workdir, args.settle, args.timeout)
+                    if result is None:
+                        print(f"{mode:<18}啟動失敗（{args.timeout:g} 秒內 API 未回應）")
+                        break
+                    results.append(result)
+                if len(results) < args.runs:
+                    continue
+
+                def median(key):
+                    values = sorted(r[key] for r in results)
+                    return values[len(values) // 2]
+
+                print(f"{mode:<18}{median('startup_s'):>10.2f}{median('rss_ready_mb'):>10.1f}"
+                      f"{median('rss_mb'):>10.1f}{median('peak_mb'):>10.1f}")
+        finally:
+            emulator.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多裝置串口集線效能測試腳本
+在子程序中啟動N台虛擬BMduino，比較單一 SerialHub 迴圈與每台一個
+BMduinoCommunicator 線程的吞吐量、線程數與CPU時間
+
+用法: python3 benchmarks/bench_hub.py [--devices 24] [--speed 50] [--duration 10] [--mode hub|threads]
+"""
+
+import argparse
+import resource
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+# 添加專案根目錄到Python路徑
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from code.serial_hub import SerialHub
+from code.serial_communicator import BMduinoCommunicator
+from code.bmduino_emulator import BMduinoEmulator
+
+
+def serve_emulators(count: int, speed: float, session_interval: float):
+    """子程序：啟動多台虛擬BMduino並輸出各自的串口路徑"""
+    emulators = []
+    for i in range(count):
+        emulator = BMduinoEmulator(speed=speed, session_interval=session_interval,
+                                   boot_banner=False, seed=i)
+        print(emulator.start(), flush=True)
+        emulators.append(emulator)
+    print("READY", flush=True)
+    try:
+        sys.stdin.read()
+    finally:
+        for emulator in emulators:
+            emulator.stop()
+
+
+def cpu_seconds() -> float:
+    """本程序（不含子程序）已使用的CPU時間"""
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def main():
+    """主函數"""
+    parser = argparse.ArgumentParser(description="多裝置串口集線效能測試")
+    parser.add_argument('--devices', type=int, default=24, help="虛擬BMduino數量")
+    parser.add_argument('--speed', type=float, default=50.0, help="虛擬BMduino時間倍率")
+    parser.add_argument('--session-interval', type=float, default=20.0, help="自動觸發流程間隔（模擬秒）")
+    parser.add_argument('--duration', type=float, default=10.0, help="測試時間（秒）")
+    parser.add_argument('--mode', choices=('hub', 'threads'), default='hub', help="hub：單一集線迴圈；threads：每台一個線程")
+    parser.add_argument('--serve-emulators', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve_emulators:
+        serve_emulators(args.devices, args.speed, args.session_interval)
+        return
+
+    child = subprocess.Popen(
+        [sys.executable, __file__, '--serve-emulators', '--devices', str(args.devices),
+         '--speed', str(args.speed), '--session-interval', str(args.session_interval)],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+    ports = []
+    for line in child.stdout:
+        line = line.strip()
+        if line == "READY":
+            break
+        ports.append(line)
+
+    events = [0]
+    lock = threading.Lock()
+
+    def count(*_):
+        with lock:
+            events[0] += 1
+
+    threads_before = threading.active_count()
+    if args.mode == 'hub':
+        hub = SerialHub()
+        for i, port in enumerate(ports):
+            hub.add_device(f"box{i + 1}", port)
+        for kind in hub.callbacks:
+            hub.register_callback(kind, count)
+        hub.start()
+    else:
+        communicators = []
+        for port in ports:
+            communicator = BMduinoCommunicator(port=port)
+            for kind in communicator.topics:
+                communicator.register_callback(kind, count)
+            communicator.start_listening()
+            communicators.append(communicator)
+
+    def total_lines() -> int:
+        if args.mode == 'hub':
+            return sum(s['lines'] for s in hub.get_stats().values())
+        return sum(c.reader_stats.lines for c in communicators)
+
+    # 等待所有裝置連線完成並讀完積壓的數據後才開始計算
+    time.sleep(1.0)
+    lines_start = total_lines()
+    events_start = events[0]
+    cpu_start = cpu_seconds()
+    wall_start = time.monotonic()
+    time.sleep(args.duration)
+    wall = time.monotonic() - wall_start
+    cpu = cpu_seconds() - cpu_start
+    lines = total_lines() - lines_start
+    event_count = events[0] - events_start
+    threads_used = threading.active_count() - threads_before
+
+    if args.mode == 'hub':
+        hub.stop()
+    else:
+        for communicator in communicators:
+            communicator.disconnect()
+
+    child.stdin.close()
+    child.wait(timeout=5)
+
+    print(f"模式: {args.mode}，裝置數量: {len(ports)}，測試時間: {wall:.1f} 秒")
+    print(f"讀取線程數: {threads_used}")
+    print(f"總行數: {lines}（{lines / wall:,.0f} 行/秒），事件數: {event_count}")
+    print(f"CPU時間: {cpu:.3f} 秒（{cpu / wall * 100:.1f}% 單核）")
+
+
+if __name__ == "__main__":
+    main()
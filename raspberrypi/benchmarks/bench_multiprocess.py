@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+單一行程與多行程模式效能比較腳本
+以虛擬BMduino（獨立行程，高頻待機回報並自動觸發測量流程）作為數據來源，
+同時以另一個行程對 API 發出大量請求，比較兩種模式下：
+
+- UI 畫格時間：模擬 UI 行程的畫格迴圈（每格讀取待機快照並更新畫面狀態），
+  同一個行程中另有一個模擬電腦視覺推論前後處理的線程（佔用 GIL 的 Python 運算）
+- API 延遲：請求 p50/p99 與吞吐量
+
+單一行程模式：串口、數據庫、API 與畫格迴圈在同一個直譯器中（program/main.py 的配置）
+多行程模式：以監督程式啟動 ingest 與 api 角色，本腳本作為 UI 行程，經由共享記憶體快照與事件通道取得數據
+
+用法: python3 benchmarks/bench_multiprocess.py [--duration 20] [--clients 8] [--cv-load 0.5] [--mode single multi]
+"""
+
+import argparse
+import json
+import multiprocessing
+import socket
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+import logging
+from pathlib import Path
+
+# 添加專案根目錄到Python路徑
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from code.event_bus import latency_summary
+
+API_PATHS = ('/api/status', '/api/current_data', '/api/link_stats', '/api/latest')
+
+
+def run_emulator(link: str, standby_interval: float, session_interval: float, stop):
+    """虛擬BMduino行程"""
+    from code.bmduino_emulator import BMduinoEmulator
+    emulator = BMduinoEmulator(standby_interval=standby_interval, status_interval=0.1,
+                               session_interval=session_interval, stable_time=0.5,
+                               finger_placement_time=0.2, boot_banner=False, link=link, seed=1)
+    emulator.start()
+    stop.wait()
+    emulator.stop()
+
+
+def run_api_load(port: int, clients: int, duration: float, results):
+    """API 負載行程：多個線程輪流請求 API_PATHS，記錄每個請求的延遲"""
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def client(index: int):
+        local = []
+        i = index
+        while time.monotonic() < deadline:
+            path = API_PATHS[i % len(API_PATHS)]
+            i += 1
+            start = time.perf_counter()
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}{path}", timeout=5) as response:
+                    response.read()
+                local.append(time.perf_counter() - start)
+            except Exception:
+                with lock:
+                    errors[0] += 1
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    results.put((latencies, errors[0]))
+
+
+def cv_worker(stop: threading.Event, period: float, load: float):
+    """模擬電腦視覺推論：每個畫格週期中 load 比例的時間執行佔用 GIL 的 Python 運算"""
+    while not stop.is_set():
+        start = time.perf_counter()
+        busy_until = start + period * load
+        total = 0
+        while time.perf_counter() < busy_until:
+            total += sum(range(200))
+        remaining = period - (time.perf_counter() - start)
+        if remaining > 0:
+            time.sleep(remaining)
+
+
+def run_frames(communicator, duration: float, fps: float, cv_load: float) -> dict:
+    """
+    畫格迴圈：每格讀取待機快照、更新畫面狀態，記錄畫格間隔
+
+    Returns:
+        畫格間隔（秒）、收到的事件數與讀到的快照數
+    """
+    period = 1.0 / fps
+    events = [0]
+    communicator.register_callback('working_status', lambda e: events.__setitem__(0, events[0] + 1))
+    communicator.register_callback('detect_user', lambda e: events.__setitem__(0, events[0] + 1))
+    reader = communicator.latest['standby'].reader()
+
+    stop = threading.Event()
+    cv_thread = threading.Thread(target=cv_worker, args=(stop, period, cv_load), daemon=True)
+    cv_thread.start()
+
+    intervals = []
+    label = ''
+    deadline = time.perf_counter() + duration
+    next_frame = time.perf_counter()
+    last = None
+    while True:
+        now = time.perf_counter()
+        if now >= deadline:
+            break
+        if last is not None:
+            intervals.append(now - last)
+        last = now
+        snapshot = reader.poll()
+        if snapshot is not None:
+            value = snapshot.value
+            label = f"{value.object_temp:.1f} / {value.ambient_temp:.1f}"
+        # 模擬畫面更新（格式化文字與少量計算）
+        _ = [f"{label} {i}" for i in range(50)]
+        next_frame += period
+        delay = next_frame - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        else:
+            next_frame = time.perf_counter()
+    stop.set()
+    cv_thread.join()
+    return {'intervals': intervals, 'events': events[0], 'snapshots': reader.received}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def make_config(workdir: Path, link: str, port: int) -> dict:
+    """基於 data/config.json 的測試配置"""
+    with open(project_root / 'data' / 'config.json', encoding='utf-8') as f:
+        config = json.load(f)
+    config['serial'].update(port=link, standby_rate=None, working_rate=None, capture_path='', replay_path='')
+    config['database'] = {'path': str(workdir / 'bench.db')}
+    config['api']['port'] = port
+    config['supervisor'] = {
+        'roles': ['ingest', 'api'],
+        'socket_path': str(workdir / 'channel.sock'),
+        'shm_prefix': f"bench_{workdir.name}",
+        'log_level': 'WARNING',
+    }
+    return config
+
+
+def wait_for_api(port: int, timeout: float = 15.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/api/health", timeout=1).read()
+            return True
+        except Exception:
+            time.sleep(0.1)
+    return False
+
+
+def run_single(config: dict, args) -> dict:
+    """單一行程模式：與 program/main.py 相同的組裝（不含 Qt）"""
+    from program.api_server import APIServer
+    from program.runtime import (create_bus, open_database, create_communicator, connect_serial, start_serial,
+                                 setup_results, connect_api_status)
+    from code.user_mapper import UserMapper
+
+    database = open_database(config)
+    bus = create_bus(config)
+    communicator = create_communicator(config, bus)
+    connect_serial(config, communicator)
+    setup_results(bus, communicator, None, database)
+    api_server = APIServer(host='127.0.0.1', port=config['api']['port'])
+    api_server.set_database(database)
+    api_server.set_data_provider(type('DataProvider', (), {
+        'user_mapper': UserMapper(str(project_root / 'data' / 'user_config.json')),
+        'communicator': communicator,
+        'ppg_pipeline': None,
+        'stabilizer': None,
+        'bus': bus
+    })())
+    connect_api_status(api_server, bus, communicator)
+    api_server.start()
+    start_serial(config, communicator)
+    try:
+        wait_for_api(config['api']['port'])
+        return measure(communicator, config['api']['port'], args)
+    finally:
+        communicator.stop_listening()
+        communicator.disconnect()
+        bus.close()
+        database.close()
+
+
+def run_multi(config: dict, config_path: str, args) -> dict:
+    """多行程模式：監督程式啟動 ingest 與 api 角色，本行程作為 UI 行程"""
+    from program.supervisor import Supervisor, connect_channel, supervisor_config
+
+    supervisor = Supervisor(config, config_path)
+    supervisor.start()
+    client = None
+    try:
+        client, communicator = connect_channel(config, supervisor_config(config))
+        if not wait_for_api(config['api']['port']):
+            print("API 角色未啟動")
+        return measure(communicator, config['api']['port'], args)
+    finally:
+        if client is not None:
+            client.stop()
+        supervisor.stop()
+
+
+def measure(communicator, port: int, args) -> dict:
+    """同時執行 API 負載行程與畫格迴圈"""
+    time.sleep(args.warmup)
+    results = multiprocessing.Queue()
+    load = multiprocessing.Process(target=run_api_load, args=(port, args.clients, args.duration, results))
+    load.start()
+    frames = run_frames(communicator, args.duration, args.fps, args.cv_load)
+    latencies, errors = results.get()
+    load.join()
+    return {'frames': frames, 'api': latencies, 'api_errors': errors}
+
+
+def report(mode: str, result: dict, args):
+    period_ms = 1000.0 / args.fps
+    intervals = sorted(result['frames']['intervals'])
+    frame = latency_summary(intervals)
+    late = sum(1 for i in intervals if i * 1000 > period_ms * 1.5)
+    api = latency_summary(result['api'])
+    print(f"{mode:<8}{len(intervals):>8}{frame['p50_ms']:>10.2f}{frame['p99_ms']:>10.2f}{frame['max_ms']:>10.1f}"
+          f"{late / len(intervals) * 100:>9.1f}%"
+          f"{api['samples'] if api else 0:>9}{api['samples'] / args.duration if api else 0:>9.0f}"
+          f"{api['p50_ms'] if api else 0:>10.2f}{api['p99_ms'] if api else 0:>10.2f}{result['api_errors']:>7}"
+          f"{result['frames']['events']:>8}{result['frames']['snapshots']:>8}")
+
+
+def main():
+    """主函數"""
+    parser = argparse.ArgumentParser(description="單一行程與多行程模式效能比較")
+    parser.add_argument('--duration', type=float, default=20.0, help="每種模式的測量秒數")
+    parser.add_argument('--warmup', type=float, default=2.0, help="開始測量前的等待秒數")
+    parser.add_argument('--clients', type=int, default=8, help="API 負載的並行請求數")
+    parser.add_argument('--fps', type=float, default=30.0, help="畫格迴圈的目標幀率")
+    parser.add_argument('--cv-load', type=float, default=0.5, help="模擬電腦視覺佔用每個畫格週期的比例")
+    parser.add_argument('--standby-interval', type=float, default=0.01, help="虛擬BMduino待機回報間隔（秒）")
+    parser.add_argument('--session-interval', type=float, default=3.0, help="自動觸發測量流程的間隔（秒）")
+    parser.add_argument('--mode', nargs='+', choices=('single', 'multi'), default=['single', 'multi'])
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    print(f"負載: 待機回報 {1 / args.standby_interval:.0f} Hz，每 {args.session_interval:g} 秒一次測量流程，"
+          f"API 並行請求 {args.clients}，模擬電腦視覺佔用 {args.cv_load * 100:.0f}%，目標 {args.fps:g} fps")
+    print(f"{'模式':<8}{'畫格數':>7}{'間隔p50':>9}{'間隔p99':>9}{'最大ms':>8}{'延遲畫格':>7}"
+          f"{'API請求':>7}{'每秒':>7}{'API p50':>10}{'API p99':>10}{'錯誤':>5}{'事件':>6}{'快照':>6}")
+
+    for mode in args.mode:
+        with tempfile.TemporaryDirectory(prefix='bench_mp') as tmp:
+            workdir = Path(tmp)
+            link = str(workdir / 'ttyBMduino')
+            config = make_config(workdir, link, free_port())
+            config_path = str(workdir / 'config.json')
+            with open(config_path, 'w', encoding='utf-8') as f:
+                json.dump(config, f)
+
+            stop = multiprocessing.Event()
+            emulator = multiprocessing.Process(target=run_emulator,
+                                               args=(link, args.standby_interval, args.session_interval, stop))
+            emulator.start()
+            deadline = time.monotonic() + 5.0
+            while not Path(link).exists() and time.monotonic() < deadline:
+                time.sleep(0.05)
+            try:
+                if mode == 'single':
+                    result = run_single(config, args)
+                else:
+                    result = run_multi(config, config_path, args)
+                report(mode, result, args)
+            finally:
+                stop.set()
+                emulator.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+PPG 波形處理效能測試腳本
+以合成（或錄製檔中）的 MAX30102 原始波形，經過完整的接收流程（分幀/分行、解碼、滑動視窗計算），
+測量單核心的即時倍率（波形秒數 / 處理秒數）、每個視窗的計算時間，以及心率與血氧的誤差
+
+用法: python3 benchmarks/bench_ppg.py [--seconds 600] [--rate 50 100] [--text] [--capture 錄製檔]
+"""
+
+import sys
+import time
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+# 添加專案根目錄到Python路徑
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from code.protocol import ProtocolDecoder
+from code.serial_framer import LineFramer
+from code.serial_capture import read_capture
+from code.binary_protocol import FrameDecoder, SYNC, encode_event
+from code.ppg_pipeline import PpgPipeline, PpgSynthesizer
+
+# 合成情境：(名稱, 心率, 血氧, 雜訊比例, 是否有手指)
+SCENARIOS = [
+    ('靜止', 72, 98, 0.001, True),
+    ('心跳過緩', 48, 95, 0.001, True),
+    ('心跳過速', 150, 92, 0.002, True),
+    ('低血氧', 85, 88, 0.001, True),
+    ('高雜訊', 90, 97, 0.004, True),
+    ('沒有手指', 72, 98, 0.001, False),
+]
+
+# 每個 PPG 批次的樣本數（與韌體相同）
+BATCH = 10
+
+
+def synthesize_stream(synth: PpgSynthesizer, seconds: float, text: bool) -> bytes:
+    """產生指定秒數的串流位元組（文字行或二進位幀）"""
+    batches = int(seconds * synth.sample_rate) // BATCH
+    if text:
+        return b''.join(synth.next_line(BATCH) + b'\r\n' for _ in range(batches))
+    return b''.join(encode_event(synth.next_event(BATCH)) for _ in range(batches))
+
+
+def split_chunks(stream: bytes, size: int = 256) -> list:
+    """將串流切成固定大小的區塊（模擬每次系統呼叫讀到的數據）"""
+    return [stream[i:i + size] for i in range(0, len(stream), size)]
+
+
+def run_pipeline(pipeline: PpgPipeline, events_of, chunks) -> dict:
+    """
+    將區塊依序解碼並送入管線，記錄處理時間
+
+    Args:
+        pipeline: PPG 管線
+        events_of: 將一個區塊解碼為事件列表的函數
+        chunks: 串流區塊列表
+
+    Returns:
+        總耗時、CPU 時間、每次計算的耗時與所有結果
+    """
+    window_times = []
+    results = []
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    for chunk in chunks:
+        for event in events_of(chunk):
+            if event.kind != 'ppg':
+                continue
+            start = time.perf_counter()
+            result = pipeline.feed(event)
+            if result is not None:
+                window_times.append(time.perf_counter() - start)
+                results.append(result)
+    return {
+        'elapsed': time.perf_counter() - wall_start,
+        'cpu': time.process_time() - cpu_start,
+        'window_times': np.array(window_times),
+        'results': results,
+    }
+
+
+def stream_decoder(text: bool):
+    """建立區塊解碼函數（文字：分行 + 解碼；二進位：幀解碼）"""
+    if not text:
+        return FrameDecoder().feed
+    framer = LineFramer()
+    decoder = ProtocolDecoder()
+
+    def decode_text(chunk):
+        events = (decoder.decode(raw_line) for raw_line in framer.feed(chunk))
+        return [event for event in events if event is not None]
+
+    return decode_text
+
+
+def print_timing(label: str, seconds: float, run: dict):
+    """輸出即時倍率與視窗計算時間"""
+    window_ms = run['window_times'] * 1000
+    p50 = np.percentile(window_ms, 50) if len(window_ms) else 0.0
+    p99 = np.percentile(window_ms, 99) if len(window_ms) else 0.0
+    print(f"{label:<12}{seconds / run['elapsed']:>10,.0f}x{run['cpu'] / seconds * 100:>11.3f}%"
+          f"{len(window_ms):>8}{p50:>10.3f}{p99:>10.3f}", end='')
+
+
+def bench_synthetic(rates, seconds: float, text: bool):
+    """合成情境：比對計算結果與產生波形時設定的心率與血氧"""
+    print(f"合成波形：每個情境 {seconds:g} 秒，{'文字協議' if text else '二進位幀'}，每批 {BATCH} 個樣本")
+    print(f"{'情境':<12}{'即時倍率':>11}{'CPU 佔用':>12}{'視窗數':>8}{'p50 ms':>10}{'p99 ms':>10}"
+          f"{'有效率':>8}{'心率誤差':>10}{'血氧誤差':>10}")
+    for rate in rates:
+        print(f"--- {rate} Hz " + "-" * 80)
+        for name, heart_rate, spo2, noise, finger in SCENARIOS:
+            synth = PpgSynthesizer(sample_rate=rate, heart_rate=heart_rate, spo2=spo2,
+                                   noise=noise, finger=finger, seed=1)
+            chunks = split_chunks(synthesize_stream(synth, seconds, text))
+            pipeline = PpgPipeline(sample_rate=rate)
+            run = run_pipeline(pipeline, stream_decoder(text), chunks)
+
+            results = run['results']
+            valid = [r for r in results if r.valid]
+            hr_error = np.mean([abs(r.heart_rate - heart_rate) for r in valid]) if valid else float('nan')
+            spo2_error = np.mean([abs(r.spo2 - spo2) for r in valid]) if valid else float('nan')
+            valid_rate = len(valid) / len(results) * 100 if results else 0.0
+            print_timing(name, seconds, run)
+            print(f"{valid_rate:>7.0f}%{hr_error:>10.2f}{spo2_error:>10.2f}")
+
+
+def bench_capture(path: str, rate: float):
+    """錄製檔：重新處理錄到的 PPG 訊息（沒有參考值，只輸出結果分佈）"""
+    records = [raw for _, raw in read_capture(path)]
+    text_decoder = ProtocolDecoder()
+    frame_decoder = FrameDecoder(text_decoder)
+
+    def decode_record(raw):
+        if raw and raw[0] == SYNC:
+            return frame_decoder.feed(raw)
+        event = text_decoder.decode(raw)
+        return [event] if event is not None else []
+
+    pipeline = PpgPipeline(sample_rate=rate)
+    run = run_pipeline(pipeline, decode_record, records)
+    seconds = pipeline.samples / rate
+    if not pipeline.samples:
+        print(f"錄製檔中沒有 PPG 訊息: {path}")
+        return
+
+    print(f"錄製檔: {path}，{pipeline.samples} 個樣本（{seconds:.1f} 秒 @ {rate:g} Hz），"
+          f"缺口 {pipeline.gaps} 次 / 遺失 {pipeline.lost_samples} 個樣本")
+    print(f"{'來源':<12}{'即時倍率':>11}{'CPU 佔用':>12}{'視窗數':>8}{'p50 ms':>10}{'p99 ms':>10}")
+    print_timing('錄製檔', seconds, run)
+    print()
+    valid = [r for r in run['results'] if r.valid]
+    print(f"有效視窗: {len(valid)} / {len(run['results'])}")
+    if valid:
+        heart_rates = [r.heart_rate for r in valid]
+        spo2_values = [r.spo2 for r in valid]
+        print(f"心率 中位數 {np.median(heart_rates):.1f} BPM（{min(heart_rates):.1f} - {max(heart_rates):.1f}）")
+        print(f"血氧 中位數 {np.median(spo2_values):.1f} %（{min(spo2_values):.1f} - {max(spo2_values):.1f}）")
+
+
+def main():
+    """主函數"""
+    parser = argparse.ArgumentParser(description="PPG 波形處理效能測試")
+    parser.add_argument('--seconds', type=float, default=600, help="每個合成情境的波形長度（秒）")
+    parser.add_argument('--rate', type=int, nargs='+', default=[50, 100], help="取樣頻率（Hz）")
+    parser.add_argument('--text', action='store_true', help="使用文字協議（預設為二進位幀）")
+    parser.add_argument('--capture', metavar='PATH', help="改為處理錄製檔中的 PPG 訊息")
+    args = parser.parse_args()
+
+    if args.capture:
+        bench_capture(args.capture, args.rate[0])
+    else:
+        bench_synthetic(args.rate, args.seconds, args.text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+協議解碼效能測試腳本
+分別測量每種訊息類型的解碼速度（行/秒），並比較文字協議（分行+解碼）與
+二進位分幀協議（幀解碼）處理串流的吞吐量與每則訊息的位元組數
+
+用法: python3 benchmarks/bench_protocol.py [每種類型的行數]
+"""
+
+import sys
+import time
+from pathlib import Path
+
+# 添加專案根目錄到Python路徑
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from code.protocol import ProtocolDecoder
+from code.data_parser import DataParser
+from code.serial_framer import LineFramer
+from code.binary_protocol import FrameDecoder, encode_event
+
+# 每種訊息類型的範例行
+SAMPLE_LINES = {
+    'STANDBY': b'STANDBY,25.50,23.20,72,98',
+    'DETECT': b'DETECT,USER3',
+    'WORKING,START': b'WORKING,START',
+    'WORKING': b'WORKING,25.52,23.22,MEASURING,87',
+    'WORKING,FINAL': b'WORKING,FINAL,1,25.50,23.20,72,98',
+    'WORKING,NO_FINGER': b'WORKING,NO_FINGER',
+    'RELAY_OK': b'RELAY_OK,2',
+    'RELAY_ERROR': b'RELAY_ERROR,INVALID_NUMBER',
+    'MODE': b'MODE,RECEIVE',
+    'WORKING,NO_DATA': b'WORKING,NO_DATA',
+}
+
+
+def bench(func, line, count: int) -> float:
+    """
+    重複解碼同一行並計算速度
+
+    Args:
+        func: 解碼函數
+        line: 訊息行
+        count: 重複次數
+
+    Returns:
+        每秒解碼行數
+    """
+    start = time.perf_counter()
+    for _ in range(count):
+        func(line)
+    elapsed = time.perf_counter() - start
+    return count / elapsed
+
+
+def bench_stream(feed, chunks, messages: int) -> float:
+    """
+    將串流分塊餵入解碼器並計算速度
+
+    Args:
+        feed: 接收一個區塊並返回結果列表的函數
+        chunks: 串流區塊列表
+        messages: 串流中的訊息總數
+
+    Returns:
+        每秒解碼訊息數
+    """
+    start = time.perf_counter()
+    decoded = 0
+    for chunk in chunks:
+        decoded += len(feed(chunk))
+    elapsed = time.perf_counter() - start
+    assert decoded == messages, f"解碼數量不符: {decoded} != {messages}"
+    return messages / elapsed
+
+
+def split_chunks(stream: bytes, size: int = 256) -> list:
+    """將串流切成固定大小的區塊（模擬每次系統呼叫讀到的數據）"""
+    return [stream[i:i + size] for i in range(0, len(stream), size)]
+
+
+def main():
+    """主函數"""
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    decoder = ProtocolDecoder()
+
+    print(f"每種訊息類型解碼 {count} 行")
+    print(f"{'訊息類型':<20}{'事件物件 (行/秒)':>20}{'字典相容介面 (行/秒)':>24}")
+    print("-" * 64)
+    for name, line in SAMPLE_LINES.items():
+        event_rate = bench(decoder.decode, line, count)
+        dict_rate = bench(DataParser.parse_message, line.decode('utf-8'), count)
+        print(f"{name:<20}{event_rate:>20,.0f}{dict_rate:>24,.0f}")
+
+    # 串流吞吐量：文字協議需要分行再解碼，二進位協議直接在緩衝區上解幀
+    stream_count = max(1, count // 10)
+    print()
+    print(f"串流吞吐量（每種類型 {stream_count} 則訊息，每次讀取 256 位元組）")
+    print(f"{'訊息類型':<20}{'文字 (則/秒)':>16}{'二進位 (則/秒)':>18}{'文字 位元組':>14}{'二進位 位元組':>16}")
+    print("-" * 84)
+    for name, line in SAMPLE_LINES.items():
+        text_message = line + b'\r\n'
+        frame = encode_event(decoder.decode(line))
+        text_chunks = split_chunks(text_message * stream_count)
+        binary_chunks = split_chunks(frame * stream_count)
+
+        framer = LineFramer()
+
+        def decode_text(chunk):
+            return [decoder.decode(raw_line) for raw_line in framer.feed(chunk)]
+
+        text_rate = bench_stream(decode_text, text_chunks, stream_count)
+        binary_rate = bench_stream(FrameDecoder().feed, binary_chunks, stream_count)
+        print(f"{name:<20}{text_rate:>16,.0f}{binary_rate:>18,.0f}{len(text_message):>14}{len(frame):>16}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+斷線恢復故障注入測試腳本
+以虛擬BMduino模擬USB拔除/重新插入、裝置停頓與數據損毀，
+測量 BMduinoCommunicator 的恢復時間與遺失的行數
+
+用法: python3 benchmarks/bench_recovery.py [--rounds 5] [--down 1.0] [--no-watch]
+"""
+
+import argparse
+import bisect
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+# 添加專案根目錄到Python路徑
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from code.serial_communicator import BMduinoCommunicator
+from code.bmduino_emulator import BMduinoEmulator
+
+
+class Probe:
+    """記錄通訊模組收到的每個事件時間"""
+
+    def __init__(self, communicator: BMduinoCommunicator):
+        self.lock = threading.Lock()
+        self.times = []
+        for kind in communicator.topics:
+            communicator.register_callback(kind, self._record)
+
+    def _record(self, _event):
+        with self.lock:
+            self.times.append(time.monotonic())
+
+    def count(self) -> int:
+        with self.lock:
+            return len(self.times)
+
+    def first_after(self, t: float, timeout: float) -> float:
+        """等待並返回 t 之後收到第一個事件的時間（超時返回None）"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self.lock:
+                index = bisect.bisect_right(self.times, t)
+                if index < len(self.times):
+                    return self.times[index]
+            time.sleep(0.005)
+        return None
+
+
+def run_scenario(emulator, probe, fault, settle: float, timeout: float):
+    """
+    執行一次故障注入
+
+    Args:
+        fault: 注入故障的函數，返回故障結束（恢復開始）的時間
+        settle: 恢復後繼續觀察的時間（秒），用於計算遺失行數
+
+    Returns:
+        (恢復時間秒數或None, 遺失行數)
+    """
+    sent_before = emulator.stats['lines_sent']
+    events_before = probe.count()
+    fault_end = fault()
+    recovered = probe.first_after(fault_end, timeout)
+    time.sleep(settle)
+    sent = emulator.stats['lines_sent'] - sent_before
+    events = probe.count() - events_before
+    recover_time = recovered - fault_end if recovered else None
+    return recover_time, max(0, sent - events)
+
+
+def report(name: str, results):
+    """輸出一個情境的統計"""
+    times = [t for t, _ in results if t is not None]
+    lost = [n for _, n in results]
+    failures = len(results) - len(times)
+    if times:
+        print(f"{name:<8} 恢復時間: 平均 {statistics.mean(times) * 1000:7.1f} ms，"
+              f"最大 {max(times) * 1000:7.1f} ms；遺失行數: 平均 {statistics.mean(lost):.1f}，"
+              f"總計 {sum(lost)}；未恢復: {failures}")
+    else:
+        print(f"{name:<8} 全部 {failures} 次都未在時限內恢復")
+
+
+def main():
+    """主函數"""
+    parser = argparse.ArgumentParser(description="斷線恢復故障注入測試")
+    parser.add_argument('--rounds', type=int, default=5, help="每個情境的次數")
+    parser.add_argument('--down', type=float, default=1.0, help="拔除/停頓/損毀持續時間（秒）")
+    parser.add_argument('--speed', type=float, default=10.0, help="虛擬BMduino時間倍率（決定回報頻率）")
+    parser.add_argument('--corrupt-rate', type=float, default=0.5, help="損毀情境中每行被損毀的機率")
+    parser.add_argument('--no-watch', action='store_true', help="不監看裝置節點，只依指數退避重連")
+    parser.add_argument('--timeout', type=float, default=15.0, help="單次恢復的最長等待時間（秒）")
+    args = parser.parse_args()
+
+    link = str(Path(tempfile.mkdtemp()) / "ttyBMduino")
+    emulator = BMduinoEmulator(speed=args.speed, boot_banner=False, link=link, seed=1)
+    emulator.start()
+    communicator = BMduinoCommunicator(port=link, watch_device=not args.no_watch)
+    probe = Probe(communicator)
+    communicator.start_listening()
+    time.sleep(0.5)
+    settle = 1.0
+
+    def unplug():
+        emulator.stop()
+        time.sleep(args.down)
+        emulator.start()
+        return time.monotonic()
+
+    def stall():
+        emulator.stall(args.down)
+        time.sleep(args.down)
+        return time.monotonic()
+
+    def corrupt():
+        emulator.corrupt_rate = args.corrupt_rate
+        time.sleep(args.down)
+        emulator.corrupt_rate = 0.0
+        return time.monotonic()
+
+    print(f"虛擬BMduino: {link}，裝置監看: {communicator.get_link_stats()['watch_mode']}，"
+          f"回報間隔: {1000 / args.speed:.0f} ms")
+    for name, fault in (('unplug', unplug), ('stall', stall), ('corrupt', corrupt)):
+        results = [run_scenario(emulator, probe, fault, settle, args.timeout)
+                   for _ in range(args.rounds)]
+        report(name, results)
+
+    print(f"連線統計: {communicator.get_link_stats()}")
+    print(f"解碼統計: {communicator.decoder.get_stats()}")
+    communicator.disconnect()
+    emulator.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+錄製檔重播效能測試腳本
+以最快速度（或指定倍速）重播串口錄製檔，經由 BMduinoCommunicator 的分派流程
+測量解碼、回調與數據庫寫入的吞吐量
+
+用法:
+    python3 benchmarks/bench_replay.py <錄製檔> [--speed 0] [--db]
+    python3 benchmarks/bench_replay.py --synthesize <輸出錄製檔> [--sessions 100]
+"""
+
+import argparse
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# 添加專案根目錄到Python路徑
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from code.serial_communicator import BMduinoCommunicator
+from code.serial_capture import CaptureWriter, capture_info
+from code.database import Database
+
+
+def synthesize_capture(path: str, sessions: int):
+    """
+    產生合成的錄製檔（待機數據與完整測量流程交錯）
+
+    Args:
+        path: 輸出錄製檔路徑
+        sessions: 測量流程數量
+    """
+    writer = CaptureWriter(path)
+    ts = time.monotonic()
+    for _ in range(sessions):
+        for _ in range(30):
+            ts += 1.0
+            writer.write(f"STANDBY,{random.uniform(24, 27):.2f},{random.uniform(22, 24):.2f},0,0".encode(), ts)
+        user = random.randint(1, 4)
+        for line in (f"DETECT,USER{user}", "WORKING,START"):
+            ts += 0.05
+            writer.write(line.encode(), ts)
+        hr, spo2 = random.randint(60, 100), random.randint(94, 99)
+        for i in range(12):
+            ts += 1.0
+            hr_text = str(hr) if i > 4 else 'MEASURING'
+            spo2_text = str(spo2) if i > 2 else 'MEASURING'
+            writer.write(f"WORKING,{random.uniform(33, 36):.2f},{random.uniform(22, 24):.2f},{hr_text},{spo2_text}".encode(), ts)
+        ts += 1.0
+        writer.write(f"WORKING,FINAL,{user},35.10,23.20,{hr},{spo2}".encode(), ts)
+        for line in ("MODE,RECEIVE", f"RELAY_OK,{user}", "MODE,STANDBY"):
+            ts += 0.1
+            writer.write(line.encode(), ts)
+    writer.close()
+
+
+def main():
+    """主函數"""
+    parser = argparse.ArgumentParser(description="錄製檔重播效能測試")
+    parser.add_argument('capture', nargs='?', help="錄製檔路徑")
+    parser.add_argument('--speed', type=float, default=0, help="播放速度倍率（0為最快）")
+    parser.add_argument('--db', action='store_true', help="同時將每筆待機/完成數據寫入臨時數據庫")
+    parser.add_argument('--synthesize', metavar='PATH', help="產生合成錄製檔")
+    parser.add_argument('--sessions', type=int, default=100, help="合成錄製檔的測量流程數量")
+    args = parser.parse_args()
+
+    if args.synthesize:
+        synthesize_capture(args.synthesize, args.sessions)
+        print(capture_info(args.synthesize))
+        return
+    if not args.capture:
+        parser.error("請指定錄製檔")
+
+    communicator = BMduinoCommunicator(port="replay")
+    counts = {}
+    callback_time = [0.0]
+
+    def count(event):
+        counts[event.kind] = counts.get(event.kind, 0) + 1
+
+    for kind in communicator.topics:
+        communicator.register_callback(kind, count)
+
+    database = None
+    if args.db:
+        database = Database(str(Path(tempfile.mkdtemp()) / "bench.db"))
+
+        def store(event):
+            start = time.perf_counter()
+            database.insert_measurement(
+                user_id=getattr(event, 'fingerprint_id', 0),
+                object_temp=event.object_temp,
+                ambient_temp=event.ambient_temp,
+                heart_rate=event.heart_rate,
+                spo2=event.spo2
+            )
+            callback_time[0] += time.perf_counter() - start
+
+        communicator.register_callback('standby', store)
+        communicator.register_callback('working_final', store)
+
+    communicator.start_replay(args.capture, speed=args.speed)
+    communicator.listen_thread.join()
+    stats = communicator.replay_source.get_stats()
+
+    print(f"重播: {stats['lines']} 行，耗時 {stats['elapsed']:.3f} 秒，{stats['lines_per_sec']:,.0f} 行/秒")
+    print(f"解碼統計: {communicator.decoder.get_stats()}")
+    print(f"事件數量: {counts}")
+    if database:
+        print(f"數據庫寫入耗時: {callback_time[0]:.3f} 秒")
+        database.close()
+
+
+if __name__ == "__main__":
+    main()
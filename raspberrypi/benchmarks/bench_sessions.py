@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多裝置流程引擎效能測試腳本
+以虛擬時鐘的事件迴圈同時執行 N 台裝置的完整流程（指紋辨識 -> 心律血氧 -> 出藥 -> 完成 -> 待機），
+事件以裝置ID標記直接送入 SessionEngine（與 SerialHub 的集線器回調相同），記錄：
+
+- 吞吐量：每秒處理的狀態轉換數與事件數（實際時間）
+- 記憶體：每個進行中流程佔用的記憶體（tracemalloc，含延遲轉換的計時器），
+  並與每台裝置各自一個 StateMachine（含專用事件匯流排）比較
+
+用法: python3 benchmarks/bench_sessions.py [--sessions 10 100 1000] [--rounds 20] [--journal]
+"""
+
+import argparse
+import gc
+import random
+import sys
+import time
+import tracemalloc
+import logging
+from pathlib import Path
+
+# 添加專案根目錄到Python路徑
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from code.clock import VirtualClock
+from code.event_bus import EventBus, THREAD
+from code.event_loop import EventLoop
+from code.protocol import DetectUserEvent, WorkingStartEvent, WorkingStatusEvent, WorkingFinalEvent, RelayOkEvent
+from code.user_mapper import UserMapper
+from code.database import Database
+from code.session_journal import SessionJournal
+from program.state_machine import StateMachine, SystemState
+from program.session_engine import SessionEngine
+
+# 每台裝置兩次流程之間的間隔（虛擬秒，大於一次流程的時間）
+ROUND_PERIOD = 30.0
+
+
+class FirmwareDriver:
+    """依韌體的時序產生每台裝置的事件（狀態回報每秒一次，4-10 秒後輸出 FINAL，出藥 1 秒後 RELAY_OK）"""
+
+    def __init__(self, loop: EventLoop, engine: SessionEngine, users: list, seed: int):
+        self.loop = loop
+        self.engine = engine
+        self.users = users
+        self.random = random.Random(seed)
+
+    def dispense(self, device_id: str, relay_num: int) -> bool:
+        self.loop.call_later(1.0, self.engine.handle, device_id, RelayOkEvent(relay_num))
+        return True
+
+    def start(self, devices: int, rounds: int):
+        for index in range(devices):
+            device_id = f"box{index}"
+            offset = self.random.uniform(0.0, 1.0)
+            for round_index in range(rounds):
+                self.loop.call_later(offset + round_index * ROUND_PERIOD, self._session, device_id)
+
+    def _session(self, device_id: str):
+        handle = self.engine.handle
+        user = self.random.choice(self.users)
+        handle(device_id, DetectUserEvent(user))
+        handle(device_id, WorkingStartEvent())
+        ready = self.random.randint(4, 10)
+        for second in range(1, ready + 1):
+            self.loop.call_later(second, handle, device_id, WorkingStatusEvent(25.5, 23.2, 'MEASURING', 'MEASURING'))
+        self.loop.call_later(ready + 1, handle, device_id, WorkingFinalEvent(user, 25.5, 23.2, 72, 97))
+
+
+def run_throughput(devices: int, rounds: int, user_mapper: UserMapper, journal: bool, seed: int) -> dict:
+    """N 台裝置同時進行 rounds 次流程"""
+    clock = VirtualClock()
+    loop = EventLoop(clock)
+    # 流程記錄與閘道器相同，在事件匯流排的工作線程寫入數據庫
+    bus = EventBus(capacity=1024) if journal else None
+    engine = SessionEngine(loop, lambda device_id, relay_num: driver.dispense(device_id, relay_num), user_mapper,
+                           bus=bus)
+    if journal:
+        session_journal = SessionJournal(Database(':memory:'), clock)
+        bus.subscribe('state_change', session_journal.record, THREAD, subscriber='SessionJournal')
+    driver = FirmwareDriver(loop, engine, [int(user_id) for user_id in user_mapper.users] or [1], seed)
+    driver.start(devices, rounds)
+
+    start = time.perf_counter()
+    loop.run()
+    if bus is not None:
+        bus.close(timeout=None)  # 包含寫入佇列中的流程記錄
+    wall = time.perf_counter() - start
+    stats = engine.get_stats()
+    return {
+        'wall_s': wall,
+        'transitions': stats['transitions'],
+        'events': stats['events'],
+        'completed': stats['completed'],
+        'peak': stats['peak'],
+        'rejected': stats['rejected'],
+    }
+
+
+def measure_memory(devices: int, user_mapper: UserMapper) -> tuple:
+    """
+    每個進行中流程的記憶體（位元組）
+
+    Returns:
+        (引擎的 DeviceSession 與計時器, 每台裝置一個 StateMachine 與事件匯流排)
+    """
+    loop = EventLoop(VirtualClock())
+    engine = SessionEngine(loop, lambda device_id, relay_num: True, user_mapper)
+    events = [(f"box{index}", DetectUserEvent(1)) for index in range(devices)]
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for device_id, event in events:
+        engine.handle(device_id, event)
+    engine_bytes = (tracemalloc.get_traced_memory()[0] - before) / devices
+    tracemalloc.stop()
+    assert engine.get_stats()['active'] == devices
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    machines = []
+    for _ in range(devices):
+        machine = StateMachine(EventBus())
+        machine.set_state(SystemState.FINGERPRINT_OK, {'fingerprint_id': 1, 'user_name': '使用者1號'}, 'detect_user')
+        machines.append(machine)
+    machine_bytes = (tracemalloc.get_traced_memory()[0] - before) / devices
+    tracemalloc.stop()
+    return engine_bytes, machine_bytes
+
+
+def main():
+    """主函數"""
+    parser = argparse.ArgumentParser(description="多裝置流程引擎效能測試")
+    parser.add_argument('--sessions', type=int, nargs='+', default=[10, 100, 1000], help="同時進行的流程數（裝置數）")
+    parser.add_argument('--rounds', type=int, default=20, help="每台裝置的流程次數")
+    parser.add_argument('--journal', action='store_true', help="同時寫入流程記錄（記憶體數據庫）")
+    parser.add_argument('--seed', type=int, default=1, help="亂數種子")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    user_mapper = UserMapper(str(project_root / 'data' / 'user_config.json'))
+
+    print(f"{'流程數':>8}{'轉換/秒':>12}{'事件/秒':>12}{'完成':>10}{'峰值':>8}"
+          f"{'引擎 B/流程':>14}{'狀態機 B/流程':>16}")
+    for devices in args.sessions:
+        result = run_throughput(devices, args.rounds, user_mapper, args.journal, args.seed)
+        engine_bytes, machine_bytes = measure_memory(devices, user_mapper)
+        print(f"{devices:>8}{result['transitions'] / result['wall_s']:>12.0f}{result['events'] / result['wall_s']:>12.0f}"
+              f"{result['completed']:>10}{result['peak']:>8}{engine_bytes:>14.0f}{machine_bytes:>16.0f}")
+        if result['rejected']:
+            print(f"{'':>8}被拒絕的轉換: {result['rejected']}")
+
+
+if __name__ == "__main__":
+    main()
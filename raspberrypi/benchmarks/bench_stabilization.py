@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+提前穩定判定測試腳本
+將錄製檔（或模擬韌體判定規則產生的合成流程）依原始時間送入 StabilizationDetector，
+統計提前完成的比例、每次流程節省的時間，以及提前結果與韌體 WORKING,FINAL 的差距
+
+用法:
+    python3 benchmarks/bench_stabilization.py <錄製檔> [<錄製檔> ...]
+    python3 benchmarks/bench_stabilization.py --sessions 500 [--rate 2]
+"""
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+# 添加專案根目錄到Python路徑
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from code.protocol import (ProtocolDecoder, MEASURING, DetectUserEvent, WorkingStartEvent, WorkingStatusEvent,
+                           WorkingFinalEvent, WorkingErrorEvent)
+from code.binary_protocol import FrameDecoder, SYNC
+from code.serial_capture import read_capture
+from code.stabilization import StabilizationDetector
+
+# 韌體常數（BMduino_Integrated.ino）
+LOOP_INTERVAL = 0.05
+DATA_STABLE_TIME = 3.0
+WORK_MODE_TIMEOUT = 45.0
+
+
+def replay_capture(path: str, detector: StabilizationDetector) -> int:
+    """依錄製時間將錄製檔中的事件送入判定器，返回事件數"""
+    text_decoder = ProtocolDecoder()
+    frame_decoder = FrameDecoder(text_decoder)
+    count = 0
+    for timestamp, raw in read_capture(path):
+        if raw and raw[0] == SYNC:
+            events = frame_decoder.feed(raw)
+        else:
+            event = text_decoder.decode(raw)
+            events = [event] if event is not None else []
+        for event in events:
+            detector.feed(event, timestamp)
+            count += 1
+    return count
+
+
+def simulate_session(rng: random.Random, start: float, status_interval: float,
+                     true_hr: float, true_spo2: float):
+    """
+    模擬一次工作模式流程（依韌體的判定規則：心率與血氧都有數值後持續 3 秒才輸出 FINAL）
+
+    心率為最近 4 拍的平均，前幾拍帶有逐漸消失的偏差；偶爾有單次迴圈的心率超出範圍，
+    使韌體重新計時；血氧約每秒更新一次
+
+    Yields:
+        (時間, 事件)
+    """
+    fingerprint_id = rng.randint(1, 4)
+    hr_ready_at = rng.uniform(3, 12)
+    spo2_ready_at = rng.uniform(4, 10)
+    bias = rng.gauss(0, 8)
+
+    yield start, DetectUserEvent(fingerprint_id)
+    yield start, WorkingStartEvent()
+
+    beats = []
+    next_beat = hr_ready_at - 4 * 60 / true_hr
+    spo2_value = 0
+    next_spo2 = spo2_ready_at
+    stable_since = None
+    next_status = 0.0
+    elapsed = 0.0
+    while elapsed <= WORK_MODE_TIMEOUT:
+        if elapsed >= next_beat:
+            next_beat += 60 / true_hr
+            transient = bias * pow(2.718, -max(0.0, elapsed - hr_ready_at) / 3)
+            beats = (beats + [true_hr * (1 + rng.gauss(0, 0.04)) + transient])[-4:]
+        heart_rate = round(sum(beats) / len(beats)) if elapsed >= hr_ready_at and beats else 0
+        if heart_rate and rng.random() < 0.003:
+            heart_rate = 0
+        if elapsed >= next_spo2:
+            next_spo2 += 1.0
+            spo2_value = min(100, round(true_spo2 + rng.gauss(0, 0.7)))
+
+        if elapsed >= next_status:
+            next_status += status_interval
+            yield start + elapsed, WorkingStatusEvent(
+                rng.uniform(34.5, 35.5), rng.uniform(22, 24), heart_rate or MEASURING, spo2_value or MEASURING)
+
+        if heart_rate and spo2_value:
+            if stable_since is None:
+                stable_since = elapsed
+            elif elapsed - stable_since >= DATA_STABLE_TIME:
+                yield start + elapsed, WorkingFinalEvent(fingerprint_id, 35.0, 23.0, heart_rate, spo2_value)
+                return
+        else:
+            stable_since = None
+        elapsed += LOOP_INTERVAL
+    yield start + elapsed, WorkingErrorEvent('TIMEOUT')
+
+
+def main():
+    """主函數"""
+    parser = argparse.ArgumentParser(description="提前穩定判定測試")
+    parser.add_argument('captures', nargs='*', help="錄製檔路徑（未指定時使用合成流程）")
+    parser.add_argument('--sessions', type=int, default=500, help="合成流程數量")
+    parser.add_argument('--rate', type=float, default=2.0, help="合成流程的狀態回報頻率（Hz）")
+    parser.add_argument('--window', type=int, default=8, help="滾動視窗樣本數")
+    parser.add_argument('--min-samples', type=int, default=4, help="最少樣本數")
+    parser.add_argument('--hr-tolerance', type=float, default=3.0, help="心率容許誤差（BPM）")
+    parser.add_argument('--spo2-tolerance', type=float, default=1.0, help="血氧容許誤差（%）")
+    parser.add_argument('--seed', type=int, default=1, help="合成流程亂數種子")
+    args = parser.parse_args()
+
+    detector = StabilizationDetector(window=args.window, min_samples=args.min_samples,
+                                     heart_rate_tolerance=args.hr_tolerance,
+                                     spo2_tolerance=args.spo2_tolerance)
+    results = []
+    detector.register_callback(lambda event: results.append((detector.sessions, event)))
+
+    start = time.perf_counter()
+    if args.captures:
+        events = sum(replay_capture(path, detector) for path in args.captures)
+        truth = {}
+    else:
+        rng = random.Random(args.seed)
+        truth = {}
+        events = 0
+        timestamp = 0.0
+        for session in range(1, args.sessions + 1):
+            truth[session] = (rng.uniform(55, 110), rng.uniform(93, 99))
+            for timestamp, event in simulate_session(rng, timestamp + 30.0, 1.0 / args.rate, *truth[session]):
+                detector.feed(event, timestamp)
+                events += 1
+    elapsed = time.perf_counter() - start
+
+    stats = detector.get_stats()
+    print(f"事件: {events}，處理耗時 {elapsed:.3f} 秒（{events / elapsed:,.0f} 事件/秒）")
+    print(f"流程: {stats['sessions']}，提前完成: {stats['early_finals']}，韌體完成: {stats['firmware_finals']}，"
+          f"提前完成後韌體回報錯誤: {stats['contradicted']}")
+    if stats['session_seconds'] is not None:
+        print(f"韌體流程平均長度: {stats['session_seconds']:.2f} 秒")
+    saved = stats['saved_seconds']
+    if saved:
+        print(f"節省時間: 平均 {saved['mean']:.2f} 秒，中位數 {saved['p50']:.2f} 秒，最多 {saved['max']:.2f} 秒，"
+              f"合計 {saved['total']:.1f} 秒（佔韌體流程時間 {saved['fraction'] * 100:.1f}%）")
+        errors = stats['errors']
+        print(f"提前結果與韌體結果差距: 心率 平均 {errors['heart_rate_mean']:.2f} / 最大 {errors['heart_rate_max']:.0f} BPM，"
+              f"血氧 平均 {errors['spo2_mean']:.2f} / 最大 {errors['spo2_max']:.0f} %")
+
+    if truth:
+        # 合成流程有真實值：比較提前結果與韌體結果各自的誤差
+        early_errors = [[], []]
+        firmware_errors = [[], []]
+        for session, result in results:
+            true_hr, true_spo2 = truth[session]
+            target = early_errors if result.kind == 'working_early_final' else firmware_errors
+            target[0].append(abs(result.heart_rate - true_hr))
+            target[1].append(abs(result.spo2 - true_spo2))
+        for label, (hr_errors, spo2_errors) in (('提前結果', early_errors), ('韌體結果', firmware_errors)):
+            if hr_errors:
+                print(f"{label}相對真實值的平均誤差: 心率 {sum(hr_errors) / len(hr_errors):.2f} BPM，"
+                      f"血氧 {sum(spo2_errors) / len(spo2_errors):.2f} %（{len(hr_errors)} 次流程）")
+
+
+if __name__ == "__main__":
+    main()
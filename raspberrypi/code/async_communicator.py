@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+非同步串口通訊模組
+將串口檔案描述符註冊到 asyncio 事件迴圈，不需額外線程即可接收BMduino事件
+
+用法:
+    comm = AsyncBMduinoCommunicator("/dev/ttyACM0")
+    await comm.connect()
+    async for event in comm.events():
+        ...
+    ok = await comm.control_relay(1)   # 收到對應的 RELAY_OK 後才返回
+"""
+
+import asyncio
+import collections
+import os
+from typing import Optional, Iterable, AsyncIterator, Deque, Tuple, Set
+import logging
+
+import serial
+
+from code.serial_framer import LineFramer, ReaderStats
+from code.protocol import ProtocolDecoder, ProtocolEvent, RelayErrorEvent
+from code.reconnect import ReconnectBackoff
+
+logger = logging.getLogger(__name__)
+
+
+class _Subscription:
+    """一個 events() 迭代器的有界佇列（滿時丟棄最舊的事件）"""
+
+    def __init__(self, kinds: Optional[Set[str]], maxsize: int):
+        self.kinds = kinds
+        self.maxsize = maxsize
+        self.queue: Deque[Optional[ProtocolEvent]] = collections.deque()
+        self.waiter: Optional[asyncio.Future] = None
+        self.dropped = 0
+
+    def put(self, event: Optional[ProtocolEvent]):
+        if event is not None and self.kinds is not None and event.kind not in self.kinds:
+            return
+        if len(self.queue) >= self.maxsize:
+            self.queue.popleft()
+            self.dropped += 1
+        self.queue.append(event)
+        if self.waiter is not None and not self.waiter.done():
+            self.waiter.set_result(None)
+
+
+class AsyncBMduinoCommunicator:
+    """BMduino 非同步通訊類別"""
+
+    def __init__(self, port: str = "/dev/ttyACM0", baudrate: int = 115200,
+                 queue_size: int = 1000, reconnect_interval: float = 5.0):
+        """
+        初始化非同步串口通訊
+
+        Args:
+            port: 串口路徑
+            baudrate: 波特率
+            queue_size: 每個 events() 迭代器的佇列上限
+            reconnect_interval: 斷線後的重連間隔上限（秒，由指數退避逐步增加到此值）
+        """
+        self.port = port
+        self.baudrate = baudrate
+        self.queue_size = queue_size
+        self.reconnect_interval = reconnect_interval
+        self.backoff = ReconnectBackoff(maximum=reconnect_interval)
+
+        self.ser: Optional[serial.Serial] = None
+        self.connected = False
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._fd: Optional[int] = None
+        self._closing = False
+        self._reconnect_task: Optional[asyncio.Task] = None
+
+        self._rx_buffer = bytearray(4096)
+        self.framer = LineFramer()
+        self.decoder = ProtocolDecoder()
+        self.reader_stats = ReaderStats()
+
+        self._subscriptions: Set[_Subscription] = set()
+        # 等待回應的繼電器命令（依發送順序）：(繼電器編號, Future)
+        self._pending_relays: Deque[Tuple[int, asyncio.Future]] = collections.deque()
+        self._tx_buffer = bytearray()
+
+    # ========== 連線 ==========
+
+    async def connect(self) -> bool:
+        """
+        連接串口並將檔案描述符註冊到事件迴圈
+
+        Returns:
+            是否連接成功
+        """
+        self.loop = asyncio.get_running_loop()
+        self._closing = False
+        try:
+            self.ser = serial.Serial(self.port, self.baudrate, timeout=0, write_timeout=0)
+            self.ser.reset_input_buffer()
+            self._fd = self.ser.fileno()
+            os.set_blocking(self._fd, False)
+        except (serial.SerialException, OSError, ValueError) as e:
+            logger.error(f"串口連接失敗: {e}")
+            self.connected = False
+            return False
+
+        self.framer.reset()
+        self.reader_stats.reset()
+        self.loop.add_reader(self._fd, self._on_readable)
+        self.connected = True
+        logger.info(f"串口連接成功（非同步）: {self.port}")
+        return True
+
+    async def close(self):
+        """斷開串口連接並結束所有 events() 迭代器"""
+        self._closing = True
+        if self._reconnect_task:
+            self._reconnect_task.cancel()
+            self._reconnect_task = None
+        self._teardown()
+        for subscription in list(self._subscriptions):
+            subscription.put(None)
+        logger.info("串口已斷開（非同步）")
+
+    def _teardown(self):
+        """移除事件迴圈註冊並關閉串口"""
+        if self._fd is not None and self.loop is not None:
+            self.loop.remove_reader(self._fd)
+            self.loop.remove_writer(self._fd)
+        self._fd = None
+        if self.ser and self.ser.is_open:
+            self.ser.close()
+        self.connected = False
+        self._tx_buffer.clear()
+        while self._pending_relays:
+            _, future = self._pending_relays.popleft()
+            if not future.done():
+                future.set_result(False)
+
+    def _connection_lost(self, reason: str):
+        """讀寫失敗時關閉串口並排程重連"""
+        logger.error(f"串口錯誤: {reason}")
+        self._teardown()
+        if not self._closing and self._reconnect_task is None:
+            self._reconnect_task = self.loop.create_task(self._reconnect())
+
+    async def _reconnect(self):
+        """以指數退避重連直到成功或被關閉"""
+        self.backoff.reset()
+        try:
+            while not self._closing:
+                await asyncio.sleep(self.backoff.next_delay())
+                if await self.connect():
+                    return
+        finally:
+            self._reconnect_task = None
+
+    def is_connected(self) -> bool:
+        """檢查是否已連接"""
+        return self.connected
+
+    # ========== 接收 ==========
+
+    def _on_readable(self):
+        """檔案描述符可讀時由事件迴圈呼叫"""
+        try:
+            nbytes = os.readv(self._fd, [self._rx_buffer])
+        except BlockingIOError:
+            return
+        except OSError as e:
+            self._connection_lost(str(e))
+            return
+        if nbytes == 0:
+            self._connection_lost("裝置回報可讀但沒有數據（可能已斷開）")
+            return
+
+        lines = self.framer.feed(memoryview(self._rx_buffer)[:nbytes])
+        self.reader_stats.record_read(nbytes, len(lines))
+        for raw_line in lines:
+            event = self.decoder.decode(raw_line)
+            if event is not None:
+                self._dispatch(event)
+
+    def _dispatch(self, event: ProtocolEvent):
+        """將事件送到所有訂閱者並完成對應的繼電器命令"""
+        if event.kind == 'relay_ok' or event.kind == 'relay_error':
+            self._resolve_relay(event)
+        for subscription in self._subscriptions:
+            subscription.put(event)
+
+    def _resolve_relay(self, event):
+        """依發送順序將 RELAY_OK/RELAY_ERROR 對應到等待中的命令"""
+        # 移除已超時的命令
+        while self._pending_relays and self._pending_relays[0][1].done():
+            self._pending_relays.popleft()
+        if not self._pending_relays:
+            return
+
+        if isinstance(event, RelayErrorEvent):
+            # RELAY_ERROR 不帶編號，對應到最早送出的命令
+            relay_num, future = self._pending_relays.popleft()
+            logger.error(f"繼電器 {relay_num} 控制失敗: {event.error}")
+            future.set_result(False)
+            return
+
+        if not any(relay_num == event.relay_num for relay_num, _ in self._pending_relays):
+            logger.debug(f"收到沒有對應命令的回應: {event}")
+            return
+        while self._pending_relays:
+            relay_num, future = self._pending_relays.popleft()
+            if relay_num == event.relay_num:
+                if not future.done():
+                    future.set_result(True)
+                return
+            # 較早的命令沒有收到回應，代表回應已遺失
+            if not future.done():
+                logger.warning(f"繼電器 {relay_num} 的回應遺失")
+                future.set_result(False)
+
+    async def events(self, kinds: Optional[Iterable[str]] = None) -> AsyncIterator[ProtocolEvent]:
+        """
+        非同步迭代收到的事件
+
+        Args:
+            kinds: 只接收這些事件類型（None表示全部）
+
+        Yields:
+            事件物件（串口關閉時結束）
+        """
+        subscription = _Subscription(set(kinds) if kinds is not None else None, self.queue_size)
+        self._subscriptions.add(subscription)
+        try:
+            while True:
+                while subscription.queue:
+                    event = subscription.queue.popleft()
+                    if event is None:
+                        return
+                    yield event
+                subscription.waiter = asyncio.get_running_loop().create_future()
+                await subscription.waiter
+                subscription.waiter = None
+        finally:
+            self._subscriptions.discard(subscription)
+            if subscription.dropped:
+                logger.warning(f"事件迭代器佇列已滿，共丟棄 {subscription.dropped} 個事件")
+
+    # ========== 發送 ==========
+
+    def _write(self, data: bytes):
+        """非阻塞寫入，寫不完的部分等檔案描述符可寫時再送出"""
+        if self._tx_buffer:
+            self._tx_buffer += data
+            return
+        try:
+            written = os.write(self._fd, data)
+        except BlockingIOError:
+            written = 0
+        if written < len(data):
+            self._tx_buffer += data[written:]
+            self.loop.add_writer(self._fd, self._on_writable)
+
+    def _on_writable(self):
+        """檔案描述符可寫時送出剩餘數據"""
+        try:
+            written = os.write(self._fd, self._tx_buffer)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            self._connection_lost(str(e))
+            return
+        del self._tx_buffer[:written]
+        if not self._tx_buffer:
+            self.loop.remove_writer(self._fd)
+
+    async def control_relay(self, relay_num: int, timeout: float = 3.0) -> bool:
+        """
+        控制繼電器並等待BMduino回應
+
+        Args:
+            relay_num: 繼電器編號 (1-4)
+            timeout: 等待 RELAY_OK 的最長時間（秒）
+
+        Returns:
+            收到對應的 RELAY_OK 返回True；RELAY_ERROR、超時或未連接返回False
+        """
+        if relay_num < 1 or relay_num > 4:
+            logger.error(f"無效的繼電器編號: {relay_num}")
+            return False
+
+        if not self.connected:
+            logger.error("串口未連接，無法發送命令")
+            return False
+
+        future = self.loop.create_future()
+        self._pending_relays.append((relay_num, future))
+        try:
+            self._write(f"RELAY,{relay_num}\n".encode('utf-8'))
+        except OSError as e:
+            logger.error(f"發送命令失敗: {e}")
+            self._connection_lost(str(e))
+            return False
+        logger.info(f"發送繼電器控制命令: RELAY,{relay_num}")
+
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"繼電器 {relay_num} 等待回應超時")
+            if not future.done():
+                future.set_result(False)
+            return False
@@ -0,0 +1,444 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+二進位分幀協議模組
+連線時以 PROTO,BIN 命令協商，韌體回應 PROTO_OK,BIN 後改以二進位幀輸出；
+舊版韌體不認得此命令（RELAY_ERROR,INVALID_COMMAND）或沒有回應時維持文字協議
+
+幀格式（多位元組欄位皆為小端序）:
+    同步位元組 0xA5 | 類型 (1) | 長度 (1) | 資料 (長度) | CRC16 (2)
+CRC16 為 CRC-16/CCITT-FALSE（多項式 0x1021，初始值 0xFFFF），涵蓋類型、長度與資料
+類型最高位元（0x80）表示資料在基本欄位之後附加了序號 (uint16) 與 millis() (uint32)
+
+解碼時以 struct.unpack_from 直接在接收緩衝區上讀取欄位，不切割、不產生中間字串
+"""
+
+import struct
+from binascii import crc_hqx
+from typing import Optional, List, Dict, Callable, Tuple
+import logging
+
+from code.protocol import (
+    ProtocolDecoder, ProtocolEvent, MEASURING,
+    StandbyEvent, DetectUserEvent, WorkingStartEvent, WorkingStatusEvent, WorkingFinalEvent,
+    WorkingErrorEvent, RelayOkEvent, RelayErrorEvent, ModeEvent, RateOkEvent, RateErrorEvent, PpgEvent,
+)
+
+logger = logging.getLogger(__name__)
+
+SYNC = 0xA5
+HEADER_SIZE = 3
+CRC_SIZE = 2
+
+# 協商命令與回應
+NEGOTIATE_COMMAND = b'PROTO,BIN\n'
+TEXT_COMMAND = b'PROTO,TEXT\n'
+NEGOTIATE_ACK = b'PROTO_OK,BIN'
+
+# 幀類型
+FRAME_STANDBY = 0x01
+FRAME_DETECT_USER = 0x02
+FRAME_WORKING_START = 0x03
+FRAME_WORKING_STATUS = 0x04
+FRAME_WORKING_FINAL = 0x05
+FRAME_WORKING_ERROR = 0x06
+FRAME_RELAY_OK = 0x07
+FRAME_RELAY_ERROR = 0x08
+FRAME_MODE = 0x09
+FRAME_RATE_OK = 0x0A
+FRAME_RATE_ERROR = 0x0B
+FRAME_PPG = 0x0C
+FRAME_TEXT = 0x7F  # 文字訊息（UTF-8，依文字協議解碼）
+STAMP_FLAG = 0x80  # 附加序號與時間戳記的幀
+
+# 工作模式狀態中心率/血氧尚在測量的標記
+VITAL_MEASURING = 0xFF
+
+# 錯誤碼/模式碼與字串對照
+WORKING_ERRORS = {1: 'NO_FINGER', 2: 'TIMEOUT', 3: 'NO_DATA'}
+RELAY_ERRORS = {1: 'INVALID_NUMBER', 2: 'INVALID_COMMAND'}
+MODES = {1: 'RECEIVE', 2: 'STANDBY'}
+REPORT_MODE_CODES = {1: 'STANDBY', 2: 'WORKING', 3: 'PPG'}
+RATE_ERRORS = {1: 'INVALID_MODE', 2: 'INVALID_RATE'}
+
+# 溫度以 0.01°C 為單位的 int16 傳送
+_VITALS = struct.Struct('<hhBB')
+_FINAL = struct.Struct('<HhhBB')
+_U8 = struct.Struct('<B')
+_U16 = struct.Struct('<H')
+_RATE = struct.Struct('<BI')
+_PPG_HEADER = struct.Struct('<IB')  # 第一個樣本編號、樣本數；之後每個樣本為 (紅光, 紅外光) uint32
+_PPG_SAMPLE_SIZE = 8
+_CRC = struct.Struct('<H')
+_STAMP = struct.Struct('<HI')
+
+_WORKING_START = WorkingStartEvent()
+
+
+def crc16(data, crc: int = 0xFFFF) -> int:
+    """
+    計算 CRC-16/CCITT-FALSE
+
+    Args:
+        data: bytes、bytearray 或 memoryview
+        crc: 初始值
+
+    Returns:
+        CRC 值
+    """
+    return crc_hqx(data, crc)
+
+
+# ========== 解碼 ==========
+
+# 心率/血氧位元組 → 事件欄位值（0xFF 為 MEASURING），預先建好避免每幀判斷
+_VITAL_VALUES = tuple(range(256))[:VITAL_MEASURING] + (MEASURING,)
+
+
+def _decode_standby(buffer, offset: int) -> StandbyEvent:
+    object_temp, ambient_temp, heart_rate, spo2 = _VITALS.unpack_from(buffer, offset)
+    return StandbyEvent(object_temp / 100, ambient_temp / 100, heart_rate or None, spo2 or None)
+
+
+def _decode_detect_user(buffer, offset: int) -> DetectUserEvent:
+    return DetectUserEvent(_U16.unpack_from(buffer, offset)[0])
+
+
+def _decode_working_start(buffer, offset: int):
+    return _WORKING_START
+
+
+def _decode_working_status(buffer, offset: int) -> WorkingStatusEvent:
+    object_temp, ambient_temp, heart_rate, spo2 = _VITALS.unpack_from(buffer, offset)
+    return WorkingStatusEvent(object_temp / 100, ambient_temp / 100,
+                              _VITAL_VALUES[heart_rate], _VITAL_VALUES[spo2])
+
+
+def _decode_working_final(buffer, offset: int) -> WorkingFinalEvent:
+    fingerprint_id, object_temp, ambient_temp, heart_rate, spo2 = _FINAL.unpack_from(buffer, offset)
+    return WorkingFinalEvent(fingerprint_id, object_temp / 100, ambient_temp / 100, heart_rate, spo2)
+
+
+def _decode_working_error(buffer, offset: int) -> WorkingErrorEvent:
+    return WorkingErrorEvent(WORKING_ERRORS[_U8.unpack_from(buffer, offset)[0]])
+
+
+def _decode_relay_ok(buffer, offset: int) -> RelayOkEvent:
+    return RelayOkEvent(_U8.unpack_from(buffer, offset)[0])
+
+
+def _decode_relay_error(buffer, offset: int) -> RelayErrorEvent:
+    return RelayErrorEvent(RELAY_ERRORS[_U8.unpack_from(buffer, offset)[0]])
+
+
+def _decode_mode(buffer, offset: int) -> ModeEvent:
+    return ModeEvent(MODES[_U8.unpack_from(buffer, offset)[0]])
+
+
+def _decode_rate_ok(buffer, offset: int) -> RateOkEvent:
+    mode, interval_ms = _RATE.unpack_from(buffer, offset)
+    return RateOkEvent(REPORT_MODE_CODES[mode], interval_ms)
+
+
+def _decode_rate_error(buffer, offset: int) -> RateErrorEvent:
+    return RateErrorEvent(RATE_ERRORS[_U8.unpack_from(buffer, offset)[0]])
+
+
+def _ppg_size(buffer, offset: int) -> int:
+    return _PPG_HEADER.size + buffer[offset + 4] * _PPG_SAMPLE_SIZE
+
+
+def _decode_ppg(buffer, offset: int) -> PpgEvent:
+    start_index, count = _PPG_HEADER.unpack_from(buffer, offset)
+    begin = offset + _PPG_HEADER.size
+    samples = bytes(buffer[begin:begin + count * _PPG_SAMPLE_SIZE])
+    if len(samples) != count * _PPG_SAMPLE_SIZE:
+        raise struct.error(f"PPG 樣本數 {count} 超出幀資料長度")
+    return PpgEvent(start_index, samples)
+
+
+# 幀類型 → (資料最小長度, 資料最大長度, 解碼函數)
+# 資料可以比最小長度長（供之後在尾端附加欄位），最大長度用來及早排除損毀的長度欄位
+FRAME_TABLE: Dict[int, Tuple[int, int, Callable]] = {
+    FRAME_STANDBY: (_VITALS.size, 32, _decode_standby),
+    FRAME_DETECT_USER: (_U16.size, 32, _decode_detect_user),
+    FRAME_WORKING_START: (0, 32, _decode_working_start),
+    FRAME_WORKING_STATUS: (_VITALS.size, 32, _decode_working_status),
+    FRAME_WORKING_FINAL: (_FINAL.size, 32, _decode_working_final),
+    FRAME_WORKING_ERROR: (_U8.size, 32, _decode_working_error),
+    FRAME_RELAY_OK: (_U8.size, 32, _decode_relay_ok),
+    FRAME_RELAY_ERROR: (_U8.size, 32, _decode_relay_error),
+    FRAME_MODE: (_U8.size, 32, _decode_mode),
+    FRAME_RATE_OK: (_RATE.size, 32, _decode_rate_ok),
+    FRAME_RATE_ERROR: (_U8.size, 32, _decode_rate_error),
+    FRAME_PPG: (_PPG_HEADER.size, 255, _decode_ppg),
+    FRAME_TEXT: (0, 255, None),
+}
+
+
+def _stamped(base_size, handler: Callable) -> Callable:
+    """
+    包裝解碼函數：讀出基本欄位後，再讀出緊接在後的序號與時間戳記
+
+    Args:
+        base_size: 基本欄位長度，長度不固定的幀（PPG）為 (buffer, offset) -> 長度 的函數
+        handler: 基本欄位的解碼函數
+    """
+    if callable(base_size):
+        def decode(buffer, offset: int):
+            seq, device_ms = _STAMP.unpack_from(buffer, offset + base_size(buffer, offset))
+            return handler(buffer, offset)._replace(seq=seq, device_ms=device_ms)
+    else:
+        def decode(buffer, offset: int):
+            seq, device_ms = _STAMP.unpack_from(buffer, offset + base_size)
+            return handler(buffer, offset)._replace(seq=seq, device_ms=device_ms)
+    return decode
+
+
+# 長度不固定的幀類型：基本欄位長度由資料內容決定
+_VARIABLE_SIZES = {FRAME_PPG: _ppg_size}
+
+# 附加時間戳記的幀類型使用獨立的表項，解碼迴圈不需要額外判斷
+for _type, (_min_len, _max_len, _handler) in list(FRAME_TABLE.items()):
+    if _handler is not None:
+        FRAME_TABLE[_type | STAMP_FLAG] = (_min_len + _STAMP.size, _max_len,
+                                           _stamped(_VARIABLE_SIZES.get(_type, _min_len), _handler))
+
+
+class FrameDecoder:
+    """二進位幀解碼器：累積位元組，一次解出所有完整且CRC正確的幀"""
+
+    def __init__(self, text_decoder: Optional[ProtocolDecoder] = None):
+        """
+        初始化幀解碼器
+
+        Args:
+            text_decoder: 解碼文字幀用的文字協議解碼器
+        """
+        self.table = FRAME_TABLE
+        self.text_decoder = text_decoder or ProtocolDecoder()
+        self._buffer = bytearray()
+        self.frames = 0
+        self.crc_errors = 0
+        self.bad_headers = 0
+        self.skipped_bytes = 0
+        self.malformed = 0
+
+    def reset(self):
+        """清空緩衝區（重新連線時使用）"""
+        self._buffer.clear()
+
+    def feed(self, data, raw_frames: Optional[List[bytes]] = None) -> List[ProtocolEvent]:
+        """
+        餵入一段位元組並解出所有完整的幀
+
+        Args:
+            data: bytes、bytearray 或 memoryview
+            raw_frames: 若提供，將每個正確幀的原始位元組加入此列表（供錄製使用）
+
+        Returns:
+            事件物件列表
+        """
+        buffer = self._buffer
+        buffer += data
+        events = []
+        append = events.append
+        find = buffer.find
+        table_get = self.table.get
+        unpack_crc = _CRC.unpack_from
+        offset = 0
+        size = len(buffer)
+        frames = skipped = bad_headers = crc_errors = 0
+        with memoryview(buffer) as view:
+            while True:
+                start = find(SYNC, offset)
+                if start < 0:
+                    skipped += size - offset
+                    offset = size
+                    break
+                skipped += start - offset
+                payload = start + HEADER_SIZE
+                if payload > size:
+                    offset = start
+                    break
+
+                length = buffer[start + 2]
+                entry = table_get(buffer[start + 1])
+                if entry is None or not entry[0] <= length <= entry[1]:
+                    # 不是幀開頭（數據中剛好出現同步位元組）或標頭損毀
+                    bad_headers += 1
+                    offset = start + 1
+                    continue
+
+                crc_at = payload + length
+                end = crc_at + CRC_SIZE
+                if end > size:
+                    offset = start
+                    break
+                if crc_hqx(view[start + 1:crc_at], 0xFFFF) != unpack_crc(buffer, crc_at)[0]:
+                    crc_errors += 1
+                    offset = start + 1
+                    continue
+
+                frames += 1
+                handler = entry[2]
+                if handler is not None:
+                    try:
+                        append(handler(view, payload))
+                    except (KeyError, struct.error) as e:
+                        self._malformed(view, payload, length, e)
+                else:
+                    event = self.text_decoder.decode(bytes(view[payload:crc_at]))
+                    if event is not None:
+                        append(event)
+                if raw_frames is not None:
+                    raw_frames.append(bytes(view[start:end]))
+                offset = end
+        del buffer[:offset]
+        self.frames += frames
+        self.skipped_bytes += skipped
+        self.bad_headers += bad_headers
+        self.crc_errors += crc_errors
+        return events
+
+    def decode_frame(self, frame) -> Optional[ProtocolEvent]:
+        """
+        解碼一個完整的幀（重播錄製檔時使用）
+
+        Args:
+            frame: 含同步位元組與CRC的完整幀
+
+        Returns:
+            事件物件，格式或CRC錯誤時返回None
+        """
+        if len(frame) < HEADER_SIZE + CRC_SIZE or frame[0] != SYNC:
+            self.malformed += 1
+            return None
+        entry = self.table.get(frame[1])
+        length = frame[2]
+        if entry is None or len(frame) != HEADER_SIZE + length + CRC_SIZE:
+            self.bad_headers += 1
+            return None
+        if crc16(memoryview(frame)[1:-CRC_SIZE]) != _CRC.unpack_from(frame, len(frame) - CRC_SIZE)[0]:
+            self.crc_errors += 1
+            return None
+        self.frames += 1
+        return self._decode(entry[2], memoryview(frame), HEADER_SIZE, length)
+
+    def _decode(self, handler: Optional[Callable], view: memoryview, offset: int, length: int):
+        """解碼幀資料（文字幀交給文字協議解碼器）"""
+        if handler is None:
+            return self.text_decoder.decode(bytes(view[offset:offset + length]))
+        try:
+            return handler(view, offset)
+        except (KeyError, struct.error) as e:
+            self._malformed(view, offset, length, e)
+            return None
+
+    def _malformed(self, view: memoryview, offset: int, length: int, error: Exception):
+        """記錄無法解析的幀資料"""
+        self.malformed += 1
+        logger.warning(f"幀資料解析錯誤: {bytes(view[offset:offset + length]).hex()}, 錯誤: {error}")
+
+    def get_stats(self) -> Dict[str, int]:
+        """獲取解碼統計"""
+        return {
+            'frames': self.frames,
+            'crc_errors': self.crc_errors,
+            'bad_headers': self.bad_headers,
+            'skipped_bytes': self.skipped_bytes,
+            'frame_malformed': self.malformed,
+        }
+
+
+# ========== 編碼（虛擬BMduino與測試工具使用） ==========
+
+def _centi(value: float) -> int:
+    return int(round(value * 100))
+
+
+def _vital_byte(value) -> int:
+    return VITAL_MEASURING if value == MEASURING else (value or 0)
+
+
+def _reverse(table: Dict[int, str]) -> Dict[str, int]:
+    return {text: code for code, text in table.items()}
+
+
+_WORKING_ERROR_CODES = _reverse(WORKING_ERRORS)
+_RELAY_ERROR_CODES = _reverse(RELAY_ERRORS)
+_MODE_CODES = _reverse(MODES)
+_REPORT_MODE_CODES = _reverse(REPORT_MODE_CODES)
+_RATE_ERROR_CODES = _reverse(RATE_ERRORS)
+
+
+def encode_frame(frame_type: int, payload: bytes = b'') -> bytes:
+    """
+    將資料包裝為完整的幀
+
+    Args:
+        frame_type: 幀類型
+        payload: 資料（最多255位元組）
+
+    Returns:
+        含同步位元組與CRC的幀
+    """
+    body = bytes((frame_type, len(payload))) + payload
+    return bytes((SYNC,)) + body + _CRC.pack(crc16(body))
+
+
+def encode_event(event: ProtocolEvent) -> bytes:
+    """
+    將事件物件編碼為幀
+
+    Args:
+        event: code.protocol 的事件物件（seq 不為 None 時附加序號與時間戳記）
+
+    Returns:
+        幀位元組
+    """
+    frame_type, payload = _encode_payload(event)
+    if event.seq is not None:
+        frame_type |= STAMP_FLAG
+        payload += _STAMP.pack(event.seq, event.device_ms or 0)
+    return encode_frame(frame_type, payload)
+
+
+def _encode_payload(event: ProtocolEvent) -> Tuple[int, bytes]:
+    """將事件物件編碼為幀類型與基本欄位"""
+    kind = event.kind
+    if kind == 'standby':
+        return FRAME_STANDBY, _VITALS.pack(
+            _centi(event.object_temp), _centi(event.ambient_temp), event.heart_rate or 0, event.spo2 or 0)
+    if kind == 'detect_user':
+        return FRAME_DETECT_USER, _U16.pack(event.fingerprint_id)
+    if kind == 'working_start':
+        return FRAME_WORKING_START, b''
+    if kind == 'working_status':
+        return FRAME_WORKING_STATUS, _VITALS.pack(
+            _centi(event.object_temp), _centi(event.ambient_temp),
+            _vital_byte(event.heart_rate), _vital_byte(event.spo2))
+    if kind == 'working_final':
+        return FRAME_WORKING_FINAL, _FINAL.pack(
+            event.fingerprint_id, _centi(event.object_temp), _centi(event.ambient_temp),
+            event.heart_rate, event.spo2)
+    if kind == 'working_error':
+        return FRAME_WORKING_ERROR, _U8.pack(_WORKING_ERROR_CODES[event.error])
+    if kind == 'relay_ok':
+        return FRAME_RELAY_OK, _U8.pack(event.relay_num)
+    if kind == 'relay_error':
+        return FRAME_RELAY_ERROR, _U8.pack(_RELAY_ERROR_CODES[event.error])
+    if kind == 'mode':
+        return FRAME_MODE, _U8.pack(_MODE_CODES[event.mode])
+    if kind == 'rate_ok':
+        return FRAME_RATE_OK, _RATE.pack(_REPORT_MODE_CODES[event.mode], event.interval_ms)
+    if kind == 'rate_error':
+        return FRAME_RATE_ERROR, _U8.pack(_RATE_ERROR_CODES[event.error])
+    if kind == 'ppg':
+        return FRAME_PPG, _PPG_HEADER.pack(event.start_index, event.count) + event.samples
+    raise ValueError(f"無法編碼的事件類型: {kind}")
+
+
+def encode_text(line: bytes) -> bytes:
+    """將一行文字訊息包裝為文字幀"""
+    return encode_frame(FRAME_TEXT, line[:255])
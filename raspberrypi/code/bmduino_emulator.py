@@ -0,0 +1,697 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+虛擬BMduino模擬器
+透過虛擬終端（pty）模擬 BMduino_Integrated.ino 的完整通訊協議，
+BMduinoCommunicator 只需將 port 指向模擬器提供的路徑即可連線，不需修改任何程式
+
+支援：
+- 待機模式 STANDBY 定時回報
+- 指紋觸發的工作模式（WORKING,START / 狀態更新 / FINAL / NO_FINGER / TIMEOUT / NO_DATA）
+- 接收模式 RELAY 命令（MODE,RECEIVE / RELAY_OK / RELAY_ERROR / MODE,STANDBY）
+- 可調整的回報速率與時間倍率，以及丟行、損毀、停頓等故障注入
+- PROTO,BIN 協商後改以二進位幀輸出（可關閉以模擬舊版韌體）
+- RATE,STANDBY|WORKING,頻率 調整回報頻率（0為不主動回報），READ 立即回報一次目前數據
+- RATE,PPG,50|100 以批次串流合成的 MAX30102 原始波形（工作模式流程使用該流程的心率與血氧）
+- STAMP,ON 後每則訊息附加序號與 millis() 時間戳記（丟行時序號照常遞增，可用來驗證遺失統計）
+
+用法: python3 -m code.bmduino_emulator [--speed 1] [--session-interval 20] [--link /tmp/ttyBMduino]
+"""
+
+import os
+import pty
+import random
+import select
+import threading
+import time
+import tty
+from typing import Optional, Dict, List
+import logging
+
+from code.protocol import ProtocolDecoder, SEQ_MODULO, DEVICE_MS_MODULO, MAX_REPORT_RATE, PPG_RATES
+from code.ppg_pipeline import PpgSynthesizer
+from code.binary_protocol import encode_event, encode_text
+
+logger = logging.getLogger(__name__)
+
+# 工作模式結果
+OUTCOME_FINAL = 'final'
+OUTCOME_NO_FINGER = 'no_finger'
+OUTCOME_TIMEOUT = 'timeout'
+OUTCOME_NO_DATA = 'no_data'
+OUTCOMES = (OUTCOME_FINAL, OUTCOME_NO_FINGER, OUTCOME_TIMEOUT, OUTCOME_NO_DATA)
+
+# 模式
+MODE_STANDBY = 'standby'
+MODE_WORKING = 'working'
+MODE_RECEIVE = 'receive'
+
+# 每個 PPG 批次的樣本數（與韌體 PPG_BATCH 相同）
+PPG_BATCH = 10
+
+
+class EmulatedSession:
+    """一次模擬的工作模式流程"""
+
+    def __init__(self, fingerprint_id: int, outcome: str, heart_rate: int, spo2: int,
+                 hr_ready_after: float, spo2_ready_after: float):
+        """
+        初始化流程
+
+        Args:
+            fingerprint_id: 指紋ID
+            outcome: 流程結果（final / no_finger / timeout / no_data）
+            heart_rate: 最終心率
+            spo2: 最終血氧
+            hr_ready_after: 開始後多久測到心率（秒，模擬時間）
+            spo2_ready_after: 開始後多久測到血氧（秒，模擬時間）
+        """
+        self.fingerprint_id = fingerprint_id
+        self.outcome = outcome
+        self.heart_rate = heart_rate
+        self.spo2 = spo2
+        self.hr_ready_after = hr_ready_after
+        self.spo2_ready_after = spo2_ready_after
+        self.started_at = 0.0
+        self.next_status = 0.0
+        self.stable_since: Optional[float] = None
+
+
+class BMduinoEmulator:
+    """虛擬BMduino"""
+
+    def __init__(self, speed: float = 1.0,
+                 standby_interval: float = 1.0,
+                 status_interval: float = 1.0,
+                 working_timeout: float = 45.0,
+                 stable_time: float = 3.0,
+                 finger_placement_time: float = 3.0,
+                 no_finger_time: float = 3.0,
+                 relay_hold: float = 1.0,
+                 session_interval: float = 0.0,
+                 outcome_weights: Optional[Dict[str, float]] = None,
+                 drop_rate: float = 0.0,
+                 corrupt_rate: float = 0.0,
+                 boot_banner: bool = True,
+                 link: Optional[str] = None,
+                 seed: Optional[int] = None,
+                 binary_protocol: bool = True,
+                 stamps: bool = True,
+                 telemetry_commands: bool = True):
+        """
+        初始化模擬器
+
+        Args:
+            speed: 時間倍率（所有間隔除以此值，100表示快100倍）
+            standby_interval: 待機模式回報間隔（秒）
+            status_interval: 工作模式狀態回報間隔（秒）
+            working_timeout: 工作模式超時時間（秒）
+            stable_time: 數據穩定多久後輸出 FINAL（秒）
+            finger_placement_time: 放置手指的緩衝時間（秒）
+            no_finger_time: 緩衝時間後沒有手指多久輸出 NO_FINGER（秒）
+            relay_hold: 繼電器開啟時間（秒）
+            session_interval: 自動觸發指紋流程的間隔（秒，0表示不自動觸發）
+            outcome_weights: 自動觸發流程的結果權重，如 {'final': 0.9, 'timeout': 0.1}
+            drop_rate: 每行被丟棄的機率（故障注入）
+            corrupt_rate: 每行被損毀的機率（故障注入）
+            boot_banner: 連線時是否輸出開機訊息
+            link: 建立指向虛擬終端的符號連結路徑（如 /tmp/ttyBMduino）
+            seed: 亂數種子
+            binary_protocol: 是否支援 PROTO,BIN 協商（False 模擬舊版韌體）
+            stamps: 是否支援 STAMP,ON 命令（False 模擬舊版韌體）
+            telemetry_commands: 是否支援 RATE / READ 命令（False 模擬舊版韌體）
+        """
+        if speed <= 0:
+            raise ValueError("時間倍率必須大於0")
+        self.speed = speed
+        self.standby_interval = standby_interval
+        self.status_interval = status_interval
+        self.working_timeout = working_timeout
+        self.stable_time = stable_time
+        self.finger_placement_time = finger_placement_time
+        self.no_finger_time = no_finger_time
+        self.relay_hold = relay_hold
+        self.session_interval = session_interval
+        self.outcome_weights = outcome_weights or {OUTCOME_FINAL: 1.0}
+        self.drop_rate = drop_rate
+        self.corrupt_rate = corrupt_rate
+        self.boot_banner = boot_banner
+        self.link = link
+        self.random = random.Random(seed)
+
+        self.master_fd: Optional[int] = None
+        self.slave_fd: Optional[int] = None
+        self.port: Optional[str] = None
+        self.running = False
+        self.thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+        # 模擬狀態
+        self.mode = MODE_STANDBY
+        self.session: Optional[EmulatedSession] = None
+        self.pending_sessions: List[EmulatedSession] = []
+        self.pending_commands: List[bytes] = []
+        self.relay_pending: Optional[int] = None
+        self.relay_done_at = 0.0
+        self.relay_states = [False, False, False, False]
+        self.next_standby = 0.0
+        self.next_auto_session = 0.0
+        self.stalled_until = 0.0
+        self._rx_buffer = bytearray()
+        self.object_temp = 25.5
+        self.ambient_temp = 23.2
+
+        # 命令表：命令名稱 → 處理函數
+        self.commands = {
+            b'RELAY': self._cmd_relay,
+        }
+        # 遙測與連線協商命令：任何模式下立即處理，不經過接收模式（與韌體相同，
+        # 主機在工作模式中連線時協商不會被保留到流程結束）
+        self.telemetry_commands = {}
+        if binary_protocol:
+            self.telemetry_commands[b'PROTO'] = self._cmd_proto
+        if stamps:
+            self.telemetry_commands[b'STAMP'] = self._cmd_stamp
+        if telemetry_commands:
+            self.telemetry_commands[b'RATE'] = self._cmd_rate
+            self.telemetry_commands[b'READ'] = self._cmd_read
+        self.pending_telemetry: List[bytes] = []
+        self.read_requested = False
+
+        # PPG 原始波形串流（RATE,PPG 開啟，0 表示關閉）
+        self.ppg_rate = 0
+        self.next_ppg = float('inf')
+        self.ppg_synth: Optional[PpgSynthesizer] = None
+
+        # 二進位協議（每次重新插入時回到文字協議，與韌體相同）
+        self.binary = False
+        self._line_decoder = ProtocolDecoder()
+
+        # 序號與時間戳記（millis() 以實際時間計算，從建立模擬器起算）
+        self.stamping = False
+        self.sequence = 0
+        self._boot_time = time.monotonic()
+
+        # 統計
+        self.stats = {
+            'lines_sent': 0,
+            'lines_dropped': 0,
+            'lines_corrupted': 0,
+            'overflow_drops': 0,
+            'commands': 0,
+            'relays': 0,
+            'sessions': 0,
+            'reads': 0,
+            'ppg_batches': 0,
+        }
+
+    # ========== 生命週期 ==========
+
+    def open(self) -> str:
+        """
+        建立虛擬終端
+
+        Returns:
+            供 BMduinoCommunicator 連線的串口路徑
+        """
+        self.master_fd, self.slave_fd = pty.openpty()
+        self.binary = False
+        self.stamping = False
+        tty.setraw(self.slave_fd)
+        os.set_blocking(self.master_fd, False)
+        self.port = os.ttyname(self.slave_fd)
+        if self.link:
+            if os.path.lexists(self.link):
+                os.unlink(self.link)
+            os.symlink(self.port, self.link)
+        logger.info(f"虛擬BMduino已建立: {self.link or self.port}")
+        return self.link or self.port
+
+    def start(self) -> str:
+        """
+        建立虛擬終端並在背景線程中開始運行
+
+        Returns:
+            串口路徑
+        """
+        if self.master_fd is None:
+            self.open()
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        return self.link or self.port
+
+    def stop(self):
+        """停止運行並關閉虛擬終端"""
+        self.running = False
+        if self.thread:
+            self.thread.join(timeout=2)
+            self.thread = None
+        self.close()
+
+    def close(self):
+        """關閉虛擬終端（模擬USB拔除）"""
+        for fd in (self.master_fd, self.slave_fd):
+            if fd is not None:
+                try:
+                    os.close(fd)
+                except OSError:
+                    pass
+        self.master_fd = self.slave_fd = None
+        if self.link and os.path.islink(self.link):
+            os.unlink(self.link)
+
+    # ========== 控制介面 ==========
+
+    def trigger_fingerprint(self, fingerprint_id: int = 1, outcome: str = OUTCOME_FINAL,
+                            heart_rate: Optional[int] = None, spo2: Optional[int] = None):
+        """
+        模擬一次指紋辨識成功並排入工作模式流程
+
+        Args:
+            fingerprint_id: 指紋ID
+            outcome: 流程結果（final / no_finger / timeout / no_data）
+            heart_rate: 最終心率，None表示隨機
+            spo2: 最終血氧，None表示隨機
+        """
+        if outcome not in OUTCOMES:
+            raise ValueError(f"未知的流程結果: {outcome}")
+        session = EmulatedSession(
+            fingerprint_id=fingerprint_id,
+            outcome=outcome,
+            heart_rate=heart_rate if heart_rate is not None else self.random.randint(60, 100),
+            spo2=spo2 if spo2 is not None else self.random.randint(94, 99),
+            hr_ready_after=self.random.uniform(4.0, 10.0),
+            spo2_ready_after=self.random.uniform(2.0, 6.0)
+        )
+        with self._lock:
+            self.pending_sessions.append(session)
+
+    def stall(self, seconds: float):
+        """
+        模擬裝置停頓（停止輸出與處理命令）
+
+        Args:
+            seconds: 停頓時間（實際秒數）
+        """
+        self.stalled_until = time.monotonic() + seconds
+
+    def inject_line(self, line: str):
+        """
+        直接輸出一行任意內容（用於測試雜訊或未知訊息）
+
+        Args:
+            line: 要輸出的內容
+        """
+        self._emit(line.encode('utf-8'), faults=False, stamp=False)
+
+    def get_stats(self) -> Dict:
+        """獲取統計"""
+        stats = dict(self.stats)
+        stats['mode'] = self.mode
+        return stats
+
+    # ========== 主迴圈 ==========
+
+    def _scaled(self, seconds: float) -> float:
+        """將模擬時間換算為實際時間"""
+        return seconds / self.speed
+
+    def _run(self):
+        """主迴圈（在獨立線程中運行）"""
+        now = time.monotonic()
+        self.next_standby = now
+        self.next_auto_session = now + self._scaled(self.session_interval)
+        if self.boot_banner:
+            for line in ("========================================", "BMduino 整合系統啟動",
+                         "系統初始化完成", "進入待機模式"):
+                self._emit(line.encode('utf-8'), faults=False)
+
+        while self.running and self.master_fd is not None:
+            try:
+                ready, _, _ = select.select([self.master_fd], [], [], self._next_wait())
+                if ready:
+                    self._read_commands()
+                self._tick(time.monotonic())
+            except OSError as e:
+                logger.warning(f"虛擬終端錯誤: {e}")
+                time.sleep(0.05)
+
+    def _next_wait(self) -> float:
+        """計算距離下一個排程事件的等待時間"""
+        now = time.monotonic()
+        deadlines = [self.next_standby, self.stalled_until, self.next_ppg]
+        if self.session:
+            deadlines.append(self.session.next_status)
+        if self.relay_pending is not None:
+            deadlines.append(self.relay_done_at)
+        if self.session_interval > 0:
+            deadlines.append(self.next_auto_session)
+        future = [d - now for d in deadlines if d > now]
+        wait = min(future) if future else 0.0
+        if self.pending_sessions or self.pending_commands or self.pending_telemetry:
+            wait = 0.0
+        return min(max(wait, 0.0), 0.1)
+
+    def _read_commands(self):
+        """讀取主機傳來的命令"""
+        try:
+            data = os.read(self.master_fd, 4096)
+        except BlockingIOError:
+            return
+        self._rx_buffer += data
+        while True:
+            end = self._rx_buffer.find(b'\n')
+            if end < 0:
+                break
+            command = bytes(self._rx_buffer[:end]).strip()
+            del self._rx_buffer[:end + 1]
+            if not command:
+                continue
+            if command.partition(b',')[0] in self.telemetry_commands:
+                self.pending_telemetry.append(command)
+            else:
+                self.pending_commands.append(command)
+
+    def _tick(self, now: float):
+        """依目前模式推進模擬"""
+        if now < self.stalled_until:
+            return
+
+        while self.pending_telemetry:
+            command = self.pending_telemetry.pop(0)
+            name, _, argument = command.partition(b',')
+            self.stats['commands'] += 1
+            self.telemetry_commands[name](argument, now)
+
+        if now >= self.next_ppg:
+            self._tick_ppg(now)
+
+        if self.session_interval > 0 and now >= self.next_auto_session:
+            self.next_auto_session = now + self._scaled(self.session_interval)
+            outcomes = list(self.outcome_weights)
+            weights = [self.outcome_weights[o] for o in outcomes]
+            self.trigger_fingerprint(self.random.randint(1, 4),
+                                     self.random.choices(outcomes, weights)[0])
+
+        if self.mode == MODE_STANDBY:
+            self._tick_standby(now)
+        elif self.mode == MODE_WORKING:
+            self._tick_working(now)
+        elif self.mode == MODE_RECEIVE:
+            self._tick_receive(now)
+
+    def _tick_standby(self, now: float):
+        """待機模式：處理命令、開始工作流程或定時回報"""
+        if self.pending_commands:
+            # 待機模式下有命令輸入時切換到接收模式
+            self.mode = MODE_RECEIVE
+            self._emit(b'MODE,RECEIVE')
+            self._handle_command(self.pending_commands.pop(0), now)
+            return
+
+        with self._lock:
+            session = self.pending_sessions.pop(0) if self.pending_sessions else None
+        if session:
+            self._start_session(session, now)
+            return
+
+        if self.read_requested or now >= self.next_standby:
+            self.read_requested = False
+            self.next_standby = self._next_report(now, self.standby_interval)
+            self._drift_temperature()
+            self._emit(f"STANDBY,{self.object_temp:.2f},{self.ambient_temp:.2f},0,0".encode())
+
+    def _tick_ppg(self, now: float):
+        """PPG 串流：依取樣頻率輸出到期的樣本批次（工作模式以流程的心率與血氧產生波形）"""
+        synth = self.ppg_synth
+        session = self.session
+        synth.finger = session is not None and session.outcome == OUTCOME_FINAL
+        if session is not None:
+            synth.heart_rate = session.heart_rate
+            synth.spo2 = session.spo2
+        period = self._scaled(PPG_BATCH / self.ppg_rate)
+        while now >= self.next_ppg:
+            self.next_ppg += period
+            self.stats['ppg_batches'] += 1
+            self._emit(synth.next_line(PPG_BATCH))
+
+    def _start_session(self, session: EmulatedSession, now: float):
+        """開始工作模式流程"""
+        self.stats['sessions'] += 1
+        session.started_at = now
+        session.next_status = now
+        self.session = session
+        self.mode = MODE_WORKING
+        self._emit(f"DETECT,USER{session.fingerprint_id}".encode())
+        self._emit(b'WORKING,START')
+
+    def _tick_working(self, now: float):
+        """工作模式：定時回報狀態，依流程結果輸出 FINAL 或錯誤"""
+        session = self.session
+        elapsed = (now - session.started_at) * self.speed
+
+        if elapsed > self.working_timeout:
+            if session.outcome == OUTCOME_NO_DATA:
+                self._finish_session(b'WORKING,NO_DATA')
+            else:
+                self._finish_session(b'WORKING,TIMEOUT')
+            return
+
+        if (session.outcome == OUTCOME_NO_FINGER
+                and elapsed > self.finger_placement_time + self.no_finger_time):
+            self._finish_session(b'WORKING,NO_FINGER')
+            return
+
+        measuring = session.outcome != OUTCOME_FINAL
+        hr_ready = not measuring and elapsed >= session.hr_ready_after
+        spo2_ready = not measuring and elapsed >= session.spo2_ready_after
+
+        if self.read_requested or now >= session.next_status:
+            self.read_requested = False
+            session.next_status = self._next_report(now, self.status_interval)
+            self._drift_temperature(body=True)
+            hr_text = str(session.heart_rate) if hr_ready else 'MEASURING'
+            spo2_text = str(session.spo2) if spo2_ready else 'MEASURING'
+            self._emit(f"WORKING,{self.object_temp:.2f},{self.ambient_temp:.2f},{hr_text},{spo2_text}".encode())
+
+        if hr_ready and spo2_ready:
+            if session.stable_since is None:
+                session.stable_since = elapsed
+            elif elapsed - session.stable_since >= self.stable_time:
+                self._finish_session(
+                    f"WORKING,FINAL,{session.fingerprint_id},{self.object_temp:.2f},"
+                    f"{self.ambient_temp:.2f},{session.heart_rate},{session.spo2}".encode())
+
+    def _finish_session(self, line: bytes):
+        """結束工作模式並回到待機模式"""
+        self._emit(line)
+        self.session = None
+        self.mode = MODE_STANDBY
+        self.next_standby = self._next_report(time.monotonic(), self.standby_interval)
+
+    def _tick_receive(self, now: float):
+        """接收模式：繼電器保持時間結束後回報結果並回到待機模式"""
+        if self.relay_pending is not None and now >= self.relay_done_at:
+            relay_num = self.relay_pending
+            self.relay_pending = None
+            self.relay_states[relay_num - 1] = False
+            self._emit(f"RELAY_OK,{relay_num}".encode())
+            self._return_to_standby()
+
+    def _return_to_standby(self):
+        """接收模式結束，回到待機模式"""
+        self.mode = MODE_STANDBY
+        self._emit(b'MODE,STANDBY')
+
+    def _next_report(self, now: float, interval: float) -> float:
+        """下一次定時回報的時間（間隔為0表示只在 READ 時回報）"""
+        return now + self._scaled(interval) if interval > 0 else float('inf')
+
+    # ========== 命令處理 ==========
+
+    def _handle_command(self, command: bytes, now: float):
+        """依命令表處理一條命令"""
+        self.stats['commands'] += 1
+        name, _, argument = command.partition(b',')
+        handler = self.commands.get(name)
+        if handler is None:
+            self._emit(b'RELAY_ERROR,INVALID_COMMAND')
+            self._return_to_standby()
+            return
+        handler(argument, now)
+
+    def _cmd_relay(self, argument: bytes, now: float):
+        """RELAY,繼電器編號"""
+        try:
+            relay_num = int(argument)
+        except ValueError:
+            relay_num = 0
+        if not 1 <= relay_num <= 4:
+            self._emit(b'RELAY_ERROR,INVALID_NUMBER')
+            self._return_to_standby()
+            return
+        self.stats['relays'] += 1
+        self.relay_states[relay_num - 1] = True
+        self.relay_pending = relay_num
+        self.relay_done_at = now + self._scaled(self.relay_hold)
+
+    def _cmd_proto(self, argument: bytes, now: float):
+        """PROTO,BIN / PROTO,TEXT（回應以文字送出，之後才切換格式）"""
+        if argument == b'BIN':
+            self._emit(b'PROTO_OK,BIN', faults=False, stamp=False)
+            self.binary = True
+        elif argument == b'TEXT':
+            self.binary = False
+            self._emit(b'PROTO_OK,TEXT', faults=False, stamp=False)
+        else:
+            self._emit(b'RELAY_ERROR,INVALID_COMMAND')
+
+    def _cmd_rate(self, argument: bytes, now: float):
+        """RATE,STANDBY|WORKING,頻率（Hz，0表示不主動回報）/ RATE,PPG,取樣頻率"""
+        mode, _, rate_text = argument.partition(b',')
+        if mode == b'PPG':
+            self._rate_ppg(rate_text, now)
+            return
+        if mode not in (b'STANDBY', b'WORKING'):
+            self._emit(b'RATE_ERROR,INVALID_MODE')
+            return
+        try:
+            hz = float(rate_text)
+        except ValueError:
+            hz = -1.0
+        if not 0 <= hz <= MAX_REPORT_RATE:
+            self._emit(b'RATE_ERROR,INVALID_RATE')
+            return
+        interval = 1.0 / hz if hz > 0 else 0.0
+        if mode == b'STANDBY':
+            self.standby_interval = interval
+            self.next_standby = self._next_report(now, interval)
+        else:
+            self.status_interval = interval
+            if self.session:
+                self.session.next_status = self._next_report(now, interval)
+        self._emit(b'RATE_OK,%s,%d' % (mode, round(interval * 1000)))
+
+    def _rate_ppg(self, rate_text: bytes, now: float):
+        """RATE,PPG,0|50|100（回應的間隔為取樣間隔毫秒）"""
+        try:
+            hz = float(rate_text)
+        except ValueError:
+            hz = -1.0
+        if hz not in PPG_RATES:
+            self._emit(b'RATE_ERROR,INVALID_RATE')
+            return
+        self.ppg_rate = int(hz)
+        if self.ppg_rate:
+            if self.ppg_synth is None or self.ppg_synth.sample_rate != hz:
+                self.ppg_synth = PpgSynthesizer(sample_rate=hz, seed=self.random.randrange(1 << 32))
+            self.next_ppg = now + self._scaled(PPG_BATCH / hz)
+        else:
+            self.next_ppg = float('inf')
+        self._emit(b'RATE_OK,PPG,%d' % (round(1000 / hz) if hz else 0))
+
+    def _cmd_read(self, argument: bytes, now: float):
+        """READ：下一次迴圈立即回報目前模式的數據"""
+        self.stats['reads'] += 1
+        self.read_requested = True
+
+    def _cmd_stamp(self, argument: bytes, now: float):
+        """STAMP,ON / STAMP,OFF"""
+        if argument in (b'ON', b'OFF'):
+            self.stamping = argument == b'ON'
+            self._emit(b'STAMP_OK,' + argument, faults=False, stamp=False)
+        else:
+            self._emit(b'RELAY_ERROR,INVALID_COMMAND')
+
+    # ========== 輸出 ==========
+
+    def _drift_temperature(self, body: bool = False):
+        """模擬溫度的緩慢變化（工作模式時物體溫度趨近體溫）"""
+        target = 35.5 if body else 25.5
+        self.object_temp += (target - self.object_temp) * 0.2 + self.random.uniform(-0.05, 0.05)
+        self.ambient_temp += self.random.uniform(-0.02, 0.02)
+
+    def _emit(self, line: bytes, faults: bool = True, stamp: bool = True):
+        """
+        輸出一行（含故障注入）
+
+        Args:
+            line: 不含換行符的內容
+            faults: 是否套用丟行與損毀
+            stamp: 開啟時間戳記時是否附加序號與 millis()（協商回應不附加）
+        """
+        if self.master_fd is None:
+            return
+        if stamp and self.stamping:
+            seq = self.sequence
+            self.sequence = (seq + 1) % SEQ_MODULO
+            device_ms = int((time.monotonic() - self._boot_time) * 1000) % DEVICE_MS_MODULO
+            line = b'%s|%d,%d' % (line, seq, device_ms)
+        if faults and self.drop_rate and self.random.random() < self.drop_rate:
+            self.stats['lines_dropped'] += 1
+            return
+        if self.binary:
+            event = self._line_decoder.decode(line)
+            data = encode_event(event) if event is not None else encode_text(line)
+        else:
+            data = line
+        if faults and self.corrupt_rate and self.random.random() < self.corrupt_rate:
+            self.stats['lines_corrupted'] += 1
+            data = bytearray(data)
+            position = self.random.randrange(len(data))
+            data[position] = self.random.choice(b',.#\xff0')
+            data = bytes(data[:self.random.randint(1, len(data))])
+        if not self.binary:
+            data += b'\r\n'
+        try:
+            os.write(self.master_fd, data)
+            self.stats['lines_sent'] += 1
+        except BlockingIOError:
+            # 主機沒有讀取，輸出緩衝區已滿（如同USB CDC，直接丟棄）
+            self.stats['overflow_drops'] += 1
+
+
+def main():
+    """命令列入口"""
+    import argparse
+    parser = argparse.ArgumentParser(description="虛擬BMduino模擬器")
+    parser.add_argument('--speed', type=float, default=1.0, help="時間倍率")
+    parser.add_argument('--standby-interval', type=float, default=1.0, help="待機回報間隔（秒）")
+    parser.add_argument('--status-interval', type=float, default=1.0, help="工作模式回報間隔（秒）")
+    parser.add_argument('--session-interval', type=float, default=0.0, help="自動觸發指紋流程間隔（秒）")
+    parser.add_argument('--drop-rate', type=float, default=0.0, help="丟行機率")
+    parser.add_argument('--corrupt-rate', type=float, default=0.0, help="損毀機率")
+    parser.add_argument('--link', default=None, help="符號連結路徑（如 /tmp/ttyBMduino）")
+    parser.add_argument('--seed', type=int, default=None, help="亂數種子")
+    parser.add_argument('--text-only', action='store_true', help="不支援二進位協議（模擬舊版韌體）")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    emulator = BMduinoEmulator(
+        speed=args.speed,
+        standby_interval=args.standby_interval,
+        status_interval=args.status_interval,
+        session_interval=args.session_interval,
+        drop_rate=args.drop_rate,
+        corrupt_rate=args.corrupt_rate,
+        link=args.link,
+        seed=args.seed,
+        binary_protocol=not args.text_only
+    )
+    port = emulator.start()
+    print(f"虛擬BMduino運行中: {port}（按 Ctrl+C 停止，輸入指紋ID後按 Enter 可觸發流程）")
+    try:
+        while True:
+            text = input().strip()
+            if text.isdigit():
+                emulator.trigger_fingerprint(int(text))
+            print(emulator.get_stats())
+    except (KeyboardInterrupt, EOFError):
+        pass
+    finally:
+        emulator.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+時鐘模組
+流程中的延遲（階段之間的等待、服藥檢測超時、韌體的工作模式時限）都以注入的時鐘計時：
+實際運行使用 REAL_CLOCK；加速模擬使用 VirtualClock，時間只在事件迴圈沒有到期工作時
+直接跳到下一個排程（離散事件模擬），數千次流程可以在數秒內跑完
+"""
+
+import threading
+import time
+from typing import Optional
+
+
+class Clock:
+    """實際時間"""
+
+    # 虛擬時鐘的事件迴圈在沒有到期工作時直接推進時間，而不是等待
+    virtual = False
+
+    def monotonic(self) -> float:
+        """單調遞增的秒數（計算間隔與排程使用）"""
+        return time.monotonic()
+
+    def time(self) -> float:
+        """目前的 Unix 時間（記錄與顯示使用）"""
+        return time.time()
+
+    def sleep(self, seconds: float):
+        """等待指定秒數"""
+        time.sleep(seconds)
+
+
+REAL_CLOCK = Clock()
+
+
+class VirtualClock(Clock):
+    """虛擬時間（由事件迴圈或呼叫端推進，不會自行前進）"""
+
+    virtual = True
+
+    def __init__(self, start: float = 0.0, epoch: Optional[float] = None):
+        """
+        初始化虛擬時鐘
+
+        Args:
+            start: monotonic() 的起始值
+            epoch: start 對應的 Unix 時間，None表示現在
+        """
+        self._now = start
+        self._epoch = (time.time() if epoch is None else epoch) - start
+        self._lock = threading.Lock()
+
+    def monotonic(self) -> float:
+        return self._now
+
+    def time(self) -> float:
+        return self._epoch + self._now
+
+    def advance(self, seconds: float):
+        """推進指定秒數"""
+        with self._lock:
+            self._now += max(seconds, 0.0)
+
+    def advance_to(self, when: float):
+        """推進到指定時間（已經超過時不倒退）"""
+        with self._lock:
+            if when > self._now:
+                self._now = when
+
+    def sleep(self, seconds: float):
+        """虛擬時間的等待即推進時間"""
+        self.advance(seconds)
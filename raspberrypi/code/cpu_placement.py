@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+CPU 配置模組
+依 data/config.json 的 cpu_placement 把各子系統的線程固定到指定的 CPU 核心並調整 nice 值，
+限制 OpenCV 的工作線程數，並提供每個線程的 CPU 使用量以驗證配置
+
+Linux 的親和性與 nice 值以線程為單位（sched_setaffinity / setpriority 使用線程的 native id），
+之後由該線程建立的線程會繼承設定：各子系統在自己的線程開始時呼叫 place_current_thread(角色)，
+沒有角色的線程（例如 Flask 每個請求的線程、OpenCV 的工作線程）沿用建立者的設定
+
+線程角色（cpu_placement.threads）：
+- ui：Qt 介面線程（無介面模式為事件迴圈線程）
+- serial：串口監聽與繼電器寫入線程
+- bus：事件匯流排工作線程（數據庫寫入等）
+- api：Flask 服務器線程（含其請求線程）
+- cv：電腦視覺檢測線程（含 OpenCV 的工作線程）
+
+行程角色（cpu_placement.processes）：多行程模式的 ingest / api / ui 行程，在行程開始時套用於主線程，
+之後建立的線程繼承；有線程角色的線程再套用自己的設定
+
+非 Linux 平台或不支援的操作只記錄警告，不影響運行
+"""
+
+import os
+import threading
+import time
+from typing import Optional, Dict, List
+import logging
+
+logger = logging.getLogger(__name__)
+
+THREAD_ROLES = ('ui', 'serial', 'bus', 'api', 'cv')
+
+_CLOCK_TICKS = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+
+
+def available_cpus() -> List[int]:
+    """目前行程可使用的 CPU 核心"""
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def _read_task_stat(tid: int) -> Optional[tuple]:
+    """
+    讀取 /proc/self/task/<tid>/stat
+
+    Returns:
+        (核心線程名稱, 使用者+系統 CPU 秒數, 最後執行的 CPU, nice 值)，讀取失敗返回None
+    """
+    try:
+        with open(f'/proc/self/task/{tid}/stat', encoding='utf-8') as f:
+            text = f.read()
+    except OSError:
+        return None
+    # 線程名稱可能含空白，以最後一個右括號分隔
+    comm = text[text.index('(') + 1:text.rindex(')')]
+    fields = text[text.rindex(')') + 2:].split()
+    cpu_seconds = (int(fields[11]) + int(fields[12])) / _CLOCK_TICKS
+    return comm, cpu_seconds, int(fields[36]), int(fields[16])
+
+
+class CpuPlacement:
+    """線程與行程的 CPU 配置計畫"""
+
+    def __init__(self, threads: Optional[Dict[str, dict]] = None, processes: Optional[Dict[str, dict]] = None,
+                 opencv_threads: Optional[int] = None, enabled: bool = True):
+        """
+        初始化配置計畫
+
+        Args:
+            threads: 線程角色 -> {'cpus': [核心編號], 'nice': nice 值}（兩者皆可省略）
+            processes: 行程角色 -> 同上
+            opencv_threads: OpenCV 工作線程數（cv2.setNumThreads），None表示不限制
+            enabled: False 時只提供線程統計，不改變任何設定
+        """
+        self.enabled = enabled
+        self.threads = threads or {}
+        self.processes = processes or {}
+        self.opencv_threads = opencv_threads
+        self.available = available_cpus()
+
+        # 已套用的線程：native id -> 角色
+        self.placed: Dict[int, str] = {}
+        self.errors = 0
+        self._warned = set()
+        self._lock = threading.Lock()
+
+        # CPU 使用率的上一次取樣：native id -> (CPU 秒數, 取樣時間)
+        self._samples: Dict[int, tuple] = {}
+
+    def _warn_once(self, key: str, message: str):
+        self.errors += 1
+        if key not in self._warned:
+            self._warned.add(key)
+            logger.warning(message)
+
+    def _apply(self, role: str, settings: Optional[dict]) -> bool:
+        """將設定套用到目前線程"""
+        if not self.enabled or not settings:
+            return False
+        tid = threading.get_native_id()
+        applied = False
+
+        cpus = settings.get('cpus')
+        if cpus:
+            usable = sorted(set(cpus) & set(self.available))
+            if not usable:
+                self._warn_once(f"cpus:{role}", f"{role} 指定的 CPU {cpus} 都不可用（可用: {self.available}），不固定核心")
+            elif not hasattr(os, 'sched_setaffinity'):
+                self._warn_once('affinity', "此平台不支援 CPU 親和性設定")
+            else:
+                try:
+                    os.sched_setaffinity(tid, usable)
+                    applied = True
+                except OSError as e:
+                    self._warn_once(f"affinity:{role}", f"設定 {role} 的 CPU 親和性失敗: {e}")
+
+        nice = settings.get('nice')
+        if nice is not None:
+            try:
+                os.setpriority(os.PRIO_PROCESS, tid, nice)
+                applied = True
+            except (OSError, AttributeError) as e:
+                # 降低 nice 值（提高優先權）需要 CAP_SYS_NICE
+                self._warn_once(f"nice:{role}", f"設定 {role} 的 nice 值 {nice} 失敗: {e}")
+
+        if applied:
+            with self._lock:
+                self.placed[tid] = role
+            logger.debug(f"線程 {threading.current_thread().name} 套用 CPU 配置: {role} {settings}")
+        return applied
+
+    def place_current_thread(self, role: str) -> bool:
+        """
+        以線程角色的設定配置目前線程
+
+        Args:
+            role: 線程角色（THREAD_ROLES 之一）
+
+        Returns:
+            是否套用了任何設定
+        """
+        return self._apply(role, self.threads.get(role))
+
+    def place_process(self, role: str) -> bool:
+        """以行程角色的設定配置目前線程（在行程開始、建立其他線程之前呼叫）"""
+        return self._apply(f"process:{role}", self.processes.get(role))
+
+    def thread_stats(self) -> List[Dict]:
+        """
+        每個線程的 CPU 使用量
+
+        Returns:
+            線程列表：名稱、native id、角色、累計 CPU 秒數、上次查詢以來的 CPU 使用率（%）、
+            最後執行的 CPU、親和性與 nice 值
+        """
+        names = {thread.native_id: thread.name for thread in threading.enumerate()}
+        try:
+            tids = sorted(int(name) for name in os.listdir('/proc/self/task'))
+        except OSError:
+            return []
+        now = time.monotonic()
+        threads = []
+        with self._lock:
+            samples = {}
+            for tid in tids:
+                stat = _read_task_stat(tid)
+                if stat is None:
+                    continue
+                comm, cpu_seconds, processor, nice = stat
+                previous = self._samples.get(tid)
+                cpu_percent = None
+                if previous is not None and now > previous[1]:
+                    cpu_percent = round((cpu_seconds - previous[0]) / (now - previous[1]) * 100, 1)
+                samples[tid] = (cpu_seconds, now)
+                try:
+                    affinity = sorted(os.sched_getaffinity(tid))
+                except (OSError, AttributeError):
+                    affinity = None
+                threads.append({
+                    'tid': tid,
+                    'name': names.get(tid, comm),
+                    'role': self.placed.get(tid),
+                    'cpu_seconds': round(cpu_seconds, 2),
+                    'cpu_percent': cpu_percent,
+                    'processor': processor,
+                    'affinity': affinity,
+                    'nice': nice,
+                })
+            self._samples = samples
+        return threads
+
+    def get_stats(self) -> Dict:
+        """獲取配置計畫與每個線程的 CPU 使用量"""
+        return {
+            'enabled': self.enabled,
+            'available_cpus': self.available,
+            'threads_plan': self.threads,
+            'processes_plan': self.processes,
+            'opencv_threads': self.opencv_threads,
+            'errors': self.errors,
+            'threads': self.thread_stats(),
+        }
+
+
+# 行程內唯一的配置計畫（親和性與 nice 值本身就是行程/線程層級的作業系統狀態）
+_placement = CpuPlacement(enabled=False)
+
+
+def configure(config: dict) -> CpuPlacement:
+    """依配置建立本行程的 CPU 配置計畫"""
+    global _placement
+    placement_config = config.get('cpu_placement', {})
+    _placement = CpuPlacement(
+        threads=placement_config.get('threads', {}),
+        processes=placement_config.get('processes', {}),
+        opencv_threads=placement_config.get('opencv_threads'),
+        enabled=placement_config.get('enabled', False)
+    )
+    if _placement.enabled:
+        logger.info(f"CPU 配置已啟用，可用核心: {_placement.available}")
+    return _placement
+
+
+def get_placement() -> CpuPlacement:
+    """本行程的 CPU 配置計畫"""
+    return _placement
+
+
+def place_current_thread(role: str) -> bool:
+    """以線程角色的設定配置目前線程（未啟用時不做任何事）"""
+    return _placement.place_current_thread(role)
+
+
+def place_process(role: str) -> bool:
+    """以行程角色的設定配置目前線程（未啟用時不做任何事）"""
+    return _placement.place_process(role)
@@ -13,6 +13,9 @@ import numpy as np
 from typing import Optional, Callable
 import logging
 
+from code.cpu_placement import get_placement, place_current_thread
+from code.clock import Clock, REAL_CLOCK
+
 logger = logging.getLogger(__name__)
 
 
@@ -20,7 +23,7 @@ class MedicationDetector:
     """服藥動作辨識類別"""
     
     def __init__(self, camera_id: int = 0, width: int = 640, height: int = 480,
-                 sensitivity: float = 0.7, timeout: int = 30):
+                 sensitivity: float = 0.7, timeout: int = 30, clock: Optional[Clock] = None):
         """
         初始化服藥動作辨識
         
@@ -30,12 +33,19 @@ class MedicationDetector:
             height: 影像高度
             sensitivity: 檢測靈敏度（0-1，越高越靈敏）
             timeout: 超時時間（秒）
+            clock: 計算超時的時鐘，None表示實際時間
         """
         self.camera_id = camera_id
         self.width = width
         self.height = height
         self.sensitivity = sensitivity
         self.timeout = timeout
+        self.clock = clock if clock is not None else REAL_CLOCK
+        
+        # 限制 OpenCV 的工作線程數（與其他子系統共用核心時避免搶佔）
+        opencv_threads = get_placement().opencv_threads
+        if opencv_threads is not None:
+            cv2.setNumThreads(opencv_threads)
         
         # MediaPipe初始化 - 手部檢測
         self.mp_hands = mp.solutions.hands
@@ -61,8 +71,16 @@ class MedicationDetector:
         # 嘴巴關鍵點索引
         self.MOUTH_OUTER_INDICES = [61, 146, 91, 181, 84, 17, 314, 405, 320, 307, 375, 321, 308, 324, 318]
         
+        # 檢測幀率與推論解析度比例（由溫度調節器調整）
+        self.frame_interval = 0.1  # 約10fps，降低CPU使用率
+        self.inference_scale = 1.0
+        self.fps = 0.0
+        
         # 狀態
         self.cap: Optional[cv2.VideoCapture] = None
+        self.camera_lock = threading.Lock()  # 預先開啟攝影機與開始檢測可能在不同線程
+        self.camera_warmed = False
+        self.last_open_ms = 0.0
         self.detecting = False
         self.detection_thread: Optional[threading.Thread] = None
         self.detected = False
@@ -93,13 +111,14 @@ class MedicationDetector:
             return False
         
         try:
-            self.cap = cv2.VideoCapture(self.camera_id)
-            if not self.cap.isOpened():
-                logger.error(f"無法開啟攝影機: {self.camera_id}")
-                return False
-            
-            self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
-            self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
+            # 已預先開啟時直接使用（預先開啟仍在進行時等待其完成）
+            with self.camera_lock:
+                warmed = self.camera_warmed
+                if not self._open_camera():
+                    return False
+                self.camera_warmed = False
+            if warmed:
+                logger.info("使用預先開啟的攝影機")
             
             self.on_detected = on_detected
             self.on_timeout = on_timeout
@@ -117,21 +136,82 @@ class MedicationDetector:
             logger.error(f"啟動檢測失敗: {e}")
             return False
     
+    def _open_camera(self) -> bool:
+        """開啟攝影機（已開啟時不做任何事；呼叫端須持有 camera_lock）"""
+        if self.cap is not None and self.cap.isOpened():
+            return True
+        start = time.perf_counter()
+        self.cap = cv2.VideoCapture(self.camera_id)
+        if not self.cap.isOpened():
+            logger.error(f"無法開啟攝影機: {self.camera_id}")
+            self.cap = None
+            return False
+        
+        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
+        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
+        self.last_open_ms = (time.perf_counter() - start) * 1000
+        return True
+    
+    def warm_camera(self, frames: int = 5) -> bool:
+        """
+        預先開啟攝影機並讀取數幀（等待自動曝光穩定），之後的 start_detection 可以立即開始
+        
+        Args:
+            frames: 預先讀取的幀數
+        
+        Returns:
+            攝影機是否已就緒
+        """
+        with self.camera_lock:
+            if self.detecting:
+                return True
+            if not self._open_camera():
+                return False
+            for _ in range(frames):
+                self.cap.read()
+            self.camera_warmed = True
+        logger.info(f"攝影機已預先開啟（開啟 {self.last_open_ms:.0f} ms）")
+        return True
+    
+    def release_camera(self):
+        """釋放預先開啟但未使用的攝影機（檢測中不做任何事）"""
+        with self.camera_lock:
+            if self.detecting or self.cap is None:
+                return
+            self.cap.release()
+            self.cap = None
+            self.camera_warmed = False
+        logger.info("釋放預先開啟的攝影機")
+    
     def stop_detection(self):
         """停止檢測"""
         self.detecting = False
         if self.detection_thread:
             self.detection_thread.join(timeout=2)
         
-        if self.cap:
-            self.cap.release()
-            self.cap = None
+        with self.camera_lock:
+            if self.cap:
+                self.cap.release()
+                self.cap = None
+            self.camera_warmed = False
         
         logger.info("停止服藥動作檢測")
     
+    def set_quality(self, level):
+        """
+        套用品質等級（溫度調節器的回調，可在任何線程中呼叫，下一幀生效）
+        
+        Args:
+            level: QualityLevel（使用 cv_fps 與 cv_scale）
+        """
+        self.frame_interval = 1.0 / max(level.cv_fps, 0.1)
+        self.inference_scale = min(max(level.cv_scale, 0.1), 1.0)
+        logger.info(f"電腦視覺檢測: {level.cv_fps:g} fps，推論解析度 {self.inference_scale:g}x")
+    
     def _detection_loop(self):
         """檢測迴圈（在獨立線程中運行）"""
-        start_time = time.time()
+        place_current_thread('cv')
+        start_time = self.clock.monotonic()
         hand_near_mouth_count = 0
         required_frames = int(10 * self.sensitivity)  # 需要連續檢測到的幀數
         
@@ -142,7 +222,7 @@ class MedicationDetector:
         try:
             while self.detecting:
                 # 檢查超時
-                if time.time() - start_time > self.timeout:
+                if self.clock.monotonic() - start_time > self.timeout:
                     logger.info("檢測超時")
                     if self.on_timeout:
                         try:
@@ -151,6 +231,7 @@ class MedicationDetector:
                             logger.error(f"超時回調錯誤: {e}")
                     break
                 
+                frame_start = time.time()
                 ret, frame = self.cap.read()
                 if not ret:
                     logger.warning("無法讀取攝影機畫面")
@@ -160,8 +241,11 @@ class MedicationDetector:
                 # 水平翻轉（鏡像效果，更符合使用者視角）
                 frame = cv2.flip(frame, 1)
                 
-                # 轉換為RGB
+                # 轉換為RGB（過熱時縮小推論解析度；MediaPipe 的標記點為正規化座標，不受縮放影響）
                 rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+                scale = self.inference_scale
+                if scale < 1.0:
+                    rgb_frame = cv2.resize(rgb_frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
                 
                 # 檢測臉部（獲取嘴巴位置）
                 face_results = self.face_mesh.process(rgb_frame)
@@ -230,15 +314,20 @@ class MedicationDetector:
                 with self.frame_lock:
                     self.current_frame = processed_frame
                 
-                time.sleep(0.1)  # 約10fps，降低CPU使用率
+                # 依目前幀率等待下一幀，並記錄實際幀率
+                elapsed = time.time() - frame_start
+                time.sleep(max(0.0, self.frame_interval - elapsed))
+                frame_time = time.time() - frame_start
+                self.fps = 1.0 / frame_time if self.fps == 0 else self.fps * 0.8 + 0.2 / frame_time
         
         except Exception as e:
             logger.error(f"檢測迴圈錯誤: {e}")
         finally:
-            self.detecting = False
-            if self.cap:
-                self.cap.release()
-                self.cap = None
+            with self.camera_lock:
+                self.detecting = False
+                if self.cap:
+                    self.cap.release()
+                    self.cap = None
     
     def _get_mouth_position(self, face_landmarks, frame_width, frame_height):
         """
@@ -335,6 +424,15 @@ class MedicationDetector:
         with self.frame_lock:
             return self.current_frame.copy() if self.current_frame is not None else None
     
+    def get_stats(self) -> dict:
+        """獲取統計（實際幀率、目標幀率與推論解析度比例）"""
+        return {
+            'detecting': self.detecting,
+            'fps': round(self.fps, 1),
+            'target_fps': round(1.0 / self.frame_interval, 1),
+            'inference_scale': self.inference_scale,
+        }
+    
     def is_detecting(self) -> bool:
         """檢查是否正在檢測"""
         return self.detecting
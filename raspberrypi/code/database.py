@@ -7,13 +7,17 @@
 
 import sqlite3
 import json
+import threading
 from datetime import datetime
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Any, Callable
 from pathlib import Path
 import logging
 
 logger = logging.getLogger(__name__)
 
+# 查詢快取的最多項目數（歷史記錄的 limit 由 API 參數決定，需限制項目數）
+CACHE_SIZE = 64
+
 
 class Database:
     """數據庫操作類別"""
@@ -31,6 +35,16 @@ class Database:
         
         self.db_path = db_path
         self.conn: Optional[sqlite3.Connection] = None
+        
+        # 熱門查詢快取（最新一筆與歷史記錄）：本連線寫入時清除；
+        # 其他連線（多行程模式的擷取行程）寫入時 PRAGMA data_version 會改變，查詢前檢查
+        self._cache: Dict[tuple, Any] = {}
+        self._cache_lock = threading.Lock()
+        self._cache_generation = 0
+        self._data_version: Optional[int] = None
+        self.cache_hits = 0
+        self.cache_misses = 0
+        
         self._init_database()
     
     def _init_database(self):
@@ -50,10 +64,17 @@ class Database:
                     object_temp REAL,
                     ambient_temp REAL,
                     heart_rate INTEGER,
-                    spo2 INTEGER
+                    spo2 INTEGER,
+                    captured_at DATETIME
                 )
             ''')
             
+            # 舊版數據庫沒有裝置端測量時間欄位
+            columns = {row['name'] for row in cursor.execute('PRAGMA table_info(measurements)')}
+            if 'captured_at' not in columns:
+                cursor.execute('ALTER TABLE measurements ADD COLUMN captured_at DATETIME')
+                logger.info("已為測量記錄表加入 captured_at 欄位")
+            
             # 創建索引以提高查詢效率
             cursor.execute('''
                 CREATE INDEX IF NOT EXISTS idx_timestamp ON measurements(timestamp)
@@ -63,6 +84,29 @@ class Database:
                 CREATE INDEX IF NOT EXISTS idx_user_id ON measurements(user_id)
             ''')
             
+            # 創建流程記錄表（每次流程一筆，狀態轉換以精簡的 JSON 陣列保存）
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS sessions (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    started_at DATETIME NOT NULL,
+                    device_id TEXT,
+                    user_id INTEGER,
+                    outcome TEXT NOT NULL,
+                    duration_ms INTEGER NOT NULL,
+                    transitions TEXT NOT NULL
+                )
+            ''')
+            
+            # 單一藥盒版本的流程記錄表沒有裝置ID欄位
+            columns = {row['name'] for row in cursor.execute('PRAGMA table_info(sessions)')}
+            if 'device_id' not in columns:
+                cursor.execute('ALTER TABLE sessions ADD COLUMN device_id TEXT')
+                logger.info("已為流程記錄表加入 device_id 欄位")
+            
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_sessions_started_at ON sessions(started_at)
+            ''')
+            
             self.conn.commit()
             logger.info("數據庫初始化完成")
             
@@ -72,7 +116,7 @@ class Database:
     
     def insert_measurement(self, user_id: int, object_temp: float = None,
                           ambient_temp: float = None, heart_rate: int = None,
-                          spo2: int = None) -> bool:
+                          spo2: int = None, captured_at: Optional[datetime] = None) -> bool:
         """
         插入測量記錄
         
@@ -82,6 +126,7 @@ class Database:
             ambient_temp: 環境溫度
             heart_rate: 心率
             spo2: 血氧
+            captured_at: 裝置端測量時間（由韌體時間戳記換算，None表示未知）
         
         Returns:
             是否插入成功
@@ -90,23 +135,110 @@ class Database:
             cursor = self.conn.cursor()
             cursor.execute('''
                 INSERT INTO measurements 
-                (timestamp, user_id, object_temp, ambient_temp, heart_rate, spo2)
-                VALUES (?, ?, ?, ?, ?, ?)
+                (timestamp, user_id, object_temp, ambient_temp, heart_rate, spo2, captured_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
             ''', (
                 datetime.now().isoformat(),
                 user_id,
                 object_temp,
                 ambient_temp,
                 heart_rate,
-                spo2
+                spo2,
+                captured_at.isoformat() if captured_at else None
             ))
             self.conn.commit()
+            self._invalidate_cache()
             logger.debug(f"插入測量記錄: 使用者{user_id}")
             return True
         except sqlite3.Error as e:
             logger.error(f"插入測量記錄失敗: {e}")
             return False
     
+    def insert_session(self, started_at: datetime, user_id: Optional[int], outcome: str,
+                       duration_ms: int, transitions: List[list], device_id: Optional[str] = None) -> bool:
+        """
+        插入流程記錄
+        
+        Args:
+            started_at: 流程開始時間
+            user_id: 使用者ID（未辨識到使用者時為None）
+            outcome: 流程結果（complete、測量錯誤代碼或 aborted）
+            duration_ms: 流程總時間（毫秒）
+            transitions: 狀態轉換列表，每項為 [狀態, 相對開始的毫秒數, 原因]
+            device_id: 裝置ID（多裝置閘道器），None表示單一藥盒
+        
+        Returns:
+            是否插入成功
+        """
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute('''
+                INSERT INTO sessions (started_at, device_id, user_id, outcome, duration_ms, transitions)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (
+                started_at.isoformat(timespec='seconds'),
+                device_id,
+                user_id,
+                outcome,
+                duration_ms,
+                json.dumps(transitions, ensure_ascii=False, separators=(',', ':'))
+            ))
+            self.conn.commit()
+            return True
+        except sqlite3.Error as e:
+            logger.error(f"插入流程記錄失敗: {e}")
+            return False
+    
+    def get_sessions(self, user_id: Optional[int] = None, since: Optional[datetime] = None,
+                     outcome: Optional[str] = None, limit: Optional[int] = None,
+                     device_id: Optional[str] = None) -> List[Dict]:
+        """
+        查詢流程記錄（新的在前）
+        
+        Args:
+            user_id: 使用者ID，None表示所有使用者
+            since: 只查詢此時間之後開始的流程
+            outcome: 只查詢此結果的流程
+            limit: 最多筆數，None表示不限制
+            device_id: 只查詢此裝置的流程
+        
+        Returns:
+            流程記錄列表（transitions 已解析為列表）
+        """
+        conditions = []
+        params: List[Any] = []
+        if user_id is not None:
+            conditions.append('user_id = ?')
+            params.append(user_id)
+        if since is not None:
+            conditions.append('started_at >= ?')
+            params.append(since.isoformat(timespec='seconds'))
+        if outcome is not None:
+            conditions.append('outcome = ?')
+            params.append(outcome)
+        if device_id is not None:
+            conditions.append('device_id = ?')
+            params.append(device_id)
+        query = 'SELECT * FROM sessions'
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        query += ' ORDER BY id DESC'
+        if limit is not None:
+            query += ' LIMIT ?'
+            params.append(limit)
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute(query, params)
+            sessions = []
+            for row in cursor.fetchall():
+                session = dict(row)
+                session['transitions'] = json.loads(session['transitions'])
+                sessions.append(session)
+            return sessions
+        except (sqlite3.Error, ValueError) as e:
+            logger.error(f"查詢流程記錄失敗: {e}")
+            return []
+    
     def get_latest_measurement(self, user_id: Optional[int] = None) -> Optional[Dict]:
         """
         獲取最新的測量記錄
@@ -118,26 +250,8 @@ class Database:
             最新的測量記錄字典，失敗返回None
         """
         try:
-            cursor = self.conn.cursor()
-            
-            if user_id:
-                cursor.execute('''
-                    SELECT * FROM measurements
-                    WHERE user_id = ?
-                    ORDER BY timestamp DESC
-                    LIMIT 1
-                ''', (user_id,))
-            else:
-                cursor.execute('''
-                    SELECT * FROM measurements
-                    ORDER BY timestamp DESC
-                    LIMIT 1
-                ''')
-            
-            row = cursor.fetchone()
-            if row:
-                return dict(row)
-            return None
+            record = self._cached(('latest', user_id), lambda: self._fetch_latest(user_id))
+            return dict(record) if record else None
         except sqlite3.Error as e:
             logger.error(f"查詢最新記錄失敗: {e}")
             return None
@@ -154,28 +268,129 @@ class Database:
             歷史記錄列表
         """
         try:
-            cursor = self.conn.cursor()
-            
-            if user_id:
-                cursor.execute('''
-                    SELECT * FROM measurements
-                    WHERE user_id = ?
-                    ORDER BY timestamp DESC
-                    LIMIT ?
-                ''', (user_id, limit))
-            else:
-                cursor.execute('''
-                    SELECT * FROM measurements
-                    ORDER BY timestamp DESC
-                    LIMIT ?
-                ''', (limit,))
-            
-            rows = cursor.fetchall()
-            return [dict(row) for row in rows]
+            records = self._cached(('history', user_id, limit), lambda: self._fetch_history(user_id, limit))
+            return [dict(record) for record in records]
         except sqlite3.Error as e:
             logger.error(f"查詢歷史記錄失敗: {e}")
             return []
     
+    def _fetch_latest(self, user_id: Optional[int]) -> Optional[Dict]:
+        cursor = self.conn.cursor()
+        if user_id:
+            cursor.execute('''
+                SELECT * FROM measurements
+                WHERE user_id = ?
+                ORDER BY timestamp DESC
+                LIMIT 1
+            ''', (user_id,))
+        else:
+            cursor.execute('''
+                SELECT * FROM measurements
+                ORDER BY timestamp DESC
+                LIMIT 1
+            ''')
+        row = cursor.fetchone()
+        return dict(row) if row else None
+    
+    def _fetch_history(self, user_id: Optional[int], limit: int) -> List[Dict]:
+        cursor = self.conn.cursor()
+        if user_id:
+            cursor.execute('''
+                SELECT * FROM measurements
+                WHERE user_id = ?
+                ORDER BY timestamp DESC
+                LIMIT ?
+            ''', (user_id, limit))
+        else:
+            cursor.execute('''
+                SELECT * FROM measurements
+                ORDER BY timestamp DESC
+                LIMIT ?
+            ''', (limit,))
+        return [dict(row) for row in cursor.fetchall()]
+    
+    def _cached(self, key: tuple, query: Callable[[], Any]) -> Any:
+        """
+        從快取取得查詢結果，沒有時查詢並存入快取
+        
+        查詢期間有寫入（世代改變）時不存入快取，避免存入寫入前的結果
+        """
+        with self._cache_lock:
+            data_version = self.conn.execute('PRAGMA data_version').fetchone()[0]
+            if data_version != self._data_version:
+                self._cache.clear()
+                self._cache_generation += 1
+                self._data_version = data_version
+            if key in self._cache:
+                self.cache_hits += 1
+                return self._cache[key]
+            self.cache_misses += 1
+            generation = self._cache_generation
+        result = query()
+        with self._cache_lock:
+            if generation == self._cache_generation:
+                if len(self._cache) >= CACHE_SIZE:
+                    self._cache.pop(next(iter(self._cache)))
+                self._cache[key] = result
+        return result
+    
+    def _invalidate_cache(self):
+        with self._cache_lock:
+            self._cache.clear()
+            self._cache_generation += 1
+    
+    def _max_id(self) -> Optional[int]:
+        return self.conn.execute('SELECT MAX(id) FROM measurements').fetchone()[0]
+    
+    def cache_snapshot(self) -> Optional[Dict]:
+        """
+        查詢快取內容（熱重啟快照用）
+        
+        Returns:
+            {'max_id', 'entries'}，快取為空時返回None
+        """
+        try:
+            with self._cache_lock:
+                if not self._cache:
+                    return None
+                return {'max_id': self._max_id(), 'entries': dict(self._cache)}
+        except sqlite3.Error as e:
+            logger.error(f"讀取查詢快取失敗: {e}")
+            return None
+    
+    def restore_cache(self, snapshot: Dict) -> bool:
+        """
+        以熱重啟快照還原查詢快取（快照之後有新記錄時不還原）
+        
+        Args:
+            snapshot: cache_snapshot() 的返回值
+        
+        Returns:
+            是否還原
+        """
+        try:
+            with self._cache_lock:
+                if snapshot.get('max_id') != self._max_id():
+                    logger.info("數據庫在快照之後有變更，不還原查詢快取")
+                    return False
+                self._data_version = self.conn.execute('PRAGMA data_version').fetchone()[0]
+                self._cache_generation += 1
+                self._cache = dict(list(snapshot.get('entries', {}).items())[-CACHE_SIZE:])
+                logger.info(f"已還原查詢快取: {len(self._cache)} 項")
+                return True
+        except sqlite3.Error as e:
+            logger.error(f"還原查詢快取失敗: {e}")
+            return False
+    
+    def get_cache_stats(self) -> Dict:
+        """獲取查詢快取統計"""
+        with self._cache_lock:
+            return {
+                'entries': len(self._cache),
+                'hits': self.cache_hits,
+                'misses': self.cache_misses,
+            }
+    
     def get_user_statistics(self, user_id: int, days: int = 30) -> Dict:
         """
         獲取使用者統計數據
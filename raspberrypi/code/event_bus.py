@@ -0,0 +1,383 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+事件匯流排模組
+串口線程、狀態機等發布端把事件發布到具名主題，訂閱端各自選擇遞送方式：
+
+- 同步（sync）：在發布端線程直接呼叫，適合很快的處理（例如交給 UI 線程、更新暫存器）
+- 工作線程（thread）：每個訂閱端一個有上限的佇列與工作線程，較慢的處理（例如寫入數據庫）
+  不會拖慢串口讀取
+
+每個主題宣告接受的事件型別與佇列滿時的處理方式：
+- drop_oldest：丟棄最舊的一筆（遙測數據，只有最新值有意義）
+- block：發布端等待佇列有空間（測量結果等不可遺失的紀錄）；等待超過 block_timeout
+  仍加入佇列並記錄警告，避免處理端卡住時串口線程永遠停止
+
+每個主題統計發布數、佇列深度、丟棄/等待次數，以及發布到處理完成的延遲
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Optional, Callable, Tuple, List, Dict, Any
+import logging
+
+from code.cpu_placement import place_current_thread
+
+logger = logging.getLogger(__name__)
+
+# 佇列滿時的處理方式
+DROP_OLDEST = 'drop_oldest'
+BLOCK = 'block'
+
+# 遞送方式
+SYNC = 'sync'
+THREAD = 'thread'
+
+# 每個訂閱端保留的延遲樣本數
+LATENCY_WINDOW = 512
+
+
+def _percentile(sorted_values: List[float], fraction: float) -> float:
+    """已排序數列的百分位數（最近排名法）"""
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return sorted_values[index]
+
+
+def latency_summary(latencies) -> Optional[Dict]:
+    """
+    延遲樣本摘要
+
+    Args:
+        latencies: 延遲樣本（秒）
+
+    Returns:
+        p50/p99/最大值（毫秒），沒有樣本時返回None
+    """
+    values = sorted(latencies)
+    if not values:
+        return None
+    return {
+        'samples': len(values),
+        'p50_ms': _percentile(values, 0.50) * 1000,
+        'p99_ms': _percentile(values, 0.99) * 1000,
+        'max_ms': values[-1] * 1000,
+    }
+
+
+class Subscription:
+    """一個訂閱端：同步呼叫，或有上限的佇列加上工作線程"""
+
+    def __init__(self, topic: 'Topic', callback: Callable, delivery: str, capacity: int, name: str):
+        self.topic = topic
+        self.callback = callback
+        self.delivery = delivery
+        self.capacity = capacity
+        self.name = name
+
+        self._queue = deque()                   # (事件, 發布時間)
+        self._condition = threading.Condition()
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+
+        # 統計
+        self.delivered = 0
+        self.errors = 0
+        self.dropped = 0
+        self.blocked = 0        # 發布端等待過佇列空間的次數
+        self.overflowed = 0     # 等待超時後仍加入佇列的次數
+        self.max_depth = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+        if delivery == THREAD:
+            self._running = True
+            self._thread = threading.Thread(target=self._run, name=f"bus-{topic.name}-{name}", daemon=True)
+            self._thread.start()
+
+    @property
+    def depth(self) -> int:
+        return len(self._queue)
+
+    def deliver(self, event, published_at: float):
+        """
+        遞送一個事件（由發布端線程呼叫）
+
+        Args:
+            event: 事件物件
+            published_at: 發布時間（time.perf_counter()）
+        """
+        if self.delivery == SYNC:
+            self._call(event, published_at)
+            return
+
+        with self._condition:
+            if len(self._queue) >= self.capacity:
+                if self.topic.overflow == DROP_OLDEST:
+                    self._queue.popleft()
+                    self.dropped += 1
+                else:
+                    self._wait_for_space()
+            self._queue.append((event, published_at))
+            if len(self._queue) > self.max_depth:
+                self.max_depth = len(self._queue)
+            self._condition.notify_all()
+
+    def _wait_for_space(self):
+        """block 主題：等待工作線程取出事件（需持有條件變數）"""
+        self.blocked += 1
+        deadline = time.monotonic() + self.topic.block_timeout
+        while len(self._queue) >= self.capacity and self._running:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.overflowed += 1
+                logger.warning(f"主題 {self.topic.name} 的訂閱端 {self.name} 佇列已滿超過 "
+                               f"{self.topic.block_timeout} 秒，仍加入佇列（{len(self._queue) + 1} 筆）")
+                return
+            self._condition.wait(remaining)
+
+    def _call(self, event, published_at: float):
+        try:
+            self.callback(event)
+            self.delivered += 1
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"{self.topic.name} 訂閱端 {self.name} 執行錯誤: {e}", exc_info=True)
+        self.latencies.append(time.perf_counter() - published_at)
+
+    def _run(self):
+        """工作線程：依序取出事件並呼叫訂閱端"""
+        place_current_thread('bus')
+        while True:
+            with self._condition:
+                while not self._queue and self._running:
+                    self._condition.wait()
+                if not self._queue:
+                    return
+                event, published_at = self._queue.popleft()
+                # 喚醒等待空間的發布端
+                self._condition.notify_all()
+            self._call(event, published_at)
+
+    def close(self, timeout: Optional[float] = None):
+        """
+        停止工作線程（佇列中剩餘的事件會先處理完）
+
+        Args:
+            timeout: 等待工作線程結束的最長時間（秒）
+        """
+        if self._thread is None:
+            return
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        if self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+        if self._thread.is_alive():
+            logger.warning(f"訂閱端 {self.name} 在 {timeout} 秒內未處理完佇列（剩餘 {self.depth} 筆）")
+
+    def get_stats(self) -> Dict:
+        """獲取統計"""
+        return {
+            'name': self.name,
+            'delivery': self.delivery,
+            'capacity': self.capacity if self.delivery == THREAD else None,
+            'depth': self.depth,
+            'max_depth': self.max_depth,
+            'delivered': self.delivered,
+            'errors': self.errors,
+            'dropped': self.dropped,
+            'blocked': self.blocked,
+            'overflowed': self.overflowed,
+            'latency': latency_summary(self.latencies),
+        }
+
+
+class Topic:
+    """具名主題：接受的事件型別、佇列滿時的處理方式與訂閱端"""
+
+    def __init__(self, name: str, types: Tuple[type, ...] = (), overflow: str = DROP_OLDEST,
+                 capacity: int = 64, block_timeout: float = 5.0):
+        """
+        初始化主題
+
+        Args:
+            name: 主題名稱（串口事件使用事件類型，例如 'working_final'）
+            types: 接受的事件型別，空表示不檢查
+            overflow: 佇列滿時的處理方式（'drop_oldest' 或 'block'）
+            capacity: 工作線程訂閱端的預設佇列上限
+            block_timeout: block 主題的發布端最長等待時間（秒）
+        """
+        if overflow not in (DROP_OLDEST, BLOCK):
+            raise ValueError(f"不支援的佇列處理方式: {overflow}")
+        self.name = name
+        self.types = tuple(types)
+        self.overflow = overflow
+        self.capacity = capacity
+        self.block_timeout = block_timeout
+
+        # 發布時只讀取列表，訂閱時整個替換（發布端不需要加鎖）
+        self.subscriptions: List[Subscription] = []
+        self.published = 0
+        self.rejected = 0
+
+    def publish(self, event) -> bool:
+        """
+        發布事件給所有訂閱端
+
+        Args:
+            event: 事件物件
+
+        Returns:
+            事件型別是否符合主題宣告
+        """
+        if self.types and not isinstance(event, self.types):
+            self.rejected += 1
+            logger.error(f"主題 {self.name} 不接受 {type(event).__name__} 事件")
+            return False
+        self.published += 1
+        subscriptions = self.subscriptions
+        if subscriptions:
+            published_at = time.perf_counter()
+            for subscription in subscriptions:
+                subscription.deliver(event, published_at)
+        return True
+
+    def get_stats(self) -> Dict:
+        """獲取統計（佇列深度與延遲合計所有訂閱端）"""
+        subscriptions = self.subscriptions
+        latencies = []
+        for subscription in subscriptions:
+            latencies.extend(subscription.latencies)
+        return {
+            'overflow': self.overflow,
+            'published': self.published,
+            'rejected': self.rejected,
+            'depth': sum(s.depth for s in subscriptions),
+            'max_depth': max((s.max_depth for s in subscriptions), default=0),
+            'dropped': sum(s.dropped for s in subscriptions),
+            'blocked': sum(s.blocked for s in subscriptions),
+            'latency': latency_summary(latencies),
+            'subscribers': [s.get_stats() for s in subscriptions],
+        }
+
+
+class EventBus:
+    """行程內事件匯流排"""
+
+    def __init__(self, capacity: int = 64, block_timeout: float = 5.0):
+        """
+        初始化事件匯流排
+
+        Args:
+            capacity: 主題未指定時的工作線程佇列上限
+            block_timeout: 主題未指定時 block 主題的發布端最長等待時間（秒）
+        """
+        self.capacity = capacity
+        self.block_timeout = block_timeout
+        self.topics: Dict[str, Topic] = {}
+        self._lock = threading.Lock()
+
+    def declare(self, name: str, types: Tuple[type, ...] = (), overflow: str = DROP_OLDEST,
+                capacity: Optional[int] = None, block_timeout: Optional[float] = None) -> Topic:
+        """
+        宣告主題（已存在時返回既有的主題）
+
+        Args:
+            name: 主題名稱
+            types: 接受的事件型別
+            overflow: 佇列滿時的處理方式（'drop_oldest' 或 'block'）
+            capacity: 工作線程佇列上限，None使用匯流排預設值
+            block_timeout: block 主題的發布端最長等待時間（秒），None使用匯流排預設值
+
+        Returns:
+            主題
+        """
+        with self._lock:
+            topic = self.topics.get(name)
+            if topic is None:
+                topic = Topic(name, types, overflow,
+                              capacity if capacity is not None else self.capacity,
+                              block_timeout if block_timeout is not None else self.block_timeout)
+                self.topics[name] = topic
+            return topic
+
+    def subscribe(self, name: str, callback: Callable, delivery: str = SYNC,
+                  capacity: Optional[int] = None, subscriber: Optional[str] = None) -> Optional[Subscription]:
+        """
+        訂閱主題
+
+        Args:
+            name: 主題名稱
+            callback: 回調函數，參數為事件物件
+            delivery: 'sync'（在發布端線程呼叫）或 'thread'（工作線程）
+            capacity: 工作線程佇列上限，None使用主題預設值
+            subscriber: 訂閱端名稱（統計與線程名稱用），None使用回調函數名稱
+
+        Returns:
+            訂閱，主題不存在或遞送方式不支援時返回None
+        """
+        topic = self.topics.get(name)
+        if topic is None:
+            logger.warning(f"未知的主題: {name}，可用的主題: {list(self.topics.keys())}")
+            return None
+        if delivery not in (SYNC, THREAD):
+            logger.error(f"不支援的遞送方式: {delivery}")
+            return None
+
+        if subscriber is None:
+            subscriber = getattr(callback, '__qualname__', None) or getattr(callback, '__name__', repr(callback))
+        subscription = Subscription(topic, callback, delivery,
+                                    capacity if capacity is not None else topic.capacity, subscriber)
+        with self._lock:
+            topic.subscriptions = topic.subscriptions + [subscription]
+        logger.debug(f"已訂閱主題: {name}（{subscriber}，{delivery}）")
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        """
+        取消訂閱（工作線程會先處理完佇列中的事件）
+
+        Args:
+            subscription: subscribe() 返回的訂閱
+        """
+        topic = subscription.topic
+        with self._lock:
+            topic.subscriptions = [s for s in topic.subscriptions if s is not subscription]
+        subscription.close()
+
+    def publish(self, name: str, event) -> bool:
+        """
+        發布事件到主題
+
+        Args:
+            name: 主題名稱
+            event: 事件物件
+
+        Returns:
+            是否發布成功（主題不存在或型別不符時返回False）
+        """
+        topic = self.topics.get(name)
+        if topic is None:
+            logger.warning(f"未知的主題: {name}")
+            return False
+        return topic.publish(event)
+
+    def close(self, timeout: Optional[float] = 5.0):
+        """
+        停止所有工作線程（佇列中剩餘的事件會先處理完）
+
+        Args:
+            timeout: 每個工作線程的最長等待時間（秒）
+        """
+        for topic in list(self.topics.values()):
+            for subscription in topic.subscriptions:
+                subscription.close(timeout)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        獲取統計
+
+        Returns:
+            每個主題的發布數、佇列深度、丟棄/等待次數與延遲
+        """
+        return {name: topic.get_stats() for name, topic in list(self.topics.items())}
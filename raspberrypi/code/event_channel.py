@@ -0,0 +1,567 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+行程間事件通道模組
+多行程模式下，擷取行程（串口 + 數據庫）以 Unix socket 提供：
+
+- 事件轉送：客戶端訂閱主題後，伺服端以事件匯流排的工作線程訂閱端轉送，
+  沿用主題的佇列處理方式（遙測丟棄最舊、測量結果等待），處理較慢的客戶端不會拖慢串口讀取
+- 遠端呼叫：客戶端呼叫伺服端允許清單中的方法（繼電器控制、即時讀取、統計）
+
+訊息為 4 bytes 長度 + pickle 的 tuple：
+    客戶端 -> 伺服端: ('subscribe', 主題) / ('call', 請求ID, 目標, 方法, args, kwargs)
+    伺服端 -> 客戶端: ('event', 主題, 事件) / ('result', 請求ID, 是否成功, 返回值) / ('callback', 請求ID, 參數)
+
+客戶端斷線後以指數退避重連並重新訂閱，伺服端（擷取行程）重啟時 API 與 UI 行程不需要重啟。
+本地代理 RemoteCommunicator 提供與 BMduinoCommunicator 相同的讀取介面（register_callback、latest、
+control_relay、read 與統計），原本使用通訊模組的 UI 與 API 程式碼不需要修改
+"""
+
+import os
+import pickle
+import socket
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import NamedTuple, Optional, Callable, Dict, Tuple, Any, List
+import logging
+
+from code.event_bus import EventBus, DROP_OLDEST, BLOCK, SYNC, THREAD
+from code.protocol import EVENT_TYPES, TELEMETRY_KINDS
+from code.reconnect import ReconnectBackoff
+
+logger = logging.getLogger(__name__)
+
+_LENGTH = struct.Struct('<I')
+MAX_MESSAGE = 16 * 1024 * 1024
+
+
+class RelayResult(NamedTuple):
+    """繼電器命令結果（RelayCommand 含線程物件無法跨行程傳送，只傳送結果欄位）"""
+    relay_num: int
+    status: str
+    error: Optional[str]
+    rtt_ms: Optional[float]
+    ok: bool
+
+
+def send_message(sock: socket.socket, message: tuple):
+    """送出一則訊息（呼叫端負責同一個 socket 的寫入互斥）"""
+    payload = pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL)
+    sock.sendall(_LENGTH.pack(len(payload)) + payload)
+
+
+def _recv_exact(sock: socket.socket, size: int) -> Optional[bytes]:
+    """讀取剛好 size bytes，對方關閉連線時返回None"""
+    data = bytearray(size)
+    view = memoryview(data)
+    received = 0
+    while received < size:
+        count = sock.recv_into(view[received:])
+        if count == 0:
+            return None
+        received += count
+    return bytes(data)
+
+
+def recv_message(sock: socket.socket) -> Optional[tuple]:
+    """讀取一則訊息，對方關閉連線時返回None"""
+    header = _recv_exact(sock, _LENGTH.size)
+    if header is None:
+        return None
+    length = _LENGTH.unpack(header)[0]
+    if length > MAX_MESSAGE:
+        raise ValueError(f"訊息過大: {length} bytes")
+    payload = _recv_exact(sock, length)
+    if payload is None:
+        return None
+    return pickle.loads(payload)
+
+
+class _ServerConnection:
+    """伺服端的一個客戶端連線"""
+
+    def __init__(self, server: 'EventChannelServer', sock: socket.socket, number: int):
+        self.server = server
+        self.sock = sock
+        self.number = number
+        self.name = f"channel-{number}"
+        self.subscriptions = []
+        self._send_lock = threading.Lock()
+        self.closed = False
+        self.events_sent = 0
+        self.thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+
+    def send(self, message: tuple) -> bool:
+        """送出訊息，失敗時關閉連線"""
+        if self.closed:
+            return False
+        try:
+            with self._send_lock:
+                send_message(self.sock, message)
+            return True
+        except OSError as e:
+            logger.warning(f"事件通道 {self.name} 寫入失敗: {e}")
+            self.close()
+            return False
+
+    def _forward(self, topic: str, event):
+        """事件匯流排訂閱端（工作線程）：轉送事件給客戶端"""
+        if self.send(('event', topic, event)):
+            self.events_sent += 1
+
+    def _run(self):
+        """讀取客戶端的訂閱與呼叫請求"""
+        try:
+            while not self.closed:
+                message = recv_message(self.sock)
+                if message is None:
+                    break
+                self._handle(message)
+        except (OSError, ValueError, pickle.UnpicklingError, EOFError) as e:
+            if not self.closed:
+                logger.warning(f"事件通道 {self.name} 讀取錯誤: {e}")
+        finally:
+            self.close()
+
+    def _handle(self, message: tuple):
+        command = message[0]
+        if command == 'subscribe':
+            topic = message[1]
+            subscription = self.server.bus.subscribe(topic, partial(self._forward, topic), delivery=THREAD,
+                                                     subscriber=self.name)
+            if subscription is not None:
+                self.subscriptions.append(subscription)
+        elif command == 'call':
+            self.server.executor.submit(self.server.call, self, *message[1:])
+        else:
+            logger.warning(f"事件通道 {self.name} 未知的請求: {command}")
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+        # 在其他線程取消訂閱：轉送的工作線程可能正是呼叫 close() 的線程
+        subscriptions, self.subscriptions = self.subscriptions, []
+        for subscription in subscriptions:
+            threading.Thread(target=self.server.bus.unsubscribe, args=(subscription,), daemon=True).start()
+        self.server.remove(self)
+
+
+class EventChannelServer:
+    """事件通道伺服端（擷取行程）"""
+
+    def __init__(self, path: str, bus: EventBus, targets: Dict[str, Tuple[Any, Tuple[str, ...]]],
+                 send_timeout: float = 5.0, call_workers: int = 4):
+        """
+        初始化伺服端
+
+        Args:
+            path: Unix socket 路徑
+            bus: 轉送事件的事件匯流排
+            targets: 允許遠端呼叫的物件，{名稱: (物件, 允許的方法名稱)}；物件為None時該目標不可用
+            send_timeout: 寫入單一客戶端的最長等待時間（秒），超過時中斷該客戶端
+            call_workers: 處理遠端呼叫的線程數
+        """
+        self.path = path
+        self.bus = bus
+        self.targets = targets
+        self.send_timeout = send_timeout
+        self.executor = ThreadPoolExecutor(max_workers=call_workers, thread_name_prefix='channel-call')
+        self.connections: List[_ServerConnection] = []
+        self._lock = threading.Lock()
+        self._sock: Optional[socket.socket] = None
+        self._accept_thread: Optional[threading.Thread] = None
+        self.running = False
+        self.accepted = 0
+        self.calls = 0
+        self.call_errors = 0
+
+    def start(self) -> bool:
+        """
+        開始監聽
+
+        Returns:
+            是否成功
+        """
+        try:
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+            self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._sock.bind(self.path)
+            self._sock.listen(8)
+        except OSError as e:
+            logger.error(f"事件通道監聽失敗: {self.path}: {e}")
+            return False
+        self.running = True
+        self._accept_thread = threading.Thread(target=self._accept_loop, name='channel-accept', daemon=True)
+        self._accept_thread.start()
+        logger.info(f"事件通道已啟動: {self.path}")
+        return True
+
+    def _accept_loop(self):
+        while self.running:
+            try:
+                sock, _ = self._sock.accept()
+            except OSError:
+                break
+            # 只限制寫入時間（讀取端一直等待客戶端的請求）
+            seconds = int(self.send_timeout)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDTIMEO,
+                            struct.pack('ll', seconds, int((self.send_timeout - seconds) * 1e6)))
+            self.accepted += 1
+            connection = _ServerConnection(self, sock, self.accepted)
+            with self._lock:
+                self.connections.append(connection)
+            connection.thread.start()
+            logger.info(f"事件通道客戶端已連接: {connection.name}")
+
+    def remove(self, connection: _ServerConnection):
+        with self._lock:
+            if connection in self.connections:
+                self.connections.remove(connection)
+                logger.info(f"事件通道客戶端已中斷: {connection.name}")
+
+    def call(self, connection: _ServerConnection, request_id: int, target: str, method: str,
+             args: tuple, kwargs: dict):
+        """執行一個遠端呼叫並回覆結果（在呼叫線程池中執行）"""
+        self.calls += 1
+        obj, allowed = self.targets.get(target, (None, ()))
+        if obj is None or method not in allowed:
+            self.call_errors += 1
+            connection.send(('result', request_id, False, f"不允許的遠端呼叫: {target}.{method}"))
+            return
+        if method == 'control_relay':
+            # 完成回調轉送給客戶端
+            kwargs = dict(kwargs, on_result=partial(self._relay_done, connection, request_id))
+        try:
+            value = getattr(obj, method)(*args, **kwargs)
+            connection.send(('result', request_id, True, value))
+        except Exception as e:
+            self.call_errors += 1
+            logger.error(f"遠端呼叫 {target}.{method} 錯誤: {e}")
+            connection.send(('result', request_id, False, str(e)))
+
+    @staticmethod
+    def _relay_done(connection: _ServerConnection, request_id: int, command):
+        connection.send(('callback', request_id, RelayResult(
+            command.relay_num, command.status, command.error, command.rtt_ms, command.ok)))
+
+    def stop(self):
+        """停止監聽並中斷所有客戶端"""
+        self.running = False
+        if self._sock is not None:
+            try:
+                self._sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self._sock.close()
+        for connection in list(self.connections):
+            connection.close()
+        self.executor.shutdown(wait=False)
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+        logger.info("事件通道已停止")
+
+    def get_stats(self) -> Dict:
+        """獲取統計"""
+        return {
+            'clients': len(self.connections),
+            'accepted': self.accepted,
+            'calls': self.calls,
+            'call_errors': self.call_errors,
+            'events_sent': {c.name: c.events_sent for c in list(self.connections)},
+        }
+
+
+class EventChannelClient:
+    """事件通道客戶端（API 與 UI 行程）：收到的事件發布到本地事件匯流排"""
+
+    def __init__(self, path: str, bus: EventBus, reconnect_initial: float = 0.05, reconnect_max: float = 2.0):
+        """
+        初始化客戶端
+
+        Args:
+            path: 伺服端的 Unix socket 路徑
+            bus: 本地事件匯流排（需已宣告要訂閱的主題）
+            reconnect_initial: 斷線後第一次重連前的等待時間（秒）
+            reconnect_max: 重連等待時間上限（秒）
+        """
+        self.path = path
+        self.bus = bus
+        self.backoff = ReconnectBackoff(initial=reconnect_initial, maximum=reconnect_max)
+        self.topics: List[str] = []
+        self.connected = False
+        self.running = False
+        self._sock: Optional[socket.socket] = None
+        self._send_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._connected_event = threading.Event()
+
+        # 等待中的呼叫：{請求ID: [完成通知, 是否成功, 返回值]}；完成回調：{請求ID: 回調}
+        self._pending: Dict[int, list] = {}
+        self._callbacks: Dict[int, Callable] = {}
+        self._next_id = 0
+        self._id_lock = threading.Lock()
+
+        self.connects = 0
+        self.events_received = 0
+
+    def start(self):
+        """啟動連線線程（連線失敗時持續重試）"""
+        if self.running:
+            return
+        self.running = True
+        self._thread = threading.Thread(target=self._run, name='channel-client', daemon=True)
+        self._thread.start()
+
+    def wait_connected(self, timeout: Optional[float] = None) -> bool:
+        """等待連上伺服端"""
+        return self._connected_event.wait(timeout)
+
+    def subscribe(self, topic: str):
+        """訂閱伺服端的主題（重連後自動重新訂閱）"""
+        if topic in self.topics:
+            return
+        self.topics.append(topic)
+        if self.connected:
+            self._send(('subscribe', topic))
+
+    def call(self, target: str, method: str, args: tuple = (), kwargs: Optional[dict] = None,
+             timeout: float = 2.0, on_callback: Optional[Callable] = None) -> Any:
+        """
+        遠端呼叫
+
+        Args:
+            target: 目標名稱（例如 'communicator'）
+            method: 方法名稱
+            args: 位置參數
+            kwargs: 關鍵字參數
+            timeout: 等待結果的最長時間（秒）
+            on_callback: 伺服端之後送回的回調（例如繼電器命令完成）
+
+        Returns:
+            返回值，未連接、逾時或伺服端錯誤時返回None
+        """
+        if not self.connected:
+            logger.warning(f"事件通道未連接，無法呼叫 {target}.{method}")
+            return None
+        with self._id_lock:
+            self._next_id += 1
+            request_id = self._next_id
+        waiter = [threading.Event(), False, None]
+        self._pending[request_id] = waiter
+        if on_callback is not None:
+            self._callbacks[request_id] = on_callback
+        try:
+            if not self._send(('call', request_id, target, method, tuple(args), kwargs or {})):
+                return None
+            if not waiter[0].wait(timeout):
+                logger.warning(f"遠端呼叫 {target}.{method} 逾時")
+                return None
+        finally:
+            self._pending.pop(request_id, None)
+        if not waiter[1]:
+            self._callbacks.pop(request_id, None)
+            logger.error(f"遠端呼叫 {target}.{method} 失敗: {waiter[2]}")
+            return None
+        return waiter[2]
+
+    def _send(self, message: tuple) -> bool:
+        sock = self._sock
+        if sock is None:
+            return False
+        try:
+            with self._send_lock:
+                send_message(sock, message)
+            return True
+        except OSError as e:
+            logger.warning(f"事件通道寫入失敗: {e}")
+            self._drop(sock)
+            return False
+
+    def _run(self):
+        """連線、重新訂閱並讀取伺服端訊息；斷線後以指數退避重連"""
+        while self.running:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(self.path)
+            except OSError:
+                sock.close()
+                time.sleep(self.backoff.next_delay())
+                continue
+            self.backoff.reset()
+            self._sock = sock
+            self.connected = True
+            self.connects += 1
+            for topic in list(self.topics):
+                self._send(('subscribe', topic))
+            self._connected_event.set()
+            logger.info(f"事件通道已連接: {self.path}")
+            try:
+                while self.running:
+                    message = recv_message(sock)
+                    if message is None:
+                        break
+                    self._handle(message)
+            except (OSError, ValueError, pickle.UnpicklingError, EOFError) as e:
+                if self.running:
+                    logger.warning(f"事件通道讀取錯誤: {e}")
+            self._drop(sock)
+            if self.running:
+                logger.warning("事件通道已中斷，等待擷取行程重新啟動")
+
+    def _handle(self, message: tuple):
+        kind = message[0]
+        if kind == 'event':
+            self.events_received += 1
+            self.bus.publish(message[1], message[2])
+        elif kind == 'result':
+            waiter = self._pending.get(message[1])
+            if waiter is not None:
+                waiter[1], waiter[2] = message[2], message[3]
+                waiter[0].set()
+        elif kind == 'callback':
+            callback = self._callbacks.pop(message[1], None)
+            if callback is not None:
+                try:
+                    callback(message[2])
+                except Exception as e:
+                    logger.error(f"遠端回調執行錯誤: {e}")
+
+    def _drop(self, sock: socket.socket):
+        """中斷目前連線，等待中的呼叫立即失敗"""
+        if self._sock is not sock:
+            return
+        self._sock = None
+        self.connected = False
+        self._connected_event.clear()
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        sock.close()
+        for waiter in list(self._pending.values()):
+            waiter[2] = '連線中斷'
+            waiter[0].set()
+        self._callbacks.clear()
+
+    def stop(self):
+        """停止客戶端"""
+        self.running = False
+        sock = self._sock
+        if sock is not None:
+            self._drop(sock)
+        if self._thread:
+            self._thread.join(timeout=2.0)
+
+    def get_stats(self) -> Dict:
+        """獲取統計"""
+        return {
+            'connected': self.connected,
+            'connects': self.connects,
+            'events_received': self.events_received,
+            'topics': list(self.topics),
+        }
+
+
+class RemoteObject:
+    """遠端物件代理：任何方法呼叫都轉為事件通道的遠端呼叫（例如 get_stats）"""
+
+    def __init__(self, client: EventChannelClient, target: str, timeout: float = 2.0):
+        self._client = client
+        self._target = target
+        self._timeout = timeout
+
+    def __getattr__(self, method: str):
+        if method.startswith('_'):
+            raise AttributeError(method)
+        return lambda *args, **kwargs: self._client.call(self._target, method, args, kwargs, self._timeout)
+
+
+class RemoteTopic:
+    """遠端主題的結果來源：提供 register_callback(callback)（例如 measurement_result）"""
+
+    def __init__(self, communicator: 'RemoteCommunicator', topic: str):
+        self.communicator = communicator
+        self.topic = topic
+
+    def register_callback(self, callback: Callable, delivery: str = SYNC):
+        return self.communicator.register_callback(self.topic, callback, delivery)
+
+
+class RemoteCommunicator:
+    """擷取行程中 BMduinoCommunicator 的本地代理"""
+
+    def __init__(self, client: EventChannelClient, latest: Optional[Dict[str, Any]] = None):
+        """
+        初始化代理
+
+        Args:
+            client: 事件通道客戶端（其事件匯流排會宣告所有串口事件主題）
+            latest: 最新值暫存器（通常為 SharedSnapshot），{'standby': ..., 'working_status': ...}
+        """
+        self.client = client
+        self.bus = client.bus
+        self.topics = {
+            kind: self.bus.declare(kind, (event_type,), DROP_OLDEST if kind in TELEMETRY_KINDS else BLOCK)
+            for kind, event_type in EVENT_TYPES.items()
+        }
+        self.latest = latest or {}
+
+    def register_callback(self, event: str, callback: Callable, delivery: str = SYNC,
+                          capacity: Optional[int] = None):
+        """
+        註冊回調函數（訂閱本地事件匯流排，並向擷取行程訂閱該主題）
+
+        Args:
+            event: 事件類型或主題名稱（主題需已在本地事件匯流排宣告）
+            callback: 回調函數，參數為事件物件（在事件通道的讀取線程或工作線程中呼叫）
+            delivery: 'sync' 或 'thread'
+            capacity: 工作線程佇列上限
+
+        Returns:
+            訂閱，主題不存在時返回None
+        """
+        subscription = self.bus.subscribe(event, callback, delivery, capacity)
+        if subscription is not None:
+            self.client.subscribe(event)
+        return subscription
+
+    def control_relay(self, relay_num: int, on_result: Optional[Callable] = None) -> bool:
+        """
+        控制繼電器（由擷取行程加入命令佇列）
+
+        Args:
+            relay_num: 繼電器編號 (1-4)
+            on_result: 完成時的回調，參數為 RelayResult
+
+        Returns:
+            是否已加入命令佇列
+        """
+        return bool(self.client.call('communicator', 'control_relay', (relay_num,), on_callback=on_result))
+
+    def read(self, timeout: float = 1.0):
+        """要求BMduino立即回報一次目前數據（見 BMduinoCommunicator.read）"""
+        return self.client.call('communicator', 'read', kwargs={'timeout': timeout}, timeout=timeout + 1.0)
+
+    def get_relay_stats(self) -> Optional[Dict]:
+        return self.client.call('communicator', 'get_relay_stats')
+
+    def get_link_stats(self) -> Optional[Dict]:
+        return self.client.call('communicator', 'get_link_stats')
+
+    def get_stamp_stats(self) -> Optional[Dict]:
+        return self.client.call('communicator', 'get_stamp_stats')
+
+    def get_reader_stats(self) -> Optional[Dict]:
+        return self.client.call('communicator', 'get_reader_stats')
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+單線程事件迴圈模組
+取代無介面模式中的 Qt 事件迴圈：其他線程（串口、工作線程、電腦視覺）以 call_soon 把工作交給迴圈線程，
+延遲轉換以 call_later 排程，所有狀態機操作都在同一個線程中依序執行（與 QTimer.singleShot 的用法相同）
+
+排程以注入的時鐘計時：使用 VirtualClock 時，沒有到期的工作就直接把時間推進到下一個排程，
+沒有任何排程時 run() 返回（加速模擬）
+"""
+
+import heapq
+import itertools
+import threading
+from typing import Callable, Optional, Dict
+import logging
+
+from code.clock import Clock, REAL_CLOCK
+
+logger = logging.getLogger(__name__)
+
+
+class TimerHandle:
+    """排程中的工作（可取消）"""
+
+    __slots__ = ('when', 'callback', 'args', 'cancelled')
+
+    def __init__(self, when: float, callback: Callable, args: tuple):
+        self.when = when
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        """取消（已執行的工作不受影響）"""
+        self.cancelled = True
+
+    def is_active(self) -> bool:
+        """尚未執行也未取消"""
+        return not self.cancelled and self.callback is not None
+
+
+class EventLoop:
+    """單線程事件迴圈（call_soon / call_later 可由任意線程呼叫）"""
+
+    def __init__(self, clock: Optional[Clock] = None):
+        """
+        初始化事件迴圈
+
+        Args:
+            clock: 排程使用的時鐘，None表示實際時間
+        """
+        self.clock = clock if clock is not None else REAL_CLOCK
+        self._heap = []
+        self._counter = itertools.count()
+        # 可重入鎖：信號處理器在迴圈線程持有鎖時呼叫 stop() 不會死結
+        self._condition = threading.Condition(threading.RLock())
+        self._running = True
+        self._thread_id: Optional[int] = None
+
+        # 統計
+        self.executed = 0
+        self.errors = 0
+        self.max_lag_ms = 0.0
+
+    def call_soon(self, callback: Callable, *args) -> TimerHandle:
+        """盡快在迴圈線程中執行 callback(*args)"""
+        return self.call_later(0.0, callback, *args)
+
+    def call_later(self, delay: float, callback: Callable, *args) -> TimerHandle:
+        """
+        延遲後在迴圈線程中執行 callback(*args)
+
+        Args:
+            delay: 延遲秒數
+            callback: 回調函數
+
+        Returns:
+            可取消的排程
+        """
+        handle = TimerHandle(self.clock.monotonic() + max(delay, 0.0), callback, args)
+        with self._condition:
+            heapq.heappush(self._heap, (handle.when, next(self._counter), handle))
+            self._condition.notify()
+        return handle
+
+    def in_loop_thread(self) -> bool:
+        """目前是否在迴圈線程中"""
+        return threading.get_ident() == self._thread_id
+
+    def run(self):
+        """
+        在目前線程執行迴圈，直到 stop() 被呼叫（在 run() 之前呼叫 stop() 時立即返回）；
+        虛擬時鐘沒有任何排程時也返回
+        """
+        self._thread_id = threading.get_ident()
+        virtual = self.clock.virtual
+        while True:
+            with self._condition:
+                while self._running:
+                    if self._heap:
+                        when = self._heap[0][0]
+                        delay = when - self.clock.monotonic()
+                        if delay <= 0:
+                            break
+                        if virtual:
+                            self.clock.advance_to(when)
+                            break
+                        self._condition.wait(delay)
+                    elif virtual:
+                        self._running = False
+                    else:
+                        self._condition.wait()
+                if not self._running:
+                    break
+                _, _, handle = heapq.heappop(self._heap)
+            if handle.cancelled:
+                continue
+            lag_ms = (self.clock.monotonic() - handle.when) * 1000
+            if lag_ms > self.max_lag_ms:
+                self.max_lag_ms = lag_ms
+            callback, args = handle.callback, handle.args
+            handle.callback = None
+            try:
+                callback(*args)
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"事件迴圈回調錯誤 {getattr(callback, '__qualname__', callback)}: {e}")
+            self.executed += 1
+        self._thread_id = None
+
+    def stop(self):
+        """停止迴圈（可由任意線程或信號處理器呼叫；尚未執行的工作捨棄）"""
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+
+    def get_stats(self) -> Dict:
+        """獲取統計"""
+        with self._condition:
+            pending = sum(1 for _, _, handle in self._heap if not handle.cancelled)
+        return {
+            'executed': self.executed,
+            'pending': pending,
+            'errors': self.errors,
+            'max_lag_ms': round(self.max_lag_ms, 2),
+        }
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+最新值暫存器模組
+串口線程每收到一筆遙測數據只發布一次；API、UI 等任意數量的讀取端取得一致的快照，
+或等待比手上更新的版本。讀取端只會看到最新值，處理較慢的讀取端不會累積過期的樣本
+
+快照是不可變的 (版本, 數值, 發布時間)，發布時以單一屬性賦值整個替換，
+讀取不需要加鎖；只有在有讀取端等待新版本時，發布端才會取得條件變數通知
+（設計為單一發布端，例如串口線程）
+"""
+
+import threading
+import time
+from typing import NamedTuple, Optional, Any, Dict
+
+
+class Snapshot(NamedTuple):
+    """一個版本的數值"""
+    version: int            # 0 表示尚未發布
+    value: Any
+    published_at: float     # time.monotonic()
+
+
+class LatestValue:
+    """版本化的最新值暫存器"""
+
+    def __init__(self, initial: Any = None):
+        """
+        初始化暫存器
+
+        Args:
+            initial: 尚未發布前的數值（版本 0）
+        """
+        self._snapshot = Snapshot(0, initial, time.monotonic())
+        self._condition = threading.Condition()
+        self._waiters = 0
+
+    def publish(self, value: Any) -> int:
+        """
+        發布新數值（數值應為不可變物件，例如事件 NamedTuple）
+
+        Args:
+            value: 新數值
+
+        Returns:
+            新版本號
+        """
+        snapshot = Snapshot(self._snapshot.version + 1, value, time.monotonic())
+        self._snapshot = snapshot
+        if self._waiters:
+            with self._condition:
+                self._condition.notify_all()
+        return snapshot.version
+
+    def get(self) -> Snapshot:
+        """取得目前快照（不加鎖）"""
+        return self._snapshot
+
+    @property
+    def version(self) -> int:
+        return self._snapshot.version
+
+    @property
+    def value(self) -> Any:
+        return self._snapshot.value
+
+    def wait_newer(self, version: int, timeout: Optional[float] = None) -> Optional[Snapshot]:
+        """
+        等待版本號大於 version 的快照
+
+        Args:
+            version: 讀取端已經看過的版本
+            timeout: 最長等待時間（秒），None表示一直等待
+
+        Returns:
+            較新的快照，超時返回None
+        """
+        snapshot = self._snapshot
+        if snapshot.version > version:
+            return snapshot
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            # 先登記等待再檢查版本：發布端在登記之後發布時一定會通知
+            self._waiters += 1
+            try:
+                while True:
+                    snapshot = self._snapshot
+                    if snapshot.version > version:
+                        return snapshot
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        return None
+                    self._condition.wait(remaining)
+            finally:
+                self._waiters -= 1
+
+    def reader(self) -> 'LatestReader':
+        """建立一個記錄讀取進度的讀取端"""
+        return LatestReader(self)
+
+
+class LatestReader:
+    """暫存器的讀取端：只取比上次更新的快照，並統計被合併（跳過）的版本數"""
+
+    def __init__(self, register: LatestValue):
+        self.register = register
+        self.version = 0
+        self.received = 0
+        self.coalesced = 0
+
+    def poll(self) -> Optional[Snapshot]:
+        """
+        取得比上次讀到的更新的快照（不等待）
+
+        Returns:
+            新快照，沒有更新時返回None
+        """
+        snapshot = self.register.get()
+        if snapshot.version <= self.version:
+            return None
+        return self._take(snapshot)
+
+    def wait(self, timeout: Optional[float] = None) -> Optional[Snapshot]:
+        """
+        等待比上次讀到的更新的快照
+
+        Args:
+            timeout: 最長等待時間（秒）
+
+        Returns:
+            新快照，超時返回None
+        """
+        snapshot = self.register.wait_newer(self.version, timeout)
+        if snapshot is None:
+            return None
+        return self._take(snapshot)
+
+    def _take(self, snapshot: Snapshot) -> Snapshot:
+        if self.version:
+            self.coalesced += snapshot.version - self.version - 1
+        self.version = snapshot.version
+        self.received += 1
+        return snapshot
+
+    def get_stats(self) -> Dict:
+        """獲取統計"""
+        return {
+            'version': self.version,
+            'received': self.received,
+            'coalesced': self.coalesced,
+        }
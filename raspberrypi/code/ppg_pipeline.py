@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+PPG 原始波形處理模組
+將 BMduino 串流的 MAX30102 紅光/紅外光原始樣本累積在滑動視窗中，以 NumPy 向量化計算：
+- 直流成分：1 秒移動平均；交流成分：原始值減去直流後再以短移動平均平滑
+- 心率：紅外光脈搏波峰（血液量增加時吸收增加、原始值下降，取反相後的波峰）間隔的中位數
+- 血氧：紅光與紅外光的 (AC/DC) 比值比 R，以 Maxim 參考演算法的校正曲線換算
+- 訊號品質指標：灌注指數、偏度、心跳間隔變異係數、紅光/紅外光相關係數
+
+每收到一批樣本只做一次陣列位移；每隔一個步長（預設 1 秒）才對整個視窗計算一次
+"""
+
+import math
+from typing import NamedTuple, Optional, Tuple, Dict
+import logging
+
+import numpy as np
+
+from code.protocol import PpgEvent
+
+logger = logging.getLogger(__name__)
+
+# Maxim 參考演算法的血氧校正曲線：SpO2 = A*R^2 + B*R + C
+SPO2_A = -45.060
+SPO2_B = 30.354
+SPO2_C = 94.845
+
+# 樣本編號為 32 位元（回繞）
+_INDEX_MODULO = 1 << 32
+
+
+class PpgResult(NamedTuple):
+    """一個視窗的計算結果"""
+    heart_rate: Optional[float]      # BPM，波峰不足時為 None
+    spo2: Optional[float]            # %，沒有手指或訊號太弱時為 None
+    perfusion_index: float           # 紅外光 AC/DC（%）
+    skewness: float                  # 脈搏波偏度（良好的 PPG 為正值）
+    ibi_cv: Optional[float]          # 心跳間隔變異係數（規律的脈搏 < 0.15）
+    correlation: float               # 紅光與紅外光交流成分的相關係數
+    finger: bool                     # 紅外光直流是否超過有手指的門檻
+    valid: bool                      # 所有品質指標都通過
+    end_index: int                   # 視窗最後一個樣本的編號
+
+
+class PpgPipeline:
+    """PPG 滑動視窗處理管線"""
+
+    def __init__(self, sample_rate: float = 100.0, window_seconds: float = 8.0,
+                 min_window_seconds: float = 4.0, hop_seconds: float = 1.0,
+                 finger_threshold: float = 50000.0):
+        """
+        初始化管線
+
+        Args:
+            sample_rate: 取樣頻率（Hz，需與 RATE,PPG 設定的頻率相同）
+            window_seconds: 計算使用的視窗長度（秒）
+            min_window_seconds: 視窗未滿時，至少累積多少秒才開始計算
+            hop_seconds: 兩次計算之間的間隔（秒）
+            finger_threshold: 紅外光直流超過此值視為有手指（與韌體相同）
+        """
+        self.sample_rate = sample_rate
+        self.capacity = int(window_seconds * sample_rate)
+        self.min_samples = int(min_window_seconds * sample_rate)
+        self.hop = max(1, int(hop_seconds * sample_rate))
+        self.finger_threshold = finger_threshold
+
+        # 濾波與波峰偵測參數（樣本數）
+        self._dc_width = max(3, int(sample_rate))               # 1 秒移動平均
+        self._smooth_width = max(1, int(sample_rate * 0.08))    # 約 12 Hz 低通
+        self._min_peak_distance = int(sample_rate * 60 / 220)   # 心率上限 220 BPM
+
+        self._buffer = np.zeros((2, self.capacity))
+        self._filled = 0
+        self._since_compute = 0
+        self._next_index: Optional[int] = None
+
+        self.latest: Optional[PpgResult] = None
+        self.samples = 0
+        self.gaps = 0
+        self.lost_samples = 0
+        self.windows = 0
+
+    def reset(self):
+        """清空視窗（樣本不連續或停止串流時使用）"""
+        self._filled = 0
+        self._since_compute = 0
+        self._next_index = None
+
+    def feed(self, event: PpgEvent) -> Optional[PpgResult]:
+        """
+        加入一批樣本
+
+        Args:
+            event: PPG 事件
+
+        Returns:
+            到達計算間隔時返回計算結果，否則返回None
+        """
+        count = event.count
+        if count == 0:
+            return None
+        if self._next_index is not None and event.start_index != self._next_index:
+            # 樣本不連續：濾波器無法跨過缺口，重新累積視窗
+            self.gaps += 1
+            self.lost_samples += (event.start_index - self._next_index) % _INDEX_MODULO
+            self.reset()
+        self._next_index = (event.start_index + count) % _INDEX_MODULO
+
+        samples = np.frombuffer(event.samples, dtype='<u4').reshape(count, 2).T
+        self._append(samples)
+        self.samples += count
+        self._since_compute += count
+
+        if self._filled < self.min_samples or self._since_compute < self.hop:
+            return None
+        self._since_compute = 0
+        red, ir = self._buffer[:, self.capacity - self._filled:]
+        self.latest = self.compute(red, ir, self._next_index - 1)
+        self.windows += 1
+        return self.latest
+
+    def _append(self, samples: np.ndarray):
+        """將新樣本移入視窗尾端"""
+        count = samples.shape[1]
+        buffer = self._buffer
+        if count >= self.capacity:
+            buffer[:] = samples[:, -self.capacity:]
+        else:
+            buffer[:, :-count] = buffer[:, count:]
+            buffer[:, -count:] = samples
+        self._filled = min(self.capacity, self._filled + count)
+
+    def compute(self, red: np.ndarray, ir: np.ndarray, end_index: int = 0) -> PpgResult:
+        """
+        計算一個視窗
+
+        Args:
+            red: 紅光原始樣本
+            ir: 紅外光原始樣本
+            end_index: 視窗最後一個樣本的編號
+
+        Returns:
+            計算結果
+        """
+        ac_red, dc_red = self._split(red)
+        ac_ir, dc_ir = self._split(ir)
+        finger = dc_ir > self.finger_threshold
+
+        # 脈搏波：紅外光交流成分取反相（血液量增加時原始值下降）
+        pulse = -ac_ir
+        amplitude_ir = _amplitude(ac_ir)
+        amplitude_red = _amplitude(ac_red)
+        perfusion_index = amplitude_ir / dc_ir * 100 if dc_ir > 0 else 0.0
+        skewness = _skewness(pulse)
+        correlation = _correlation(ac_red, ac_ir)
+
+        heart_rate = ibi_cv = None
+        peaks = self._find_peaks(pulse) if finger else ()
+        if len(peaks) >= 3:
+            intervals = np.diff(peaks) / self.sample_rate
+            heart_rate = 60.0 / float(np.median(intervals))
+            ibi_cv = float(intervals.std() / intervals.mean())
+
+        spo2 = None
+        if finger and amplitude_ir > 0 and dc_red > 0:
+            ratio = (amplitude_red / dc_red) / (amplitude_ir / dc_ir)
+            spo2 = min(100.0, max(0.0, SPO2_A * ratio * ratio + SPO2_B * ratio + SPO2_C))
+
+        valid = bool(finger and heart_rate is not None and 30 <= heart_rate <= 220
+                     and ibi_cv < 0.25 and correlation > 0.7 and skewness > 0)
+        return PpgResult(heart_rate, spo2, perfusion_index, skewness, ibi_cv,
+                         correlation, bool(finger), valid, end_index)
+
+    def _split(self, signal: np.ndarray) -> Tuple[np.ndarray, float]:
+        """分離交流（平滑後）與直流成分"""
+        dc = _moving_average(signal, self._dc_width)
+        offset = self._dc_width // 2
+        ac = signal[offset:offset + len(dc)] - dc
+        if self._smooth_width > 1:
+            ac = _moving_average(ac, self._smooth_width)
+        return ac, float(dc.mean())
+
+    def _find_peaks(self, pulse: np.ndarray) -> np.ndarray:
+        """
+        找出脈搏波峰：先以向量化比較找出所有高於門檻的局部最大值，
+        再依最小間隔（不應期）保留較高的波峰
+        """
+        if len(pulse) < 3:
+            return np.empty(0, dtype=int)
+        threshold = 0.3 * pulse.std()
+        middle = pulse[1:-1]
+        candidates = np.flatnonzero((middle > pulse[:-2]) & (middle >= pulse[2:]) & (middle > threshold)) + 1
+        if len(candidates) < 2:
+            return candidates
+        peaks = [candidates[0]]
+        for index in candidates[1:]:
+            if index - peaks[-1] >= self._min_peak_distance:
+                peaks.append(index)
+            elif pulse[index] > pulse[peaks[-1]]:
+                peaks[-1] = index
+        return np.asarray(peaks)
+
+    def get_stats(self) -> Dict:
+        """獲取統計"""
+        return {
+            'samples': self.samples,
+            'windows': self.windows,
+            'gaps': self.gaps,
+            'lost_samples': self.lost_samples,
+            'latest': self.latest._asdict() if self.latest else None,
+        }
+
+
+def _moving_average(signal: np.ndarray, width: int) -> np.ndarray:
+    """以累積和計算移動平均（只保留完整視窗，長度為 len - width + 1）"""
+    cumulative = np.cumsum(signal, dtype=float)
+    cumulative[width:] = cumulative[width:] - cumulative[:-width]
+    return cumulative[width - 1:] / width
+
+
+def _amplitude(ac: np.ndarray) -> float:
+    """交流成分的峰對峰振幅（取第 5 與第 95 百分位數，排除突波）"""
+    low, high = np.percentile(ac, (5, 95))
+    return float(high - low)
+
+
+def _skewness(signal: np.ndarray) -> float:
+    centered = signal - signal.mean()
+    std = centered.std()
+    if std == 0:
+        return 0.0
+    return float(np.mean(centered ** 3) / std ** 3)
+
+
+def _correlation(a: np.ndarray, b: np.ndarray) -> float:
+    a = a - a.mean()
+    b = b - b.mean()
+    denominator = math.sqrt(float(np.dot(a, a)) * float(np.dot(b, b)))
+    return float(np.dot(a, b)) / denominator if denominator else 0.0
+
+
+# ========== 合成波形（虛擬BMduino與效能測試使用） ==========
+
+def ratio_for_spo2(spo2: float) -> float:
+    """校正曲線的反函數：取得產生指定血氧的比值比 R（取曲線下降段）"""
+    discriminant = SPO2_B * SPO2_B - 4 * SPO2_A * (SPO2_C - spo2)
+    return (SPO2_B + math.sqrt(max(0.0, discriminant))) / (-2 * SPO2_A)
+
+
+class PpgSynthesizer:
+    """連續的合成 PPG 波形產生器（心率變異、呼吸基線飄移與雜訊）"""
+
+    def __init__(self, sample_rate: float = 100.0, heart_rate: float = 72.0, spo2: float = 97.0,
+                 dc_ir: float = 120000.0, perfusion: float = 0.02, noise: float = 0.001,
+                 finger: bool = True, seed: Optional[int] = None):
+        """
+        初始化產生器
+
+        Args:
+            sample_rate: 取樣頻率（Hz）
+            heart_rate: 心率（BPM）
+            spo2: 血氧（%）
+            dc_ir: 紅外光直流值
+            perfusion: 紅外光交流振幅相對於直流的比例
+            noise: 白雜訊標準差相對於直流的比例
+            finger: False 時只輸出低直流的雜訊（沒有手指）
+            seed: 亂數種子
+        """
+        self.sample_rate = sample_rate
+        self.heart_rate = heart_rate
+        self.spo2 = spo2
+        self.dc_ir = dc_ir
+        self.perfusion = perfusion
+        self.noise = noise
+        self.finger = finger
+        self.random = np.random.default_rng(seed)
+        self.index = 0
+        self._phase = 0.0
+
+    def next(self, count: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        產生接下來的樣本
+
+        Args:
+            count: 樣本數
+
+        Returns:
+            (紅光, 紅外光) uint32 陣列
+        """
+        t = (self.index + np.arange(count)) / self.sample_rate
+        self.index += count
+        if not self.finger:
+            ir = 2000 + self.random.normal(0, 200, count)
+            red = 1500 + self.random.normal(0, 200, count)
+            return _to_samples(red), _to_samples(ir)
+
+        # 心率每拍有少量變異，相位連續累加
+        rate = self.heart_rate / 60.0 * (1 + 0.02 * self.random.standard_normal(count).cumsum() / math.sqrt(count))
+        phase = self._phase + np.cumsum(rate) * 2 * math.pi / self.sample_rate
+        self._phase = float(phase[-1])
+        # 收縮期波峰加上較小的重搏波
+        volume = 0.6 * np.sin(phase) + 0.25 * np.sin(2 * phase - 0.8) + 0.1 * np.sin(3 * phase - 1.6)
+
+        ratio = ratio_for_spo2(self.spo2)
+        dc_red = self.dc_ir * 0.8
+        breathing = 1 + 0.003 * np.sin(2 * math.pi * 0.25 * t)
+        ir = self.dc_ir * breathing * (1 - self.perfusion * volume)
+        red = dc_red * breathing * (1 - self.perfusion * ratio * volume)
+        ir += self.random.normal(0, self.noise * self.dc_ir, count)
+        red += self.random.normal(0, self.noise * dc_red, count)
+        return _to_samples(red), _to_samples(ir)
+
+    def next_event(self, count: int) -> PpgEvent:
+        """產生接下來的樣本並包裝為 PPG 事件"""
+        start_index = self.index % _INDEX_MODULO
+        red, ir = self.next(count)
+        return PpgEvent(start_index, np.column_stack((red, ir)).astype('<u4').tobytes())
+
+    def next_line(self, count: int) -> bytes:
+        """產生接下來的樣本並格式化為文字協議的 PPG 行（不含換行符）"""
+        start_index = self.index % _INDEX_MODULO
+        red, ir = self.next(count)
+        values = np.column_stack((red, ir)).ravel().tolist()
+        return b'PPG,%d,' % start_index + ','.join(map(str, values)).encode()
+
+
+def _to_samples(values: np.ndarray) -> np.ndarray:
+    return np.clip(values, 0, (1 << 18) - 1).astype(np.uint32)
@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+通訊協議解碼模組
+以前綴查表方式將BMduino的原始訊息行（bytes）解碼為輕量的事件物件
+
+韌體收到 STAMP,ON 後在每行尾端附加 "|序號,millis()"（如 STANDBY,36.50,25.10,75,98|42,123456），
+解碼後放在事件的 seq / device_ms 欄位；沒有附加時兩者為 None
+"""
+
+import struct
+from typing import NamedTuple, Optional, Union, Dict, Callable
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 序號與裝置時間戳記的分隔符號
+STAMP_SEPARATOR = b'|'
+
+# 開啟/關閉時間戳記的命令與回應
+STAMP_ON_COMMAND = b'STAMP,ON\n'
+STAMP_OFF_COMMAND = b'STAMP,OFF\n'
+STAMP_ACK = b'STAMP_OK,ON'
+
+# 回報頻率與即時讀取命令（任何模式下立即處理，不切換到接收模式）
+RATE_COMMAND = 'RATE,{mode},{hz:.3f}\n'
+READ_COMMAND = b'READ\n'
+# 韌體支援回報頻率命令時的回應前綴（RATE_OK 或 RATE_ERROR；舊版韌體回應 RELAY_ERROR,INVALID_COMMAND）
+RATE_ACK = b'RATE_'
+
+# 可設定回報頻率的模式與頻率上限（韌體主迴圈約每 50ms 一次）
+# PPG 為原始波形串流的取樣頻率，只支援固定的幾種（對應 MAX30102 的取樣設定）
+REPORT_MODES = ('STANDBY', 'WORKING', 'PPG')
+MAX_REPORT_RATE = 10.0
+PPG_RATES = (0, 50, 100)
+
+# 序號為 16 位元（回繞），millis() 為 32 位元
+SEQ_MODULO = 1 << 16
+DEVICE_MS_MODULO = 1 << 32
+
+# 韌體工作模式的最長時間（秒，WORK_MODE_TIMEOUT；超時輸出 WORKING,TIMEOUT）。
+# 工作模式中除了 RATE / READ / PROTO / STAMP 以外的命令（如 RELAY）都保留到工作模式結束才處理
+WORKING_TIMEOUT = 45.0
+
+# 心率/血氧尚在測量中的標記
+MEASURING = 'MEASURING'
+
+# 心率/血氧欄位型別：數值、None（待機模式無數據）或 MEASURING
+VitalValue = Union[int, str, None]
+
+
+class StandbyEvent(NamedTuple):
+    """待機模式數據：STANDBY,物體溫度,環境溫度,心率,血氧"""
+    object_temp: float
+    ambient_temp: float
+    heart_rate: Optional[int]
+    spo2: Optional[int]
+    seq: Optional[int] = None
+    device_ms: Optional[int] = None
+    kind = 'standby'
+
+
+class DetectUserEvent(NamedTuple):
+    """指紋辨識結果：DETECT,USER指紋ID"""
+    fingerprint_id: int
+    seq: Optional[int] = None
+    device_ms: Optional[int] = None
+    kind = 'detect_user'
+
+
+class WorkingStartEvent(NamedTuple):
+    """進入工作模式：WORKING,START"""
+    seq: Optional[int] = None
+    device_ms: Optional[int] = None
+    kind = 'working_start'
+
+
+class WorkingStatusEvent(NamedTuple):
+    """工作模式狀態更新：WORKING,物體溫度,環境溫度,心率,血氧"""
+    object_temp: float
+    ambient_temp: float
+    heart_rate: VitalValue
+    spo2: VitalValue
+    seq: Optional[int] = None
+    device_ms: Optional[int] = None
+    kind = 'working_status'
+
+
+class WorkingFinalEvent(NamedTuple):
+    """工作模式完成：WORKING,FINAL,指紋ID,物體溫度,環境溫度,心率,血氧"""
+    fingerprint_id: int
+    object_temp: float
+    ambient_temp: float
+    heart_rate: int
+    spo2: int
+    seq: Optional[int] = None
+    device_ms: Optional[int] = None
+    kind = 'working_final'
+
+
+class WorkingErrorEvent(NamedTuple):
+    """工作模式錯誤：WORKING,NO_FINGER / WORKING,TIMEOUT / WORKING,NO_DATA"""
+    error: str
+    seq: Optional[int] = None
+    device_ms: Optional[int] = None
+    kind = 'working_error'
+
+
+class RelayOkEvent(NamedTuple):
+    """繼電器控制成功：RELAY_OK,繼電器編號"""
+    relay_num: int
+    seq: Optional[int] = None
+    device_ms: Optional[int] = None
+    kind = 'relay_ok'
+
+
+class RelayErrorEvent(NamedTuple):
+    """繼電器控制失敗：RELAY_ERROR,INVALID_NUMBER / RELAY_ERROR,INVALID_COMMAND"""
+    error: str
+    seq: Optional[int] = None
+    device_ms: Optional[int] = None
+    kind = 'relay_error'
+
+
+class ModeEvent(NamedTuple):
+    """模式切換通知：MODE,RECEIVE / MODE,STANDBY"""
+    mode: str
+    seq: Optional[int] = None
+    device_ms: Optional[int] = None
+    kind = 'mode'
+
+
+class RateOkEvent(NamedTuple):
+    """回報頻率設定成功：RATE_OK,STANDBY|WORKING,回報間隔毫秒（0表示不主動回報）"""
+    mode: str
+    interval_ms: int
+    seq: Optional[int] = None
+    device_ms: Optional[int] = None
+    kind = 'rate_ok'
+
+
+class RateErrorEvent(NamedTuple):
+    """回報頻率設定失敗：RATE_ERROR,INVALID_MODE / RATE_ERROR,INVALID_RATE"""
+    error: str
+    seq: Optional[int] = None
+    device_ms: Optional[int] = None
+    kind = 'rate_error'
+
+
+class PpgEvent(NamedTuple):
+    """原始 PPG 波形批次：PPG,第一個樣本編號,紅光,紅外光,紅光,紅外光,...
+
+    samples 為交錯的小端序 uint32（紅光, 紅外光），可直接以 numpy.frombuffer 讀取
+    """
+    start_index: int
+    samples: bytes
+    seq: Optional[int] = None
+    device_ms: Optional[int] = None
+    kind = 'ppg'
+
+    @property
+    def count(self) -> int:
+        """批次中的樣本數"""
+        return len(self.samples) // 8
+
+
+ProtocolEvent = Union[StandbyEvent, DetectUserEvent, WorkingStartEvent, WorkingStatusEvent,
+                      WorkingFinalEvent, WorkingErrorEvent, RelayOkEvent, RelayErrorEvent,
+                      ModeEvent, RateOkEvent, RateErrorEvent, PpgEvent]
+
+# 所有事件類型（kind）名稱
+EVENT_KINDS = tuple(cls.kind for cls in ProtocolEvent.__args__)
+EVENT_TYPES = {cls.kind: cls for cls in ProtocolEvent.__args__}
+
+# 高頻遙測事件：訂閱端處理不及時丟棄最舊的一筆；其他事件（結果、命令回應）不可遺失
+TELEMETRY_KINDS = ('standby', 'working_status', 'ppg')
+
+# 無欄位事件共用同一個實例
+_WORKING_START = WorkingStartEvent()
+
+# 常見的字串值預先建立，避免每行都產生新字串
+_ERRORS = {
+    b'NO_FINGER': 'NO_FINGER',
+    b'TIMEOUT': 'TIMEOUT',
+    b'NO_DATA': 'NO_DATA',
+    b'INVALID_NUMBER': 'INVALID_NUMBER',
+    b'INVALID_COMMAND': 'INVALID_COMMAND',
+    b'RECEIVE': 'RECEIVE',
+    b'STANDBY': 'STANDBY',
+    b'WORKING': 'WORKING',
+    b'PPG': 'PPG',
+    b'INVALID_MODE': 'INVALID_MODE',
+    b'INVALID_RATE': 'INVALID_RATE',
+}
+
+
+def _vital(field: bytes) -> VitalValue:
+    """解析工作模式的心率/血氧欄位（數字或 MEASURING）"""
+    if field == b'MEASURING':
+        return MEASURING
+    try:
+        return int(field)
+    except ValueError:
+        return MEASURING
+
+
+def _decode_standby(fields: list) -> StandbyEvent:
+    heart_rate = int(fields[3])
+    spo2 = int(fields[4])
+    return StandbyEvent(float(fields[1]), float(fields[2]),
+                        heart_rate or None, spo2 or None)
+
+
+def _decode_detect(fields: list) -> DetectUserEvent:
+    user = fields[1].strip()
+    if user.startswith(b'USER'):
+        user = user[4:]  # 跳過 "USER" 四個字符
+    return DetectUserEvent(int(user))
+
+
+def _decode_working_start(fields: list) -> WorkingStartEvent:
+    return _WORKING_START
+
+
+def _decode_working_final(fields: list) -> WorkingFinalEvent:
+    return WorkingFinalEvent(int(fields[2]), float(fields[3]), float(fields[4]),
+                             int(fields[5]), int(fields[6]))
+
+
+def _decode_working_error(fields: list) -> WorkingErrorEvent:
+    return WorkingErrorEvent(_ERRORS[fields[1]])
+
+
+def _decode_working_status(fields: list) -> WorkingStatusEvent:
+    if len(fields) != 5:
+        raise ValueError(f"WORKING 狀態更新應有5個欄位，實際{len(fields)}個")
+    return WorkingStatusEvent(float(fields[1]), float(fields[2]),
+                              _vital(fields[3]), _vital(fields[4]))
+
+
+# WORKING 訊息依第二個欄位再查一次表，查不到則為狀態更新
+_WORKING_TABLE: Dict[bytes, Callable] = {
+    b'START': _decode_working_start,
+    b'FINAL': _decode_working_final,
+    b'NO_FINGER': _decode_working_error,
+    b'TIMEOUT': _decode_working_error,
+    b'NO_DATA': _decode_working_error,
+}
+
+
+def _decode_working(fields: list):
+    return _WORKING_TABLE.get(fields[1], _decode_working_status)(fields)
+
+
+def _decode_relay_ok(fields: list) -> RelayOkEvent:
+    return RelayOkEvent(int(fields[1]))
+
+
+def _decode_relay_error(fields: list) -> RelayErrorEvent:
+    error = fields[1]
+    return RelayErrorEvent(_ERRORS.get(error) or error.decode('utf-8', errors='replace'))
+
+
+def _decode_mode(fields: list) -> ModeEvent:
+    mode = fields[1]
+    return ModeEvent(_ERRORS.get(mode) or mode.decode('utf-8', errors='replace'))
+
+
+def _decode_rate_ok(fields: list) -> RateOkEvent:
+    return RateOkEvent(_ERRORS[fields[1]], int(fields[2]))
+
+
+def _decode_rate_error(fields: list) -> RateErrorEvent:
+    error = fields[1]
+    return RateErrorEvent(_ERRORS.get(error) or error.decode('utf-8', errors='replace'))
+
+
+def _decode_ppg(fields: list) -> PpgEvent:
+    values = fields[2:]
+    if not values or len(values) % 2:
+        raise ValueError(f"PPG 樣本數應為成對的紅光/紅外光，實際{len(values)}個數值")
+    return PpgEvent(int(fields[1]), struct.pack(f'<{len(values)}I', *map(int, values)))
+
+
+# 訊息前綴（第一個欄位）→ 解碼函數
+DECODE_TABLE: Dict[bytes, Callable] = {
+    b'STANDBY': _decode_standby,
+    b'DETECT': _decode_detect,
+    b'WORKING': _decode_working,
+    b'RELAY_OK': _decode_relay_ok,
+    b'RELAY_ERROR': _decode_relay_error,
+    b'MODE': _decode_mode,
+    b'RATE_OK': _decode_rate_ok,
+    b'RATE_ERROR': _decode_rate_error,
+    b'PPG': _decode_ppg,
+}
+
+
+class ProtocolDecoder:
+    """協議解碼器：每行只切割一次，依前綴查表解碼"""
+
+    def __init__(self):
+        """初始化解碼器"""
+        self.table = DECODE_TABLE
+        self.decoded = 0
+        self.unknown = 0
+        self.malformed = 0
+
+    def decode(self, line: bytes) -> Optional[ProtocolEvent]:
+        """
+        解碼一行原始訊息
+
+        Args:
+            line: 不含行結束符的原始位元組（bytes、bytearray）
+
+        Returns:
+            事件物件；無法辨識（如啟動訊息）或格式錯誤時返回None
+        """
+        stamp = None
+        if STAMP_SEPARATOR in line:
+            line, _, stamp = line.partition(STAMP_SEPARATOR)
+        fields = line.split(b',')
+        handler = self.table.get(fields[0])
+        if handler is None:
+            self.unknown += 1
+            return None
+        try:
+            event = handler(fields)
+            if stamp is not None:
+                seq, device_ms = stamp.split(b',')
+                event = event._replace(seq=int(seq), device_ms=int(device_ms))
+        except (ValueError, IndexError, KeyError, struct.error) as e:
+            self.malformed += 1
+            logger.warning(f"數據解析錯誤: {bytes(line)!r}, 錯誤: {e}")
+            return None
+        self.decoded += 1
+        return event
+
+    def decode_text(self, line: str) -> Optional[ProtocolEvent]:
+        """
+        解碼一行文字訊息（離線工具使用）
+
+        Args:
+            line: 訊息行字串
+
+        Returns:
+            事件物件，失敗返回None
+        """
+        return self.decode(line.strip().encode('utf-8'))
+
+    def get_stats(self) -> Dict[str, int]:
+        """獲取解碼統計"""
+        return {
+            'decoded': self.decoded,
+            'unknown': self.unknown,
+            'malformed': self.malformed
+        }
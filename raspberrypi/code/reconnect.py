@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+串口重連模組
+- ReconnectBackoff：帶抖動的指數退避，決定下一次嘗試重連前的等待時間
+- DeviceWatcher：監看串口裝置節點（inotify 監看所在目錄，不支援時改為定時檢查），
+  裝置重新出現時立即喚醒重連，不必等待固定的重連間隔
+"""
+
+import ctypes
+import ctypes.util
+import os
+import random
+import select
+import struct
+import time
+from typing import Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+# inotify 事件遮罩（<sys/inotify.h>）
+IN_ATTRIB = 0x00000004
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+_INOTIFY_EVENT = struct.Struct('iIII')
+
+
+class ReconnectBackoff:
+    """帶抖動的指數退避"""
+
+    def __init__(self, initial: float = 0.05, maximum: float = 5.0,
+                 factor: float = 2.0, jitter: float = 0.5):
+        """
+        初始化退避
+
+        Args:
+            initial: 第一次等待時間（秒）
+            maximum: 等待時間上限（秒）
+            factor: 每次失敗後的倍率
+            jitter: 隨機縮短的比例（0-1），避免多台裝置同時重試
+        """
+        self.initial = initial
+        self.maximum = maximum
+        self.factor = factor
+        self.jitter = jitter
+        self.attempts = 0
+
+    def reset(self):
+        """連線成功（或裝置重新出現）後重新從最短等待時間開始"""
+        self.attempts = 0
+
+    def next_delay(self) -> float:
+        """
+        取得下一次等待時間並遞增嘗試次數
+
+        Returns:
+            等待時間（秒）
+        """
+        delay = min(self.maximum, self.initial * (self.factor ** self.attempts))
+        self.attempts += 1
+        return delay * (1.0 - self.jitter * random.random())
+
+
+class DeviceWatcher:
+    """串口裝置節點監看器"""
+
+    def __init__(self, path: str, poll_interval: float = 0.1):
+        """
+        初始化監看器
+
+        Args:
+            path: 串口裝置路徑（如 /dev/ttyACM0 或 /dev/serial/by-id/...）
+            poll_interval: 無法使用 inotify 時檢查裝置是否存在的間隔（秒）
+        """
+        self.path = path
+        self.directory = os.path.dirname(os.path.abspath(path))
+        self.poll_interval = poll_interval
+        self._fd: Optional[int] = None
+        self._wd: Optional[int] = None
+        self._libc = None
+        self._inotify_unavailable = False
+
+    def _init_inotify(self) -> bool:
+        """建立 inotify 實例（非Linux或失敗時改為定時檢查）"""
+        if self._fd is not None:
+            return True
+        if self._inotify_unavailable:
+            return False
+        try:
+            libc_name = ctypes.util.find_library('c')
+            libc = ctypes.CDLL(libc_name, use_errno=True) if libc_name else None
+            fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC) if libc else -1
+        except (OSError, AttributeError) as e:
+            logger.debug(f"無法使用 inotify: {e}")
+            fd = -1
+        if fd < 0:
+            logger.info("無法使用 inotify，改為定時檢查裝置是否出現")
+            self._inotify_unavailable = True
+            return False
+        self._libc = libc
+        self._fd = fd
+        return True
+
+    def _ensure_watch(self) -> bool:
+        """監看裝置所在目錄（目錄本身可能隨裝置消失，如 /dev/serial/by-id）"""
+        if not self._init_inotify():
+            return False
+        if self._wd is not None:
+            return True
+        wd = self._libc.inotify_add_watch(self._fd, self.directory.encode(),
+                                          IN_CREATE | IN_MOVED_TO | IN_ATTRIB | IN_DELETE_SELF)
+        if wd < 0:
+            return False
+        self._wd = wd
+        return True
+
+    @property
+    def mode(self) -> str:
+        """目前的監看方式"""
+        return 'poll' if self._inotify_unavailable else 'inotify'
+
+    def exists(self) -> bool:
+        """裝置節點是否存在"""
+        return os.path.exists(self.path)
+
+    def wait_for_device(self, timeout: float) -> bool:
+        """
+        等待裝置節點出現
+
+        Args:
+            timeout: 最長等待時間（秒）
+
+        Returns:
+            裝置存在返回True（已存在時立即返回），超時返回False
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            if self.exists():
+                return True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            if self._ensure_watch():
+                # 監看建立後再檢查一次，避免在兩者之間出現的裝置被漏掉
+                if self.exists():
+                    return True
+                ready, _, _ = select.select([self._fd], [], [], remaining)
+                if ready:
+                    self._drain()
+            else:
+                time.sleep(min(self.poll_interval, remaining))
+
+    def _drain(self):
+        """讀出所有 inotify 事件（只關心目錄被移除時需要重新監看）"""
+        try:
+            data = os.read(self._fd, 4096)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset + _INOTIFY_EVENT.size <= len(data):
+            _, mask, _, name_len = _INOTIFY_EVENT.unpack_from(data, offset)
+            offset += _INOTIFY_EVENT.size + name_len
+            if mask & IN_DELETE_SELF:
+                self._wd = None
+
+    def close(self):
+        """關閉 inotify 實例（之後再等待時會重新建立）"""
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+            self._wd = None
@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+繼電器命令管線模組
+由專用的寫入線程依序送出繼電器命令，將 RELAY_OK/RELAY_ERROR 回應對應到
+送出的命令（或判定超時），並記錄每個繼電器的往返時間分佈
+
+BMduino 在執行繼電器動作期間不處理下一個命令，因此管線一次只有一個命令在等待回應
+"""
+
+import collections
+import threading
+import time
+from typing import Optional, Callable, Dict, Deque
+import logging
+
+from code.cpu_placement import place_current_thread
+
+logger = logging.getLogger(__name__)
+
+
+class RttHistogram:
+    """往返時間直方圖（固定毫秒分桶）"""
+
+    # 各分桶的上限（毫秒），最後一桶為超過最大上限的所有數值
+    BUCKET_BOUNDS_MS = (10, 25, 50, 100, 250, 500, 1000, 1500, 2000, 3000, 5000)
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """清除所有樣本"""
+        self.buckets = [0] * (len(self.BUCKET_BOUNDS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.min_ms: Optional[float] = None
+        self.max_ms: Optional[float] = None
+
+    def record(self, rtt_ms: float):
+        """
+        記錄一個樣本
+
+        Args:
+            rtt_ms: 往返時間（毫秒）
+        """
+        index = 0
+        while index < len(self.BUCKET_BOUNDS_MS) and rtt_ms > self.BUCKET_BOUNDS_MS[index]:
+            index += 1
+        self.buckets[index] += 1
+        self.count += 1
+        self.total_ms += rtt_ms
+        self.min_ms = rtt_ms if self.min_ms is None else min(self.min_ms, rtt_ms)
+        self.max_ms = rtt_ms if self.max_ms is None else max(self.max_ms, rtt_ms)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """
+        以分桶上限估計百分位數
+
+        Args:
+            p: 百分位（0-100）
+
+        Returns:
+            估計值（毫秒），沒有樣本時返回None
+        """
+        if self.count == 0:
+            return None
+        target = self.count * p / 100.0
+        seen = 0
+        for index, bucket_count in enumerate(self.buckets):
+            seen += bucket_count
+            if seen >= target and bucket_count:
+                if index < len(self.BUCKET_BOUNDS_MS):
+                    return min(float(self.BUCKET_BOUNDS_MS[index]), self.max_ms)
+                return self.max_ms
+        return self.max_ms
+
+    def snapshot(self) -> Dict:
+        """
+        獲取統計快照
+
+        Returns:
+            包含樣本數、平均/最小/最大/p50/p95 與各分桶計數的字典
+        """
+        labels = [f"<={bound}ms" for bound in self.BUCKET_BOUNDS_MS]
+        labels.append(f">{self.BUCKET_BOUNDS_MS[-1]}ms")
+        return {
+            'count': self.count,
+            'avg_ms': self.total_ms / self.count if self.count else None,
+            'min_ms': self.min_ms,
+            'max_ms': self.max_ms,
+            'p50_ms': self.percentile(50),
+            'p95_ms': self.percentile(95),
+            'buckets': dict(zip(labels, self.buckets)),
+        }
+
+
+class RelayCommand:
+    """一個繼電器命令及其結果"""
+
+    PENDING = 'pending'
+    OK = 'ok'
+    ERROR = 'error'
+    TIMEOUT = 'timeout'
+    WRITE_FAILED = 'write_failed'
+    CANCELLED = 'cancelled'
+
+    def __init__(self, relay_num: int, on_result: Optional[Callable] = None):
+        """
+        初始化命令
+
+        Args:
+            relay_num: 繼電器編號 (1-4)
+            on_result: 完成時的回調，參數為此命令物件（在管線線程或讀取線程中呼叫）
+        """
+        self.relay_num = relay_num
+        self.on_result = on_result
+        self.status = self.PENDING
+        self.error: Optional[str] = None
+        self.attempts = 0
+        self.queued_at = time.monotonic()
+        self.sent_at: Optional[float] = None
+        self.completed_at: Optional[float] = None
+        self.rtt_ms: Optional[float] = None
+        self._done = threading.Event()
+
+    @property
+    def ok(self) -> bool:
+        """是否收到 RELAY_OK"""
+        return self.status == self.OK
+
+    def done(self) -> bool:
+        """是否已完成（成功、失敗或超時）"""
+        return self._done.is_set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        阻塞等待命令完成（不要在UI線程中呼叫）
+
+        Args:
+            timeout: 最長等待時間（秒）
+
+        Returns:
+            是否收到 RELAY_OK
+        """
+        self._done.wait(timeout)
+        return self.ok
+
+    def _complete(self, status: str, error: Optional[str] = None):
+        """設定結果並呼叫完成回調"""
+        self.status = status
+        self.error = error
+        self.completed_at = time.monotonic()
+        self._done.set()
+        if self.on_result:
+            try:
+                self.on_result(self)
+            except Exception as e:
+                logger.error(f"繼電器命令回調錯誤: {e}", exc_info=True)
+
+    def __repr__(self):
+        rtt = f", rtt={self.rtt_ms:.1f}ms" if self.rtt_ms is not None else ""
+        return f"RelayCommand(relay={self.relay_num}, status={self.status}, attempts={self.attempts}{rtt})"
+
+
+class RelayCommandQueue:
+    """繼電器命令管線（寫入佇列 + 回應對應 + 往返時間統計）"""
+
+    def __init__(self, write: Callable[[bytes], None], response_timeout: float = 3.0,
+                 max_retries: int = 0, max_queue: int = 16):
+        """
+        初始化命令管線
+
+        Args:
+            write: 寫入函數，參數為完整命令位元組，失敗時拋出例外
+            response_timeout: 每次送出後等待回應的最長時間（秒）
+            max_retries: 超時後重送的次數。BMduino 可能已經執行動作只是回應遺失，
+                         重送可能造成重複出藥，預設不重送
+            max_queue: 佇列上限，超過時拒絕新命令
+        """
+        self._write = write
+        self.response_timeout = response_timeout
+        self.max_retries = max_retries
+        self.max_queue = max_queue
+
+        self._queue: Deque[RelayCommand] = collections.deque()
+        self._in_flight: Optional[RelayCommand] = None
+        self._condition = threading.Condition()
+        self.running = False
+        self.thread: Optional[threading.Thread] = None
+
+        # 每個繼電器的往返時間（只計算收到 RELAY_OK 的命令）
+        self.rtt = {relay_num: RttHistogram() for relay_num in range(1, 5)}
+        # 寫入呼叫本身花費的時間（原本在UI線程中阻塞的部分）
+        self.write_time = RttHistogram()
+        self.stats = {
+            'submitted': 0,
+            'ok': 0,
+            'error': 0,
+            'timeout': 0,
+            'write_failed': 0,
+            'retries': 0,
+            'rejected': 0,
+            'unsolicited': 0,
+        }
+
+    # ========== 生命週期 ==========
+
+    def start(self):
+        """啟動寫入線程"""
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """停止寫入線程，尚未完成的命令標記為取消"""
+        with self._condition:
+            self.running = False
+            self._condition.notify_all()
+        if self.thread:
+            self.thread.join(timeout=2)
+            self.thread = None
+        with self._condition:
+            pending = list(self._queue)
+            self._queue.clear()
+            if self._in_flight:
+                pending.insert(0, self._in_flight)
+                self._in_flight = None
+        for command in pending:
+            command._complete(RelayCommand.CANCELLED, "管線已停止")
+
+    # ========== 提交與回應 ==========
+
+    def submit(self, relay_num: int, on_result: Optional[Callable] = None) -> Optional[RelayCommand]:
+        """
+        將命令加入佇列（不阻塞）
+
+        Args:
+            relay_num: 繼電器編號 (1-4)
+            on_result: 完成時的回調
+
+        Returns:
+            命令物件，佇列已滿時返回None
+        """
+        command = RelayCommand(relay_num, on_result)
+        with self._condition:
+            if len(self._queue) >= self.max_queue:
+                self.stats['rejected'] += 1
+                logger.error(f"繼電器命令佇列已滿，拒絕繼電器 {relay_num} 的命令")
+                return None
+            self._queue.append(command)
+            self.stats['submitted'] += 1
+            self._condition.notify_all()
+        if not self.running:
+            self.start()
+        return command
+
+    def on_response(self, event, received_at: Optional[float] = None) -> Optional[RelayCommand]:
+        """
+        將 RELAY_OK/RELAY_ERROR 事件對應到等待中的命令（由讀取線程呼叫）
+
+        Args:
+            event: RelayOkEvent 或 RelayErrorEvent
+            received_at: 收到回應的時間（time.monotonic()），None表示現在
+
+        Returns:
+            對應到的命令，沒有等待中的命令、編號不符或為其他命令的錯誤回應（INVALID_COMMAND）時返回None
+        """
+        received_at = received_at or time.monotonic()
+        with self._condition:
+            command = self._in_flight
+            # INVALID_COMMAND 是韌體對其他未知命令的回應，只有 INVALID_NUMBER 表示繼電器命令被拒絕
+            if command is None or (event.kind == 'relay_ok' and event.relay_num != command.relay_num) \
+                    or (event.kind == 'relay_error' and event.error == 'INVALID_COMMAND'):
+                self.stats['unsolicited'] += 1
+                logger.debug(f"收到沒有對應命令的回應: {event}")
+                return None
+            self._in_flight = None
+            self._condition.notify_all()
+
+        command.rtt_ms = (received_at - command.sent_at) * 1000
+        if event.kind == 'relay_ok':
+            self.stats['ok'] += 1
+            self.rtt[command.relay_num].record(command.rtt_ms)
+            logger.info(f"繼電器 {command.relay_num} 完成，往返時間: {command.rtt_ms:.0f} ms")
+            command._complete(RelayCommand.OK)
+        else:
+            self.stats['error'] += 1
+            logger.error(f"繼電器 {command.relay_num} 控制失敗: {event.error}")
+            command._complete(RelayCommand.ERROR, event.error)
+        return command
+
+    # ========== 寫入線程 ==========
+
+    def _run(self):
+        """寫入迴圈（在獨立線程中運行）"""
+        place_current_thread('serial')
+        while True:
+            with self._condition:
+                while self.running and not self._queue:
+                    self._condition.wait()
+                if not self.running:
+                    return
+                command = self._queue.popleft()
+                self._in_flight = command
+
+            self._send(command)
+
+    def _send(self, command: RelayCommand):
+        """送出命令並等待回應，超時時依設定重送"""
+        data = f"RELAY,{command.relay_num}\n".encode('utf-8')
+        while True:
+            command.attempts += 1
+            command.sent_at = time.monotonic()
+            try:
+                self._write(data)
+            except Exception as e:
+                with self._condition:
+                    self._in_flight = None
+                self.stats['write_failed'] += 1
+                logger.error(f"發送繼電器 {command.relay_num} 命令失敗: {e}")
+                command._complete(RelayCommand.WRITE_FAILED, str(e))
+                return
+            self.write_time.record((time.monotonic() - command.sent_at) * 1000)
+            logger.info(f"發送繼電器控制命令: RELAY,{command.relay_num}（第 {command.attempts} 次）")
+
+            deadline = command.sent_at + self.response_timeout
+            with self._condition:
+                while self.running and self._in_flight is command:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                if self._in_flight is not command:
+                    return  # 已由 on_response 完成
+                if not self.running:
+                    return  # stop() 會將其標記為取消
+                if command.attempts <= self.max_retries:
+                    self.stats['retries'] += 1
+                    logger.warning(f"繼電器 {command.relay_num} 等待回應超時，重送命令")
+                    continue
+                self._in_flight = None
+
+            self.stats['timeout'] += 1
+            logger.error(f"繼電器 {command.relay_num} 等待回應超時（共送出 {command.attempts} 次）")
+            command._complete(RelayCommand.TIMEOUT)
+            return
+
+    # ========== 統計 ==========
+
+    def pending(self) -> int:
+        """佇列中與等待回應的命令數量"""
+        with self._condition:
+            return len(self._queue) + (1 if self._in_flight else 0)
+
+    def get_stats(self) -> Dict:
+        """
+        獲取管線統計
+
+        Returns:
+            計數器、每個繼電器的往返時間直方圖與寫入耗時
+        """
+        stats = dict(self.stats)
+        stats['pending'] = self.pending()
+        stats['rtt'] = {relay_num: histogram.snapshot() for relay_num, histogram in self.rtt.items()}
+        stats['write_time'] = self.write_time.snapshot()
+        return stats
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+串口錄製與重播模組
+將收到的每一行原始訊息連同單調時鐘接收時間寫入緊湊的僅追加檔案，
+並可將錄製檔以原速、N倍速或最快速度重新送入通訊模組的分派流程
+
+檔案格式：
+    檔頭：MAGIC（6 bytes）+ 錄製開始的系統時間（float64）
+    記錄：接收時間（float64，time.monotonic()）+ 行長度（uint16）+ 原始位元組
+"""
+
+import struct
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Iterator, Optional, Tuple, Dict
+import logging
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'BMCAP\x01'
+_HEADER = struct.Struct('<d')
+_RECORD = struct.Struct('<dH')
+
+
+class CaptureWriter:
+    """錄製檔寫入器"""
+
+    def __init__(self, path: str, flush_interval: float = 1.0):
+        """
+        開啟（或追加到）錄製檔
+
+        Args:
+            path: 錄製檔路徑
+            flush_interval: 寫入磁碟的間隔（秒）
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.flush_interval = flush_interval
+        self.records = 0
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+
+        new_file = not self.path.exists() or self.path.stat().st_size == 0
+        self._file = open(self.path, 'ab')
+        if new_file:
+            self._file.write(MAGIC + _HEADER.pack(time.time()))
+        logger.info(f"開始錄製串口數據: {self.path}")
+
+    def write(self, raw_line: bytes, timestamp: Optional[float] = None):
+        """
+        寫入一行記錄
+
+        Args:
+            raw_line: 不含行結束符的原始位元組
+            timestamp: 接收時間（time.monotonic()），None表示現在
+        """
+        if timestamp is None:
+            timestamp = time.monotonic()
+        raw_line = raw_line[:0xFFFF]
+        with self._lock:
+            if self._file.closed:
+                return
+            self._file.write(_RECORD.pack(timestamp, len(raw_line)))
+            self._file.write(raw_line)
+            self.records += 1
+            if timestamp - self._last_flush >= self.flush_interval:
+                self._file.flush()
+                self._last_flush = timestamp
+
+    def close(self):
+        """關閉錄製檔"""
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+                logger.info(f"停止錄製串口數據: {self.path}，共 {self.records} 行")
+
+
+def read_capture(path: str) -> Iterator[Tuple[float, bytes]]:
+    """
+    逐筆讀取錄製檔
+
+    Args:
+        path: 錄製檔路徑
+
+    Yields:
+        (接收時間, 原始位元組)
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    if not data.startswith(MAGIC):
+        raise ValueError(f"不是有效的錄製檔: {path}")
+
+    offset = len(MAGIC) + _HEADER.size
+    view = memoryview(data)
+    end = len(data)
+    while offset + _RECORD.size <= end:
+        timestamp, length = _RECORD.unpack_from(view, offset)
+        offset += _RECORD.size
+        if offset + length > end:
+            logger.warning(f"錄製檔結尾不完整: {path}")
+            break
+        yield timestamp, bytes(view[offset:offset + length])
+        offset += length
+
+
+class ReplaySource:
+    """錄製檔重播來源"""
+
+    def __init__(self, path: str, speed: float = 1.0, loop: bool = False):
+        """
+        初始化重播來源
+
+        Args:
+            path: 錄製檔路徑
+            speed: 播放速度倍率（1為原速，0或負數為最快速度）
+            loop: 播放完畢後是否從頭重播
+        """
+        self.path = path
+        self.speed = speed
+        self.loop = loop
+        self.running = False
+        self.lines = 0
+        self.elapsed = 0.0
+
+    def run(self, handler: Callable[[bytes], None]):
+        """
+        在目前線程中播放錄製檔（阻塞直到播放完畢或被停止）
+
+        Args:
+            handler: 每一行原始位元組的處理函數
+        """
+        self.running = True
+        self.lines = 0
+        started = time.monotonic()
+        try:
+            while self.running:
+                self._play_once(handler)
+                if not self.loop:
+                    break
+        finally:
+            self.elapsed = time.monotonic() - started
+            self.running = False
+
+    def _play_once(self, handler: Callable[[bytes], None]):
+        """播放一次錄製檔"""
+        first_timestamp = None
+        play_start = time.monotonic()
+        for timestamp, raw_line in read_capture(self.path):
+            if not self.running:
+                return
+            if first_timestamp is None:
+                first_timestamp = timestamp
+            if self.speed > 0:
+                # 依錄製時的間隔等待（錄製檔跨越重開機時時間可能倒退，此時不等待）
+                due = play_start + max(timestamp - first_timestamp, 0.0) / self.speed
+                delay = due - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            handler(raw_line)
+            self.lines += 1
+
+    def stop(self):
+        """停止播放"""
+        self.running = False
+
+    def get_stats(self) -> Dict:
+        """
+        獲取播放統計
+
+        Returns:
+            統計字典
+        """
+        return {
+            'path': str(self.path),
+            'speed': self.speed,
+            'lines': self.lines,
+            'elapsed': round(self.elapsed, 3),
+            'lines_per_sec': round(self.lines / self.elapsed, 1) if self.elapsed else 0.0
+        }
+
+
+def capture_info(path: str) -> Dict:
+    """
+    獲取錄製檔摘要
+
+    Args:
+        path: 錄製檔路徑
+
+    Returns:
+        摘要字典（行數、時長、各訊息前綴數量）
+    """
+    with open(path, 'rb') as f:
+        header = f.read(len(MAGIC) + _HEADER.size)
+    started_at = _HEADER.unpack_from(header, len(MAGIC))[0] if header.startswith(MAGIC) else None
+
+    lines = 0
+    first = last = None
+    prefixes: Dict[str, int] = {}
+    for timestamp, raw_line in read_capture(path):
+        lines += 1
+        if first is None:
+            first = timestamp
+        last = timestamp
+        prefix = raw_line.split(b',', 1)[0].decode('utf-8', errors='replace')
+        prefixes[prefix] = prefixes.get(prefix, 0) + 1
+
+    return {
+        'path': str(path),
+        'started_at': started_at,
+        'lines': lines,
+        'duration': round(last - first, 3) if lines else 0.0,
+        'prefixes': prefixes
+    }
+
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) < 2:
+        print("用法: python3 -m code.serial_capture <錄製檔> [--dump]")
+        sys.exit(1)
+    if '--dump' in sys.argv[2:]:
+        for ts, line in read_capture(sys.argv[1]):
+            print(f"{ts:.6f} {line.decode('utf-8', errors='replace')}")
+    else:
+        print(capture_info(sys.argv[1]))
@@ -5,25 +5,68 @@
 負責與BMduino進行通訊
 """
 
+import os
+import select
 import serial
 import threading
 import time
-from typing import Optional, Callable, List
+from datetime import datetime
+from typing import Optional, Callable, List, Dict
 import logging
 
+from code.serial_framer import LineFramer, ReaderStats
+from code.protocol import (
+    ProtocolDecoder, EVENT_TYPES, TELEMETRY_KINDS, STAMP_ON_COMMAND, STAMP_ACK,
+    RATE_COMMAND, READ_COMMAND, RATE_ACK, REPORT_MODES, MAX_REPORT_RATE, PPG_RATES,
+)
+from code.serial_capture import CaptureWriter, ReplaySource
+from code.relay_pipeline import RelayCommandQueue, RelayCommand
+from code.reconnect import ReconnectBackoff, DeviceWatcher
+from code.binary_protocol import FrameDecoder, SYNC as FRAME_SYNC, NEGOTIATE_COMMAND, NEGOTIATE_ACK
+from code.stamp_tracker import StampTracker
+from code.latest_value import LatestValue
+from code.event_bus import EventBus, DROP_OLDEST, BLOCK, SYNC
+from code.cpu_placement import place_current_thread
+
 logger = logging.getLogger(__name__)
 
 
 class BMduinoCommunicator:
     """BMduino 通訊類別"""
     
-    def __init__(self, port: str = "/dev/ttyACM0", baudrate: int = 115200):
+    READER_MODES = ('event', 'poll')
+    PROTOCOLS = ('text', 'binary')
+    
+    def __init__(self, port: str = "/dev/ttyACM0", baudrate: int = 115200,
+                 reader_mode: str = 'event', read_timeout: float = 0.5,
+                 relay_timeout: float = 3.0, relay_retries: int = 0,
+                 reconnect_initial: float = 0.05, reconnect_max: float = 5.0,
+                 watch_device: bool = True, protocol: str = 'text',
+                 negotiate_timeout: float = 1.0, stamps: bool = False,
+                 standby_rate: Optional[float] = None, working_rate: Optional[float] = None,
+                 bus: Optional[EventBus] = None):
         """
         初始化串口通訊
         
         Args:
             port: 串口路徑
             baudrate: 波特率
+            reader_mode: 讀取模式（'event'：阻塞於檔案描述符，一次讀取所有可用位元組；
+                         'poll'：舊版 in_waiting 輪詢）
+            read_timeout: event 模式下單次等待數據的最長時間（秒）
+            relay_timeout: 繼電器命令等待 RELAY_OK/RELAY_ERROR 的最長時間（秒）
+            relay_retries: 繼電器命令超時後的重送次數
+            reconnect_initial: 斷線後第一次重連前的等待時間（秒），之後以指數退避增加
+            reconnect_max: 重連等待時間上限（秒）
+            watch_device: 是否監看裝置節點，裝置重新出現時立即重連
+            protocol: 'text' 使用文字協議；'binary' 連線時協商二進位分幀協議，
+                      韌體不支援時退回文字協議（只支援 event 讀取模式）
+            negotiate_timeout: 等待韌體回應協商命令的最長時間（秒）
+            stamps: 是否在連線時要求韌體為每則訊息附加序號與 millis() 時間戳記
+                    （用於計算遺失率、傳輸延遲與測量的裝置端時間）
+            standby_rate: 連線後設定的待機模式回報頻率（Hz，0表示只在 read() 時回報，None表示沿用韌體預設）
+            working_rate: 連線後設定的工作模式狀態回報頻率（Hz，None表示沿用韌體預設）
+            bus: 發布事件的事件匯流排（與狀態機等模組共用），None表示建立專用的匯流排
         """
         self.port = port
         self.baudrate = baudrate
@@ -31,35 +74,106 @@ class BMduinoCommunicator:
         self.running = False
         self.listen_thread: Optional[threading.Thread] = None
         
-        # 回調函數列表
-        self.callbacks = {
-            'standby': [],
-            'detect_user': [],  # 指紋辨識結果
-            'working_start': [],
-            'working_status': [],
-            'working_final': [],
-            'working_error': [],
-            'relay_ok': [],
-            'raw_message': []  # 原始訊息回調（用於調試）
+        if reader_mode not in self.READER_MODES:
+            logger.warning(f"未知的讀取模式: {reader_mode}，改用 event")
+            reader_mode = 'event'
+        self.reader_mode = reader_mode
+        self.read_timeout = read_timeout
+        
+        if protocol not in self.PROTOCOLS:
+            logger.warning(f"未知的協議: {protocol}，改用 text")
+            protocol = 'text'
+        if protocol == 'binary' and reader_mode != 'event':
+            logger.warning("二進位協議只支援 event 讀取模式，改用 text")
+            protocol = 'text'
+        self.protocol = protocol
+        self.negotiate_timeout = negotiate_timeout
+        # 目前實際使用的協議（每次連線時協商）
+        self.active_protocol = 'text'
+        # 協商期間多讀到的位元組，在第一次讀取時優先處理
+        self._rx_leftover = b''
+        
+        # 序號與時間戳記（每次連線時協商，韌體不支援時事件的 seq 為 None）
+        self.stamps = stamps
+        self.stamps_active = False
+        self.stamp_tracker = StampTracker()
+        
+        # 回報頻率（每次連線後重新設定；report_intervals 為韌體確認的回報間隔毫秒）
+        # RATE / READ 命令只在韌體確認支援後送出（每次連線時協商），
+        # 舊版韌體以 RELAY_ERROR,INVALID_COMMAND 回應未知命令，會被誤認為出藥失敗
+        self.telemetry_active = False
+        self.report_rates = {'STANDBY': standby_rate, 'WORKING': working_rate, 'PPG': None}
+        self.report_intervals: Dict[str, int] = {}
+        # 等待 read() 結果的呼叫端：[完成通知, 收到的事件]
+        self._read_lock = threading.Lock()
+        self._read_waiters: List[list] = []
+        
+        # 讀取緩衝區與分幀器（重複使用，避免每次讀取都配置記憶體）
+        self._rx_buffer = bytearray(4096)
+        self.framer = LineFramer()
+        self.reader_stats = ReaderStats()
+        
+        # 錄製與重播
+        self.capture: Optional[CaptureWriter] = None
+        self.replay_source: Optional[ReplaySource] = None
+        
+        # 協議解碼器（文字行與二進位幀）
+        self.decoder = ProtocolDecoder()
+        self.frame_decoder = FrameDecoder(self.decoder)
+        
+        # 繼電器命令管線（由寫入線程送出，呼叫端不會阻塞在USB寫入上）
+        self._write_lock = threading.Lock()
+        self.relay_queue = RelayCommandQueue(self._write_command, response_timeout=relay_timeout,
+                                             max_retries=relay_retries)
+        
+        # 最新遙測數據（串口線程發布一次，API/UI 等讀取端各自取最新快照，不排隊）
+        self.latest = {
+            'standby': LatestValue(),
+            'working_status': LatestValue(),
         }
         
-        # 連接狀態
+        # 事件匯流排：每個事件類型一個主題（事件為 code.protocol 的事件物件），
+        # raw_message 主題為原始字串（用於調試，只在文字協議下發布）
+        self.bus = bus if bus is not None else EventBus()
+        self.topics = {
+            kind: self.bus.declare(kind, (event_type,), DROP_OLDEST if kind in TELEMETRY_KINDS else BLOCK)
+            for kind, event_type in EVENT_TYPES.items()
+        }
+        self.raw_topic = self.bus.declare('raw_message', (str,), DROP_OLDEST)
+        
+        # 低頻事件記錄到 info 日誌，高頻的 STANDBY/WORKING 狀態不記錄
+        self._logged_kinds = {'detect_user', 'working_final', 'working_error',
+                              'relay_ok', 'relay_error', 'rate_ok', 'rate_error'}
+        self.register_callback('rate_ok', self._on_rate_ok)
+        
+        # 連接狀態與重連（指數退避，裝置節點重新出現時立即重連）
         self.connected = False
-        self.reconnect_interval = 5  # 重連間隔（秒）
+        self.backoff = ReconnectBackoff(initial=reconnect_initial, maximum=reconnect_max)
+        self.device_watcher = DeviceWatcher(port) if watch_device else None
+        self.link_stats = {
+            'disconnects': 0,
+            'reconnects': 0,
+            'failed_attempts': 0,
+            'last_downtime': None,
+        }
+        self._disconnected_at: Optional[float] = None
     
-    def register_callback(self, event: str, callback: Callable):
+    def register_callback(self, event: str, callback: Callable, delivery: str = SYNC,
+                          capacity: Optional[int] = None):
         """
-        註冊回調函數
+        註冊回調函數（訂閱事件匯流排上的事件主題）
         
         Args:
-            event: 事件類型 ('standby', 'detect_user', 'working_start', 'working_status', 'working_final', 'working_error', 'relay_ok', 'raw_message')
-            callback: 回調函數
+            event: 事件類型 ('standby', 'detect_user', 'working_start', 'working_status', 'working_final',
+                   'working_error', 'relay_ok', 'relay_error', 'mode', 'raw_message')
+            callback: 回調函數，參數為對應的事件物件（raw_message 為原始字串，只在文字協議下觸發）
+            delivery: 'sync' 在串口線程直接呼叫（必須很快返回）；'thread' 由專用工作線程呼叫
+            capacity: 工作線程佇列上限，None使用匯流排預設值
+        
+        Returns:
+            訂閱（可用 bus.unsubscribe() 取消），事件類型不存在時返回None
         """
-        if event in self.callbacks:
-            self.callbacks[event].append(callback)
-            logger.debug(f"已註冊回調: {event}")
-        else:
-            logger.warning(f"未知的事件類型: {event}，可用的類型: {list(self.callbacks.keys())}")
+        return self.bus.subscribe(event, callback, delivery, capacity)
     
     def connect(self) -> bool:
         """
@@ -82,11 +196,27 @@ class BMduinoCommunicator:
             # 清空緩衝區
             self.ser.reset_input_buffer()
             self.ser.reset_output_buffer()
+            self.framer.reset()
+            self.frame_decoder.reset()
+            self._rx_leftover = b''
+            
+            # 時間戳記的回應一定是文字，需在切換為二進位協議之前協商
+            self.stamps_active = False
+            if self.stamps:
+                self.stamps_active = self._negotiate(STAMP_ON_COMMAND, STAMP_ACK, "序號與時間戳記")
+            self.stamp_tracker.resync()
+            
+            # 回報頻率命令的回應也需在切換為二進位協議之前協商
+            self.telemetry_active = self._negotiate(
+                RATE_COMMAND.format(mode='PPG', hz=self.report_rates['PPG'] or 0).encode(), RATE_ACK, "回報頻率命令")
             
-            time.sleep(0.5)  # 等待串口穩定
+            self.active_protocol = 'text'
+            if self.protocol == 'binary' and self._negotiate(NEGOTIATE_COMMAND, NEGOTIATE_ACK, "二進位協議"):
+                self.active_protocol = 'binary'
             
             self.connected = True
-            logger.info(f"串口連接成功: {self.port}")
+            logger.info(f"串口連接成功: {self.port}（{self.active_protocol} 協議）")
+            self._apply_report_rates()
             return True
             
         except serial.SerialException as e:
@@ -98,12 +228,57 @@ class BMduinoCommunicator:
             self.connected = False
             return False
     
+    def _negotiate(self, command: bytes, ack: bytes, feature: str) -> bool:
+        """
+        送出協商命令並等待韌體回應
+        
+        Args:
+            command: 完整命令位元組（如 PROTO,BIN）
+            ack: 韌體支援時的文字回應
+            feature: 日誌中顯示的功能名稱
+        
+        Returns:
+            韌體回應 ack 返回True；回應 INVALID_COMMAND（舊版韌體）或超時返回False
+        """
+        self.ser.write(command)
+        received = bytearray(self._rx_leftover)
+        deadline = time.monotonic() + self.negotiate_timeout
+        timeout = self.ser.timeout
+        self.ser.timeout = 0.05
+        try:
+            while time.monotonic() < deadline:
+                received += self.ser.read(max(1, self.ser.in_waiting))
+                index = received.find(ack)
+                if index >= 0:
+                    newline = received.find(b'\n', index)
+                    if newline >= 0:
+                        # 回應之後的位元組已經是新的格式
+                        self._rx_leftover = bytes(received[newline + 1:])
+                        return True
+                    continue
+                index = received.find(b'INVALID_COMMAND')
+                if index >= 0:
+                    newline = received.find(b'\n', index)
+                    if newline >= 0:
+                        logger.warning(f"韌體不支援{feature}")
+                        self._rx_leftover = bytes(received[newline + 1:])
+                        return False
+        finally:
+            self.ser.timeout = timeout
+        logger.warning(f"等待{feature}協商回應超時")
+        self._rx_leftover = bytes(received)
+        return False
+    
     def disconnect(self):
         """斷開串口連接"""
         self.stop_listening()
+        self.stop_capture()
+        self.relay_queue.stop()
         if self.ser and self.ser.is_open:
             self.ser.close()
         self.connected = False
+        if self.device_watcher:
+            self.device_watcher.close()
         logger.info("串口已斷開")
     
     def start_listening(self):
@@ -112,10 +287,10 @@ class BMduinoCommunicator:
             logger.warning("監聽線程已在運行")
             return
         
-        if not self.connected:
-            if not self.connect():
-                logger.error("無法連接串口，無法開始監聽")
-                return
+        if not self.connected and not self.connect():
+            # 仍然啟動監聽線程，由它在裝置出現後自動連接
+            logger.error("無法連接串口，將在裝置出現後自動連接")
+            self._disconnected_at = time.monotonic()
         
         self.running = True
         self.listen_thread = threading.Thread(target=self._listen_loop, daemon=True)
@@ -125,266 +300,481 @@ class BMduinoCommunicator:
     def stop_listening(self):
         """停止監聽"""
         self.running = False
+        if self.replay_source:
+            self.replay_source.stop()
         if self.listen_thread:
             self.listen_thread.join(timeout=2)
         logger.info("停止監聽串口數據")
     
     def _listen_loop(self):
         """監聽迴圈（在獨立線程中運行）"""
+        place_current_thread('serial')
+        self.reader_stats.reset()
         while self.running:
             try:
                 if not self.connected or not self.ser or not self.ser.is_open:
-                    # 嘗試重連
-                    time.sleep(self.reconnect_interval)
-                    if self.running:
-                        self.connect()
+                    self._reconnect()
                     continue
                 
-                if self.ser.in_waiting > 0:
-                    try:
-                        line = self.ser.readline().decode('utf-8', errors='ignore').strip()
-                        if line:
-                            # 記錄收到的原始訊息（用於調試）
-                            logger.debug(f"收到原始訊息: {line}")
-                            
-                            # 觸發原始訊息回調
-                            for callback in self.callbacks['raw_message']:
-                                try:
-                                    callback(line)
-                                except Exception as e:
-                                    logger.error(f"回調函數執行錯誤: {e}")
-                            
-                            # 處理訊息
-                            self._process_message(line)
-                    except UnicodeDecodeError:
-                        logger.warning("解碼錯誤，跳過該行")
-                    except Exception as e:
-                        logger.error(f"處理訊息時發生錯誤: {e}")
-                
-                time.sleep(0.01)  # 避免CPU占用過高
+                if self.reader_mode == 'event':
+                    self._read_available()
+                else:
+                    self._read_polling()
                 
             except serial.SerialException as e:
                 logger.error(f"串口錯誤: {e}")
-                self.connected = False
-                time.sleep(self.reconnect_interval)
+                self._connection_lost()
             except Exception as e:
                 logger.error(f"監聽迴圈錯誤: {e}")
                 time.sleep(1)
     
-    def _process_message(self, line: str):
+    def _connection_lost(self):
+        """讀取失敗時立即關閉串口（釋放裝置節點），由監聽迴圈負責重連"""
+        self.connected = False
+        self.link_stats['disconnects'] += 1
+        self._disconnected_at = time.monotonic()
+        self.backoff.reset()
+        try:
+            if self.ser:
+                self.ser.close()
+        except Exception:
+            pass
+    
+    def _reconnect(self):
         """
-        處理接收到的訊息
+        等待後嘗試重連一次
         
-        Args:
-            line: 接收到的訊息行
+        裝置節點不存在時等待它出現（最長為退避時間），出現後立即重連；
+        節點存在但開啟失敗（如權限尚未設定好）時依退避時間重試
+        """
+        delay = self.backoff.next_delay()
+        if self.device_watcher and not self.device_watcher.exists():
+            if self.device_watcher.wait_for_device(delay):
+                logger.info(f"偵測到裝置: {self.port}")
+                self.backoff.reset()
+        else:
+            time.sleep(delay)
+        
+        if not self.running:
+            return
+        if self.connect():
+            self.backoff.reset()
+            self.link_stats['reconnects'] += 1
+            if self._disconnected_at is not None:
+                downtime = time.monotonic() - self._disconnected_at
+                self.link_stats['last_downtime'] = downtime
+                logger.info(f"串口已重新連接，中斷時間: {downtime:.2f} 秒")
+                self._disconnected_at = None
+        else:
+            self.link_stats['failed_attempts'] += 1
+    
+    def _read_available(self):
+        """
+        事件驅動讀取：阻塞等待檔案描述符可讀，再以單次系統呼叫讀出所有可用位元組
+        
+        沒有檔案描述符的平台（如Windows）改用帶超時的 read()
         """
+        fd = self._fileno()
+        if fd is not None:
+            ready, _, _ = select.select([fd], [], [], self.read_timeout)
+            if not ready:
+                self.reader_stats.record_idle()
+                return
+            try:
+                nbytes = os.readv(fd, [self._rx_buffer])
+            except OSError as e:
+                raise serial.SerialException(f"讀取失敗: {e}")
+            if nbytes == 0:
+                # 可讀但讀不到數據，代表裝置已斷開
+                raise serial.SerialException("裝置回報可讀但沒有數據（可能已斷開）")
+            chunk = memoryview(self._rx_buffer)[:nbytes]
+        else:
+            chunk = self.ser.read(max(1, self.ser.in_waiting))
+            nbytes = len(chunk)
+            if nbytes == 0:
+                self.reader_stats.record_idle()
+                return
+        
+        received_at = time.monotonic()
+        if self._rx_leftover:
+            chunk = self._rx_leftover + bytes(chunk)
+            self._rx_leftover = b''
+        
+        if self.active_protocol == 'binary':
+            raw_frames = [] if self.capture else None
+            events = self.frame_decoder.feed(chunk, raw_frames)
+            self.reader_stats.record_read(nbytes, len(events))
+            if raw_frames:
+                for frame in raw_frames:
+                    self.capture.write(frame, received_at)
+            for event in events:
+                self._dispatch_event(event, received_at)
+            return
+        
+        lines = self.framer.feed(chunk)
+        self.reader_stats.record_read(nbytes, len(lines))
+        for raw_line in lines:
+            self._handle_line(raw_line, received_at)
+    
+    def _read_polling(self):
+        """舊版輪詢讀取：檢查 in_waiting 後讀取一行，再休眠10ms"""
+        if self.ser.in_waiting > 0:
+            try:
+                raw_line = self.ser.readline()
+                line = raw_line.strip()
+                self.reader_stats.record_read(len(raw_line), 1 if line else 0)
+                if line:
+                    self._handle_line(line)
+            except Exception as e:
+                logger.error(f"處理訊息時發生錯誤: {e}")
+        else:
+            self.reader_stats.record_idle()
+        
+        time.sleep(0.01)  # 避免CPU占用過高
+    
+    def _fileno(self) -> Optional[int]:
+        """取得串口的檔案描述符，不支援時返回None"""
         try:
-            if line.startswith('STANDBY,'):
-                # 待機模式數據
-                parts = line.split(',')
-                if len(parts) >= 5:
-                    data = {
-                        'object_temp': float(parts[1]),
-                        'ambient_temp': float(parts[2]),
-                        'heart_rate': int(parts[3]) if parts[3] != '0' else None,
-                        'spo2': int(parts[4]) if parts[4] != '0' else None
-                    }
-                    for callback in self.callbacks['standby']:
-                        try:
-                            callback(data)
-                        except Exception as e:
-                            logger.error(f"待機模式回調錯誤: {e}")
-            
-            elif line.startswith('DETECT,USER'):
-                # 指紋辨識結果（格式：DETECT,USER1 或 DETECT,USER2 等）
-                logger.info(f"收到指紋辨識消息: {line}")
-                parts = line.split(',')
-                logger.info(f"分割後的parts: {parts}, 長度: {len(parts)}")
-                if len(parts) >= 2:
-                    user_str = parts[1].strip()  # 移除換行符等空白字符
-                    logger.info(f"解析用戶字符串: '{user_str}'")
-                    if user_str.startswith('USER'):
-                        logger.info(f"用戶字符串以USER開頭，準備解析ID")
-                        try:
-                            fingerprint_id = int(user_str[4:])  # 跳過 "USER" 四個字符
-                            logger.info(f"解析到指紋ID: {fingerprint_id}")
-                            data = {'fingerprint_id': fingerprint_id}
-                            logger.info(f"準備調用 detect_user 回調，回調數量: {len(self.callbacks['detect_user'])}")
-                            if len(self.callbacks['detect_user']) == 0:
-                                logger.warning("detect_user 回調列表為空！")
-                            for callback in self.callbacks['detect_user']:
-                                try:
-                                    logger.info(f"調用 detect_user 回調: {callback}")
-                                    callback(data)
-                                    logger.info(f"detect_user 回調執行完成")
-                                except Exception as e:
-                                    logger.error(f"指紋辨識回調錯誤: {e}", exc_info=True)
-                        except ValueError as e:
-                            logger.error(f"無法解析指紋ID: {user_str}, 錯誤: {e}", exc_info=True)
-                    else:
-                        # 如果格式不對，嘗試直接解析為數字
-                        logger.warning(f"用戶字符串 '{user_str}' 不以USER開頭，嘗試直接解析為數字")
-                        try:
-                            fingerprint_id = int(user_str)
-                            logger.info(f"直接解析到指紋ID: {fingerprint_id}")
-                            data = {'fingerprint_id': fingerprint_id}
-                            logger.info(f"準備調用 detect_user 回調，回調數量: {len(self.callbacks['detect_user'])}")
-                            if len(self.callbacks['detect_user']) == 0:
-                                logger.warning("detect_user 回調列表為空！")
-                            for callback in self.callbacks['detect_user']:
-                                try:
-                                    logger.info(f"調用 detect_user 回調: {callback}")
-                                    callback(data)
-                                    logger.info(f"detect_user 回調執行完成")
-                                except Exception as e:
-                                    logger.error(f"指紋辨識回調錯誤: {e}", exc_info=True)
-                        except ValueError as e:
-                            logger.error(f"無法解析指紋ID: {user_str}, 錯誤: {e}", exc_info=True)
-                else:
-                    logger.warning(f"DETECT,USER 消息格式錯誤: {line}")
-            
-            elif line == 'WORKING,START':
-                # 進入工作模式
-                for callback in self.callbacks['working_start']:
-                    try:
-                        callback()
-                    except Exception as e:
-                        logger.error(f"工作模式開始回調錯誤: {e}")
-            
-            elif line.startswith('WORKING,FINAL,'):
-                # 工作模式完成（格式：WORKING,FINAL,指紋ID,物體溫度,環境溫度,心率,血氧）
-                logger.info(f"收到 WORKING,FINAL 消息: {line}")
-                parts = line.split(',')
-                logger.info(f"分割後的parts: {parts}, 長度: {len(parts)}")
-                if len(parts) >= 7:
-                    try:
-                        data = {
-                            'fingerprint_id': int(parts[2]),
-                            'object_temp': float(parts[3]),
-                            'ambient_temp': float(parts[4]),
-                            'heart_rate': int(parts[5]),
-                            'spo2': int(parts[6])
-                        }
-                        logger.info(f"解析後的數據: {data}")
-                        logger.info(f"準備調用 working_final 回調，回調數量: {len(self.callbacks['working_final'])}")
-                        for callback in self.callbacks['working_final']:
-                            try:
-                                logger.info(f"調用 working_final 回調: {callback}")
-                                callback(data)
-                                logger.info(f"working_final 回調執行完成")
-                            except Exception as e:
-                                logger.error(f"工作模式完成回調錯誤: {e}", exc_info=True)
-                    except (ValueError, IndexError) as e:
-                        logger.error(f"解析 WORKING,FINAL 失敗: {line}, 錯誤: {e}", exc_info=True)
-                else:
-                    logger.warning(f"WORKING,FINAL 格式錯誤: {line}, 期望至少7個部分，實際{len(parts)}個")
-            
-            elif line.startswith('WORKING,NO_FINGER') or line.startswith('WORKING,TIMEOUT'):
-                # 工作模式錯誤（必須在 WORKING, 之前檢查，避免被當作狀態更新）
-                logger.info(f"收到工作模式錯誤消息: {line}")
-                error_type = 'NO_FINGER' if 'NO_FINGER' in line else 'TIMEOUT'
-                logger.info(f"錯誤類型: {error_type}")
-                logger.info(f"準備調用 working_error 回調，回調數量: {len(self.callbacks['working_error'])}")
-                for callback in self.callbacks['working_error']:
-                    try:
-                        logger.info(f"調用 working_error 回調: {callback}")
-                        callback(error_type)
-                        logger.info(f"working_error 回調執行完成")
-                    except Exception as e:
-                        logger.error(f"工作模式錯誤回調錯誤: {e}", exc_info=True)
-            
-            elif line.startswith('WORKING,'):
-                # 工作模式狀態更新（格式：WORKING,物體溫度,環境溫度,心率,血氧）
-                logger.info(f"收到 WORKING 狀態更新: {line}")
-                parts = line.split(',')
-                logger.info(f"分割後的parts: {parts}, 長度: {len(parts)}")
-                if len(parts) == 5:
-                    try:
-                        # 解析心率（可能是 'MEASURING' 或數字字符串）
-                        heart_rate = parts[3].strip()
-                        if heart_rate == 'MEASURING':
-                            heart_rate = 'MEASURING'
-                        else:
-                            try:
-                                heart_rate = int(heart_rate)
-                            except ValueError:
-                                heart_rate = 'MEASURING'
-                        
-                        # 解析血氧（可能是 'MEASURING' 或數字字符串）
-                        spo2 = parts[4].strip()
-                        if spo2 == 'MEASURING':
-                            spo2 = 'MEASURING'
-                        else:
-                            try:
-                                spo2 = int(spo2)
-                            except ValueError:
-                                spo2 = 'MEASURING'
-                        
-                        data = {
-                            'object_temp': float(parts[1]),
-                            'ambient_temp': float(parts[2]),
-                            'heart_rate': heart_rate,
-                            'spo2': spo2
-                        }
-                        logger.info(f"解析後的數據: {data}")
-                        logger.info(f"準備調用 working_status 回調，回調數量: {len(self.callbacks['working_status'])}")
-                        for callback in self.callbacks['working_status']:
-                            try:
-                                logger.info(f"調用 working_status 回調: {callback}")
-                                callback(data)
-                                logger.info(f"working_status 回調執行完成")
-                            except Exception as e:
-                                logger.error(f"工作模式狀態回調錯誤: {e}", exc_info=True)
-                    except (ValueError, IndexError) as e:
-                        logger.error(f"解析 WORKING 狀態更新失敗: {line}, 錯誤: {e}", exc_info=True)
-                else:
-                    logger.warning(f"WORKING 狀態更新格式錯誤: {line}, 期望5個部分，實際{len(parts)}個")
-            
-            
-            elif line.startswith('RELAY_OK,'):
-                # 繼電器控制成功
-                parts = line.split(',')
-                if len(parts) >= 2:
-                    relay_num = int(parts[1])
-                    for callback in self.callbacks['relay_ok']:
-                        try:
-                            callback(relay_num)
-                        except Exception as e:
-                            logger.error(f"繼電器回調錯誤: {e}")
-        
-        except ValueError as e:
-            logger.warning(f"數據解析錯誤: {line}, 錯誤: {e}")
-        except Exception as e:
-            logger.error(f"處理訊息時發生未預期錯誤: {e}")
+            return self.ser.fileno()
+        except (AttributeError, OSError, ValueError):
+            return None
+    
+    def _handle_line(self, raw_line: bytes, received_at: Optional[float] = None):
+        """
+        處理一行完整訊息（重播時也可能是一個完整的二進位幀）
+        
+        Args:
+            raw_line: 不含行結束符的原始位元組
+            received_at: 接收時間（time.monotonic()），None表示現在
+        """
+        if self.capture:
+            self.capture.write(raw_line, received_at)
+        
+        if raw_line and raw_line[0] == FRAME_SYNC:
+            event = self.frame_decoder.decode_frame(raw_line)
+            if event is not None:
+                self._dispatch_event(event, received_at)
+            return
+        
+        # 觸發原始訊息回調（只有在有訂閱者或需要調試時才解碼為字串）
+        if self.raw_topic.subscriptions or logger.isEnabledFor(logging.DEBUG):
+            line = raw_line.decode('utf-8', errors='ignore').strip()
+            logger.debug(f"收到原始訊息: {line}")
+            self.raw_topic.publish(line)
+        
+        # 處理訊息
+        self._process_message(raw_line, received_at)
+    
+    def _process_message(self, raw_line: bytes, received_at: Optional[float] = None):
+        """
+        解碼訊息並分派給對應事件類型的回調
+        
+        Args:
+            raw_line: 接收到的訊息行（原始位元組）
+            received_at: 接收時間（time.monotonic()），None表示現在
+        """
+        event = self.decoder.decode(raw_line)
+        if event is not None:
+            self._dispatch_event(event, received_at)
+    
+    def _dispatch_event(self, event, received_at: Optional[float] = None):
+        """
+        分派一個已解碼的事件，並發布到對應事件類型的主題
+        
+        Args:
+            event: code.protocol 的事件物件
+            received_at: 接收時間（time.monotonic()），None表示現在
+        """
+        if event.kind in self._logged_kinds:
+            logger.info(f"收到事件: {event}")
+        
+        if event.seq is not None:
+            self.stamp_tracker.observe(event.seq, event.device_ms,
+                                       received_at if received_at is not None else time.monotonic())
+        
+        # 繼電器回應先對應到送出的命令，再發布給訂閱端
+        if event.kind == 'relay_ok' or event.kind == 'relay_error':
+            self.relay_queue.on_response(event, received_at)
+        elif self._read_waiters and (event.kind == 'standby' or event.kind == 'working_status'):
+            self._complete_reads(event)
+        
+        register = self.latest.get(event.kind)
+        if register is not None:
+            register.publish(event)
+        
+        self.topics[event.kind].publish(event)
+    
+    def control_relay(self, relay_num: int, on_result: Optional[Callable] = None) -> bool:
+        """
+        控制繼電器（加入命令佇列後立即返回，不阻塞呼叫端）
+        
+        Args:
+            relay_num: 繼電器編號 (1-4)
+            on_result: 完成時的回調，參數為 RelayCommand（在通訊線程中呼叫）
+        
+        Returns:
+            是否已加入命令佇列
+        """
+        return self.submit_relay(relay_num, on_result) is not None
     
-    def control_relay(self, relay_num: int) -> bool:
+    def submit_relay(self, relay_num: int, on_result: Optional[Callable] = None) -> Optional[RelayCommand]:
         """
-        控制繼電器
+        將繼電器命令加入佇列
         
         Args:
             relay_num: 繼電器編號 (1-4)
+            on_result: 完成時的回調，參數為 RelayCommand
         
         Returns:
-            是否發送成功
+            命令物件（可用 wait() 等待結果），無效編號、未連接或佇列已滿時返回None
         """
         if relay_num < 1 or relay_num > 4:
             logger.error(f"無效的繼電器編號: {relay_num}")
-            return False
+            return None
         
-        if not self.connected or not self.ser or not self.ser.is_open:
+        if not self.is_connected():
             logger.error("串口未連接，無法發送命令")
+            return None
+        
+        return self.relay_queue.submit(relay_num, on_result)
+    
+    def _write_command(self, data: bytes):
+        """
+        寫入命令（由繼電器命令管線的寫入線程呼叫）
+        
+        Args:
+            data: 完整命令位元組
+        """
+        with self._write_lock:
+            if not self.is_connected():
+                raise serial.SerialException("串口未連接")
+            self.ser.write(data)
+    
+    def set_report_rate(self, mode: str, hz: float) -> bool:
+        """
+        設定韌體主動回報的頻率（韌體以 RATE_OK 確認，確認後的間隔記錄在 report_intervals）
+        
+        Args:
+            mode: 'standby'、'working' 或 'ppg'
+            hz: 每秒回報次數（0表示不主動回報，只在 read() 時回報；上限 10）；
+                'ppg' 為原始波形的取樣頻率（0 / 50 / 100，0 表示停止串流）
+        
+        Returns:
+            命令是否已送出（韌體不支援時只記錄設定，返回False）
+        """
+        mode = mode.upper()
+        if mode not in REPORT_MODES:
+            logger.error(f"無效的回報模式: {mode}")
+            return False
+        if mode == 'PPG':
+            if hz not in PPG_RATES:
+                logger.error(f"無效的PPG取樣頻率: {hz}（可用: {PPG_RATES}）")
+                return False
+        elif not 0 <= hz <= MAX_REPORT_RATE:
+            logger.error(f"無效的回報頻率: {hz}（0-{MAX_REPORT_RATE:g} Hz）")
+            return False
+        self.report_rates[mode] = hz
+        if not self.telemetry_active:
+            logger.debug(f"韌體不支援回報頻率命令，只記錄設定: {mode} {hz:g} Hz")
             return False
+        return self._send_command(RATE_COMMAND.format(mode=mode, hz=hz).encode())
+    
+    def _apply_report_rates(self):
+        """連線後送出設定過的回報頻率（韌體重新開機後會回到預設值）"""
+        if not self.telemetry_active:
+            return
+        for mode, hz in self.report_rates.items():
+            if hz is not None:
+                self._send_command(RATE_COMMAND.format(mode=mode, hz=hz).encode())
+    
+    def _on_rate_ok(self, event):
+        """記錄韌體確認的回報間隔（收到 RATE_OK 表示韌體支援回報頻率命令）"""
+        self.telemetry_active = True
+        self.report_intervals[event.mode] = event.interval_ms
+    
+    def request_read(self) -> bool:
+        """
+        要求韌體立即回報一次目前模式的數據（結果經由 standby / working_status 回調送達）
         
+        Returns:
+            命令是否已送出（韌體不支援 READ 時返回False）
+        """
+        if not self.telemetry_active:
+            return False
+        return self._send_command(READ_COMMAND)
+    
+    def read(self, timeout: float = 1.0):
+        """
+        送出 READ 並等待下一筆 STANDBY 或 WORKING 狀態數據
+        
+        Args:
+            timeout: 最長等待時間（秒）
+        
+        Returns:
+            StandbyEvent / WorkingStatusEvent，未連接或超時返回None
+        """
+        waiter = [threading.Event(), None]
+        with self._read_lock:
+            self._read_waiters.append(waiter)
+        try:
+            if self.request_read() and waiter[0].wait(timeout):
+                return waiter[1]
+            return None
+        finally:
+            with self._read_lock:
+                if waiter in self._read_waiters:
+                    self._read_waiters.remove(waiter)
+    
+    def _complete_reads(self, event):
+        """將收到的數據交給所有等待中的 read()"""
+        with self._read_lock:
+            waiters = self._read_waiters
+            self._read_waiters = []
+        for waiter in waiters:
+            waiter[1] = event
+            waiter[0].set()
+    
+    def _send_command(self, data: bytes) -> bool:
+        """
+        由呼叫端線程直接寫入一條不需要排隊的命令
+        
+        Args:
+            data: 完整命令位元組
+        
+        Returns:
+            是否寫入成功
+        """
         try:
-            command = f"RELAY,{relay_num}\n"
-            self.ser.write(command.encode('utf-8'))
-            logger.info(f"發送繼電器控制命令: {command.strip()}")
+            self._write_command(data)
             return True
-        except Exception as e:
-            logger.error(f"發送命令失敗: {e}")
+        except serial.SerialException as e:
+            logger.error(f"發送命令失敗: {data!r}, 錯誤: {e}")
             return False
     
+    def get_relay_stats(self) -> Dict:
+        """
+        獲取繼電器命令統計
+        
+        Returns:
+            成功/失敗/超時/重送計數、每個繼電器的往返時間直方圖與寫入耗時
+        """
+        return self.relay_queue.get_stats()
+    
+    def snapshot_latest(self) -> Dict:
+        """最新遙測數值（熱重啟快照用，只含已收到過數據的暫存器）"""
+        return {kind: register.value for kind, register in self.latest.items() if register.version}
+    
+    def restore_latest(self, values: Dict):
+        """
+        以熱重啟快照還原最新遙測數值（已收到新數據的暫存器不覆蓋）
+        
+        Args:
+            values: snapshot_latest() 的返回值
+        """
+        for kind, value in values.items():
+            register = self.latest.get(kind)
+            if register is not None and not register.version:
+                register.publish(value)
+    
+    def capture_datetime(self, event) -> Optional[datetime]:
+        """
+        換算事件在裝置端的產生時間
+        
+        Args:
+            event: code.protocol 的事件物件
+        
+        Returns:
+            主機本地時間，事件沒有時間戳記時返回None
+        """
+        if event.device_ms is None:
+            return None
+        return self.stamp_tracker.capture_datetime(event.device_ms)
+    
+    def get_stamp_stats(self) -> Dict:
+        """
+        獲取序號與時間戳記統計
+        
+        Returns:
+            是否啟用、收到/遺失數、遺失率、時鐘偏移與傳輸延遲（毫秒）
+        """
+        stats = self.stamp_tracker.get_stats()
+        stats['enabled'] = self.stamps_active
+        return stats
+    
     def is_connected(self) -> bool:
         """檢查是否已連接"""
         return self.connected and self.ser is not None and self.ser.is_open
+    
+    def start_capture(self, path: str):
+        """
+        開始錄製收到的每一行原始訊息
+        
+        Args:
+            path: 錄製檔路徑（已存在時追加）
+        """
+        self.stop_capture()
+        self.capture = CaptureWriter(path)
+    
+    def stop_capture(self):
+        """停止錄製"""
+        if self.capture:
+            self.capture.close()
+            self.capture = None
+    
+    def start_replay(self, path: str, speed: float = 1.0, loop: bool = False):
+        """
+        以錄製檔取代串口作為數據來源，經由相同的分派流程觸發回調
+        
+        Args:
+            path: 錄製檔路徑
+            speed: 播放速度倍率（1為原速，0為最快速度）
+            loop: 播放完畢後是否從頭重播
+        """
+        if self.running:
+            logger.warning("監聽線程已在運行，無法開始重播")
+            return
+        
+        self.replay_source = ReplaySource(path, speed=speed, loop=loop)
+        self.running = True
+        self.listen_thread = threading.Thread(target=self._replay_loop, daemon=True)
+        self.listen_thread.start()
+        logger.info(f"開始重播錄製檔: {path}，速度: {speed if speed > 0 else '最快'}")
+    
+    def _replay_loop(self):
+        """重播迴圈（在獨立線程中運行）"""
+        place_current_thread('serial')
+        try:
+            self.replay_source.run(self._handle_line)
+        except Exception as e:
+            logger.error(f"重播錯誤: {e}")
+        finally:
+            self.running = False
+            logger.info(f"重播結束: {self.replay_source.get_stats()}")
+    
+    def get_link_stats(self) -> Dict:
+        """
+        獲取連線統計
+        
+        Returns:
+            斷線/重連次數、失敗嘗試次數、最近一次中斷時間與裝置監看方式
+        """
+        stats = dict(self.link_stats)
+        stats['connected'] = self.is_connected()
+        stats['watch_mode'] = self.device_watcher.mode if self.device_watcher else None
+        return stats
+    
+    def get_reader_stats(self) -> Dict:
+        """
+        獲取讀取統計
+        
+        Returns:
+            統計字典（位元組/行數速率、系統呼叫次數、空閒喚醒次數）
+        """
+        stats = self.reader_stats.snapshot()
+        stats['mode'] = self.reader_mode
+        stats['framer_overflows'] = self.framer.overflows
+        stats['protocol'] = self.active_protocol
+        stats['telemetry_commands'] = self.telemetry_active
+        stats.update(self.frame_decoder.get_stats())
+        return stats
 
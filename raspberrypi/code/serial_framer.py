@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+串口分幀模組
+將串口讀到的原始位元組切成完整的訊息行，並統計讀取效能
+"""
+
+import time
+from typing import List, Dict
+
+
+class LineFramer:
+    """行分幀器：以可重用的 bytearray 累積位元組，一次切出所有完整的行"""
+
+    def __init__(self, delimiter: bytes = b'\n', max_line_length: int = 4096):
+        """
+        初始化行分幀器
+
+        Args:
+            delimiter: 行結束符
+            max_line_length: 單行最大長度，超過時丟棄緩衝區（避免雜訊導致無限增長）
+        """
+        self.delimiter = delimiter
+        self.max_line_length = max_line_length
+        self._buffer = bytearray()
+        self.overflows = 0
+
+    def feed(self, data) -> List[bytes]:
+        """
+        餵入一段位元組並取出所有完整的行
+
+        Args:
+            data: bytes、bytearray 或 memoryview
+
+        Returns:
+            完整行的列表（不含行結束符與 \\r，空行會被略過）
+        """
+        buffer = self._buffer
+        buffer += data
+
+        end = buffer.rfind(self.delimiter)
+        if end < 0:
+            if len(buffer) > self.max_line_length:
+                self.overflows += 1
+                buffer.clear()
+            return []
+
+        lines = [line.rstrip(b'\r') for line in bytes(buffer[:end]).split(self.delimiter)]
+        del buffer[:end + 1]
+        return [line for line in lines if line]
+
+    def pending(self) -> int:
+        """尚未組成完整行的位元組數"""
+        return len(self._buffer)
+
+    def reset(self):
+        """清空緩衝區（重連時使用）"""
+        self._buffer.clear()
+
+
+class ReaderStats:
+    """讀取統計：位元組數、行數、系統呼叫次數與空閒喚醒次數"""
+
+    def __init__(self):
+        """初始化統計"""
+        self.reset()
+
+    def reset(self):
+        """重置統計"""
+        self.started_at = time.monotonic()
+        self.bytes_read = 0
+        self.lines = 0
+        self.reads = 0
+        self.idle_wakeups = 0
+
+    def record_read(self, nbytes: int, nlines: int):
+        """
+        記錄一次讀取
+
+        Args:
+            nbytes: 本次讀到的位元組數
+            nlines: 本次切出的完整行數
+        """
+        self.reads += 1
+        self.bytes_read += nbytes
+        self.lines += nlines
+
+    def record_idle(self):
+        """記錄一次沒有數據的喚醒"""
+        self.idle_wakeups += 1
+
+    def snapshot(self) -> Dict:
+        """
+        取得目前的統計快照
+
+        Returns:
+            統計字典（含每秒速率）
+        """
+        elapsed = max(time.monotonic() - self.started_at, 1e-9)
+        return {
+            'elapsed': round(elapsed, 3),
+            'bytes': self.bytes_read,
+            'lines': self.lines,
+            'reads': self.reads,
+            'idle_wakeups': self.idle_wakeups,
+            'bytes_per_sec': round(self.bytes_read / elapsed, 1),
+            'lines_per_sec': round(self.lines / elapsed, 1),
+            'wakeups_per_sec': round((self.reads + self.idle_wakeups) / elapsed, 2),
+            'lines_per_read': round(self.lines / self.reads, 2) if self.reads else 0.0
+        }
@@ -0,0 +1,385 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多裝置串口集線模組
+以單一 selectors（epoll）迴圈同時服務多個BMduino串口，
+每個解碼後的事件都帶有裝置ID，繼電器命令依裝置ID送到對應的串口
+"""
+
+import os
+import selectors
+import threading
+import time
+from typing import Optional, Callable, Dict, List
+import logging
+
+import serial
+
+from code.serial_framer import LineFramer, ReaderStats
+from code.protocol import ProtocolDecoder, EVENT_KINDS
+from code.reconnect import ReconnectBackoff
+
+logger = logging.getLogger(__name__)
+
+
+class HubDevice:
+    """集線器中的一台BMduino（提供與 BMduinoCommunicator 相同的回調與繼電器介面）"""
+
+    def __init__(self, hub: 'SerialHub', device_id: str, port: str, baudrate: int = 115200):
+        """
+        初始化裝置
+
+        Args:
+            hub: 所屬集線器
+            device_id: 裝置ID
+            port: 串口路徑
+            baudrate: 波特率
+        """
+        self.hub = hub
+        self.device_id = device_id
+        self.port = port
+        self.baudrate = baudrate
+        self.ser: Optional[serial.Serial] = None
+        self.connected = False
+        self.next_reconnect = 0.0
+        self.backoff = ReconnectBackoff(maximum=hub.reconnect_interval)
+
+        self.framer = LineFramer()
+        self.decoder = ProtocolDecoder()
+        self.reader_stats = ReaderStats()
+
+        # 回調函數列表（參數為事件物件，raw_message 為原始字串）
+        self.callbacks = {kind: [] for kind in EVENT_KINDS}
+        self.callbacks['raw_message'] = []
+
+    def register_callback(self, event: str, callback: Callable):
+        """
+        註冊此裝置的回調函數
+
+        Args:
+            event: 事件類型
+            callback: 回調函數，參數為事件物件
+        """
+        if event in self.callbacks:
+            self.callbacks[event].append(callback)
+        else:
+            logger.warning(f"未知的事件類型: {event}，可用的類型: {list(self.callbacks.keys())}")
+
+    def control_relay(self, relay_num: int) -> bool:
+        """
+        控制此裝置的繼電器
+
+        Args:
+            relay_num: 繼電器編號 (1-4)
+
+        Returns:
+            是否發送成功
+        """
+        return self.hub.control_relay(self.device_id, relay_num)
+
+    def is_connected(self) -> bool:
+        """檢查是否已連接"""
+        return self.connected and self.ser is not None and self.ser.is_open
+
+    def fileno(self) -> int:
+        """串口的檔案描述符"""
+        return self.ser.fileno()
+
+
+class SerialHub:
+    """多裝置串口集線器"""
+
+    def __init__(self, reconnect_interval: float = 5.0, select_timeout: float = 0.5):
+        """
+        初始化集線器
+
+        Args:
+            reconnect_interval: 斷線裝置的重連間隔上限（秒，由指數退避逐步增加到此值）
+            select_timeout: 單次等待事件的最長時間（秒）
+        """
+        self.reconnect_interval = reconnect_interval
+        self.select_timeout = select_timeout
+        self.devices: Dict[str, HubDevice] = {}
+        self.selector = selectors.DefaultSelector()
+        self.running = False
+        self.loop_thread: Optional[threading.Thread] = None
+
+        # 集線器層級的回調（參數為 (device_id, event)）
+        self.callbacks: Dict[str, List[Callable]] = {kind: [] for kind in EVENT_KINDS}
+
+        # 所有裝置共用的讀取緩衝區（只在迴圈線程中使用）
+        self._rx_buffer = bytearray(4096)
+
+        # 喚醒管道：其他線程新增/移除裝置時喚醒 select
+        self._wakeup_r, self._wakeup_w = os.pipe()
+        os.set_blocking(self._wakeup_r, False)
+        os.set_blocking(self._wakeup_w, False)
+        self.selector.register(self._wakeup_r, selectors.EVENT_READ, None)
+        self._pending: List[Callable] = []
+        self._pending_lock = threading.Lock()
+
+    # ========== 裝置管理 ==========
+
+    def add_device(self, device_id: str, port: str, baudrate: int = 115200) -> HubDevice:
+        """
+        新增裝置
+
+        Args:
+            device_id: 裝置ID
+            port: 串口路徑
+            baudrate: 波特率
+
+        Returns:
+            裝置物件
+        """
+        if device_id in self.devices:
+            raise ValueError(f"裝置ID重複: {device_id}")
+        device = HubDevice(self, device_id, port, baudrate)
+        self.devices[device_id] = device
+        self._call_in_loop(lambda: self._connect(device))
+        logger.info(f"新增裝置 {device_id}: {port}")
+        return device
+
+    def remove_device(self, device_id: str):
+        """
+        移除裝置
+
+        Args:
+            device_id: 裝置ID
+        """
+        device = self.devices.pop(device_id, None)
+        if device:
+            self._call_in_loop(lambda: self._disconnect(device))
+            logger.info(f"移除裝置 {device_id}")
+
+    def get_device(self, device_id: str) -> Optional[HubDevice]:
+        """獲取裝置物件"""
+        return self.devices.get(device_id)
+
+    def register_callback(self, event: str, callback: Callable):
+        """
+        註冊所有裝置共用的回調函數
+
+        Args:
+            event: 事件類型
+            callback: 回調函數，參數為 (device_id, event)
+        """
+        if event in self.callbacks:
+            self.callbacks[event].append(callback)
+        else:
+            logger.warning(f"未知的事件類型: {event}，可用的類型: {list(self.callbacks.keys())}")
+
+    # ========== 生命週期 ==========
+
+    def start(self):
+        """在背景線程中開始運行集線迴圈"""
+        if self.running:
+            logger.warning("集線器已在運行")
+            return
+        self.running = True
+        self.loop_thread = threading.Thread(target=self._loop, daemon=True)
+        self.loop_thread.start()
+        logger.info(f"串口集線器已啟動，裝置數量: {len(self.devices)}")
+
+    def stop(self):
+        """停止集線迴圈並關閉所有串口"""
+        self.running = False
+        self._wakeup()
+        if self.loop_thread:
+            self.loop_thread.join(timeout=2)
+            self.loop_thread = None
+        for device in list(self.devices.values()):
+            self._disconnect(device)
+        logger.info("串口集線器已停止")
+
+    def _call_in_loop(self, func: Callable):
+        """在迴圈線程中執行（未運行時直接執行）"""
+        if not self.running:
+            func()
+            return
+        with self._pending_lock:
+            self._pending.append(func)
+        self._wakeup()
+
+    def _wakeup(self):
+        """喚醒 select"""
+        try:
+            os.write(self._wakeup_w, b'\0')
+        except BlockingIOError:
+            pass
+
+    # ========== 主迴圈 ==========
+
+    def _loop(self):
+        """集線迴圈（在獨立線程中運行）"""
+        for device in self.devices.values():
+            device.reader_stats.reset()
+        while self.running:
+            try:
+                for key, _ in self.selector.select(self._next_timeout()):
+                    if key.data is None:
+                        self._drain_wakeup()
+                    else:
+                        self._read_device(key.data)
+
+                self._reconnect_due(time.monotonic())
+            except Exception as e:
+                logger.error(f"集線迴圈錯誤: {e}")
+                time.sleep(0.1)
+
+    def _next_timeout(self) -> float:
+        """select 的等待時間（不超過最近一台斷線裝置的重連時間）"""
+        timeout = self.select_timeout
+        now = time.monotonic()
+        for device in self.devices.values():
+            if not device.connected:
+                timeout = min(timeout, max(0.0, device.next_reconnect - now))
+        return timeout
+
+    def _drain_wakeup(self):
+        """清空喚醒管道並執行待處理的工作"""
+        try:
+            while os.read(self._wakeup_r, 512):
+                pass
+        except BlockingIOError:
+            pass
+        with self._pending_lock:
+            pending, self._pending = self._pending, []
+        for func in pending:
+            try:
+                func()
+            except Exception as e:
+                logger.error(f"集線器工作執行錯誤: {e}")
+
+    def _read_device(self, device: HubDevice):
+        """讀取一台裝置的所有可用位元組並分派完整的行"""
+        try:
+            nbytes = os.readv(device.fileno(), [self._rx_buffer])
+        except BlockingIOError:
+            return
+        except OSError as e:
+            logger.error(f"裝置 {device.device_id} 讀取失敗: {e}")
+            self._disconnect(device)
+            return
+        if nbytes == 0:
+            logger.error(f"裝置 {device.device_id} 已斷開")
+            self._disconnect(device)
+            return
+
+        lines = device.framer.feed(memoryview(self._rx_buffer)[:nbytes])
+        device.reader_stats.record_read(nbytes, len(lines))
+        for raw_line in lines:
+            self._dispatch(device, raw_line)
+
+    def _dispatch(self, device: HubDevice, raw_line: bytes):
+        """解碼一行並觸發裝置與集線器的回調"""
+        if device.callbacks['raw_message']:
+            line = raw_line.decode('utf-8', errors='ignore').strip()
+            for callback in device.callbacks['raw_message']:
+                try:
+                    callback(line)
+                except Exception as e:
+                    logger.error(f"回調函數執行錯誤: {e}")
+
+        event = device.decoder.decode(raw_line)
+        if event is None:
+            return
+
+        for callback in device.callbacks[event.kind]:
+            try:
+                callback(event)
+            except Exception as e:
+                logger.error(f"裝置 {device.device_id} {event.kind} 回調錯誤: {e}", exc_info=True)
+        for callback in self.callbacks[event.kind]:
+            try:
+                callback(device.device_id, event)
+            except Exception as e:
+                logger.error(f"集線器 {event.kind} 回調錯誤: {e}", exc_info=True)
+
+    # ========== 連線管理 ==========
+
+    def _connect(self, device: HubDevice) -> bool:
+        """開啟裝置串口並註冊到 selector"""
+        try:
+            device.ser = serial.Serial(device.port, device.baudrate, timeout=0, write_timeout=1)
+            device.ser.reset_input_buffer()
+            device.framer.reset()
+            self.selector.register(device.fileno(), selectors.EVENT_READ, device)
+            device.connected = True
+            device.backoff.reset()
+            logger.info(f"裝置 {device.device_id} 連接成功: {device.port}")
+            return True
+        except (serial.SerialException, OSError, ValueError) as e:
+            logger.error(f"裝置 {device.device_id} 連接失敗: {e}")
+            device.connected = False
+            device.next_reconnect = time.monotonic() + device.backoff.next_delay()
+            return False
+
+    def _disconnect(self, device: HubDevice):
+        """從 selector 移除裝置並關閉串口"""
+        if device.ser:
+            try:
+                self.selector.unregister(device.fileno())
+            except (KeyError, ValueError, OSError):
+                pass
+            try:
+                device.ser.close()
+            except Exception:
+                pass
+        device.connected = False
+        device.backoff.reset()
+        device.next_reconnect = time.monotonic() + device.backoff.next_delay()
+
+    def _reconnect_due(self, now: float):
+        """重連到期的斷線裝置"""
+        for device in list(self.devices.values()):
+            if not device.connected and now >= device.next_reconnect:
+                self._connect(device)
+
+    # ========== 命令 ==========
+
+    def control_relay(self, device_id: str, relay_num: int) -> bool:
+        """
+        控制指定裝置的繼電器
+
+        Args:
+            device_id: 裝置ID
+            relay_num: 繼電器編號 (1-4)
+
+        Returns:
+            是否發送成功
+        """
+        if relay_num < 1 or relay_num > 4:
+            logger.error(f"無效的繼電器編號: {relay_num}")
+            return False
+
+        device = self.devices.get(device_id)
+        if device is None:
+            logger.error(f"未知的裝置: {device_id}")
+            return False
+        if not device.is_connected():
+            logger.error(f"裝置 {device_id} 未連接，無法發送命令")
+            return False
+
+        try:
+            device.ser.write(f"RELAY,{relay_num}\n".encode('utf-8'))
+            logger.info(f"發送繼電器控制命令到裝置 {device_id}: RELAY,{relay_num}")
+            return True
+        except Exception as e:
+            logger.error(f"發送命令到裝置 {device_id} 失敗: {e}")
+            return False
+
+    def get_stats(self) -> Dict[str, Dict]:
+        """
+        獲取每台裝置的讀取與解碼統計
+
+        Returns:
+            {裝置ID: 統計字典}
+        """
+        stats = {}
+        for device_id, device in self.devices.items():
+            device_stats = device.reader_stats.snapshot()
+            device_stats.update(device.decoder.get_stats())
+            device_stats['connected'] = device.is_connected()
+            stats[device_id] = device_stats
+        return stats
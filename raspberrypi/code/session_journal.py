@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+流程記錄模組
+訂閱狀態機的 state_change 主題，把每次流程（離開待機到返回待機）的每個狀態轉換、轉換原因與時間
+記錄為 sessions 表的一筆（狀態轉換以 [狀態, 相對開始的毫秒數, 原因] 的精簡 JSON 陣列保存），
+並依流程記錄計算各階段停留時間的百分位數（整體、每位使用者、每天），找出流程實際花費時間的位置
+
+流程結果：
+- complete：到達完成狀態
+- 測量錯誤代碼（no_finger、timeout、no_data）：韌體回報測量錯誤後返回待機
+- aborted：其他原因返回待機（重置、未找到指紋ID），或流程中再次辨識到使用者（韌體重啟後的新流程）
+
+數據庫寫入在事件匯流排的工作線程中進行，不佔用介面線程；數據庫尚未就緒時先暫存。
+多裝置的流程引擎（program.session_engine）發布的狀態變更帶有裝置ID，每台裝置各自一個進行中的流程
+"""
+
+import math
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Optional, Dict, List, Iterable
+import logging
+
+from code.clock import Clock, REAL_CLOCK
+from code.event_bus import THREAD
+
+logger = logging.getLogger(__name__)
+
+# 再次進入時表示新流程開始的狀態（來自其他流程中狀態時，先結束目前的流程）
+START_STATES = ('fingerprint', 'fingerprint_ok')
+
+# 百分位數
+PERCENTILES = (50, 90, 95)
+
+
+class SessionJournal:
+    """流程記錄（每次流程的狀態轉換與各階段時間）"""
+
+    def __init__(self, database=None, clock: Optional[Clock] = None, buffer_size: int = 100):
+        """
+        初始化流程記錄
+
+        Args:
+            database: 數據庫物件（None表示先暫存，以 set_database 設定後寫入）
+            clock: 狀態機使用的時鐘（換算流程開始的實際時間），None表示實際時間
+            buffer_size: 數據庫就緒前暫存的最多流程數
+        """
+        self.database = database
+        self.clock = clock if clock is not None else REAL_CLOCK
+        self._pending: deque = deque(maxlen=buffer_size)
+        self._lock = threading.Lock()
+        # 進行中的流程：裝置ID（單一藥盒為None）-> 流程
+        self._sessions: Dict[Optional[str], Dict] = {}
+        self.state_machine = None
+
+        # 統計
+        self.sessions = 0
+        self.written = 0
+        self.failed = 0
+        self.outcomes: Dict[str, int] = {}
+
+    def attach(self, state_machine, delivery: str = THREAD):
+        """
+        訂閱狀態機的狀態變更
+
+        Args:
+            state_machine: 狀態機物件
+            delivery: 'thread' 在事件匯流排的工作線程記錄（預設）；'sync' 在轉換狀態的線程記錄（模擬使用）
+        """
+        self.state_machine = state_machine
+        return state_machine.bus.subscribe('state_change', self.record, delivery, subscriber='SessionJournal')
+
+    def set_database(self, database):
+        """設定數據庫並寫入暫存的流程"""
+        with self._lock:
+            self.database = database
+            pending = list(self._pending)
+            self._pending.clear()
+        for record in pending:
+            self._write(record)
+
+    def record(self, change):
+        """
+        記錄一次狀態轉換（同一台裝置的轉換須依序記錄）
+
+        Args:
+            change: StateChange（device_id 為None表示單一藥盒）
+        """
+        device_id = change.device_id
+        state = change.state.value
+        previous = change.previous.value if change.previous is not None else None
+        session = self._sessions.get(device_id)
+
+        if session is not None and state in START_STATES and previous not in ('standby',) + START_STATES:
+            # 流程中再次辨識到使用者：目前的流程中斷，開始新的流程
+            self._finish(device_id, session, change.at, 'aborted')
+            session = None
+        if session is None:
+            if state == 'standby':
+                return
+            wall = self.clock.time() - (self.clock.monotonic() - change.at)
+            session = self._sessions[device_id] = {
+                'started': change.at,
+                'started_at': datetime.fromtimestamp(wall),
+                'user_id': None,
+                'transitions': [],
+            }
+
+        if change.data and change.data.get('fingerprint_id'):
+            session['user_id'] = change.data['fingerprint_id']
+        session['transitions'].append([state, int(round((change.at - session['started']) * 1000)), change.cause])
+
+        if state == 'standby':
+            self._finish(device_id, session, change.at, self._outcome(session))
+
+    @staticmethod
+    def _outcome(session: Dict) -> str:
+        states = {transition[0] for transition in session['transitions']}
+        if 'complete' in states:
+            return 'complete'
+        cause = session['transitions'][-1][2] or ''
+        if cause.startswith('working_error:'):
+            return cause.split(':', 1)[1].lower()
+        return 'aborted'
+
+    def _finish(self, device_id: Optional[str], session: Dict, at: float, outcome: str):
+        self._sessions.pop(device_id, None)
+        record = {
+            'started_at': session['started_at'],
+            'device_id': device_id,
+            'user_id': session['user_id'],
+            'outcome': outcome,
+            'duration_ms': int(round((at - session['started']) * 1000)),
+            'transitions': session['transitions'],
+        }
+        with self._lock:
+            self.sessions += 1
+            self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+            if self.database is None:
+                self._pending.append(record)
+                return
+        self._write(record)
+
+    def _write(self, record: Dict):
+        if self.database.insert_session(**record):
+            self.written += 1
+        else:
+            self.failed += 1
+
+    def get_stats(self) -> Dict:
+        """獲取統計（記錄的流程數與結果、寫入數據庫的筆數、狀態機的轉換統計）"""
+        with self._lock:
+            stats = {
+                'sessions': self.sessions,
+                'written': self.written,
+                'failed': self.failed,
+                'pending': len(self._pending),
+                'outcomes': dict(self.outcomes),
+                'in_progress': len(self._sessions),
+            }
+        if self.state_machine is not None:
+            stats['state_machine'] = self.state_machine.get_stats()
+        return stats
+
+
+def phase_durations(transitions: List[list], duration_ms: int) -> Dict[str, int]:
+    """
+    由狀態轉換計算各狀態的停留時間
+
+    Args:
+        transitions: [狀態, 相對開始的毫秒數, 原因] 列表
+        duration_ms: 流程總時間（最後一個狀態停留到流程結束）
+
+    Returns:
+        狀態 -> 停留毫秒數（同一狀態進入多次時累加；不含結束時的待機）
+    """
+    durations: Dict[str, int] = {}
+    for index, (state, offset, _) in enumerate(transitions):
+        if state == 'standby':
+            continue
+        end = transitions[index + 1][1] if index + 1 < len(transitions) else duration_ms
+        durations[state] = durations.get(state, 0) + end - offset
+    return durations
+
+
+def _percentile(ordered: List[int], percent: float) -> int:
+    """最近排名法的百分位數（ordered 已排序）"""
+    rank = max(math.ceil(len(ordered) * percent / 100.0) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def _summarize(values: List[int]) -> Dict:
+    ordered = sorted(values)
+    summary = {'count': len(ordered), 'mean_ms': round(sum(ordered) / len(ordered), 1)}
+    for percent in PERCENTILES:
+        summary[f'p{percent}_ms'] = _percentile(ordered, percent)
+    summary['max_ms'] = ordered[-1]
+    return summary
+
+
+def _group_latency(sessions: Iterable[Dict]) -> Dict:
+    phases: Dict[str, List[int]] = {}
+    totals: List[int] = []
+    outcomes: Dict[str, int] = {}
+    for session in sessions:
+        totals.append(session['duration_ms'])
+        outcomes[session['outcome']] = outcomes.get(session['outcome'], 0) + 1
+        for state, duration in phase_durations(session['transitions'], session['duration_ms']).items():
+            phases.setdefault(state, []).append(duration)
+    return {
+        'sessions': len(totals),
+        'outcomes': outcomes,
+        'session': _summarize(totals) if totals else None,
+        'phases': {state: _summarize(values) for state, values in phases.items()},
+    }
+
+
+def latency_report(sessions: List[Dict]) -> Dict:
+    """
+    各階段停留時間的百分位數
+
+    Args:
+        sessions: Database.get_sessions() 的流程記錄
+
+    Returns:
+        {'overall': ..., 'by_user': {使用者ID: ...}, 'by_day': {日期: ...}}（多裝置時另有 'by_device'）；
+        每組包含流程數、各結果次數、流程總時間與各狀態停留時間的次數、平均、P50/P90/P95 與最大值（毫秒）
+    """
+    by_user: Dict[str, List[Dict]] = {}
+    by_day: Dict[str, List[Dict]] = {}
+    by_device: Dict[str, List[Dict]] = {}
+    for session in sessions:
+        user = str(session['user_id']) if session['user_id'] is not None else 'unknown'
+        by_user.setdefault(user, []).append(session)
+        by_day.setdefault(str(session['started_at'])[:10], []).append(session)
+        if session.get('device_id') is not None:
+            by_device.setdefault(session['device_id'], []).append(session)
+    report = {
+        'overall': _group_latency(sessions),
+        'by_user': {user: _group_latency(group) for user, group in sorted(by_user.items())},
+        'by_day': {day: _group_latency(group) for day, group in sorted(by_day.items())},
+    }
+    if by_device:
+        report['by_device'] = {device: _group_latency(group) for device, group in sorted(by_device.items())}
+    return report
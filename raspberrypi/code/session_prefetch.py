@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+流程預取模組
+指紋辨識成功（DETECT,USER）後到取藥階段之間還有心律血氧測量（通常十數秒），
+在這段時間於背景預先完成取藥階段需要的較慢步驟：查詢使用者與對應的繼電器、
+載入使用者最近的測量記錄（同時填入數據庫的查詢快取）、開啟攝影機並讀取數幀等待自動曝光穩定，
+取藥階段開始時即可立即出藥與檢測
+
+每次流程記錄各預取工作的耗時，取藥階段開始（consume）時計算被隱藏的延遲：
+已完成的工作隱藏全部耗時，仍在進行的工作隱藏已經過的部分（剩餘部分由使用端等待，記錄為未及完成）
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Optional, Dict
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class SessionPrefetcher:
+    """依流程狀態預先準備取藥階段需要的資源"""
+
+    def __init__(self, user_mapper, database=None, history_limit: int = 10, camera: bool = True,
+                 warm_frames: int = 5, camera_hold: float = 120.0):
+        """
+        初始化預取
+
+        Args:
+            user_mapper: 使用者映射物件
+            database: 數據庫物件（None表示不預先載入測量記錄，可稍後以 set_database 設定）
+            history_limit: 預先載入的測量記錄筆數
+            camera: 是否預先開啟攝影機
+            warm_frames: 預先開啟攝影機後讀取的幀數
+            camera_hold: 預先開啟的攝影機未被使用時，保留的最長秒數
+        """
+        self.user_mapper = user_mapper
+        self.database = database
+        self.history_limit = history_limit
+        self.camera = camera
+        self.warm_frames = warm_frames
+        self.camera_hold = camera_hold
+
+        self._lock = threading.Lock()
+        self._session: Optional[Dict] = None
+        self._release_timer: Optional[threading.Timer] = None
+
+        # 統計
+        self.sessions = 0
+        self.consumed = 0
+        self.cancelled = 0
+        self.hidden_ms_total = 0.0
+        self.incomplete = 0
+        self.recent: deque = deque(maxlen=10)
+
+    def set_database(self, database):
+        """設定數據庫（背景初始化完成後）"""
+        self.database = database
+
+    def prefetch(self, fingerprint_id: int, medication_detector=None) -> bool:
+        """
+        開始預取（同一使用者的流程已在預取時不重複）
+
+        Args:
+            fingerprint_id: 指紋ID
+            medication_detector: 服藥動作檢測物件（None表示不預先開啟攝影機）
+
+        Returns:
+            是否開始新的預取
+        """
+        with self._lock:
+            if self._session is not None and self._session['fingerprint_id'] == fingerprint_id:
+                return False
+        self.cancel()
+
+        session = {
+            'fingerprint_id': fingerprint_id,
+            'started': time.perf_counter(),
+            'tasks': {},
+            'user': None,
+            'relay_num': None,
+            'history': None,
+            'detector': medication_detector if self.camera else None,
+            'consumed': None,
+        }
+        with self._lock:
+            self._session = session
+            self.sessions += 1
+        threading.Thread(target=self._run, args=(session,), name='session-prefetch', daemon=True).start()
+        return True
+
+    def _task(self, session: Dict, name: str, func):
+        """執行一個預取工作並記錄開始與結束時間"""
+        task = {'start': time.perf_counter(), 'end': None, 'ok': False}
+        with self._lock:
+            session['tasks'][name] = task
+        try:
+            result = func()
+            task['ok'] = result is not False
+            return result
+        except Exception as e:
+            logger.error(f"預取 {name} 失敗: {e}")
+            return None
+        finally:
+            task['end'] = time.perf_counter()
+
+    def _run(self, session: Dict):
+        """預取線程：依取藥階段的使用順序執行（攝影機最慢，放在最後）"""
+        fingerprint_id = session['fingerprint_id']
+        user = self._task(session, 'user', lambda: self.user_mapper.get_user_info(fingerprint_id))
+        session['user'] = user
+        session['relay_num'] = user.get('relay') if user else None
+
+        database = self.database
+        if database is not None and self.history_limit > 0:
+            session['history'] = self._task(
+                session, 'history', lambda: database.get_history(user_id=fingerprint_id, limit=self.history_limit))
+            self._task(session, 'latest', lambda: database.get_latest_measurement(user_id=fingerprint_id))
+
+        detector = session['detector']
+        if detector is not None and self._is_current(session):
+            if self._task(session, 'camera', lambda: detector.warm_camera(self.warm_frames)):
+                with self._lock:
+                    idle = self._session is None
+                if self._is_current(session):
+                    self._schedule_release(session)
+                elif idle:
+                    # 預先開啟期間流程已結束
+                    detector.release_camera()
+
+        elapsed = (time.perf_counter() - session['started']) * 1000
+        logger.info(f"使用者 {fingerprint_id} 的流程預取完成（{elapsed:.0f} ms）: "
+                    f"{', '.join(f'{name} {self._duration_ms(task):.0f} ms' for name, task in session['tasks'].items())}")
+
+    def _is_current(self, session: Dict) -> bool:
+        with self._lock:
+            return self._session is session
+
+    def _schedule_release(self, session: Dict):
+        """攝影機預先開啟後長時間未進入取藥階段（例如流程中斷）時釋放"""
+        if self.camera_hold <= 0:
+            return
+        timer = threading.Timer(self.camera_hold, self._release_if_unused, args=(session,))
+        timer.daemon = True
+        with self._lock:
+            if self._release_timer is not None:
+                self._release_timer.cancel()
+            self._release_timer = timer
+        timer.start()
+
+    def _release_if_unused(self, session: Dict):
+        with self._lock:
+            unused = session['consumed'] is None
+        if unused and session['detector'] is not None:
+            session['detector'].release_camera()
+
+    @staticmethod
+    def _duration_ms(task: Dict) -> float:
+        end = task['end'] if task['end'] is not None else time.perf_counter()
+        return (end - task['start']) * 1000
+
+    def get_user_relay(self, fingerprint_id: int) -> Optional[int]:
+        """使用者對應的繼電器編號（已預取時使用預取結果）"""
+        with self._lock:
+            session = self._session
+        if session is not None and session['fingerprint_id'] == fingerprint_id and session['user'] is not None:
+            return session['relay_num']
+        return self.user_mapper.get_user_relay(fingerprint_id)
+
+    def consume(self, fingerprint_id: int) -> Optional[Dict]:
+        """
+        取藥階段開始：計算預取隱藏的延遲
+
+        Args:
+            fingerprint_id: 指紋ID
+
+        Returns:
+            預取結果（user、relay_num、history），沒有該使用者的預取時返回None
+        """
+        now = time.perf_counter()
+        with self._lock:
+            session = self._session
+            if session is None or session['fingerprint_id'] != fingerprint_id or session['consumed'] is not None:
+                return None
+            session['consumed'] = now
+            tasks = dict(session['tasks'])
+
+        hidden_ms = 0.0
+        incomplete = 0
+        task_stats = {}
+        for name, task in tasks.items():
+            complete = task['end'] is not None and task['end'] <= now
+            hidden = self._duration_ms(task) if complete else (now - task['start']) * 1000
+            if not complete:
+                incomplete += 1
+            hidden_ms += hidden
+            task_stats[name] = {'hidden_ms': round(hidden, 1), 'complete': complete, 'ok': task['ok']}
+
+        lead_ms = (now - session['started']) * 1000
+        with self._lock:
+            self.consumed += 1
+            self.hidden_ms_total += hidden_ms
+            self.incomplete += incomplete
+            self.recent.append({
+                'fingerprint_id': fingerprint_id,
+                'lead_ms': round(lead_ms, 1),
+                'hidden_ms': round(hidden_ms, 1),
+                'tasks': task_stats,
+            })
+        logger.info(f"取藥階段使用預取結果：提前 {lead_ms:.0f} ms 開始，隱藏延遲 {hidden_ms:.0f} ms")
+        return {'user': session['user'], 'relay_num': session['relay_num'], 'history': session['history']}
+
+    def cancel(self):
+        """流程結束（返回待機）：釋放未使用的攝影機"""
+        with self._lock:
+            session = self._session
+            self._session = None
+            timer = self._release_timer
+            self._release_timer = None
+            if session is not None and session['consumed'] is None:
+                self.cancelled += 1
+        if timer is not None:
+            timer.cancel()
+        if session is not None and session['consumed'] is None and session['detector'] is not None:
+            session['detector'].release_camera()
+
+    def get_stats(self) -> Dict:
+        """獲取統計（預取次數、使用次數、隱藏的延遲與取藥階段開始時仍未完成的工作數）"""
+        with self._lock:
+            return {
+                'sessions': self.sessions,
+                'consumed': self.consumed,
+                'cancelled': self.cancelled,
+                'hidden_ms_total': round(self.hidden_ms_total, 1),
+                'hidden_ms_avg': round(self.hidden_ms_total / self.consumed, 1) if self.consumed else 0.0,
+                'incomplete': self.incomplete,
+                'recent': list(self.recent),
+            }
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+共享記憶體快照模組
+多行程模式下，擷取行程把最新的遙測數據寫入共享記憶體，API 與 UI 行程直接讀取，
+不經過 socket 也不排隊。讀取介面與 code.latest_value.LatestValue 相同（get / wait_newer / reader），
+原本讀取最新值暫存器的程式碼不需要修改
+
+記憶體配置為固定大小的區段：
+    [序號 u64][版本 u64][發布時間 f64][長度 u32][保留 4 bytes][pickle 數值]
+寫入端（單一寫入行程）以序號鎖（seqlock）發布：寫入前序號加一成為奇數，寫完再加一成為偶數；
+讀取端讀取前後序號相同且為偶數時才採用，否則重試。發布時間為 time.monotonic()，
+同一台機器上的行程之間可以直接比較
+"""
+
+import pickle
+import struct
+import time
+from multiprocessing import shared_memory
+from typing import Any, Optional, Dict
+import logging
+
+from code.latest_value import Snapshot, LatestReader
+
+logger = logging.getLogger(__name__)
+
+_SEQ = struct.Struct('<Q')
+_HEADER = struct.Struct('<QdI4x')       # 版本、發布時間、數值長度
+HEADER_SIZE = _SEQ.size + _HEADER.size
+
+# 讀取端在寫入進行中時的重試次數
+READ_RETRIES = 100
+
+# 本行程建立的區段（同一行程再連接時不能取消 resource_tracker 的登記，否則刪除時會重複取消）
+_created = set()
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    """
+    連接既有的共享記憶體區段（不交給 resource_tracker 管理）
+
+    Python 3.13 之前連接端的 resource_tracker 會在行程結束時刪除區段，
+    角色行程重啟時其他行程的區段就消失了；區段由建立者（監督程式）負責刪除
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        from multiprocessing import resource_tracker
+        segment = shared_memory.SharedMemory(name=name)
+        if name not in _created:
+            resource_tracker.unregister(segment._name, 'shared_memory')
+        return segment
+
+
+class SharedSnapshot:
+    """共享記憶體中的版本化最新值（單一寫入端，任意數量的讀取端）"""
+
+    def __init__(self, name: str, size: int = 4096, create: bool = False, initial: Any = None,
+                 poll_interval: float = 0.01):
+        """
+        建立或連接共享記憶體快照
+
+        Args:
+            name: 區段名稱（/dev/shm 下的檔名）
+            size: 區段大小（bytes，含標頭）
+            create: True 建立區段（已存在時沿用），False 連接既有區段
+            initial: 尚未發布前的數值（版本 0）
+            poll_interval: wait_newer() 檢查新版本的間隔（秒；行程之間沒有條件變數可以通知）
+        """
+        self.name = name
+        self.initial = initial
+        self.poll_interval = poll_interval
+        self.owner = False
+        if create:
+            try:
+                self._segment = shared_memory.SharedMemory(name=name, create=True, size=size)
+                self.owner = True
+                _created.add(name)
+            except FileExistsError:
+                logger.warning(f"共享記憶體區段已存在，沿用: {name}")
+                self._segment = _attach(name)
+        else:
+            self._segment = _attach(name)
+        self._buffer = self._segment.buf
+        self.capacity = len(self._buffer) - HEADER_SIZE
+
+        # 讀取端快取：序號未變時不重新反序列化
+        self._cached_seq = -1
+        self._cached: Snapshot = Snapshot(0, initial, 0.0)
+        self.torn_reads = 0
+
+    def publish(self, value: Any) -> int:
+        """
+        發布新數值（只能由單一寫入行程呼叫）
+
+        Args:
+            value: 可 pickle 的數值（例如事件 NamedTuple）
+
+        Returns:
+            新版本號，數值過大時返回0
+        """
+        payload = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(payload) > self.capacity:
+            logger.error(f"快照 {self.name} 數值過大: {len(payload)} > {self.capacity} bytes")
+            return 0
+        buffer = self._buffer
+        seq = _SEQ.unpack_from(buffer, 0)[0]
+        if seq & 1:
+            # 上一個寫入端在寫入途中結束（行程重啟），從下一個偶數繼續
+            seq += 1
+        version = _HEADER.unpack_from(buffer, _SEQ.size)[0] + 1
+        _SEQ.pack_into(buffer, 0, seq + 1)
+        buffer[HEADER_SIZE:HEADER_SIZE + len(payload)] = payload
+        _HEADER.pack_into(buffer, _SEQ.size, version, time.monotonic(), len(payload))
+        _SEQ.pack_into(buffer, 0, seq + 2)
+        return version
+
+    def get(self) -> Snapshot:
+        """取得目前快照（寫入進行中時重試，仍無法取得一致的內容時返回上一次讀到的快照）"""
+        buffer = self._buffer
+        for _ in range(READ_RETRIES):
+            seq = _SEQ.unpack_from(buffer, 0)[0]
+            if seq == self._cached_seq:
+                return self._cached
+            if seq & 1:
+                time.sleep(0)
+                continue
+            version, published_at, length = _HEADER.unpack_from(buffer, _SEQ.size)
+            payload = bytes(buffer[HEADER_SIZE:HEADER_SIZE + length])
+            if _SEQ.unpack_from(buffer, 0)[0] != seq:
+                self.torn_reads += 1
+                continue
+            if version == 0:
+                snapshot = Snapshot(0, self.initial, published_at)
+            else:
+                try:
+                    snapshot = Snapshot(version, pickle.loads(payload), published_at)
+                except Exception:
+                    self.torn_reads += 1
+                    continue
+            self._cached_seq = seq
+            self._cached = snapshot
+            return snapshot
+        return self._cached
+
+    @property
+    def version(self) -> int:
+        return self.get().version
+
+    @property
+    def value(self) -> Any:
+        return self.get().value
+
+    def wait_newer(self, version: int, timeout: Optional[float] = None) -> Optional[Snapshot]:
+        """
+        等待版本號大於 version 的快照（以 poll_interval 輪詢）
+
+        Args:
+            version: 讀取端已經看過的版本
+            timeout: 最長等待時間（秒），None表示一直等待
+
+        Returns:
+            較新的快照，超時返回None
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            snapshot = self.get()
+            if snapshot.version > version:
+                return snapshot
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                time.sleep(min(self.poll_interval, remaining))
+            else:
+                time.sleep(self.poll_interval)
+
+    def reader(self) -> LatestReader:
+        """建立一個記錄讀取進度的讀取端"""
+        return LatestReader(self)
+
+    def close(self):
+        """中斷與區段的連接"""
+        self._buffer = None
+        self._segment.close()
+
+    def unlink(self):
+        """刪除區段（只由建立者在所有行程結束後呼叫）"""
+        try:
+            self._segment.unlink()
+        except FileNotFoundError:
+            pass
+
+    def get_stats(self) -> Dict:
+        """獲取統計"""
+        snapshot = self.get()
+        return {
+            'name': self.name,
+            'version': snapshot.version,
+            'capacity': self.capacity,
+            'torn_reads': self.torn_reads,
+        }
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+加速模擬模組
+在虛擬時鐘的事件迴圈上模擬 BMduino 與服藥動作檢測，不經過串口與攝影機：
+流程控制（HeadlessController）、狀態機與所有延遲都以虛擬時間運行，
+完整的指紋辨識 -> 心律血氧 -> 出藥 -> 服藥確認 -> 完成流程可以比實際時間快數百倍
+
+- SimulatedBMduino：與 BMduinoCommunicator 相同的 register_callback / control_relay 介面，
+  依 bmduino_emulator 的流程模型（放置手指緩衝、狀態回報、穩定時間、45 秒時限）產生協議事件；
+  事件由協議文字經 ProtocolDecoder 解碼，與實際串口收到的事件相同
+- SimulatedDetector：與 MedicationDetector 相同的 start_detection / stop_detection 介面，
+  依機率在隨機延遲後回報檢測到服藥動作，否則在超時時間後回報超時
+"""
+
+import random
+from typing import Optional, Callable, Dict, Tuple
+import logging
+
+from code.event_bus import EventBus, DROP_OLDEST, BLOCK, SYNC
+from code.event_loop import EventLoop
+from code.protocol import ProtocolDecoder, EVENT_TYPES, TELEMETRY_KINDS
+from code.relay_pipeline import RelayCommand
+from code.bmduino_emulator import (EmulatedSession, OUTCOME_FINAL, OUTCOME_NO_FINGER, OUTCOME_NO_DATA,
+                                   OUTCOMES)
+
+logger = logging.getLogger(__name__)
+
+
+class SimulatedBMduino:
+    """虛擬時間上的 BMduino（直接發布協議事件）"""
+
+    def __init__(self, loop: EventLoop, bus: Optional[EventBus] = None,
+                 status_interval: float = 1.0,
+                 working_timeout: float = 45.0,
+                 stable_time: float = 3.0,
+                 finger_placement_time: float = 3.0,
+                 no_finger_time: float = 3.0,
+                 relay_hold: float = 1.0,
+                 seed: Optional[int] = None):
+        """
+        初始化模擬
+
+        Args:
+            loop: 虛擬時鐘的事件迴圈（所有事件在迴圈線程中發布）
+            bus: 事件匯流排，None表示建立專用的匯流排
+            status_interval: 工作模式狀態回報間隔（秒）
+            working_timeout: 工作模式超時時間（秒）
+            stable_time: 數據穩定多久後輸出 FINAL（秒）
+            finger_placement_time: 放置手指的緩衝時間（秒）
+            no_finger_time: 緩衝時間後沒有手指多久輸出 NO_FINGER（秒）
+            relay_hold: 繼電器開啟時間（秒）
+            seed: 亂數種子
+        """
+        self.loop = loop
+        self.clock = loop.clock
+        self.bus = bus if bus is not None else EventBus()
+        self.status_interval = status_interval
+        self.working_timeout = working_timeout
+        self.stable_time = stable_time
+        self.finger_placement_time = finger_placement_time
+        self.no_finger_time = no_finger_time
+        self.relay_hold = relay_hold
+        self.random = random.Random(seed)
+
+        self.topics = {
+            kind: self.bus.declare(kind, (event_type,), DROP_OLDEST if kind in TELEMETRY_KINDS else BLOCK)
+            for kind, event_type in EVENT_TYPES.items()
+        }
+        self.decoder = ProtocolDecoder()
+        self.session: Optional[EmulatedSession] = None
+        self.relay_busy = False
+        self.object_temp = 25.5
+        self.ambient_temp = 23.2
+
+        # 統計
+        self.stats = {'events': 0, 'sessions': 0, 'relays': 0}
+        self.outcomes = {outcome: 0 for outcome in OUTCOMES}
+
+    # ========== 通訊模組介面 ==========
+
+    def register_callback(self, event: str, callback: Callable, delivery: str = SYNC,
+                          capacity: Optional[int] = None):
+        """註冊回調函數（與 BMduinoCommunicator.register_callback 相同）"""
+        return self.bus.subscribe(event, callback, delivery, capacity)
+
+    def control_relay(self, relay_num: int, on_result: Optional[Callable] = None) -> bool:
+        """
+        控制繼電器（繼電器保持時間後以 RELAY_OK 完成）
+
+        Args:
+            relay_num: 繼電器編號 (1-4)
+            on_result: 完成時的回調，參數為 RelayCommand
+
+        Returns:
+            是否已接受命令
+        """
+        if not 1 <= relay_num <= 4 or self.relay_busy:
+            return False
+        self.stats['relays'] += 1
+        self.relay_busy = True
+        command = RelayCommand(relay_num, on_result)
+        command.attempts = 1
+        command.queued_at = command.sent_at = self.clock.monotonic()
+        self._emit('MODE,RECEIVE')
+        self.loop.call_later(self.relay_hold, self._finish_relay, command)
+        return True
+
+    def _finish_relay(self, command: RelayCommand):
+        self.relay_busy = False
+        command.rtt_ms = (self.clock.monotonic() - command.sent_at) * 1000
+        self._emit(f'RELAY_OK,{command.relay_num}')
+        self._emit('MODE,STANDBY')
+        command._complete(RelayCommand.OK)
+
+    # ========== 流程 ==========
+
+    def is_idle(self) -> bool:
+        """是否在待機模式（沒有進行中的流程與繼電器動作）"""
+        return self.session is None and not self.relay_busy
+
+    def trigger_fingerprint(self, fingerprint_id: int = 1, outcome: str = OUTCOME_FINAL,
+                            heart_rate: Optional[int] = None, spo2: Optional[int] = None) -> bool:
+        """
+        指紋辨識成功並開始工作模式流程（與 BMduinoEmulator.trigger_fingerprint 相同的流程模型）
+
+        Returns:
+            是否開始流程（已有流程進行中時返回False）
+        """
+        if outcome not in OUTCOMES:
+            raise ValueError(f"未知的流程結果: {outcome}")
+        if self.session is not None:
+            return False
+        session = EmulatedSession(
+            fingerprint_id=fingerprint_id,
+            outcome=outcome,
+            heart_rate=heart_rate if heart_rate is not None else self.random.randint(60, 100),
+            spo2=spo2 if spo2 is not None else self.random.randint(94, 99),
+            hr_ready_after=self.random.uniform(4.0, 10.0),
+            spo2_ready_after=self.random.uniform(2.0, 6.0)
+        )
+        session.started_at = self.clock.monotonic()
+        self.session = session
+        self.stats['sessions'] += 1
+        self._emit(f'DETECT,USER{fingerprint_id}')
+        self._emit('WORKING,START')
+        self._tick_working(session)
+        return True
+
+    def _tick_working(self, session: EmulatedSession):
+        """工作模式：每個狀態回報間隔推進一次（與模擬器的 _tick_working 相同的判定）"""
+        if self.session is not session:
+            return
+        elapsed = self.clock.monotonic() - session.started_at
+
+        if elapsed > self.working_timeout:
+            self._finish_session('WORKING,NO_DATA' if session.outcome == OUTCOME_NO_DATA else 'WORKING,TIMEOUT')
+            return
+        if session.outcome == OUTCOME_NO_FINGER and elapsed > self.finger_placement_time + self.no_finger_time:
+            self._finish_session('WORKING,NO_FINGER')
+            return
+
+        measuring = session.outcome != OUTCOME_FINAL
+        hr_ready = not measuring and elapsed >= session.hr_ready_after
+        spo2_ready = not measuring and elapsed >= session.spo2_ready_after
+        hr_text = str(session.heart_rate) if hr_ready else 'MEASURING'
+        spo2_text = str(session.spo2) if spo2_ready else 'MEASURING'
+        self._emit(f'WORKING,{self.object_temp:.2f},{self.ambient_temp:.2f},{hr_text},{spo2_text}')
+
+        if hr_ready and spo2_ready:
+            if session.stable_since is None:
+                session.stable_since = elapsed
+            elif elapsed - session.stable_since >= self.stable_time:
+                self._finish_session(
+                    f'WORKING,FINAL,{session.fingerprint_id},{self.object_temp:.2f},'
+                    f'{self.ambient_temp:.2f},{session.heart_rate},{session.spo2}')
+                return
+        self.loop.call_later(self.status_interval, self._tick_working, session)
+
+    def _finish_session(self, line: str):
+        self.outcomes[self.session.outcome] += 1
+        self.session = None
+        self._emit(line)
+
+    def _emit(self, line: str):
+        """以協議文字產生事件並發布（與串口收到的事件相同）"""
+        event = self.decoder.decode(line.encode())
+        if event is None:
+            logger.warning(f"模擬產生無法解碼的訊息: {line}")
+            return
+        self.stats['events'] += 1
+        self.topics[event.kind].publish(event)
+
+    def get_stats(self) -> Dict:
+        """獲取統計"""
+        return {**self.stats, 'outcomes': dict(self.outcomes)}
+
+
+class SimulatedDetector:
+    """虛擬時間上的服藥動作檢測"""
+
+    def __init__(self, loop: EventLoop, timeout: float = 30.0, detect_probability: float = 0.9,
+                 detect_delay: Tuple[float, float] = (2.0, 8.0), seed: Optional[int] = None):
+        """
+        初始化模擬
+
+        Args:
+            loop: 虛擬時鐘的事件迴圈
+            timeout: 超時時間（秒，與 MedicationDetector.timeout 相同）
+            detect_probability: 在超時前檢測到服藥動作的機率
+            detect_delay: 檢測到服藥動作所需時間的範圍（秒）
+            seed: 亂數種子
+        """
+        self.loop = loop
+        self.timeout = timeout
+        self.detect_probability = detect_probability
+        self.detect_delay = detect_delay
+        self.random = random.Random(seed)
+        self.handle = None
+        self.detected = False
+
+        # 統計
+        self.detections = 0
+        self.timeouts = 0
+
+    def start_detection(self, on_detected: Optional[Callable] = None,
+                        on_timeout: Optional[Callable] = None) -> bool:
+        """開始檢測（與 MedicationDetector.start_detection 相同）"""
+        if self.is_detecting():
+            logger.warning("檢測已在進行中")
+            return False
+        self.detected = False
+        if self.random.random() < self.detect_probability:
+            delay = min(self.random.uniform(*self.detect_delay), self.timeout)
+            self.handle = self.loop.call_later(delay, self._finish, True, on_detected)
+        else:
+            self.handle = self.loop.call_later(self.timeout, self._finish, False, on_timeout)
+        return True
+
+    def _finish(self, detected: bool, callback: Optional[Callable]):
+        self.handle = None
+        self.detected = detected
+        if detected:
+            self.detections += 1
+        else:
+            self.timeouts += 1
+        if callback:
+            callback()
+
+    def stop_detection(self):
+        """停止檢測"""
+        if self.handle is not None:
+            self.handle.cancel()
+            self.handle = None
+
+    def is_detecting(self) -> bool:
+        """檢查是否正在檢測"""
+        return self.handle is not None and self.handle.is_active()
+
+    def has_detected(self) -> bool:
+        """檢查是否已檢測到動作"""
+        return self.detected
+
+    def get_stats(self) -> Dict:
+        """獲取統計"""
+        return {'detections': self.detections, 'timeouts': self.timeouts}
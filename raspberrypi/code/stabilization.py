@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+測量提前穩定判定模組
+韌體在心率與血氧都有數值後還要再等 3 秒才輸出 WORKING,FINAL（中途任一數值消失就重新計時），
+整個流程最長 45 秒。本模組在樹莓派端以 WORKING 狀態更新的滾動統計判斷數值是否已收斂：
+
+- 每個數值保留最近幾筆樣本，計算平均的 95% 信賴區間（t 分佈）半寬
+- 以最小平方法斜率乘上視窗時間長度估計趨勢，避免把仍在上升/下降的數值當成穩定
+- 所有數值的區間半寬與趨勢都小於容許誤差時，輸出一次提前完成事件
+
+結果回調對每次流程只送出一個結果：提前完成事件，或（未提前收斂時）韌體的 WORKING,FINAL。
+韌體稍後送出的 FINAL 用來統計節省的時間與提前結果的誤差
+"""
+
+import math
+import time
+from collections import deque
+from typing import NamedTuple, Optional, Callable, List, Dict
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 95% 雙尾 t 分佈臨界值（自由度 1-20），更大的自由度使用常態分佈近似
+_T_95 = (12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+         2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086)
+_Z_95 = 1.960
+
+# 節省時間中位數所用的最近流程數（其餘統計以累計值計算，長時間運行不增加記憶體）
+HISTORY = 500
+
+
+def t_critical(degrees_of_freedom: int) -> float:
+    """95% 雙尾 t 臨界值"""
+    if degrees_of_freedom <= len(_T_95):
+        return _T_95[degrees_of_freedom - 1]
+    return _Z_95
+
+
+class EarlyFinalEvent(NamedTuple):
+    """提前完成：欄位與 WorkingFinalEvent 相同，另附判定時的流程時間與信賴區間半寬"""
+    fingerprint_id: int
+    object_temp: float
+    ambient_temp: float
+    heart_rate: int
+    spo2: int
+    elapsed: float                  # 流程開始到判定收斂的秒數
+    heart_rate_ci: float            # 心率平均的 95% 信賴區間半寬（BPM）
+    spo2_ci: float                  # 血氧平均的 95% 信賴區間半寬（%）
+    seq: Optional[int] = None
+    device_ms: Optional[int] = None
+    kind = 'working_early_final'
+
+
+class RollingChannel:
+    """單一數值的滾動視窗：信賴區間半寬與趨勢"""
+
+    def __init__(self, window: int, min_samples: int, tolerance: float):
+        self.samples = deque(maxlen=window)
+        self.min_samples = min_samples
+        self.tolerance = tolerance
+
+    def clear(self):
+        self.samples.clear()
+
+    def add(self, timestamp: float, value: float):
+        self.samples.append((timestamp, value))
+
+    def mean(self) -> float:
+        return sum(v for _, v in self.samples) / len(self.samples)
+
+    def confidence(self) -> float:
+        """平均的 95% 信賴區間半寬（樣本不足時為無限大）"""
+        n = len(self.samples)
+        if n < 2:
+            return math.inf
+        mean = self.mean()
+        variance = sum((v - mean) ** 2 for _, v in self.samples) / (n - 1)
+        return t_critical(n - 1) * math.sqrt(variance / n)
+
+    def drift(self) -> float:
+        """最小平方法斜率乘上視窗時間長度（視窗內的趨勢變化量）"""
+        n = len(self.samples)
+        if n < 2:
+            return math.inf
+        t_mean = sum(t for t, _ in self.samples) / n
+        v_mean = self.mean()
+        sxx = sum((t - t_mean) ** 2 for t, _ in self.samples)
+        if sxx == 0:
+            return 0.0
+        slope = sum((t - t_mean) * (v - v_mean) for t, v in self.samples) / sxx
+        return abs(slope) * (self.samples[-1][0] - self.samples[0][0])
+
+    def converged(self) -> bool:
+        return (len(self.samples) >= self.min_samples
+                and self.confidence() <= self.tolerance
+                and self.drift() <= self.tolerance)
+
+
+class StabilizationDetector:
+    """WORKING 狀態更新的提前穩定判定"""
+
+    def __init__(self, window: int = 8, min_samples: int = 4,
+                 heart_rate_tolerance: float = 3.0, spo2_tolerance: float = 1.0):
+        """
+        初始化判定器
+
+        Args:
+            window: 每個數值保留的最近樣本數
+            min_samples: 至少需要幾筆有效樣本才判定
+            heart_rate_tolerance: 心率的容許誤差（BPM，信賴區間半寬與趨勢的上限）
+            spo2_tolerance: 血氧的容許誤差（%）
+        """
+        self.heart_rate = RollingChannel(window, min_samples, heart_rate_tolerance)
+        self.spo2 = RollingChannel(window, min_samples, spo2_tolerance)
+        self.callbacks: List[Callable] = []
+
+        # 目前流程
+        self.fingerprint_id = 0
+        self.started_at: Optional[float] = None
+        self.early_final: Optional[EarlyFinalEvent] = None
+        self.early_at: Optional[float] = None
+
+        # 統計
+        self.sessions = 0
+        self.early_finals = 0
+        self.firmware_finals = 0
+        self.contradicted = 0
+        self.session_count = 0
+        self.session_total = 0.0
+        self.compared = 0
+        self.saved_total = 0.0
+        self.saved_max = 0.0
+        self.recent_saved = deque(maxlen=HISTORY)
+        self.heart_rate_error_total = 0.0
+        self.heart_rate_error_max = 0.0
+        self.spo2_error_total = 0.0
+        self.spo2_error_max = 0.0
+
+    def attach(self, communicator):
+        """
+        訂閱通訊模組的工作模式事件
+
+        Args:
+            communicator: BMduinoCommunicator（或任何提供 register_callback 的物件）
+        """
+        for kind in ('detect_user', 'working_start', 'working_status', 'working_final', 'working_error'):
+            communicator.register_callback(kind, self.feed)
+
+    def register_callback(self, callback: Callable):
+        """
+        註冊流程結果回調（每次流程一個：EarlyFinalEvent 或 WorkingFinalEvent）
+
+        Args:
+            callback: 回調函數，參數為事件物件
+        """
+        self.callbacks.append(callback)
+
+    def feed(self, event, timestamp: Optional[float] = None) -> Optional[EarlyFinalEvent]:
+        """
+        處理一個事件
+
+        Args:
+            event: code.protocol 的事件物件
+            timestamp: 事件時間（秒）；None 時使用裝置時間戳記，沒有時間戳記則使用 time.monotonic()
+
+        Returns:
+            本次判定收斂時返回提前完成事件，否則返回None
+        """
+        if timestamp is None:
+            timestamp = event.device_ms / 1000.0 if event.device_ms is not None else time.monotonic()
+
+        kind = event.kind
+        if kind == 'working_status':
+            return self._on_status(event, timestamp)
+        if kind == 'detect_user':
+            self.fingerprint_id = event.fingerprint_id
+        elif kind == 'working_start':
+            self._start(timestamp)
+        elif kind == 'working_final':
+            self._on_final(event, timestamp)
+        elif kind == 'working_error':
+            self._on_error(event, timestamp)
+        return None
+
+    def _start(self, timestamp: float):
+        """開始新的流程"""
+        self.sessions += 1
+        self.started_at = timestamp
+        self.early_final = None
+        self.early_at = None
+        self.heart_rate.clear()
+        self.spo2.clear()
+
+    def _on_status(self, event, timestamp: float) -> Optional[EarlyFinalEvent]:
+        """加入一筆狀態更新並檢查是否收斂"""
+        if self.started_at is None or self.early_final is not None:
+            return None
+        # 測量中（MEASURING）表示感測器失去數值，之前的樣本不再代表目前狀態
+        for channel, value in ((self.heart_rate, event.heart_rate), (self.spo2, event.spo2)):
+            if not isinstance(value, int):
+                channel.clear()
+            else:
+                channel.add(timestamp, value)
+        if not (self.heart_rate.converged() and self.spo2.converged()):
+            return None
+
+        early = EarlyFinalEvent(
+            fingerprint_id=self.fingerprint_id,
+            object_temp=event.object_temp,
+            ambient_temp=event.ambient_temp,
+            heart_rate=round(self.heart_rate.mean()),
+            spo2=round(self.spo2.mean()),
+            elapsed=timestamp - self.started_at,
+            heart_rate_ci=self.heart_rate.confidence(),
+            spo2_ci=self.spo2.confidence(),
+            seq=event.seq,
+            device_ms=event.device_ms,
+        )
+        self.early_final = early
+        self.early_at = timestamp
+        self.early_finals += 1
+        logger.info(f"數值提前收斂（{early.elapsed:.1f} 秒）: 心率 {early.heart_rate}±{early.heart_rate_ci:.1f}，"
+                    f"血氧 {early.spo2}±{early.spo2_ci:.1f}")
+        self._notify(early)
+        return early
+
+    def _on_final(self, event, timestamp: float):
+        """韌體完成：沒有提前收斂時轉送結果，有提前收斂時統計節省時間與誤差"""
+        self.firmware_finals += 1
+        if self.started_at is not None:
+            self.session_count += 1
+            self.session_total += timestamp - self.started_at
+        early = self.early_final
+        if early is None:
+            self._notify(event)
+        else:
+            saved = timestamp - self.early_at
+            heart_rate_error = abs(early.heart_rate - event.heart_rate)
+            spo2_error = abs(early.spo2 - event.spo2)
+            self.compared += 1
+            self.saved_total += saved
+            self.saved_max = max(self.saved_max, saved)
+            self.recent_saved.append(saved)
+            self.heart_rate_error_total += heart_rate_error
+            self.heart_rate_error_max = max(self.heart_rate_error_max, heart_rate_error)
+            self.spo2_error_total += spo2_error
+            self.spo2_error_max = max(self.spo2_error_max, spo2_error)
+        self._end()
+
+    def _on_error(self, event, timestamp: float):
+        """韌體以錯誤結束（提前完成後才失敗的流程另外計數）"""
+        if self.early_final is not None:
+            self.contradicted += 1
+            logger.warning(f"提前完成後韌體回報錯誤: {event.error}")
+        self._end()
+
+    def _end(self):
+        self.started_at = None
+        self.early_final = None
+        self.early_at = None
+
+    def _notify(self, event):
+        for callback in self.callbacks:
+            try:
+                callback(event)
+            except Exception as e:
+                logger.error(f"回調函數執行錯誤: {e}")
+
+    def get_stats(self) -> Dict:
+        """
+        獲取統計
+
+        Returns:
+            流程數、韌體流程平均長度（秒）、提前完成數、節省時間（秒，中位數取最近 HISTORY 次流程）
+            與提前結果相對於韌體結果的誤差
+        """
+        stats = {
+            'sessions': self.sessions,
+            'early_finals': self.early_finals,
+            'firmware_finals': self.firmware_finals,
+            'contradicted': self.contradicted,
+            'session_seconds': self.session_total / self.session_count if self.session_count else None,
+            'saved_seconds': None,
+            'errors': None,
+        }
+        if self.compared:
+            recent = sorted(self.recent_saved)
+            stats['saved_seconds'] = {
+                'total': self.saved_total,
+                'mean': self.saved_total / self.compared,
+                'p50': recent[len(recent) // 2],
+                'max': self.saved_max,
+                'fraction': self.saved_total / self.session_total if self.session_total else 0.0,
+            }
+            stats['errors'] = {
+                'heart_rate_mean': self.heart_rate_error_total / self.compared,
+                'heart_rate_max': self.heart_rate_error_max,
+                'spo2_mean': self.spo2_error_total / self.compared,
+                'spo2_max': self.spo2_error_max,
+            }
+        return stats
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+序號與裝置時間戳記追蹤模組
+依韌體附加的序號計算遺失率，並以 millis() 時間戳記估計裝置與主機的時鐘偏移與傳輸延遲
+
+時鐘偏移取最近一段時間內（接收時間 - 裝置時間）的最小值：傳輸只會增加延遲，
+最快到達的訊息最接近真實偏移；以滑動視窗取最小值可跟上裝置石英振盪器的漂移。
+傳輸延遲因此是相對於最快訊息的延遲（USB CDC 的最小延遲約1ms以內）
+"""
+
+import time
+from collections import deque
+from datetime import datetime
+from typing import Optional, Dict
+import logging
+
+from code.protocol import SEQ_MODULO, DEVICE_MS_MODULO
+
+logger = logging.getLogger(__name__)
+
+# 序號差超過一半範圍視為重複或亂序（而非遺失大量訊息）
+_SEQ_HALF = SEQ_MODULO // 2
+
+# 裝置時間倒退超過此值（毫秒）且不是 millis() 回繞時，視為裝置重新開機
+_REBOOT_THRESHOLD_MS = 1000
+
+
+class StampTracker:
+    """序號缺口、時鐘偏移與傳輸延遲追蹤"""
+
+    def __init__(self, offset_window: int = 256, latency_window: int = 1024):
+        """
+        初始化追蹤器
+
+        Args:
+            offset_window: 估計時鐘偏移使用的最近訊息數
+            latency_window: 計算延遲百分位數保留的最近訊息數
+        """
+        self.offset_window = offset_window
+        self.latencies = deque(maxlen=latency_window)
+        self.received = 0
+        self.lost = 0
+        self.duplicates = 0
+        self.device_resets = 0
+        self.max_latency = 0.0
+        self._latency_sum = 0.0
+        self._last_seq: Optional[int] = None
+        self._last_device_ms: Optional[int] = None
+        self._ms_epoch = 0
+        self._index = 0
+        # 單調遞增佇列 (訊息索引, 偏移)，隊首為視窗內最小偏移
+        self._offsets = deque()
+
+    def resync(self):
+        """重新連線後呼叫：下一個序號作為新的起點，中斷期間的缺口不計入遺失"""
+        self._last_seq = None
+
+    def observe(self, seq: int, device_ms: int, received_at: float) -> float:
+        """
+        記錄一則附有時間戳記的訊息
+
+        Args:
+            seq: 序號（16位元回繞）
+            device_ms: 裝置 millis()（32位元回繞）
+            received_at: 接收時間（time.monotonic()）
+
+        Returns:
+            傳輸延遲（秒）
+        """
+        self._check_sequence(seq)
+        device_time = self._unwrap(device_ms) / 1000.0
+
+        offset = received_at - device_time
+        self._index += 1
+        offsets = self._offsets
+        while offsets and offsets[-1][1] >= offset:
+            offsets.pop()
+        offsets.append((self._index, offset))
+        if offsets[0][0] <= self._index - self.offset_window:
+            offsets.popleft()
+
+        latency = offset - offsets[0][1]
+        self.latencies.append(latency)
+        self._latency_sum += latency
+        if latency > self.max_latency:
+            self.max_latency = latency
+        return latency
+
+    def _check_sequence(self, seq: int):
+        """比對序號，計算遺失與重複"""
+        self.received += 1
+        last = self._last_seq
+        self._last_seq = seq
+        if last is None:
+            return
+        gap = (seq - last - 1) % SEQ_MODULO
+        if gap == 0:
+            return
+        if gap >= _SEQ_HALF:
+            self.duplicates += 1
+            self._last_seq = last
+            return
+        self.lost += gap
+        logger.debug(f"序號缺口: {last} → {seq}，遺失 {gap} 則")
+
+    def _unwrap(self, device_ms: int) -> int:
+        """將 32 位元 millis() 展開為單調遞增的毫秒數，並偵測裝置重新開機"""
+        last = self._last_device_ms
+        self._last_device_ms = device_ms
+        if last is not None and device_ms < last:
+            if last - device_ms > DEVICE_MS_MODULO // 2:
+                self._ms_epoch += DEVICE_MS_MODULO
+            elif last - device_ms > _REBOOT_THRESHOLD_MS:
+                # 裝置時鐘從頭開始，舊的偏移估計已無效
+                logger.info("裝置時間戳記倒退，視為裝置重新開機")
+                self.device_resets += 1
+                self._ms_epoch = 0
+                self._offsets.clear()
+        return self._ms_epoch + device_ms
+
+    @property
+    def clock_offset(self) -> Optional[float]:
+        """裝置時間 0 對應的主機 time.monotonic()（秒），尚無數據時為None"""
+        return self._offsets[0][1] if self._offsets else None
+
+    def capture_time(self, device_ms: int) -> Optional[float]:
+        """
+        將裝置時間換算為主機 time.monotonic()
+
+        Args:
+            device_ms: 裝置 millis()（最近一則訊息附近的值）
+
+        Returns:
+            主機單調時間（秒），尚無偏移估計時返回None
+        """
+        offset = self.clock_offset
+        if offset is None:
+            return None
+        if device_ms - self._last_device_ms > DEVICE_MS_MODULO // 2:
+            # 回繞之前的時間戳記
+            device_ms -= DEVICE_MS_MODULO
+        return offset + (self._ms_epoch + device_ms) / 1000.0
+
+    def capture_datetime(self, device_ms: int) -> Optional[datetime]:
+        """
+        將裝置時間換算為主機本地時間
+
+        Args:
+            device_ms: 裝置 millis()
+
+        Returns:
+            datetime，尚無偏移估計時返回None
+        """
+        monotonic_time = self.capture_time(device_ms)
+        if monotonic_time is None:
+            return None
+        return datetime.fromtimestamp(time.time() - (time.monotonic() - monotonic_time))
+
+    def get_stats(self) -> Dict:
+        """
+        獲取統計
+
+        Returns:
+            收到/遺失/重複數、遺失率、時鐘偏移與傳輸延遲（毫秒）
+        """
+        total = self.received + self.lost
+        latencies = sorted(self.latencies)
+        stats = {
+            'received': self.received,
+            'lost': self.lost,
+            'loss_rate': self.lost / total if total else 0.0,
+            'duplicates': self.duplicates,
+            'device_resets': self.device_resets,
+            'clock_offset': self.clock_offset,
+            'latency_ms': None,
+        }
+        if latencies:
+            stats['latency_ms'] = {
+                'mean': self._latency_sum / self.received * 1000 if self.received else 0.0,
+                'p50': latencies[len(latencies) // 2] * 1000,
+                'p95': latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000,
+                'max': self.max_latency * 1000,
+            }
+        return stats
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+啟動時間分析模組
+記錄啟動過程中每個階段（可在不同線程中並行）的開始時間與耗時，啟動完成後輸出分階段報告
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import NamedTuple, Optional, Callable, List, Dict
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Phase(NamedTuple):
+    """一個啟動階段（時間為相對於程式開始的秒數）"""
+    name: str
+    thread: str
+    start: float
+    end: float
+    ok: bool
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+
+class StartupProfile:
+    """啟動階段計時（可由多個線程同時記錄）"""
+
+    def __init__(self, origin: Optional[float] = None):
+        """
+        初始化計時
+
+        Args:
+            origin: 程式開始的 time.perf_counter() 值，None表示現在
+        """
+        self.origin = time.perf_counter() if origin is None else origin
+        self.phases: List[Phase] = []
+        self._lock = threading.Lock()
+
+    def elapsed(self) -> float:
+        """程式開始至今的秒數"""
+        return time.perf_counter() - self.origin
+
+    def _record(self, name: str, start: float, end: float, ok: bool):
+        phase = Phase(name, threading.current_thread().name, start - self.origin, end - self.origin, ok)
+        with self._lock:
+            self.phases.append(phase)
+
+    @contextmanager
+    def phase(self, name: str):
+        """記錄 with 區塊的耗時（區塊拋出例外時標記為失敗，例外照常拋出）"""
+        start = time.perf_counter()
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            self._record(name, start, time.perf_counter(), ok)
+
+    def call(self, name: str, func: Callable, *args, **kwargs):
+        """執行 func 並記錄為一個階段（供 ThreadPoolExecutor.submit 使用）"""
+        with self.phase(name):
+            return func(*args, **kwargs)
+
+    def mark(self, name: str):
+        """記錄一個時間點（例如介面已顯示）"""
+        now = time.perf_counter()
+        self._record(name, now, now, True)
+
+    def report(self) -> str:
+        """分階段報告（依開始時間排序）"""
+        with self._lock:
+            phases = sorted(self.phases, key=lambda p: (p.start, p.end))
+        lines = [f"{'階段':<20}{'線程':<14}{'開始ms':>10}{'耗時ms':>10}"]
+        for phase in phases:
+            status = '' if phase.ok else '  失敗'
+            lines.append(f"{phase.name:<20}{phase.thread[:13]:<14}{phase.start * 1000:>10.0f}"
+                         f"{phase.duration * 1000:>10.0f}{status}")
+        total = max((p.end for p in phases), default=0.0)
+        busy = sum(p.duration for p in phases)
+        lines.append(f"總計 {total * 1000:.0f} ms（各階段耗時合計 {busy * 1000:.0f} ms）")
+        return '\n'.join(lines)
+
+    def log(self, title: str = "啟動時間分析"):
+        """將報告寫入日誌"""
+        logger.info(f"{title}:\n{self.report()}")
+
+    def get_stats(self) -> Dict:
+        """獲取統計（各階段的開始時間與耗時，毫秒）"""
+        with self._lock:
+            phases = list(self.phases)
+        return {
+            'total_ms': round(max((p.end for p in phases), default=0.0) * 1000, 1),
+            'phases': [
+                {'name': p.name, 'thread': p.thread, 'start_ms': round(p.start * 1000, 1),
+                 'duration_ms': round(p.duration * 1000, 1), 'ok': p.ok}
+                for p in sorted(phases, key=lambda p: p.start)
+            ],
+        }
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+連線協商測試程式
+在虛擬BMduino的工作模式中（流程進行中）連線並協商二進位協議與時間戳記，
+確認協商在時限內完成、流程結束後主機與韌體使用相同的協議，且之後的待機數據都能解碼
+
+用法: python3 code/test_emulator_negotiation.py
+"""
+
+import sys
+import tempfile
+import time
+import logging
+from pathlib import Path
+
+# 添加專案根目錄到Python路徑
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from code.bmduino_emulator import BMduinoEmulator, MODE_STANDBY, MODE_WORKING
+from code.serial_communicator import BMduinoCommunicator
+
+
+def wait_until(condition, timeout: float) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return condition()
+
+
+def run_test(protocol: str, stamps: bool) -> bool:
+    """流程進行中連線，返回是否通過"""
+    link = str(Path(tempfile.mkdtemp()) / 'ttyBMduino')
+    emulator = BMduinoEmulator(speed=5.0, standby_interval=0.5, link=link, seed=1)
+    emulator.start()
+    communicator = BMduinoCommunicator(port=link, protocol=protocol, stamps=stamps, watch_device=False)
+    standby = []
+    communicator.register_callback('standby', standby.append)
+    try:
+        emulator.trigger_fingerprint(1)
+        if not wait_until(lambda: emulator.mode == MODE_WORKING, 2.0):
+            print("  失敗：虛擬BMduino未進入工作模式")
+            return False
+
+        started = time.monotonic()
+        if not communicator.connect():
+            print("  失敗：無法連接")
+            return False
+        negotiate_s = time.monotonic() - started
+        communicator.start_listening()
+
+        # 流程結束回到待機模式後再收到幾筆待機數據
+        wait_until(lambda: emulator.mode == MODE_STANDBY, 5.0)
+        standby.clear()
+        wait_until(lambda: len(standby) >= 3, 3.0)
+
+        unknown = communicator.decoder.get_stats()['unknown']
+        checks = [
+            ("協商未超時", negotiate_s < communicator.negotiate_timeout),
+            ("主機與韌體的協議相同", (communicator.active_protocol == 'binary') == emulator.binary),
+            ("協商為二進位協議", communicator.active_protocol == protocol),
+            ("時間戳記已啟用", communicator.stamps_active == stamps),
+            ("流程結束後收到待機數據", len(standby) >= 3),
+            ("沒有無法解碼的行", unknown == 0),
+        ]
+        print(f"  協商 {negotiate_s * 1000:.0f} ms，協議 {communicator.active_protocol}，"
+              f"待機數據 {len(standby)} 筆，無法解碼 {unknown} 行")
+        passed = True
+        for name, ok in checks:
+            if not ok:
+                print(f"  失敗：{name}")
+                passed = False
+        return passed
+    finally:
+        communicator.disconnect()
+        emulator.stop()
+
+
+def main():
+    """主函數"""
+    logging.basicConfig(level=logging.ERROR)
+    results = []
+    for protocol, stamps in (('binary', False), ('binary', True), ('text', True)):
+        print(f"流程進行中連線（{protocol} 協議，時間戳記 {'開啟' if stamps else '關閉'}）")
+        results.append(run_test(protocol, stamps))
+    print("全部通過" if all(results) else "測試失敗")
+    sys.exit(0 if all(results) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+溫度與負載調節模組
+藥盒為密閉空間，長時間執行 MediaPipe 時樹莓派會因過熱降頻，檢測幀率會不可預期地崩落。
+調節器定期讀取 /sys 下的溫度區（thermal_zone*/temp）與 CPU 頻率（cpufreq），以及系統負載，
+依溫度門檻選擇品質等級，同時調整電腦視覺的幀率與推論解析度、介面計時器間隔與遙測回報頻率，
+以較低的品質換取持續穩定的處理量，而不是撞上降頻的懸崖
+
+等級規則：
+- 溫度達到某等級的門檻即升到該等級（立即生效）
+- 負載（1 分鐘平均負載 / CPU 核心數）超過 load_high 時至少為第 1 級
+- 高負載且 CPU 頻率低於最高頻率（已被降頻）時再升一級
+- 降級（恢復品質）需溫度低於目前等級門檻 hysteresis 度以上，且在目前等級停留 hold 秒，每次只降一級
+
+sysfs_root / proc_root 可改為假的目錄樹以便測試
+"""
+
+import glob
+import os
+import threading
+import time
+from collections import deque
+from typing import NamedTuple, Optional, Callable, List, Dict
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class QualityLevel(NamedTuple):
+    """品質等級（溫度達到 temperature 時使用）"""
+    name: str
+    temperature: float      # 進入此等級的溫度門檻（°C）
+    cv_fps: float           # 電腦視覺檢測幀率
+    cv_scale: float         # 推論解析度比例（相對於攝影機解析度）
+    ui_slowdown: float      # 介面計時器間隔倍數
+    telemetry_scale: float  # 遙測回報頻率比例（相對於配置的回報頻率）
+
+
+# 預設等級（樹莓派 4 在 80°C 開始降頻、85°C 大幅降頻）
+DEFAULT_LEVELS = (
+    QualityLevel('full', 0.0, 10.0, 1.0, 1.0, 1.0),
+    QualityLevel('warm', 65.0, 6.0, 0.75, 1.5, 0.5),
+    QualityLevel('hot', 72.0, 4.0, 0.5, 2.0, 0.5),
+    QualityLevel('critical', 78.0, 2.0, 0.5, 4.0, 0.25),
+)
+
+
+class ThermalReading(NamedTuple):
+    """一次溫度、頻率與負載讀數（讀不到的項目為None）"""
+    temperature: Optional[float]    # 所有溫度區的最高溫度（°C）
+    frequency_mhz: Optional[float]  # 所有核心的平均目前頻率
+    max_frequency_mhz: Optional[float]
+    load: Optional[float]           # 1 分鐘平均負載 / CPU 核心數
+
+    @property
+    def frequency_capped(self) -> bool:
+        """目前頻率是否低於最高頻率（閒置時 cpufreq 也會降頻，須搭配負載判斷）"""
+        if self.frequency_mhz is None or not self.max_frequency_mhz:
+            return False
+        return self.frequency_mhz < self.max_frequency_mhz * 0.95
+
+
+def _read_number(path: str) -> Optional[float]:
+    try:
+        with open(path, encoding='utf-8') as f:
+            return float(f.read().split()[0])
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def read_thermal(sysfs_root: str = '/sys', proc_root: str = '/proc') -> ThermalReading:
+    """
+    讀取溫度區、CPU 頻率與負載
+
+    Args:
+        sysfs_root: sysfs 掛載點
+        proc_root: procfs 掛載點
+
+    Returns:
+        ThermalReading
+    """
+    temperatures = []
+    for path in sorted(glob.glob(os.path.join(sysfs_root, 'class/thermal/thermal_zone*/temp'))):
+        value = _read_number(path)
+        if value is not None:
+            temperatures.append(value / 1000.0)  # 毫度
+
+    frequencies = []
+    max_frequencies = []
+    for cpufreq in sorted(glob.glob(os.path.join(sysfs_root, 'devices/system/cpu/cpu[0-9]*/cpufreq'))):
+        current = _read_number(os.path.join(cpufreq, 'scaling_cur_freq'))
+        maximum = _read_number(os.path.join(cpufreq, 'cpuinfo_max_freq'))
+        if current is not None:
+            frequencies.append(current / 1000.0)  # kHz
+        if maximum is not None:
+            max_frequencies.append(maximum / 1000.0)
+
+    load = None
+    loadavg = _read_number(os.path.join(proc_root, 'loadavg'))
+    if loadavg is not None:
+        cpus = len(frequencies) or os.cpu_count() or 1
+        load = loadavg / cpus
+
+    return ThermalReading(
+        temperature=max(temperatures) if temperatures else None,
+        frequency_mhz=sum(frequencies) / len(frequencies) if frequencies else None,
+        max_frequency_mhz=max(max_frequencies) if max_frequencies else None,
+        load=load
+    )
+
+
+class ThermalGovernor:
+    """依溫度與負載調整各子系統的品質等級"""
+
+    def __init__(self, levels: Optional[List[QualityLevel]] = None, interval: float = 5.0,
+                 hysteresis: float = 3.0, hold: float = 30.0, load_high: float = 0.9,
+                 sysfs_root: str = '/sys', proc_root: str = '/proc'):
+        """
+        初始化調節器
+
+        Args:
+            levels: 品質等級（依溫度門檻由低到高），None表示使用 DEFAULT_LEVELS
+            interval: 取樣間隔（秒）
+            hysteresis: 降級所需低於門檻的溫度差（°C）
+            hold: 降級前須在目前等級停留的秒數
+            load_high: 視為高負載的每核心平均負載
+            sysfs_root: sysfs 掛載點（測試時可指向假的目錄樹）
+            proc_root: procfs 掛載點
+        """
+        self.levels = sorted(levels or DEFAULT_LEVELS, key=lambda level: level.temperature)
+        self.interval = interval
+        self.hysteresis = hysteresis
+        self.hold = hold
+        self.load_high = load_high
+        self.sysfs_root = sysfs_root
+        self.proc_root = proc_root
+
+        self.index = 0
+        self.reading: Optional[ThermalReading] = None
+        self._listeners: List[Callable[[QualityLevel], None]] = []
+        self._metrics: Dict[str, Callable[[], Dict]] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        # 統計
+        now = time.monotonic()
+        self.level_since = now
+        self._accounted_at = now
+        self.time_in_level = [0.0] * len(self.levels)
+        self.samples = 0
+        self.transitions = 0
+        self.decisions: deque = deque(maxlen=20)
+
+    @property
+    def level(self) -> QualityLevel:
+        """目前的品質等級"""
+        return self.levels[self.index]
+
+    def add_listener(self, callback: Callable[[QualityLevel], None]):
+        """
+        登記等級變更回調（立即以目前等級呼叫一次；之後在調節器線程中呼叫）
+
+        Args:
+            callback: 接收 QualityLevel 的函數
+        """
+        with self._lock:
+            self._listeners.append(callback)
+            level = self.level
+        self._notify(callback, level)
+
+    def add_metrics(self, name: str, provider: Callable[[], Dict]):
+        """登記受調節子系統的統計（例如電腦視覺的實際幀率），併入 get_stats() 的 subsystems"""
+        with self._lock:
+            self._metrics[name] = provider
+
+    def _notify(self, callback: Callable, level: QualityLevel):
+        try:
+            callback(level)
+        except Exception as e:
+            logger.error(f"套用品質等級 {level.name} 失敗: {e}")
+
+    def _target(self, reading: ThermalReading) -> tuple:
+        """依讀數決定目標等級與原因"""
+        target = 0
+        reasons = []
+        if reading.temperature is not None:
+            for index, level in enumerate(self.levels):
+                if reading.temperature >= level.temperature:
+                    target = index
+            reasons.append(f"溫度 {reading.temperature:.1f}°C")
+        if reading.load is not None and reading.load >= self.load_high:
+            if target < 1 < len(self.levels):
+                target = 1
+            reasons.append(f"負載 {reading.load:.2f}")
+            if reading.frequency_capped:
+                target = min(target + 1, len(self.levels) - 1)
+                reasons.append(f"已降頻 {reading.frequency_mhz:.0f}/{reading.max_frequency_mhz:.0f} MHz")
+        return target, '，'.join(reasons) or '無讀數'
+
+    def update(self, reading: Optional[ThermalReading] = None) -> bool:
+        """
+        取樣一次並調整等級
+
+        Args:
+            reading: 讀數，None表示從 sysfs 讀取
+
+        Returns:
+            等級是否改變
+        """
+        if reading is None:
+            reading = read_thermal(self.sysfs_root, self.proc_root)
+        now = time.monotonic()
+        with self._lock:
+            self.reading = reading
+            self.samples += 1
+            self.time_in_level[self.index] += now - self._accounted_at
+            self._accounted_at = now
+
+            target, reason = self._target(reading)
+            new_index = self.index
+            if target > self.index:
+                new_index = target
+            elif target < self.index and now - self.level_since >= self.hold:
+                threshold = self.level.temperature - self.hysteresis
+                if reading.temperature is None or reading.temperature <= threshold:
+                    new_index = self.index - 1
+            if new_index == self.index:
+                return False
+
+            previous = self.level
+            self.index = new_index
+            self.level_since = now
+            self.transitions += 1
+            level = self.level
+            listeners = list(self._listeners)
+            self.decisions.append({
+                'time': time.time(),
+                'from': previous.name,
+                'to': level.name,
+                'reason': reason,
+            })
+
+        logger.info(f"品質等級 {previous.name} -> {level.name}（{reason}）：電腦視覺 {level.cv_fps:g} fps、"
+                    f"解析度 {level.cv_scale:g}x，介面間隔 {level.ui_slowdown:g}x，遙測 {level.telemetry_scale:g}x")
+        for callback in listeners:
+            self._notify(callback, level)
+        return True
+
+    def start(self):
+        """啟動取樣線程（先取樣一次，啟動時已過熱則立即降級）"""
+        if self._thread is not None:
+            return
+        self.update()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='thermal-governor', daemon=True)
+        self._thread.start()
+        logger.info(f"溫度調節器已啟動: {self.reading}")
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.update()
+            except Exception as e:
+                logger.error(f"溫度調節取樣錯誤: {e}")
+
+    def stop(self):
+        """停止取樣線程"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+            self._thread = None
+
+    def get_stats(self) -> Dict:
+        """獲取統計（目前等級與讀數、各等級停留秒數、最近的等級變更）"""
+        now = time.monotonic()
+        with self._lock:
+            metrics = dict(self._metrics)
+        subsystems = {}
+        for name, provider in metrics.items():
+            try:
+                subsystems[name] = provider()
+            except Exception as e:
+                subsystems[name] = {'error': str(e)}
+        with self._lock:
+            time_in_level = list(self.time_in_level)
+            time_in_level[self.index] += now - self._accounted_at
+            reading = self.reading
+            return {
+                'level': self.level._asdict(),
+                'level_index': self.index,
+                'level_seconds': round(now - self.level_since, 1),
+                'temperature': reading.temperature if reading else None,
+                'frequency_mhz': reading.frequency_mhz if reading else None,
+                'max_frequency_mhz': reading.max_frequency_mhz if reading else None,
+                'load': round(reading.load, 2) if reading and reading.load is not None else None,
+                'samples': self.samples,
+                'transitions': self.transitions,
+                'time_in_level': {level.name: round(seconds, 1)
+                                  for level, seconds in zip(self.levels, time_in_level)},
+                'decisions': list(self.decisions),
+                'subsystems': subsystems,
+            }
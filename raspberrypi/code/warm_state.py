@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+熱重啟快照模組
+服務重啟（systemd Restart=always）後不必從空白狀態開始：定期與關閉時把執行期狀態
+（進行中的流程、最新遙測數值、API 狀態與熱門查詢快取）寫入一個壓縮檔，開機時讀回
+
+檔案內容為 zlib 壓縮的 pickle：{'version', 'saved_at', 'sections': {名稱: (儲存時間, 數值)}}，
+以暫存檔加 os.replace 原子寫入，寫到一半斷電時保留上一份快照
+
+每個區段由擁有該狀態的子系統以 register(name, save, restore) 登記：
+已讀入的快照中有該區段時立即呼叫 restore（子系統可以在背景初始化完成後才登記），
+之後每次儲存時呼叫 save 取得目前數值
+"""
+
+import os
+import pickle
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Any, Callable, Optional, Dict
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 檔案格式版本（格式不相容時改變，舊檔案直接忽略）
+FORMAT_VERSION = 1
+
+
+class WarmStateStore:
+    """執行期狀態快照（定期與關閉時儲存，啟動時還原）"""
+
+    def __init__(self, path: str = "data/warm_state.bin", interval: float = 10.0, max_age: float = 300.0):
+        """
+        初始化快照
+
+        Args:
+            path: 快照檔案路徑
+            interval: 定期儲存間隔（秒），0表示只在關閉時儲存
+            max_age: 快照超過此秒數時不還原（區段可另外指定）
+        """
+        self.path = Path(path)
+        self.interval = interval
+        self.max_age = max_age
+
+        self._sections: Dict[str, tuple] = {}     # 名稱 -> (save, restore)
+        self._loaded: Dict[str, tuple] = {}       # 名稱 -> (儲存時間, 數值)
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        # 統計
+        self.restored = []
+        self.skipped = []
+        self.saves = 0
+        self.save_errors = 0
+        self.last_save_ms = 0.0
+        self.last_size = 0
+        self.load_ms = 0.0
+
+    def load(self) -> bool:
+        """
+        讀入快照檔（尚未還原，區段登記時才還原）
+
+        Returns:
+            是否讀到可用的快照
+        """
+        start = time.perf_counter()
+        try:
+            with open(self.path, 'rb') as f:
+                document = pickle.loads(zlib.decompress(f.read()))
+        except FileNotFoundError:
+            logger.info("沒有熱重啟快照，冷啟動")
+            return False
+        except Exception as e:
+            logger.warning(f"熱重啟快照無法讀取，冷啟動: {e}")
+            return False
+        if not isinstance(document, dict) or document.get('version') != FORMAT_VERSION:
+            logger.warning("熱重啟快照格式不相容，冷啟動")
+            return False
+        with self._lock:
+            self._loaded = dict(document.get('sections', {}))
+        self.load_ms = (time.perf_counter() - start) * 1000
+        age = time.time() - document.get('saved_at', 0)
+        logger.info(f"讀入熱重啟快照: {len(self._loaded)} 個區段，{age:.1f} 秒前儲存，耗時 {self.load_ms:.1f} ms")
+        return True
+
+    def register(self, name: str, save: Callable[[], Any], restore: Callable[[Any], Any],
+                 max_age: Optional[float] = None) -> bool:
+        """
+        登記一個區段，快照中有該區段時立即還原
+
+        Args:
+            name: 區段名稱
+            save: 返回目前數值的函數（數值須可 pickle；返回None表示不儲存）
+            restore: 以快照數值還原狀態的函數
+            max_age: 此區段的最長保存秒數，None表示使用 store 的 max_age
+
+        Returns:
+            是否還原了此區段
+        """
+        with self._lock:
+            self._sections[name] = (save, restore)
+            loaded = self._loaded.pop(name, None)
+        if loaded is None:
+            return False
+        saved_at, value = loaded
+        age = time.time() - saved_at
+        limit = self.max_age if max_age is None else max_age
+        if limit and age > limit:
+            logger.info(f"熱重啟快照區段 {name} 已過期（{age:.0f} 秒），不還原")
+            self.skipped.append(name)
+            return False
+        try:
+            restore(value)
+        except Exception as e:
+            logger.error(f"還原熱重啟快照區段 {name} 失敗: {e}")
+            self.skipped.append(name)
+            return False
+        self.restored.append(name)
+        logger.info(f"已還原熱重啟快照區段: {name}（{age:.1f} 秒前）")
+        return True
+
+    def save(self) -> bool:
+        """
+        收集所有區段並寫入快照檔（原子替換）
+
+        Returns:
+            是否寫入成功
+        """
+        with self._save_lock:
+            start = time.perf_counter()
+            now = time.time()
+            with self._lock:
+                sections = list(self._sections.items())
+            collected = {}
+            for name, (save, _) in sections:
+                try:
+                    value = save()
+                except Exception as e:
+                    logger.error(f"收集熱重啟快照區段 {name} 失敗: {e}")
+                    continue
+                if value is not None:
+                    collected[name] = (now, value)
+            try:
+                payload = zlib.compress(pickle.dumps({
+                    'version': FORMAT_VERSION,
+                    'saved_at': now,
+                    'sections': collected,
+                }, protocol=pickle.HIGHEST_PROTOCOL))
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                temp_path = self.path.with_name(self.path.name + '.tmp')
+                with open(temp_path, 'wb') as f:
+                    f.write(payload)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(temp_path, self.path)
+            except Exception as e:
+                self.save_errors += 1
+                logger.error(f"儲存熱重啟快照失敗: {e}")
+                return False
+            self.saves += 1
+            self.last_size = len(payload)
+            self.last_save_ms = (time.perf_counter() - start) * 1000
+            logger.debug(f"熱重啟快照已儲存: {len(collected)} 個區段，{self.last_size} bytes")
+            return True
+
+    def start(self):
+        """啟動定期儲存線程"""
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='warm-state', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.save()
+
+    def stop(self, save: bool = True):
+        """
+        停止定期儲存
+
+        Args:
+            save: 是否在停止後儲存最後一次快照（正常關閉時）
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        if save:
+            self.save()
+
+    def get_stats(self) -> Dict:
+        """獲取統計"""
+        return {
+            'path': str(self.path),
+            'restored': list(self.restored),
+            'skipped': list(self.skipped),
+            'load_ms': round(self.load_ms, 2),
+            'saves': self.saves,
+            'save_errors': self.save_errors,
+            'last_save_ms': round(self.last_save_ms, 2),
+            'last_size': self.last_size,
+        }
@@ -9,9 +9,13 @@ from flask import Flask, jsonify, request
 from flask_cors import CORS
 import threading
 from typing import Optional, Dict, Any
-from datetime import datetime
+from datetime import datetime, timedelta
 import logging
 
+from code.latest_value import LatestValue
+from code.session_journal import latency_report
+from code.cpu_placement import get_placement, place_current_thread
+
 logger = logging.getLogger(__name__)
 
 
@@ -35,11 +39,8 @@ class APIServer:
         self.data_provider: Optional[Any] = None
         self.database: Optional[Any] = None
         
-        # 當前狀態
-        self.current_status: Dict[str, Any] = {
-            'mode': 'standby',
-            'data': None
-        }
+        # 當前狀態（模式切換時發布；待機數據直接讀取通訊模組的最新值暫存器）
+        self.status = LatestValue(('standby', None))
         
         # 設置路由
         self._setup_routes()
@@ -194,12 +195,37 @@ class APIServer:
         
         @self.app.route('/api/current_data', methods=['GET'])
         def get_current_data():
-            """獲取當前感測器數據（待機模式）"""
+            """
+            獲取當前感測器數據（待機模式）
+            
+            帶 since=版本 時等待比該版本新的數據（timeout 秒，上限 30），
+            讀取端只會拿到最新的一筆，不會收到中間累積的舊數據
+            """
             try:
-                if self.current_status['mode'] == 'standby' and self.current_status['data']:
+                register = self._standby_register()
+                since = request.args.get('since', type=int)
+                if register is not None and since is not None:
+                    timeout = min(request.args.get('timeout', 10.0, type=float), 30.0)
+                    snapshot = register.wait_newer(since, timeout)
+                    if snapshot is None:
+                        return jsonify({
+                            'success': True,
+                            'data': None,
+                            'version': register.version,
+                            'message': '等待逾時，沒有新數據'
+                        })
                     return jsonify({
                         'success': True,
-                        'data': self.current_status['data']
+                        'data': snapshot.value._asdict(),
+                        'version': snapshot.version
+                    })
+                
+                status = self.current_status
+                if status['mode'] == 'standby' and status['data']:
+                    return jsonify({
+                        'success': True,
+                        'data': status['data'],
+                        'version': status.get('version')
                     })
                 else:
                     return jsonify({
@@ -214,6 +240,296 @@ class APIServer:
                     'error': str(e)
                 }), 500
         
+        @self.app.route('/api/sessions', methods=['GET'])
+        def get_sessions():
+            """獲取流程記錄（每次流程的結果、總時間與狀態轉換，新的在前）"""
+            try:
+                if not self.database:
+                    return jsonify({
+                        'success': False,
+                        'error': '數據庫未初始化'
+                    }), 500
+                user_id = request.args.get('user_id', type=int)
+                limit = request.args.get('limit', default=50, type=int)
+                sessions = self.database.get_sessions(user_id=user_id, outcome=request.args.get('outcome'),
+                                                      limit=limit, device_id=request.args.get('device_id'))
+                journal = getattr(self.data_provider, 'journal', None)
+                return jsonify({
+                    'success': True,
+                    'data': sessions,
+                    'count': len(sessions),
+                    'journal': journal.get_stats() if journal is not None else None
+                })
+            except Exception as e:
+                logger.error(f"獲取流程記錄錯誤: {e}")
+                return jsonify({
+                    'success': False,
+                    'error': str(e)
+                }), 500
+        
+        @self.app.route('/api/sessions/latency', methods=['GET'])
+        def get_session_latency():
+            """獲取各階段停留時間的百分位數（整體、每位使用者、每天；days 為統計天數）"""
+            try:
+                if not self.database:
+                    return jsonify({
+                        'success': False,
+                        'error': '數據庫未初始化'
+                    }), 500
+                days = max(request.args.get('days', default=7, type=int), 1)
+                since = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=days - 1)
+                sessions = self.database.get_sessions(user_id=request.args.get('user_id', type=int), since=since,
+                                                      outcome=request.args.get('outcome'),
+                                                      device_id=request.args.get('device_id'))
+                return jsonify({
+                    'success': True,
+                    'data': {'days': days, 'since': since.isoformat(), **latency_report(sessions)}
+                })
+            except Exception as e:
+                logger.error(f"獲取流程階段時間錯誤: {e}")
+                return jsonify({
+                    'success': False,
+                    'error': str(e)
+                }), 500
+        
+        @self.app.route('/api/engine', methods=['GET'])
+        def get_engine():
+            """獲取多裝置流程引擎的狀態（每台裝置進行中的流程、轉換與事件次數）"""
+            try:
+                engine = getattr(self.data_provider, 'engine', None)
+                if engine is None:
+                    return jsonify({
+                        'success': False,
+                        'error': '多裝置流程引擎未啟用'
+                    }), 503
+                return jsonify({
+                    'success': True,
+                    'data': engine.get_stats()
+                })
+            except Exception as e:
+                logger.error(f"獲取流程引擎狀態錯誤: {e}")
+                return jsonify({
+                    'success': False,
+                    'error': str(e)
+                }), 500
+        
+        @self.app.route('/api/relay_stats', methods=['GET'])
+        def get_relay_stats():
+            """獲取繼電器命令統計（出藥往返時間）"""
+            try:
+                communicator = getattr(self.data_provider, 'communicator', None)
+                if communicator is None:
+                    return jsonify({
+                        'success': False,
+                        'error': '串口通訊未初始化'
+                    }), 503
+                return jsonify({
+                    'success': True,
+                    'data': communicator.get_relay_stats()
+                })
+            except Exception as e:
+                logger.error(f"獲取繼電器統計錯誤: {e}")
+                return jsonify({
+                    'success': False,
+                    'error': str(e)
+                }), 500
+        
+        @self.app.route('/api/reading', methods=['GET'])
+        def get_reading():
+            """要求BMduino立即回報一次目前數據（待機或工作模式狀態）"""
+            try:
+                communicator = getattr(self.data_provider, 'communicator', None)
+                if communicator is None:
+                    return jsonify({
+                        'success': False,
+                        'error': '串口通訊未初始化'
+                    }), 503
+                event = communicator.read(timeout=1.0)
+                if event is None:
+                    return jsonify({
+                        'success': False,
+                        'error': 'BMduino未回應'
+                    }), 504
+                return jsonify({
+                    'success': True,
+                    'data': {'mode': event.kind, **event._asdict()}
+                })
+            except Exception as e:
+                logger.error(f"讀取即時數據錯誤: {e}")
+                return jsonify({
+                    'success': False,
+                    'error': str(e)
+                }), 500
+        
+        @self.app.route('/api/link_stats', methods=['GET'])
+        def get_link_stats():
+            """獲取串口連線統計（斷線重連、訊息遺失率與傳輸延遲）"""
+            try:
+                communicator = getattr(self.data_provider, 'communicator', None)
+                if communicator is None:
+                    return jsonify({
+                        'success': False,
+                        'error': '串口通訊未初始化'
+                    }), 503
+                return jsonify({
+                    'success': True,
+                    'data': {
+                        'link': communicator.get_link_stats(),
+                        'stamps': communicator.get_stamp_stats()
+                    }
+                })
+            except Exception as e:
+                logger.error(f"獲取連線統計錯誤: {e}")
+                return jsonify({
+                    'success': False,
+                    'error': str(e)
+                }), 500
+        
+        @self.app.route('/api/ppg', methods=['GET'])
+        def get_ppg():
+            """獲取PPG波形計算結果（心率、血氧與訊號品質指標）"""
+            try:
+                pipeline = getattr(self.data_provider, 'ppg_pipeline', None)
+                if pipeline is None:
+                    return jsonify({
+                        'success': False,
+                        'error': 'PPG串流未啟用'
+                    }), 503
+                return jsonify({
+                    'success': True,
+                    'data': pipeline.get_stats()
+                })
+            except Exception as e:
+                logger.error(f"獲取PPG數據錯誤: {e}")
+                return jsonify({
+                    'success': False,
+                    'error': str(e)
+                }), 500
+        
+        @self.app.route('/api/stabilization', methods=['GET'])
+        def get_stabilization():
+            """獲取提前穩定判定統計（提前完成次數、節省時間與結果差距）"""
+            try:
+                stabilizer = getattr(self.data_provider, 'stabilizer', None)
+                if stabilizer is None:
+                    return jsonify({
+                        'success': False,
+                        'error': '提前穩定判定未啟用'
+                    }), 503
+                return jsonify({
+                    'success': True,
+                    'data': stabilizer.get_stats()
+                })
+            except Exception as e:
+                logger.error(f"獲取提前穩定判定統計錯誤: {e}")
+                return jsonify({
+                    'success': False,
+                    'error': str(e)
+                }), 500
+        
+        @self.app.route('/api/event_bus', methods=['GET'])
+        def get_event_bus():
+            """獲取事件匯流排統計（每個主題的佇列深度、丟棄次數與延遲）"""
+            try:
+                bus = getattr(self.data_provider, 'bus', None)
+                if bus is None:
+                    return jsonify({
+                        'success': False,
+                        'error': '事件匯流排未設定'
+                    }), 503
+                return jsonify({
+                    'success': True,
+                    'data': bus.get_stats()
+                })
+            except Exception as e:
+                logger.error(f"獲取事件匯流排統計錯誤: {e}")
+                return jsonify({
+                    'success': False,
+                    'error': str(e)
+                }), 500
+        
+        @self.app.route('/api/startup', methods=['GET'])
+        def get_startup():
+            """獲取啟動時間分析（各階段的開始時間、耗時與執行線程，以及熱重啟快照的還原結果）"""
+            try:
+                startup = getattr(self.data_provider, 'startup', None)
+                if startup is None:
+                    return jsonify({
+                        'success': False,
+                        'error': '啟動時間分析未設定'
+                    }), 503
+                data = startup.get_stats()
+                warm_state = getattr(self.data_provider, 'warm_state', None)
+                if warm_state is not None:
+                    data['warm_state'] = warm_state.get_stats()
+                return jsonify({
+                    'success': True,
+                    'data': data
+                })
+            except Exception as e:
+                logger.error(f"獲取啟動時間分析錯誤: {e}")
+                return jsonify({
+                    'success': False,
+                    'error': str(e)
+                }), 500
+        
+        @self.app.route('/api/prefetch', methods=['GET'])
+        def get_prefetch():
+            """獲取流程預取統計（預取與使用次數、取藥階段隱藏的延遲與各預取工作的耗時）"""
+            try:
+                prefetcher = getattr(self.data_provider, 'prefetch', None)
+                if prefetcher is None:
+                    return jsonify({
+                        'success': False,
+                        'error': '流程預取未啟用'
+                    }), 503
+                return jsonify({
+                    'success': True,
+                    'data': prefetcher.get_stats()
+                })
+            except Exception as e:
+                logger.error(f"獲取流程預取統計錯誤: {e}")
+                return jsonify({
+                    'success': False,
+                    'error': str(e)
+                }), 500
+        
+        @self.app.route('/api/thermal', methods=['GET'])
+        def get_thermal():
+            """獲取溫度調節狀態（溫度、頻率、負載、目前品質等級、各等級停留時間與最近的等級變更）"""
+            try:
+                thermal = getattr(self.data_provider, 'thermal', None)
+                if thermal is None:
+                    return jsonify({
+                        'success': False,
+                        'error': '溫度調節未啟用'
+                    }), 503
+                return jsonify({
+                    'success': True,
+                    'data': thermal.get_stats()
+                })
+            except Exception as e:
+                logger.error(f"獲取溫度調節狀態錯誤: {e}")
+                return jsonify({
+                    'success': False,
+                    'error': str(e)
+                }), 500
+        
+        @self.app.route('/api/threads', methods=['GET'])
+        def get_threads():
+            """獲取 CPU 配置計畫與每個線程的 CPU 使用量（cpu_percent 為上次查詢以來的使用率）"""
+            try:
+                return jsonify({
+                    'success': True,
+                    'data': get_placement().get_stats()
+                })
+            except Exception as e:
+                logger.error(f"獲取線程CPU使用量錯誤: {e}")
+                return jsonify({
+                    'success': False,
+                    'error': str(e)
+                }), 500
+        
         @self.app.route('/api/health', methods=['GET'])
         def health_check():
             """健康檢查"""
@@ -248,7 +564,49 @@ class APIServer:
             mode: 模式名稱
             data: 狀態數據
         """
-        self.current_status = {
+        self.status.publish((mode, data))
+    
+    def snapshot_status(self) -> Optional[Dict]:
+        """
+        模式狀態（熱重啟快照用）
+        
+        Returns:
+            {'mode', 'data'}，目前為待機模式時返回None（待機數據由通訊模組的最新值區段還原）
+        """
+        if self.current_status['mode'] == 'standby':
+            return None
+        mode, data = self.status.value
+        return {'mode': mode, 'data': data}
+    
+    def restore_status(self, snapshot: Dict):
+        """以熱重啟快照還原模式狀態（在通訊模組的最新值還原之後呼叫，才會優先於還原的待機數據）"""
+        self.update_status(snapshot['mode'], snapshot.get('data'))
+    
+    def _standby_register(self) -> Optional[LatestValue]:
+        """通訊模組的待機數據暫存器（尚未設置數據提供者時為None）"""
+        communicator = getattr(self.data_provider, 'communicator', None)
+        latest = getattr(communicator, 'latest', None)
+        return latest.get('standby') if latest else None
+    
+    @property
+    def current_status(self) -> Dict[str, Any]:
+        """
+        當前狀態：模式切換之後收到的待機數據代表已回到待機模式
+        
+        Returns:
+            {'mode', 'data'}，待機數據另附 'version'
+        """
+        status = self.status.get()
+        register = self._standby_register()
+        standby = register.get() if register is not None else None
+        if standby is not None and standby.version and standby.published_at >= status.published_at:
+            return {
+                'mode': 'standby',
+                'data': standby.value._asdict(),
+                'version': standby.version
+            }
+        mode, data = status.value
+        return {
             'mode': mode,
             'data': data
         }
@@ -269,6 +627,7 @@ class APIServer:
     
     def _run_server(self):
         """運行服務器"""
+        place_current_thread('api')
         try:
             self.app.run(
                 host=self.host,
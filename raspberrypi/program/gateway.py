@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多藥盒閘道器模式
+一台樹莓派以串口集線器（code.serial_hub）連接 gateway 配置中的多個 BMduino，
+每台裝置的流程（指紋辨識 -> 心律血氧 -> 出藥 -> 完成 -> 待機）由多裝置流程引擎（program.session_engine）
+在單線程事件迴圈上同時進行；流程記錄以裝置ID區分，API 提供 /api/engine 與 /api/sessions?device_id=
+
+事件迴圈線程驅動所有裝置的流程，不執行會阻塞的工作：流程記錄由事件匯流排的工作線程寫入數據庫，
+繼電器命令由專用的寫入線程送到串口（寫入失敗時以 RELAY_ERROR 事件交回引擎）
+
+用法:
+    python3 program/gateway.py
+    python3 program/gateway.py --config data/config.json
+"""
+
+import sys
+import signal
+import argparse
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+# 添加專案根目錄到Python路徑
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from code.event_bus import THREAD
+from code.event_loop import EventLoop
+from code.protocol import RelayErrorEvent
+from code.serial_hub import SerialHub
+from code.user_mapper import UserMapper
+from code.session_journal import SessionJournal
+from program.session_engine import SessionEngine
+from program.runtime import setup_logging, load_config, create_bus, open_database, create_api_server
+
+logger = logging.getLogger(__name__)
+
+
+def main():
+    """主函數"""
+    parser = argparse.ArgumentParser(description="智慧藥盒多藥盒閘道器模式")
+    parser.add_argument('--config', default='data/config.json', help="配置檔案路徑")
+    args = parser.parse_args()
+
+    setup_logging(role='gateway')
+    logger.info("=" * 50)
+    logger.info("智慧藥盒系統啟動（多藥盒閘道器模式）")
+    logger.info("=" * 50)
+
+    config = load_config(args.config)
+    gateway_config = config.get('gateway', {})
+    devices = gateway_config.get('devices', {})
+    if not devices:
+        logger.error("gateway 配置中沒有裝置")
+        return
+
+    database = open_database(config)
+    user_mapper = UserMapper("data/user_config.json")
+    bus = create_bus(config)
+
+    loop = EventLoop()
+    hub = SerialHub(reconnect_interval=gateway_config.get('reconnect_interval', 5.0))
+    for device_id, port in devices.items():
+        hub.add_device(device_id, port, gateway_config.get('baudrate', 115200))
+
+    # 繼電器命令的寫入線程（串口寫入可能阻塞到 write_timeout）
+    relay_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='relay')
+
+    def write_relay(device_id: str, relay_num: int):
+        if not hub.control_relay(device_id, relay_num):
+            loop.call_soon(engine.handle, device_id, RelayErrorEvent('WRITE_FAILED'))
+
+    def dispense(device_id: str, relay_num: int) -> bool:
+        relay_writer.submit(write_relay, device_id, relay_num)
+        return True
+
+    engine = SessionEngine(
+        loop, dispense, user_mapper,
+        stage_delay=gateway_config.get('stage_delay', 2.0),
+        complete_delay=gateway_config.get('complete_delay', 3.0),
+        relay_timeout=gateway_config.get('relay_timeout', 5.0),
+        bus=bus
+    )
+    engine.attach_hub(hub)
+
+    # 流程記錄在事件匯流排的工作線程寫入數據庫
+    journal = None
+    if config.get('session_journal', {}).get('enabled', True):
+        journal = SessionJournal(database)
+        bus.subscribe('state_change', journal.record, THREAD, subscriber='SessionJournal')
+
+    api_server = create_api_server(config)
+    api_server.set_database(database)
+    api_server.set_data_provider(type('DataProvider', (), {
+        'user_mapper': user_mapper,
+        'hub': hub,
+        'bus': bus,
+        'engine': engine,
+        'journal': journal
+    })())
+
+    api_server.start()
+    logger.info("API服務器已啟動")
+    hub.start()
+
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *_: loop.stop())
+
+    try:
+        loop.run()
+    finally:
+        logger.info("正在清理資源...")
+        relay_writer.shutdown(wait=True)
+        hub.stop()
+        stats = engine.get_stats()
+        stats.pop('sessions')
+        logger.info(f"流程引擎統計: {stats}")
+        api_server.stop()
+        bus.close()  # 先寫入佇列中的流程記錄再關閉數據庫
+        database.close()
+        logger.info("系統已關閉")
+
+
+if __name__ == "__main__":
+    main()
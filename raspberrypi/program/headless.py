@@ -0,0 +1,446 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+無介面服務模式
+沒有螢幕的藥盒與只負責擷取數據、提供API的閘道器使用：串口通訊、數據庫、API服務器與狀態機流程
+由單線程事件迴圈（code.event_loop）驅動，取代 Qt 事件迴圈。本程式與其導入的模組都不導入 PyQt6，
+電腦視覺檢測（cv2 / MediaPipe）只在啟用時才導入
+
+流程與 UI 相同（指紋辨識 -> 心律血氧 -> 出藥 -> 服藥確認 -> 待機），只是沒有畫面；
+沒有電腦視覺檢測時，繼電器出藥完成即視為流程完成
+
+用法:
+    python3 program/headless.py                 # 無螢幕藥盒（流程控制，依 headless 配置啟用電腦視覺）
+    python3 program/headless.py --no-cv         # 不導入電腦視覺
+    python3 program/headless.py --no-flow       # 閘道器（只有串口、數據庫與API）
+"""
+
+import sys
+import time
+import signal
+import argparse
+import logging
+from functools import partial
+from pathlib import Path
+from typing import Optional, Dict, Callable
+
+_started = time.perf_counter()
+
+# 添加專案根目錄到Python路徑
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from code import cpu_placement
+from code.event_loop import EventLoop, TimerHandle
+from code.protocol import DetectUserEvent, WorkingStatusEvent, WorkingErrorEvent, WORKING_TIMEOUT
+from code.startup_profile import StartupProfile
+from code.user_mapper import UserMapper
+from program.state_machine import StateMachine, SystemState, MEASURED_STATES
+from program.runtime import (
+    setup_logging, load_config, create_bus, open_database, create_communicator, connect_serial,
+    start_serial, setup_ppg, setup_stabilizer, setup_results, create_api_server, create_medication_detector,
+    connect_api_status, create_warm_state, register_warm_state, create_thermal_governor, connect_thermal,
+    create_prefetcher, create_session_journal,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class HeadlessController:
+    """無畫面的流程控制（MainUI 的狀態轉換部分，回調一律交給事件迴圈線程執行）"""
+
+    def __init__(self, state_machine: StateMachine, communicator, user_mapper: UserMapper, loop: EventLoop,
+                 medication_detector=None, stabilizer=None, stage_delay: float = 2.0,
+                 complete_delay: float = 3.0, prefetcher=None):
+        """
+        初始化流程控制
+
+        Args:
+            state_machine: 狀態機物件
+            communicator: 串口通訊物件
+            user_mapper: 使用者映射物件
+            loop: 事件迴圈（所有狀態轉換在此線程執行）
+            medication_detector: 服藥動作檢測物件，None表示出藥完成即完成流程
+            stabilizer: 提前穩定判定器（None表示等待韌體的 WORKING,FINAL）
+            stage_delay: 身份確認與測量完成後進入下一階段前的等待秒數
+            complete_delay: 流程完成後返回待機前的等待秒數
+            prefetcher: 流程預取（指紋辨識成功後預先開啟攝影機等），None表示取藥階段才準備
+        """
+        self.state_machine = state_machine
+        self.communicator = communicator
+        self.user_mapper = user_mapper
+        self.loop = loop
+        self.medication_detector = medication_detector
+        self.prefetcher = prefetcher
+        self.stage_delay = stage_delay
+        self.complete_delay = complete_delay
+
+        # 指紋辨識結果（臨時保存）
+        self.detected_fingerprint_id: Optional[int] = None
+        self.detected_user_name: Optional[str] = None
+
+        # 狀態轉換延遲
+        self.pending: Optional[TimerHandle] = None
+
+        # 韌體是否在工作模式（提前穩定判定完成後仍在測量）；此時出藥命令會被韌體保留到測量結束，
+        # 先暫存到收到 WORKING,FINAL 或錯誤時再送出，避免繼電器命令在等待期間超時
+        self.firmware_working = False
+        self.deferred_relay: Optional[Callable] = None
+        self.deferred_timer: Optional[TimerHandle] = None
+
+        # 統計
+        self.sessions = 0
+        self.completed = 0
+        self.errors = 0
+
+        self.state_machine.register_state_change_callback(self._on_state_changed)
+
+        self.communicator.register_callback('detect_user', partial(loop.call_soon, self._do_detect_user))
+        self.communicator.register_callback('working_start', lambda e: loop.call_soon(self._do_working_start))
+        self.communicator.register_callback('working_status', partial(loop.call_soon, self._do_working_status))
+        # 工作模式完成（啟用提前穩定判定時，數值收斂後即完成）
+        if stabilizer:
+            stabilizer.register_callback(partial(loop.call_soon, self._do_working_final))
+            self.communicator.register_callback('working_final', lambda e: loop.call_soon(self._do_firmware_done))
+        else:
+            self.communicator.register_callback('working_final', partial(loop.call_soon, self._do_working_final))
+        self.communicator.register_callback('working_error', partial(loop.call_soon, self._do_working_error))
+
+    def _schedule(self, delay: float, state: SystemState, data: Optional[Dict] = None, cause: str = 'delay'):
+        """延遲後轉換狀態（取代尚未執行的延遲轉換）"""
+        self._cancel_pending()
+        self.pending = self.loop.call_later(delay, self.state_machine.set_state, state, data, cause)
+
+    def _cancel_pending(self):
+        if self.pending is not None:
+            self.pending.cancel()
+            self.pending = None
+
+    def _do_detect_user(self, event: DetectUserEvent):
+        """指紋辨識結果"""
+        fingerprint_id = event.fingerprint_id
+        if not fingerprint_id:
+            logger.warning(f"未找到指紋ID: {event}")
+            return
+        user_name = self.user_mapper.get_user_name(fingerprint_id)
+        logger.info(f"辨識到使用者: {user_name} (ID: {fingerprint_id})")
+        self.detected_fingerprint_id = fingerprint_id
+        self.detected_user_name = user_name
+        self.sessions += 1
+        self.state_machine.set_state(
+            SystemState.FINGERPRINT_OK,
+            {'fingerprint_id': fingerprint_id, 'user_name': user_name},
+            cause='detect_user'
+        )
+
+    def _do_working_start(self):
+        """工作模式開始（在 DETECT,USER 之後；尚未收到辨識結果時進入 FINGERPRINT 等待）"""
+        self.firmware_working = True
+        current_state = self.state_machine.get_state()
+        if current_state not in (SystemState.STANDBY, SystemState.FINGERPRINT):
+            return
+        if self.detected_fingerprint_id:
+            self.state_machine.set_state(
+                SystemState.FINGERPRINT_OK,
+                {'fingerprint_id': self.detected_fingerprint_id, 'user_name': self.detected_user_name},
+                cause='working_start'
+            )
+        elif current_state == SystemState.STANDBY:
+            self.state_machine.set_state(SystemState.FINGERPRINT, cause='working_start')
+
+    def _do_working_status(self, event: WorkingStatusEvent):
+        """工作模式狀態更新（收到第一筆時立即進入心律血氧測量）"""
+        if self.state_machine.get_state() in (SystemState.FINGERPRINT, SystemState.FINGERPRINT_OK):
+            self._cancel_pending()
+            self.state_machine.set_state(SystemState.VITAL_SIGNS, cause='working_status')
+
+    def _do_working_final(self, event):
+        """工作模式完成（韌體結果或提前結果）"""
+        if event.kind == 'working_final':
+            self._do_firmware_done()
+        user_name = self.user_mapper.get_user_name(event.fingerprint_id)
+        logger.info(f"測量完成: {user_name} 心率 {event.heart_rate} BPM，血氧 {event.spo2}%")
+        self.state_machine.set_state(SystemState.VITAL_SIGNS_OK, {'user_name': user_name, **event._asdict()},
+                                     cause='working_final')
+
+    def _do_working_error(self, event: WorkingErrorEvent):
+        """工作模式錯誤：立即回到待機模式（測量已提前完成時不中斷流程）"""
+        self._do_firmware_done()
+        if self.state_machine.get_state() in MEASURED_STATES:
+            logger.warning(f"測量已提前完成，忽略韌體的測量錯誤: {event.error}")
+            return
+        logger.warning(f"測量錯誤: {event.error}，返回待機模式")
+        self.errors += 1
+        self._cancel_pending()
+        self.state_machine.set_state(SystemState.STANDBY, cause=f'working_error:{event.error}')
+
+    def _do_firmware_done(self):
+        """韌體結束工作模式（WORKING,FINAL 或錯誤）：送出暫存的出藥命令"""
+        self.firmware_working = False
+        self._release_relay()
+
+    def _release_relay(self):
+        """送出暫存的出藥命令（韌體結束工作模式，或超過工作模式時限仍未收到結束訊息）"""
+        if self.deferred_timer is not None:
+            self.deferred_timer.cancel()
+            self.deferred_timer = None
+        submit, self.deferred_relay = self.deferred_relay, None
+        if submit is not None:
+            submit()
+
+    def _on_state_changed(self, new_state, previous_state, data: Optional[Dict]):
+        """狀態變更（在呼叫 set_state 的事件迴圈線程中執行）"""
+        if new_state == SystemState.STANDBY:
+            self._cancel_pending()
+            self.detected_fingerprint_id = None
+            self.detected_user_name = None
+            if self.prefetcher is not None:
+                self.prefetcher.cancel()
+        elif new_state == SystemState.FINGERPRINT_OK:
+            if data and data.get('fingerprint_id'):
+                # 熱重啟接續的流程沒有經過 DETECT,USER
+                self.detected_fingerprint_id = data['fingerprint_id']
+                self.detected_user_name = data.get('user_name')
+                # 測量期間在背景準備取藥階段
+                if self.prefetcher is not None:
+                    self.prefetcher.prefetch(data['fingerprint_id'], self.medication_detector)
+            self._schedule(self.stage_delay, SystemState.VITAL_SIGNS)
+        elif new_state == SystemState.VITAL_SIGNS_OK:
+            fingerprint_id = (data or {}).get('fingerprint_id')
+            if fingerprint_id:
+                if self.prefetcher is not None:
+                    relay_num = self.prefetcher.get_user_relay(fingerprint_id)
+                else:
+                    relay_num = self.user_mapper.get_user_relay(fingerprint_id)
+                logger.info(f"準備進入取藥階段，使用者ID: {fingerprint_id}, 繼電器編號: {relay_num}")
+                self._schedule(self.stage_delay, SystemState.MEDICATION,
+                               {'relay_num': relay_num, 'fingerprint_id': fingerprint_id})
+            else:
+                logger.error("未找到指紋ID，無法進入取藥階段")
+                self._schedule(self.complete_delay, SystemState.STANDBY, cause='no_fingerprint')
+        elif new_state == SystemState.MEDICATION:
+            self._start_medication(data or {})
+        elif new_state == SystemState.MEDICATION_OK:
+            self.state_machine.set_state(SystemState.STANDBY, cause='medication_ok')
+        elif new_state == SystemState.COMPLETE:
+            self.completed += 1
+            logger.info(f"{self.detected_user_name or '使用者'}登錄完畢")
+            self._schedule(self.complete_delay, SystemState.STANDBY)
+
+    def _start_medication(self, data: Dict):
+        """出藥並等待服藥確認（沒有電腦視覺檢測時以出藥結果完成流程）"""
+        relay_num = data.get('relay_num')
+        if self.prefetcher is not None and data.get('fingerprint_id'):
+            self.prefetcher.consume(data['fingerprint_id'])
+        detecting = False
+        if self.medication_detector is not None:
+            detecting = self.medication_detector.start_detection(
+                lambda: self.loop.call_soon(self._finish_medication, "檢測到服藥動作", 'medication_detected'),
+                lambda: self.loop.call_soon(self._finish_medication, "服藥動作檢測超時", 'medication_timeout')
+            )
+
+        if not relay_num:
+            logger.warning("未提供繼電器編號，跳過繼電器控制")
+            if not detecting:
+                self._finish_medication("未進行服藥確認", 'no_confirmation')
+            return
+
+        def on_result(command):
+            # 在通訊線程中呼叫
+            if command.ok:
+                logger.info(f"繼電器 {command.relay_num} 出藥完成，往返時間: {command.rtt_ms:.0f} ms")
+            else:
+                logger.error(f"繼電器 {command.relay_num} 出藥失敗: {command.status} {command.error or ''}")
+            if not detecting:
+                self.loop.call_soon(self._finish_medication, "出藥完成", 'relay_done')
+
+        def submit():
+            if self.communicator.control_relay(relay_num, on_result=on_result):
+                logger.info(f"繼電器 {relay_num} 控制命令已加入佇列")
+                return
+            logger.error(f"繼電器 {relay_num} 控制命令加入佇列失敗")
+            if not detecting:
+                self._finish_medication("未進行服藥確認", 'no_confirmation')
+
+        if self.firmware_working:
+            logger.info(f"韌體仍在工作模式，繼電器 {relay_num} 的命令在測量結束後送出")
+            self.deferred_relay = submit
+            self.deferred_timer = self.loop.call_later(WORKING_TIMEOUT, self._release_relay)
+        else:
+            submit()
+
+    def _cancel_deferred_relay(self):
+        """停止時捨棄暫存的出藥命令"""
+        if self.deferred_timer is not None:
+            self.deferred_timer.cancel()
+            self.deferred_timer = None
+        self.deferred_relay = None
+
+    def _finish_medication(self, reason: str, cause: str):
+        """服藥確認結束，轉換到完成狀態"""
+        if self.state_machine.get_state() != SystemState.MEDICATION:
+            return
+        logger.info(f"{reason}，流程完成")
+        if self.medication_detector is not None:
+            self.medication_detector.stop_detection()
+        self.state_machine.set_state(
+            SystemState.COMPLETE,
+            {'fingerprint_id': self.detected_fingerprint_id, 'user_name': self.detected_user_name},
+            cause=cause
+        )
+
+    def stop(self):
+        """停止延遲轉換與電腦視覺檢測"""
+        self._cancel_pending()
+        self._cancel_deferred_relay()
+        if self.medication_detector is not None:
+            self.medication_detector.stop_detection()
+
+    def get_stats(self) -> Dict:
+        """獲取統計"""
+        return {
+            'state': self.state_machine.get_state().value,
+            'sessions': self.sessions,
+            'completed': self.completed,
+            'errors': self.errors,
+            'loop': self.loop.get_stats(),
+        }
+
+
+def current_rss_mb() -> float:
+    """目前行程的常駐記憶體（MB，僅 Linux）"""
+    try:
+        with open('/proc/self/status', encoding='utf-8') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+def main():
+    """主函數"""
+    parser = argparse.ArgumentParser(description="智慧藥盒無介面服務模式")
+    parser.add_argument('--config', default='data/config.json', help="配置檔案路徑")
+    parser.add_argument('--no-flow', action='store_true', help="不執行流程控制（閘道器：只擷取數據與提供API）")
+    parser.add_argument('--no-cv', action='store_true', help="不啟用電腦視覺檢測")
+    args = parser.parse_args()
+
+    profile = StartupProfile(_started)
+    profile.mark("導入模組")
+
+    setup_logging(role='headless')
+    logger.info("=" * 50)
+    logger.info("智慧藥盒系統啟動（無介面模式）")
+    logger.info("=" * 50)
+
+    config = load_config(args.config)
+    cpu_placement.configure(config)
+    headless_config = config.get('headless', {})
+    flow = headless_config.get('flow', True) and not args.no_flow
+    use_cv = flow and headless_config.get('medication_detection', True) and not args.no_cv
+
+    with profile.phase("數據庫"):
+        database = open_database(config)
+        user_mapper = UserMapper("data/user_config.json")
+    with profile.phase("熱重啟快照"):
+        warm_state = create_warm_state(config)
+        bus = create_bus(config)
+        communicator = create_communicator(config, bus)
+        register_warm_state(warm_state, config, communicator=communicator)
+    with profile.phase("串口連接"):
+        connect_serial(config, communicator)
+    with profile.phase("API 服務器"):
+        api_server = create_api_server(config)
+        api_server.set_database(database)
+
+    with profile.phase("PPG 與提前穩定判定"):
+        ppg_pipeline = setup_ppg(config, communicator)
+        stabilizer = setup_stabilizer(config, communicator)
+    thermal = create_thermal_governor(config)
+    connect_thermal(thermal, config, communicator=communicator)
+    # 流程預取（只有流程控制使用）
+    prefetcher = create_prefetcher(config, user_mapper, database) if flow else None
+    # 狀態機與流程記錄（只有流程控制使用）
+    state_machine = StateMachine(bus) if flow else None
+    journal = create_session_journal(config, state_machine, database) if flow else None
+    api_server.set_data_provider(type('DataProvider', (), {
+        'user_mapper': user_mapper,
+        'communicator': communicator,
+        'ppg_pipeline': ppg_pipeline,
+        'stabilizer': stabilizer,
+        'bus': bus,
+        'startup': profile,
+        'warm_state': warm_state,
+        'thermal': thermal,
+        'prefetch': prefetcher,
+        'journal': journal
+    })())
+    setup_results(bus, communicator, stabilizer, database)
+    connect_api_status(api_server, bus, communicator)
+    register_warm_state(warm_state, config, api_server=api_server, database=database)
+
+    # 事件迴圈與流程控制（取代 Qt 事件迴圈與 MainUI）
+    loop = EventLoop()
+    controller = None
+    if flow:
+        with profile.phase("電腦視覺"):
+            medication_detector = create_medication_detector(config) if use_cv else None
+        controller = HeadlessController(
+            state_machine=state_machine,
+            communicator=communicator,
+            user_mapper=user_mapper,
+            loop=loop,
+            medication_detector=medication_detector,
+            stabilizer=stabilizer,
+            stage_delay=headless_config.get('stage_delay', 2.0),
+            complete_delay=headless_config.get('complete_delay', 3.0),
+            prefetcher=prefetcher
+        )
+        logger.info(f"流程控制已啟用（電腦視覺檢測: {'啟用' if medication_detector else '停用'}）")
+        register_warm_state(warm_state, config, state_machine=state_machine)
+        connect_thermal(thermal, config, medication_detector=medication_detector)
+
+    with profile.phase("啟動服務"):
+        api_server.start()
+        logger.info("API服務器已啟動")
+        start_serial(config, communicator)
+        if warm_state is not None:
+            warm_state.start()
+        if thermal is not None:
+            thermal.start()
+
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *_: loop.stop())
+
+    qt_modules = [name for name in sys.modules if name.startswith('PyQt')]
+    if qt_modules:
+        logger.warning(f"無介面模式導入了 Qt 模組: {qt_modules}")
+    profile.mark("所有子系統就緒")
+    profile.log()
+    logger.info(f"啟動完成，耗時 {profile.elapsed():.2f} 秒，記憶體 {current_rss_mb():.1f} MB")
+
+    # 事件迴圈線程（其他線程已建立，不會繼承此設定）
+    cpu_placement.place_current_thread('ui')
+    try:
+        loop.run()
+    finally:
+        logger.info("正在清理資源...")
+        if thermal is not None:
+            thermal.stop()
+        if controller is not None:
+            controller.stop()
+            logger.info(f"流程統計: {controller.get_stats()}")
+        communicator.stop_listening()
+        communicator.disconnect()
+        api_server.stop()
+        bus.close()  # 先處理完佇列中的測量結果再關閉數據庫
+        if warm_state is not None:
+            warm_state.stop()
+        database.close()
+        logger.info("系統已關閉")
+
+
+if __name__ == "__main__":
+    main()
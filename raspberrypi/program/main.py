@@ -3,187 +3,228 @@
 """
 主程式入口
 初始化所有模組並啟動系統
+
+啟動順序：先建立輕量的事件匯流排、串口通訊物件與狀態機，數據庫、串口連接（含協議協商）、
+API服務器（Flask）與電腦視覺檢測（cv2 / MediaPipe）在背景線程中並行初始化；
+主線程同時導入 PyQt6 並立即顯示介面，各子系統就緒後再回報給介面（串口監聽在介面建立後才開始）。
+全部就緒後在日誌中輸出分階段的啟動時間分析（亦可由 GET /api/startup 查詢）
 """
 
 import sys
-import json
+import time
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
 from pathlib import Path
-from PyQt6.QtWidgets import QApplication
+
+_started = time.perf_counter()
 
 # 添加專案根目錄到Python路徑
 project_root = Path(__file__).parent.parent
 sys.path.insert(0, str(project_root))
 
-from code.serial_communicator import BMduinoCommunicator
-from code.database import Database
+from code import cpu_placement
+from code.startup_profile import StartupProfile
 from code.user_mapper import UserMapper
-from code.cv_medication_detector import MedicationDetector
 from program.state_machine import StateMachine
-from program.api_server import APIServer
-from program.main_ui import MainUI
-
-
-def setup_logging():
-    """設置日誌"""
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.FileHandler('data/system.log', encoding='utf-8'),
-            logging.StreamHandler(sys.stdout)
-        ]
-    )
-
-
-def load_config(config_path: str = "data/config.json") -> dict:
-    """
-    載入配置檔案
-    
-    Args:
-        config_path: 配置檔案路徑
-    
-    Returns:
-        配置字典
-    """
+from program.runtime import (
+    setup_logging, load_config, create_bus, open_database, create_communicator, connect_serial,
+    start_serial, setup_ppg, setup_stabilizer, setup_results, create_api_server, create_medication_detector,
+    connect_api_status, create_warm_state, register_warm_state, create_thermal_governor, connect_thermal,
+    create_prefetcher, create_session_journal,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def future_result(future: Future, name: str):
+    """取得背景初始化的結果，失敗時記錄錯誤並返回None"""
     try:
-        with open(config_path, 'r', encoding='utf-8') as f:
-            config = json.load(f)
-        logging.info(f"載入配置檔案: {config_path}")
-        return config
-    except FileNotFoundError:
-        logging.error(f"配置檔案不存在: {config_path}")
-        sys.exit(1)
-    except json.JSONDecodeError as e:
-        logging.error(f"配置檔案格式錯誤: {e}")
-        sys.exit(1)
+        return future.result()
+    except Exception as e:
+        logger.error(f"{name}初始化失敗: {e}")
+        return None
 
 
 def main():
     """主函數"""
+    profile = StartupProfile(_started)
+    profile.mark("導入模組")
+
     # 設置日誌
     setup_logging()
-    logger = logging.getLogger(__name__)
     logger.info("=" * 50)
     logger.info("智慧藥盒系統啟動")
     logger.info("=" * 50)
-    
+
     # 載入配置
     config = load_config()
-    
-    # 初始化數據庫
-    db_path = Path("data/database.db")
-    db_path.parent.mkdir(parents=True, exist_ok=True)
-    database = Database(str(db_path))
-    logger.info("數據庫初始化完成")
-    
-    # 初始化使用者映射
-    user_mapper = UserMapper("data/user_config.json")
-    logger.info("使用者映射初始化完成")
-    
-    # 初始化串口通訊
-    serial_config = config.get('serial', {})
-    communicator = BMduinoCommunicator(
-        port=serial_config.get('port', '/dev/ttyACM0'),
-        baudrate=serial_config.get('baudrate', 115200)
-    )
-    
-    # 連接串口
-    if not communicator.connect():
-        logger.error("無法連接BMduino，請檢查連接")
-        # 不退出，繼續運行（可能稍後會自動重連）
-    
-    # 初始化電腦視覺檢測
-    camera_config = config.get('camera', {})
-    medication_config = config.get('medication_detection', {})
-    medication_detector = MedicationDetector(
-        camera_id=camera_config.get('device_id', 0),
-        width=camera_config.get('width', 640),
-        height=camera_config.get('height', 480),
-        sensitivity=medication_config.get('sensitivity', 0.7),
-        timeout=medication_config.get('timeout', 30)
-    )
-    logger.info("電腦視覺檢測初始化完成")
-    
-    # 初始化狀態機
-    state_machine = StateMachine()
-    logger.info("狀態機初始化完成")
-    
-    # 初始化API服務器
-    api_config = config.get('api', {})
-    api_server = APIServer(
-        host=api_config.get('host', '0.0.0.0'),
-        port=api_config.get('port', 5000)
-    )
-    api_server.set_database(database)
-    api_server.set_data_provider(type('DataProvider', (), {
-        'user_mapper': user_mapper
-    })())
-    
-    # 註冊數據回調到API服務器
-    def update_api_status(mode: str, data: dict = None):
-        api_server.update_status(mode, data)
-    
-    communicator.register_callback('standby', lambda d: update_api_status('standby', d))
-    communicator.register_callback('working_start', lambda: update_api_status('working'))
-    communicator.register_callback('working_final', lambda d: update_api_status('working_final', d))
-    
-    # 註冊數據儲存回調
-    def save_measurement(data: dict):
-        fingerprint_id = data.get('fingerprint_id')
-        if fingerprint_id:
-            database.insert_measurement(
-                user_id=fingerprint_id,
-                object_temp=data.get('object_temp'),
-                ambient_temp=data.get('ambient_temp'),
-                heart_rate=data.get('heart_rate'),
-                spo2=data.get('spo2')
+    cpu_placement.configure(config)
+
+    with profile.phase("事件匯流排與狀態機"):
+        # 初始化使用者映射
+        user_mapper = UserMapper("data/user_config.json")
+
+        # 事件匯流排（串口事件、狀態變更與測量結果；較慢的訂閱端使用工作線程，不拖慢串口讀取）
+        bus = create_bus(config)
+
+        # 串口通訊物件（連接在背景進行；介面建立時即可註冊回調）
+        communicator = create_communicator(config, bus)
+
+        # 熱重啟快照：最新遙測數值立即還原，其他區段在各子系統就緒時還原
+        warm_state = create_warm_state(config)
+        register_warm_state(warm_state, config, communicator=communicator)
+        stabilizer = setup_stabilizer(config, communicator)
+        state_machine = StateMachine(bus)
+        # 流程記錄（數據庫就緒前的流程先暫存）
+        journal = create_session_journal(config, state_machine)
+
+        # 溫度調節器：遙測回報頻率立即跟隨，電腦視覺與介面就緒時再接上
+        thermal = create_thermal_governor(config)
+        connect_thermal(thermal, config, communicator=communicator)
+
+        # 流程預取（數據庫就緒後再設定，之前的流程不預先載入測量記錄）
+        prefetcher = create_prefetcher(config, user_mapper)
+
+    # 獨立的子系統在背景並行初始化（串口協商、Flask 與 MediaPipe 各需數百毫秒到數秒）
+    executor = ThreadPoolExecutor(max_workers=6, thread_name_prefix='startup')
+    database_future = executor.submit(profile.call, "數據庫", open_database, config)
+    serial_future = executor.submit(profile.call, "串口連接", connect_serial, config, communicator)
+    ppg_future = executor.submit(profile.call, "PPG 波形計算", setup_ppg, config, communicator)
+    api_future = executor.submit(profile.call, "API 服務器", create_api_server, config)
+    detector_future = executor.submit(profile.call, "電腦視覺", create_medication_detector, config)
+
+    # 介面已建立（流程事件的回調已註冊）
+    ui_ready = threading.Event()
+
+    def start_services():
+        """數據庫、API服務器與串口就緒後接上測量結果，介面建立後開始監聽（回調須在串口監聽前註冊）"""
+        database = database_future.result()
+        api_server = future_result(api_future, "API服務器")
+        ppg_pipeline = future_result(ppg_future, "PPG波形計算")
+        serial_future.result()
+
+        # 測量結果寫入數據庫，模式切換與測量結果更新到API服務器
+        setup_results(bus, communicator, stabilizer, database)
+        if prefetcher is not None:
+            prefetcher.set_database(database)
+        if journal is not None:
+            journal.set_database(database)
+        if api_server is not None:
+            api_server.set_database(database)
+            api_server.set_data_provider(type('DataProvider', (), {
+                'user_mapper': user_mapper,
+                'communicator': communicator,
+                'ppg_pipeline': ppg_pipeline,
+                'stabilizer': stabilizer,
+                'bus': bus,
+                'startup': profile,
+                'warm_state': warm_state,
+                'thermal': thermal,
+                'prefetch': prefetcher,
+                'journal': journal
+            })())
+            connect_api_status(api_server, bus, communicator)
+        register_warm_state(warm_state, config, api_server=api_server, database=database)
+        if api_server is not None:
+            api_server.start()
+            logger.info("API服務器已啟動")
+
+        # 介面建立前沒有 detect_user / working_* 的訂閱者，此時開始監聽會遺失事件
+        ui_ready.wait()
+
+        # 啟動串口監聽（重播模式以錄製檔取代BMduino作為數據來源）
+        start_serial(config, communicator)
+        if warm_state is not None:
+            warm_state.start()
+        return api_server
+
+    services_future = executor.submit(profile.call, "啟動服務", start_services)
+
+    # 主線程：導入 PyQt6 並立即顯示介面（背景線程已建立，不會繼承介面線程的 CPU 配置）
+    cpu_placement.place_current_thread('ui')
+    try:
+        with profile.phase("導入 Qt"):
+            from PyQt6.QtWidgets import QApplication
+            from program.main_ui import MainUI
+
+        with profile.phase("建立介面"):
+            # 創建Qt應用程式
+            app = QApplication(sys.argv)
+
+            # 設置應用程式字體（支援繁體中文）
+            app.setFont(app.font())  # 使用系統預設字體
+
+            # 創建主UI（電腦視覺檢測就緒後再由 report_ready 補上）
+            main_ui = MainUI(
+                state_machine=state_machine,
+                communicator=communicator,
+                user_mapper=user_mapper,
+                medication_detector=None,
+                config=config,
+                stabilizer=stabilizer,
+                starting=("服務", "電腦視覺"),
+                prefetcher=prefetcher
             )
-    
-    communicator.register_callback('working_final', save_measurement)
-    
-    # 啟動API服務器
-    api_server.start()
-    logger.info("API服務器已啟動")
-    
-    # 啟動串口監聽
-    communicator.start_listening()
-    logger.info("串口監聽已啟動")
-    
-    # 創建Qt應用程式
-    app = QApplication(sys.argv)
-    
-    # 設置應用程式字體（支援繁體中文）
-    app.setFont(app.font())  # 使用系統預設字體
-    
-    # 創建主UI
-    main_ui = MainUI(
-        state_machine=state_machine,
-        communicator=communicator,
-        user_mapper=user_mapper,
-        medication_detector=medication_detector,
-        config=config
-    )
-    
-    main_ui.show()
-    logger.info("UI界面已顯示")
-    
+            main_ui.show()
+        profile.mark("介面已顯示")
+        logger.info("UI界面已顯示")
+
+        # 接續重啟前進行中的流程（介面已註冊狀態變更回調）
+        register_warm_state(warm_state, config, state_machine=state_machine)
+    finally:
+        # 建立失敗時也放行，避免啟動線程一直等待
+        ui_ready.set()
+    connect_thermal(thermal, config, main_ui=main_ui)
+    if thermal is not None:
+        thermal.start()
+
+    # 子系統就緒時回報給介面（已完成的 future 立即在主線程回呼），全部就緒後輸出啟動時間分析
+    pending = [2]
+    pending_lock = threading.Lock()
+
+    def on_ready(name: str, future: Future):
+        result = future_result(future, name)
+        if name == "電腦視覺":
+            connect_thermal(thermal, config, medication_detector=result)
+        main_ui.report_ready(name, result)
+        with pending_lock:
+            pending[0] -= 1
+            done = pending[0] == 0
+        if done:
+            profile.mark("所有子系統就緒")
+            profile.log()
+
+    services_future.add_done_callback(lambda f: on_ready("服務", f))
+    detector_future.add_done_callback(lambda f: on_ready("電腦視覺", f))
+
     try:
         # 運行應用程式
         sys.exit(app.exec())
     except KeyboardInterrupt:
         logger.info("收到中斷信號，正在關閉...")
     finally:
-        # 清理資源
+        # 清理資源（等待仍在進行的初始化完成）
         logger.info("正在清理資源...")
+        if thermal is not None:
+            thermal.stop()
+        executor.shutdown(wait=True)
+        database = future_result(database_future, "數據庫")
+        api_server = future_result(services_future, "服務")
+        medication_detector = future_result(detector_future, "電腦視覺")
         communicator.stop_listening()
         communicator.disconnect()
-        medication_detector.stop_detection()
-        api_server.stop()
-        database.close()
+        if medication_detector is not None:
+            medication_detector.stop_detection()
+        if api_server is not None:
+            api_server.stop()
+        bus.close()  # 先處理完佇列中的測量結果再關閉數據庫
+        if warm_state is not None:
+            warm_state.stop()
+        if database is not None:
+            database.close()
         logger.info("系統已關閉")
 
 
 if __name__ == "__main__":
     main()
-
@@ -6,22 +6,71 @@
 """
 
 import sys
-import cv2
-import numpy as np
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
                              QHBoxLayout, QLabel, QGraphicsOpacityEffect, QFrame)
 from PyQt6.QtCore import Qt, QTimer, QPropertyAnimation, QEasingCurve, pyqtSignal, QObject, QSize, QRect
 from PyQt6.QtGui import QFont, QColor, QPalette, QImage, QPixmap, QPainter, QPen, QBrush
 from datetime import datetime
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Callable
 import logging
 
 # 導入狀態機
-from program.state_machine import SystemState
+from program.state_machine import SystemState, MEASURED_STATES
+from code.protocol import (StandbyEvent, DetectUserEvent, WorkingStartEvent, WorkingStatusEvent,
+                           WorkingFinalEvent, WorkingErrorEvent, WORKING_TIMEOUT)
 
 logger = logging.getLogger(__name__)
 
 
+class QtTimerHandle:
+    """QtScheduler 的排程（介面與 code.event_loop.TimerHandle 相同）"""
+    
+    def __init__(self, timer: QTimer, callback, args: tuple):
+        self.timer = timer
+        self.callback = callback
+        self.args = args
+        self.active = True
+        timer.timeout.connect(self._fire)
+    
+    def _fire(self):
+        self._release()
+        self.callback(*self.args)
+    
+    def _release(self):
+        # 計時器執行或取消後即刪除，之後只以 active 判斷狀態
+        if self.active:
+            self.active = False
+            self.timer.stop()
+            self.timer.deleteLater()
+    
+    def cancel(self):
+        """取消（已執行的工作不受影響）"""
+        self._release()
+    
+    def is_active(self) -> bool:
+        """尚未執行也未取消"""
+        return self.active
+
+
+class QtScheduler:
+    """以單次 QTimer 實作的延遲排程（介面與 EventLoop.call_later 相同，可替換為虛擬時鐘的事件迴圈）"""
+    
+    def __init__(self, parent: QObject):
+        """
+        Args:
+            parent: 計時器的父物件（由 Qt 管理計時器的生命週期）
+        """
+        self.parent = parent
+    
+    def call_later(self, delay: float, callback, *args) -> QtTimerHandle:
+        """延遲 delay 秒後在UI線程中執行 callback(*args)"""
+        timer = QTimer(self.parent)
+        timer.setSingleShot(True)
+        handle = QtTimerHandle(timer, callback, args)
+        timer.start(int(delay * 1000))
+        return handle
+
+
 class StepIndicator(QWidget):
     """流程步驟指示器"""
     
@@ -104,7 +153,21 @@ class StepIndicator(QWidget):
 class MainUI(QMainWindow):
     """主UI視窗"""
     
-    def __init__(self, state_machine, communicator, user_mapper, medication_detector, config):
+    # 子系統在背景初始化完成（名稱, 子系統物件；初始化失敗時為None），跨線程發出時在UI線程處理
+    subsystem_ready = pyqtSignal(str, object)
+    
+    # 溫度調節器變更品質等級（QualityLevel），跨線程發出時在UI線程處理
+    quality_changed = pyqtSignal(object)
+    
+    # 週期計時器的基本間隔（毫秒），過熱時依品質等級的 ui_slowdown 放大
+    TIMER_INTERVALS = {'cv_timer': 100, 'standby_timer': 200, 'animation_timer': 50}
+    
+    # 身份確認與測量完成後進入下一階段、流程完成後返回待機前的等待秒數
+    STAGE_DELAY = 2.0
+    COMPLETE_DELAY = 3.0
+    
+    def __init__(self, state_machine, communicator, user_mapper, medication_detector, config,
+                 stabilizer=None, starting=(), prefetcher=None, scheduler=None):
         """
         初始化UI
         
@@ -112,20 +175,32 @@ class MainUI(QMainWindow):
             state_machine: 狀態機物件
             communicator: 串口通訊物件
             user_mapper: 使用者映射物件
-            medication_detector: 服藥動作檢測物件
+            medication_detector: 服藥動作檢測物件（None表示尚未就緒，由 report_ready('電腦視覺', ...) 補上）
             config: 配置字典
+            stabilizer: 提前穩定判定器（None表示等待韌體的 WORKING,FINAL）
+            starting: 仍在背景初始化的子系統名稱（就緒前狀態列顯示「系統啟動中」）
+            prefetcher: 流程預取（指紋辨識成功後預先開啟攝影機等），None表示取藥階段才準備
+            scheduler: 流程延遲的排程（call_later 介面），None表示使用 QTimer；
+                       測試時可傳入虛擬時鐘的 EventLoop
         """
         super().__init__()
         
         self.state_machine = state_machine
         self.communicator = communicator
+        self.stabilizer = stabilizer
         self.user_mapper = user_mapper
+        self.prefetcher = prefetcher
         self.medication_detector = medication_detector
         self.config = config
         
+        # 尚未就緒的子系統
+        self.starting = list(starting)
+        self.subsystem_ready.connect(self._on_subsystem_ready)
+        self.quality_changed.connect(self._on_quality_changed)
+        
         # 當前顯示的數據
-        self.current_standby_data: Optional[Dict] = None
-        self.current_vital_signs_data: Optional[Dict] = None
+        self.current_standby_data: Optional[StandbyEvent] = None
+        self.current_vital_signs_data: Optional[WorkingStatusEvent] = None
         
         # 指紋辨識結果（臨時保存）
         self.detected_fingerprint_id: Optional[int] = None
@@ -134,23 +209,34 @@ class MainUI(QMainWindow):
         # CV畫面更新計時器
         self.cv_timer = QTimer()
         self.cv_timer.timeout.connect(self._update_cv_frame)
-        self.cv_timer.start(100)  # 每100ms更新一次CV畫面
+        self.cv_timer.start(self.TIMER_INTERVALS['cv_timer'])  # 每100ms更新一次CV畫面
+        
+        # 待機數據：在UI線程定時取通訊模組暫存器的最新快照（不逐筆排隊，慢的時候只顯示最新值）
+        self.standby_reader = self.communicator.latest['standby'].reader()
+        self.standby_timer = QTimer()
+        self.standby_timer.timeout.connect(self._poll_standby_data)
+        self.standby_timer.start(self.TIMER_INTERVALS['standby_timer'])
         
         # 動畫計時器
         self.animation_timer = QTimer()
         self.animation_timer.timeout.connect(self._update_animations)
-        self.animation_timer.start(50)  # 約20fps（降低更新頻率讓動畫更慢）
+        self.animation_timer.start(self.TIMER_INTERVALS['animation_timer'])  # 約20fps（降低更新頻率讓動畫更慢）
         
         # 心跳動畫變數
         self.heartbeat_scale = 1.0
         self.heartbeat_direction = 1
         
         # 狀態轉換延遲計時器
-        self.state_delay_timer = QTimer()
-        self.state_delay_timer.setSingleShot(True)
-        self.state_delay_timer.timeout.connect(self._handle_state_delay)
+        self.scheduler = scheduler if scheduler is not None else QtScheduler(self)
+        self.state_delay = None
         self.pending_state: Optional[tuple] = None
         
+        # 韌體是否在工作模式（提前穩定判定完成後仍在測量）；此時出藥命令會被韌體保留到測量結束，
+        # 先暫存到收到 WORKING,FINAL 或錯誤時再送出，避免繼電器命令在等待期間超時
+        self.firmware_working = False
+        self.deferred_relay: Optional[Callable] = None
+        self.deferred_timer = None
+        
         # 初始化UI
         self._init_ui()
         
@@ -159,6 +245,7 @@ class MainUI(QMainWindow):
         
         # 註冊串口通訊回調
         self._register_communicator_callbacks()
+        self._update_startup_status()
     
     def _init_ui(self):
         """初始化UI界面"""
@@ -312,6 +399,48 @@ class MainUI(QMainWindow):
         self.status_label.setStyleSheet("color: #999999;")
         parent_layout.addWidget(self.status_label)
     
+    def report_ready(self, name: str, subsystem=None):
+        """
+        回報子系統初始化完成（可由任意線程呼叫）
+        
+        Args:
+            name: 子系統名稱（與 starting 中的名稱相同）
+            subsystem: 子系統物件（'電腦視覺' 為 MedicationDetector），初始化失敗時為None
+        """
+        self.subsystem_ready.emit(name, subsystem)
+    
+    def _on_subsystem_ready(self, name: str, subsystem):
+        """子系統就緒（在UI線程中執行）"""
+        if name == '電腦視覺' and subsystem is not None:
+            self.medication_detector = subsystem
+        if name in self.starting:
+            self.starting.remove(name)
+        logger.info(f"子系統就緒: {name}{'' if subsystem is not None else '（無法使用）'}")
+        if self.state_machine.get_state() == SystemState.STANDBY:
+            self._update_startup_status()
+    
+    def apply_quality(self, level):
+        """
+        套用品質等級（溫度調節器的回調，可由任意線程呼叫）
+        
+        Args:
+            level: QualityLevel（使用 ui_slowdown）
+        """
+        self.quality_changed.emit(level)
+    
+    def _on_quality_changed(self, level):
+        """調整週期計時器的間隔（在UI線程中執行）"""
+        for name, interval in self.TIMER_INTERVALS.items():
+            getattr(self, name).setInterval(int(interval * level.ui_slowdown))
+        logger.info(f"介面計時器間隔: {level.ui_slowdown:g}x（品質等級 {level.name}）")
+    
+    def _update_startup_status(self):
+        """待機畫面的狀態列：子系統尚未全部就緒時顯示啟動進度"""
+        if self.starting:
+            self.status_label.setText(f"系統啟動中...（{'、'.join(self.starting)}）")
+        else:
+            self.status_label.setText("系統就緒")
+    
     def _update_time(self):
         """更新時間顯示"""
         current_time = datetime.now().strftime("%Y年%m月%d日 %H:%M:%S")
@@ -338,7 +467,7 @@ class MainUI(QMainWindow):
     
     def _update_cv_frame(self):
         """更新CV畫面"""
-        if self.medication_detector.is_detecting():
+        if self.medication_detector is not None and self.medication_detector.is_detecting():
             frame = self.medication_detector.get_current_frame()
             if frame is not None:
                 # 轉換OpenCV畫面為Qt格式
@@ -357,9 +486,6 @@ class MainUI(QMainWindow):
     
     def _register_communicator_callbacks(self):
         """註冊串口通訊回調"""
-        # 待機模式數據
-        self.communicator.register_callback('standby', self._on_standby_data)
-        
         # 指紋辨識結果
         self.communicator.register_callback('detect_user', self._on_detect_user)
         
@@ -369,38 +495,45 @@ class MainUI(QMainWindow):
         # 工作模式狀態
         self.communicator.register_callback('working_status', self._on_working_status)
         
-        # 工作模式完成
-        self.communicator.register_callback('working_final', self._on_working_final)
+        # 工作模式完成（啟用提前穩定判定時，數值收斂後即完成）
+        if self.stabilizer:
+            self.stabilizer.register_callback(self._on_working_final)
+            self.communicator.register_callback('working_final',
+                                                lambda event: QTimer.singleShot(0, self._do_firmware_done))
+        else:
+            self.communicator.register_callback('working_final', self._on_working_final)
         
         # 工作模式錯誤
         self.communicator.register_callback('working_error', self._on_working_error)
     
-    def _on_standby_data(self, data: Dict):
-        """處理待機模式數據"""
-        self.current_standby_data = data
+    def _poll_standby_data(self):
+        """處理待機模式數據（只取上次之後的最新一筆）"""
+        snapshot = self.standby_reader.poll()
+        if snapshot is None:
+            return
+        event: StandbyEvent = snapshot.value
+        self.current_standby_data = event
         
         # 無論當前狀態如何，都更新溫度顯示（確保不會卡死）
-        object_temp = data.get('object_temp', 0)
-        ambient_temp = data.get('ambient_temp', 0)
-        self.temp_label.setText(f"溫度: {object_temp:.1f}°C / {ambient_temp:.1f}°C")
+        self.temp_label.setText(f"溫度: {event.object_temp:.1f}°C / {event.ambient_temp:.1f}°C")
         
         # 只有在待機狀態時才清空副標題
         if self.state_machine.get_state().value == 'standby':
             # 清空副標題（待機模式不顯示心律血氧）
             self.subtitle_label.setText("")
     
-    def _on_detect_user(self, data: Dict):
+    def _on_detect_user(self, event: DetectUserEvent):
         """處理指紋辨識結果"""
-        logger.info(f"_on_detect_user 被調用，數據: {data}")
+        logger.info(f"_on_detect_user 被調用，數據: {event}")
         # 確保在UI線程中執行
         # 使用 functools.partial 確保數據正確傳遞
         from functools import partial
-        QTimer.singleShot(0, partial(self._do_detect_user, data))
+        QTimer.singleShot(0, partial(self._do_detect_user, event))
     
-    def _do_detect_user(self, data: Dict):
+    def _do_detect_user(self, event: DetectUserEvent):
         """在UI線程中執行指紋辨識結果處理"""
-        logger.info(f"_do_detect_user 開始執行，數據: {data}")
-        fingerprint_id = data.get('fingerprint_id')
+        logger.info(f"_do_detect_user 開始執行，數據: {event}")
+        fingerprint_id = event.fingerprint_id
         if fingerprint_id:
             user_name = self.user_mapper.get_user_name(fingerprint_id)
             logger.info(f"辨識到使用者: {user_name} (ID: {fingerprint_id})")
@@ -413,19 +546,21 @@ class MainUI(QMainWindow):
             logger.info(f"準備轉換狀態到 FINGERPRINT_OK，當前狀態: {self.state_machine.get_state().value}")
             self.state_machine.set_state(
                 SystemState.FINGERPRINT_OK,
-                {'fingerprint_id': fingerprint_id, 'user_name': user_name}
+                {'fingerprint_id': fingerprint_id, 'user_name': user_name},
+                cause='detect_user'
             )
             logger.info(f"狀態已轉換到 FINGERPRINT_OK，新狀態: {self.state_machine.get_state().value}")
         else:
-            logger.warning(f"未找到指紋ID: {data}")
+            logger.warning(f"未找到指紋ID: {event}")
     
-    def _on_working_start(self):
+    def _on_working_start(self, event: WorkingStartEvent):
         """處理工作模式開始（在 DETECT,USER 之後）"""
         # 確保在UI線程中執行
         QTimer.singleShot(0, lambda: self._do_working_start())
     
     def _do_working_start(self):
         """在UI線程中執行工作模式開始"""
+        self.firmware_working = True
         current_state = self.state_machine.get_state()
         logger.info(f"工作模式開始，當前狀態: {current_state.value}")
         
@@ -440,47 +575,43 @@ class MainUI(QMainWindow):
                 # 有指紋信息，轉換到 FINGERPRINT_OK
                 self.state_machine.set_state(
                     SystemState.FINGERPRINT_OK,
-                    {'fingerprint_id': self.detected_fingerprint_id, 'user_name': self.detected_user_name}
+                    {'fingerprint_id': self.detected_fingerprint_id, 'user_name': self.detected_user_name},
+                    cause='working_start'
                 )
             else:
                 # 沒有指紋信息，進入 FINGERPRINT 狀態等待
                 if current_state == SystemState.STANDBY:
-                    self.state_machine.set_state(SystemState.FINGERPRINT)
+                    self.state_machine.set_state(SystemState.FINGERPRINT, cause='working_start')
     
-    def _on_working_status(self, data: Dict):
+    def _on_working_status(self, event: WorkingStatusEvent):
         """處理工作模式狀態更新"""
         # 確保在UI線程中執行
-        QTimer.singleShot(0, lambda: self._do_working_status(data))
+        QTimer.singleShot(0, lambda: self._do_working_status(event))
     
-    def _do_working_status(self, data: Dict):
+    def _do_working_status(self, event: WorkingStatusEvent):
         """在UI線程中執行工作模式狀態更新"""
-        logger.info(f"_do_working_status 開始執行，數據: {data}")
-        self.current_vital_signs_data = data
+        self.current_vital_signs_data = event
         
         current_state = self.state_machine.get_state()
-        logger.info(f"當前狀態: {current_state.value}")
         
         # 如果當前是 FINGERPRINT 或 FINGERPRINT_OK 狀態，轉換到 VITAL_SIGNS
         if current_state == SystemState.FINGERPRINT or current_state == SystemState.FINGERPRINT_OK:
             # 取消之前的延遲轉換（如果有的話）
-            if self.state_delay_timer.isActive():
-                self.state_delay_timer.stop()
+            if self._cancel_state_delay():
                 logger.info("取消之前的延遲轉換")
             logger.info("收到 WORKING 狀態更新，立即轉換到心律血氧測量狀態")
             # 立即轉換到 VITAL_SIGNS
-            self.state_machine.set_state(SystemState.VITAL_SIGNS)
+            self.state_machine.set_state(SystemState.VITAL_SIGNS, cause='working_status')
             return
         
         if current_state == SystemState.VITAL_SIGNS:
             logger.info("當前在 VITAL_SIGNS 狀態，更新顯示")
             # 更新顯示
-            object_temp = data.get('object_temp', 0)
-            ambient_temp = data.get('ambient_temp', 0)
-            self.temp_label.setText(f"溫度: {object_temp:.1f}°C / {ambient_temp:.1f}°C")
+            self.temp_label.setText(f"溫度: {event.object_temp:.1f}°C / {event.ambient_temp:.1f}°C")
             
             # 顯示心律血氧（在標題卡片中顯示）
-            heart_rate = data.get('heart_rate')
-            spo2 = data.get('spo2')
+            heart_rate = event.heart_rate
+            spo2 = event.spo2
             
             # 構建顯示文字
             if heart_rate == 'MEASURING' or spo2 == 'MEASURING':
@@ -512,39 +643,46 @@ class MainUI(QMainWindow):
         else:
             logger.debug(f"當前狀態 {current_state.value} 不是 VITAL_SIGNS，跳過更新")
     
-    def _on_working_final(self, data: Dict):
+    def _on_working_final(self, event: WorkingFinalEvent):
         """處理工作模式完成"""
-        logger.info(f"_on_working_final 被調用，數據: {data}")
+        logger.info(f"_on_working_final 被調用，數據: {event}")
         # 確保在UI線程中執行
         from functools import partial
-        QTimer.singleShot(0, partial(self._do_working_final, data))
+        QTimer.singleShot(0, partial(self._do_working_final, event))
     
-    def _do_working_final(self, data: Dict):
+    def _do_working_final(self, event: WorkingFinalEvent):
         """在UI線程中執行工作模式完成處理"""
-        logger.info(f"_do_working_final 開始執行，數據: {data}")
-        fingerprint_id = data.get('fingerprint_id')
+        logger.info(f"_do_working_final 開始執行，數據: {event}")
+        if event.kind == 'working_final':
+            self._do_firmware_done()
+        fingerprint_id = event.fingerprint_id
         user_name = self.user_mapper.get_user_name(fingerprint_id)
         
         logger.info(f"準備轉換狀態到 VITAL_SIGNS_OK，當前狀態: {self.state_machine.get_state().value}")
         # 更新狀態機
         self.state_machine.set_state(
             SystemState.VITAL_SIGNS_OK,
-            {'fingerprint_id': fingerprint_id, 'user_name': user_name, **data}
+            {'user_name': user_name, **event._asdict()},
+            cause='working_final'
         )
         logger.info(f"狀態已轉換到 VITAL_SIGNS_OK，新狀態: {self.state_machine.get_state().value}")
     
-    def _on_working_error(self, error_type: str):
+    def _on_working_error(self, event: WorkingErrorEvent):
         """處理工作模式錯誤"""
-        logger.info(f"_on_working_error 被調用，錯誤類型: {error_type}")
+        logger.info(f"_on_working_error 被調用，錯誤類型: {event.error}")
         # 確保在UI線程中執行
         from functools import partial
-        QTimer.singleShot(0, partial(self._do_working_error, error_type))
+        QTimer.singleShot(0, partial(self._do_working_error, event.error))
     
     def _do_working_error(self, error_type: str):
-        """在UI線程中執行工作模式錯誤處理"""
+        """在UI線程中執行工作模式錯誤處理（測量已提前完成時不中斷流程）"""
         logger.info(f"_do_working_error 開始執行，錯誤類型: {error_type}")
+        self._do_firmware_done()
         current_state = self.state_machine.get_state()
         logger.info(f"當前狀態: {current_state.value}")
+        if current_state in MEASURED_STATES:
+            logger.warning(f"測量已提前完成，忽略韌體的測量錯誤: {error_type}")
+            return
         
         if error_type == 'NO_FINGER':
             self.status_label.setText("錯誤: 未檢測到手指，請重新放置")
@@ -552,12 +690,29 @@ class MainUI(QMainWindow):
         elif error_type == 'TIMEOUT':
             self.status_label.setText("錯誤: 測量超時，請重試")
             logger.warning("測量超時，返回待機模式")
+        elif error_type == 'NO_DATA':
+            self.status_label.setText("錯誤: 未取得有效數據，請重試")
+            logger.warning("未取得有效數據，返回待機模式")
         
         # 立即回到待機模式（不延遲，避免卡死）
         logger.info("準備返回待機模式")
-        self.state_machine.set_state(SystemState.STANDBY)
+        self.state_machine.set_state(SystemState.STANDBY, cause=f'working_error:{error_type}')
         logger.info("已返回待機模式")
     
+    def _do_firmware_done(self):
+        """韌體結束工作模式（WORKING,FINAL 或錯誤）：送出暫存的出藥命令"""
+        self.firmware_working = False
+        self._release_relay()
+    
+    def _release_relay(self):
+        """送出暫存的出藥命令（韌體結束工作模式，或超過工作模式時限仍未收到結束訊息）"""
+        if self.deferred_timer is not None:
+            self.deferred_timer.cancel()
+            self.deferred_timer = None
+        submit, self.deferred_relay = self.deferred_relay, None
+        if submit is not None:
+            submit()
+    
     def _on_state_changed(self, new_state, previous_state, data: Optional[Dict]):
         """處理狀態變更"""
         
@@ -582,9 +737,12 @@ class MainUI(QMainWindow):
         """顯示待機畫面"""
         self.title_label.setText("請將手指放在指紋辨識器上")
         self.subtitle_label.setText("")
-        self.status_label.setText("系統就緒")
+        self._update_startup_status()
         self.cv_label.hide()
         self.step_indicator.set_current_step(0)
+        # 流程結束：釋放預先開啟但未使用的攝影機
+        if self.prefetcher is not None:
+            self.prefetcher.cancel()
     
     def _show_fingerprint_screen(self):
         """顯示指紋辨識畫面（等待辨識中）"""
@@ -597,6 +755,13 @@ class MainUI(QMainWindow):
     def _show_fingerprint_ok_screen(self, data: Dict):
         """顯示指紋辨識成功畫面"""
         user_name = data.get('user_name', '使用者')
+        if data.get('fingerprint_id'):
+            # 熱重啟接續的流程沒有經過 DETECT,USER
+            self.detected_fingerprint_id = data['fingerprint_id']
+            self.detected_user_name = user_name
+            # 測量期間在背景準備取藥階段（使用者、繼電器、最近記錄與攝影機）
+            if self.prefetcher is not None:
+                self.prefetcher.prefetch(data['fingerprint_id'], self.medication_detector)
         self.title_label.setText(f"{user_name}，您好！")
         self.subtitle_label.setText("身份確認成功")
         self.status_label.setText("")
@@ -604,7 +769,7 @@ class MainUI(QMainWindow):
         
         # 延遲2秒後進入下一階段
         self.pending_state = (SystemState.VITAL_SIGNS, None)
-        self.state_delay_timer.start(2000)
+        self._start_state_delay(self.STAGE_DELAY)
     
     def _show_vital_signs_screen(self):
         """顯示心律血氧測量畫面"""
@@ -628,14 +793,18 @@ class MainUI(QMainWindow):
         # 延遲2秒後進入取藥階段
         fingerprint_id = data.get('fingerprint_id')
         if fingerprint_id:
-            relay_num = self.user_mapper.get_user_relay(fingerprint_id)
+            if self.prefetcher is not None:
+                relay_num = self.prefetcher.get_user_relay(fingerprint_id)
+            else:
+                relay_num = self.user_mapper.get_user_relay(fingerprint_id)
             logger.info(f"準備進入取藥階段，使用者ID: {fingerprint_id}, 繼電器編號: {relay_num}")
             self.pending_state = (SystemState.MEDICATION, {'relay_num': relay_num, 'fingerprint_id': fingerprint_id})
-            self.state_delay_timer.start(2000)
+            self._start_state_delay(self.STAGE_DELAY)
         else:
             logger.error("未找到指紋ID，無法進入取藥階段")
             # 如果沒有指紋ID，延遲後回到待機模式
-            QTimer.singleShot(3000, lambda: self.state_machine.set_state(SystemState.STANDBY))
+            self.pending_state = (SystemState.STANDBY, None)
+            self._start_state_delay(self.COMPLETE_DELAY)
     
     def _show_medication_screen(self, data: Dict):
         """顯示取藥畫面"""
@@ -643,6 +812,8 @@ class MainUI(QMainWindow):
         fingerprint_id = data.get('fingerprint_id')
         
         logger.info(f"進入取藥階段，繼電器編號: {relay_num}, 使用者ID: {fingerprint_id}")
+        if self.prefetcher is not None and fingerprint_id:
+            self.prefetcher.consume(fingerprint_id)
         
         self.title_label.setText("請確認已取藥")
         self.subtitle_label.setText("請將手部靠近嘴巴以確認服藥動作")
@@ -660,14 +831,30 @@ class MainUI(QMainWindow):
         
         # 控制繼電器
         if relay_num:
-            success = self.communicator.control_relay(relay_num)
-            if success:
-                logger.info(f"繼電器 {relay_num} 控制命令已發送")
+            # 命令交由通訊模組的寫入線程送出，不阻塞UI線程；結果在通訊線程中回報
+            def submit():
+                success = self.communicator.control_relay(relay_num, on_result=self._on_relay_result)
+                if success:
+                    logger.info(f"繼電器 {relay_num} 控制命令已加入佇列")
+                else:
+                    logger.error(f"繼電器 {relay_num} 控制命令加入佇列失敗")
+            
+            if self.firmware_working:
+                logger.info(f"韌體仍在工作模式，繼電器 {relay_num} 的命令在測量結束後送出")
+                self.deferred_relay = submit
+                self.deferred_timer = self.scheduler.call_later(WORKING_TIMEOUT, self._release_relay)
             else:
-                logger.error(f"繼電器 {relay_num} 控制命令發送失敗")
+                submit()
         else:
             logger.warning("未提供繼電器編號，跳過繼電器控制")
         
+        # 電腦視覺檢測尚未就緒（仍在背景載入或無法使用）時略過服藥確認
+        if self.medication_detector is None:
+            logger.warning("電腦視覺檢測尚未就緒，略過服藥動作確認")
+            self.status_label.setText("略過服藥確認")
+            QTimer.singleShot(0, self._handle_medication_timeout)
+            return
+        
         # 啟動電腦視覺檢測
         def on_detected():
             logger.info("檢測到服藥動作，準備返回待機模式")
@@ -683,11 +870,19 @@ class MainUI(QMainWindow):
         
         self.medication_detector.start_detection(on_detected, on_timeout)
     
+    def _on_relay_result(self, command):
+        """繼電器命令完成（在通訊線程中呼叫，只記錄結果）"""
+        if command.ok:
+            logger.info(f"繼電器 {command.relay_num} 出藥完成，往返時間: {command.rtt_ms:.0f} ms")
+        else:
+            logger.error(f"繼電器 {command.relay_num} 出藥失敗: {command.status} {command.error or ''}")
+    
     def _handle_medication_detected(self):
         """處理檢測到服藥動作"""
         logger.info("_handle_medication_detected 開始執行")
         # 停止檢測
-        self.medication_detector.stop_detection()
+        if self.medication_detector is not None:
+            self.medication_detector.stop_detection()
         # 獲取當前使用者信息
         current_state = self.state_machine.get_state()
         fingerprint_id = None
@@ -702,7 +897,8 @@ class MainUI(QMainWindow):
         logger.info(f"準備顯示完成畫面，使用者: {user_name}")
         self.state_machine.set_state(
             SystemState.COMPLETE,
-            {'fingerprint_id': fingerprint_id, 'user_name': user_name}
+            {'fingerprint_id': fingerprint_id, 'user_name': user_name},
+            cause='medication_detected'
         )
         logger.info("已轉換到完成狀態")
     
@@ -710,7 +906,8 @@ class MainUI(QMainWindow):
         """處理檢測超時"""
         logger.info("_handle_medication_timeout 開始執行")
         # 停止檢測
-        self.medication_detector.stop_detection()
+        if self.medication_detector is not None:
+            self.medication_detector.stop_detection()
         # 獲取當前使用者信息
         fingerprint_id = None
         user_name = None
@@ -724,7 +921,8 @@ class MainUI(QMainWindow):
         logger.info(f"準備顯示完成畫面，使用者: {user_name}")
         self.state_machine.set_state(
             SystemState.COMPLETE,
-            {'fingerprint_id': fingerprint_id, 'user_name': user_name}
+            {'fingerprint_id': fingerprint_id, 'user_name': user_name},
+            cause='medication_timeout'
         )
         logger.info("已轉換到完成狀態")
     
@@ -733,8 +931,9 @@ class MainUI(QMainWindow):
         logger.info("_show_medication_ok_screen 被調用（應該不會執行到這裡）")
         # 直接返回待機模式
         self.cv_label.hide()
-        self.medication_detector.stop_detection()
-        self.state_machine.set_state(SystemState.STANDBY)
+        if self.medication_detector is not None:
+            self.medication_detector.stop_detection()
+        self.state_machine.set_state(SystemState.STANDBY, cause='medication_ok')
     
     def _show_complete_screen(self, data: Optional[Dict] = None):
         """顯示完成畫面"""
@@ -760,21 +959,39 @@ class MainUI(QMainWindow):
         
         # 延遲3秒後回到待機模式
         self.pending_state = (SystemState.STANDBY, None)
-        self.state_delay_timer.start(3000)
+        self._start_state_delay(self.COMPLETE_DELAY)
         logger.info("3秒後將返回待機模式")
     
+    def _start_state_delay(self, delay: float):
+        """延遲後轉換到 pending_state（取代尚未執行的延遲轉換）"""
+        self._cancel_state_delay()
+        self.state_delay = self.scheduler.call_later(delay, self._handle_state_delay)
+    
+    def _cancel_state_delay(self) -> bool:
+        """取消尚未執行的延遲轉換，返回是否有被取消的轉換"""
+        active = self.state_delay is not None and self.state_delay.is_active()
+        if active:
+            self.state_delay.cancel()
+        self.state_delay = None
+        return active
+    
     def _handle_state_delay(self):
         """處理狀態延遲轉換"""
         if self.pending_state:
             new_state, data = self.pending_state
-            self.state_machine.set_state(new_state, data)
             self.pending_state = None
+            self.state_machine.set_state(new_state, data, cause='delay')
     
     def closeEvent(self, event):
         """關閉事件"""
         self.animation_timer.stop()
         self.time_timer.stop()
         self.cv_timer.stop()
-        self.state_delay_timer.stop()
-        self.medication_detector.stop_detection()
+        self._cancel_state_delay()
+        if self.deferred_timer is not None:
+            self.deferred_timer.cancel()
+            self.deferred_timer = None
+        self.deferred_relay = None
+        if self.medication_detector is not None:
+            self.medication_detector.stop_detection()
         event.accept()
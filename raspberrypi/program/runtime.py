@@ -0,0 +1,419 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+執行環境組裝模組
+依配置建立事件匯流排、串口通訊、數據庫與測量結果的訂閱，
+供單一行程的主程式、無介面模式與多行程監督程式的各個角色共用（本模組不導入 Qt）
+
+Flask、cv2 與 MediaPipe 等較重的模組只在建立對應的子系統時才導入
+"""
+
+import sys
+import json
+import logging
+from functools import partial
+from pathlib import Path
+from typing import Optional
+
+from code.serial_communicator import BMduinoCommunicator
+from code.database import Database
+from code.stabilization import StabilizationDetector, EarlyFinalEvent
+from code.protocol import WorkingFinalEvent
+from code.event_bus import EventBus, BLOCK, THREAD
+from code.warm_state import WarmStateStore
+from code.thermal_governor import ThermalGovernor, QualityLevel
+
+logger = logging.getLogger(__name__)
+
+# 每次流程一個測量結果（提前結果或韌體結果）
+RESULT_TOPIC = 'measurement_result'
+
+
+def setup_logging(role: Optional[str] = None, level: str = 'INFO'):
+    """
+    設置日誌
+
+    Args:
+        role: 多行程模式的角色名稱（加在每行日誌中），None表示單一行程
+        level: 日誌等級
+    """
+    label = f" - {role}" if role else ""
+    logging.basicConfig(
+        level=getattr(logging, level.upper(), logging.INFO),
+        format=f'%(asctime)s{label} - %(name)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler('data/system.log', encoding='utf-8'),
+            logging.StreamHandler(sys.stdout)
+        ]
+    )
+
+
+def load_config(config_path: str = "data/config.json") -> dict:
+    """
+    載入配置檔案
+
+    Args:
+        config_path: 配置檔案路徑
+
+    Returns:
+        配置字典
+    """
+    try:
+        with open(config_path, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        logging.info(f"載入配置檔案: {config_path}")
+        return config
+    except FileNotFoundError:
+        logging.error(f"配置檔案不存在: {config_path}")
+        sys.exit(1)
+    except json.JSONDecodeError as e:
+        logging.error(f"配置檔案格式錯誤: {e}")
+        sys.exit(1)
+
+
+def create_bus(config: dict) -> EventBus:
+    """建立事件匯流排（串口事件、狀態變更與測量結果）"""
+    bus_config = config.get('event_bus', {})
+    return EventBus(
+        capacity=bus_config.get('capacity', 64),
+        block_timeout=bus_config.get('block_timeout', 5.0)
+    )
+
+
+def declare_result_topic(bus: EventBus):
+    """宣告測量結果主題（不可遺失，佇列滿時等待）"""
+    return bus.declare(RESULT_TOPIC, (WorkingFinalEvent, EarlyFinalEvent), BLOCK)
+
+
+def open_database(config: dict) -> Database:
+    """開啟數據庫（不存在時建立）"""
+    db_path = Path(config.get('database', {}).get('path', 'data/database.db'))
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    database = Database(str(db_path))
+    logger.info("數據庫初始化完成")
+    return database
+
+
+def create_communicator(config: dict, bus: EventBus) -> BMduinoCommunicator:
+    """依 serial 配置建立串口通訊（尚未連接）"""
+    serial_config = config.get('serial', {})
+    return BMduinoCommunicator(
+        port=serial_config.get('port', '/dev/ttyACM0'),
+        baudrate=serial_config.get('baudrate', 115200),
+        reader_mode=serial_config.get('reader_mode', 'event'),
+        read_timeout=serial_config.get('read_timeout', 0.5),
+        relay_timeout=serial_config.get('relay_timeout', 3.0),
+        relay_retries=serial_config.get('relay_retries', 0),
+        reconnect_initial=serial_config.get('reconnect_initial', 0.05),
+        reconnect_max=serial_config.get('reconnect_max', 5.0),
+        watch_device=serial_config.get('watch_device', True),
+        protocol=serial_config.get('protocol', 'text'),
+        negotiate_timeout=serial_config.get('negotiate_timeout', 1.0),
+        stamps=serial_config.get('stamps', False),
+        standby_rate=serial_config.get('standby_rate'),
+        working_rate=serial_config.get('working_rate'),
+        bus=bus
+    )
+
+
+def connect_serial(config: dict, communicator: BMduinoCommunicator):
+    """連接串口並開始錄製（重播模式不連接）"""
+    serial_config = config.get('serial', {})
+    if not serial_config.get('replay_path') and not communicator.connect():
+        logger.error("無法連接BMduino，請檢查連接")
+        # 不退出，繼續運行（可能稍後會自動重連）
+
+    # 錄製串口數據（供離線重播）
+    if serial_config.get('capture_path'):
+        communicator.start_capture(serial_config['capture_path'])
+
+
+def start_serial(config: dict, communicator: BMduinoCommunicator):
+    """啟動串口監聽（重播模式：以錄製檔取代BMduino作為數據來源）"""
+    serial_config = config.get('serial', {})
+    replay_path = serial_config.get('replay_path')
+    if replay_path:
+        communicator.start_replay(
+            replay_path,
+            speed=serial_config.get('replay_speed', 1.0),
+            loop=serial_config.get('replay_loop', False)
+        )
+        logger.info("串口重播已啟動")
+    else:
+        communicator.start_listening()
+        logger.info("串口監聽已啟動")
+
+
+def setup_ppg(config: dict, communicator: BMduinoCommunicator):
+    """
+    PPG 原始波形串流（工作模式期間開啟，由樹莓派計算心率與血氧）
+
+    Returns:
+        PpgPipeline，未啟用時返回None
+    """
+    ppg_config = config.get('ppg', {})
+    ppg_rate = ppg_config.get('stream_rate', 0)
+    if not ppg_rate:
+        return None
+    from code.ppg_pipeline import PpgPipeline
+    ppg_pipeline = PpgPipeline(
+        sample_rate=ppg_rate,
+        window_seconds=ppg_config.get('window_seconds', 8.0),
+        hop_seconds=ppg_config.get('hop_seconds', 1.0)
+    )
+
+    def start_ppg_stream(event):
+        ppg_pipeline.reset()
+        communicator.set_report_rate('ppg', ppg_rate)
+
+    communicator.register_callback('ppg', ppg_pipeline.feed)
+    communicator.register_callback('working_start', start_ppg_stream)
+    communicator.register_callback('working_final', lambda e: communicator.set_report_rate('ppg', 0))
+    communicator.register_callback('working_error', lambda e: communicator.set_report_rate('ppg', 0))
+    logger.info(f"PPG串流已啟用: {ppg_rate} Hz")
+    return ppg_pipeline
+
+
+def setup_stabilizer(config: dict, communicator: BMduinoCommunicator) -> Optional[StabilizationDetector]:
+    """
+    提前穩定判定：數值收斂後不等待韌體的 3 秒穩定時間，直接以提前結果完成流程
+
+    Returns:
+        StabilizationDetector，未啟用時返回None
+    """
+    stabilization_config = config.get('stabilization', {})
+    if not stabilization_config.get('enabled', False):
+        return None
+    stabilizer = StabilizationDetector(
+        window=stabilization_config.get('window', 8),
+        min_samples=stabilization_config.get('min_samples', 4),
+        heart_rate_tolerance=stabilization_config.get('heart_rate_tolerance', 3.0),
+        spo2_tolerance=stabilization_config.get('spo2_tolerance', 1.0)
+    )
+    stabilizer.attach(communicator)
+    logger.info("提前穩定判定已啟用")
+    return stabilizer
+
+
+def setup_results(bus: EventBus, communicator: BMduinoCommunicator,
+                  stabilizer: Optional[StabilizationDetector], database: Database):
+    """
+    將流程結果發布到 measurement_result 主題並寫入數據庫
+
+    啟用提前穩定判定時由判定器送出（每次流程一個，提前結果或韌體結果），否則為韌體的 WORKING,FINAL
+    """
+    declare_result_topic(bus)
+    register_final = stabilizer.register_callback if stabilizer else partial(communicator.register_callback, 'working_final')
+    register_final(partial(bus.publish, RESULT_TOPIC))
+
+    def save_measurement(event):
+        if event.fingerprint_id:
+            database.insert_measurement(
+                user_id=event.fingerprint_id,
+                object_temp=event.object_temp,
+                ambient_temp=event.ambient_temp,
+                heart_rate=event.heart_rate,
+                spo2=event.spo2,
+                captured_at=communicator.capture_datetime(event)
+            )
+
+    # 寫入數據庫較慢，由工作線程處理
+    bus.subscribe(RESULT_TOPIC, save_measurement, delivery=THREAD)
+
+
+def create_api_server(config: dict):
+    """建立API服務器（延遲導入 Flask，尚未啟動）"""
+    from program.api_server import APIServer
+    api_config = config.get('api', {})
+    return APIServer(
+        host=api_config.get('host', '0.0.0.0'),
+        port=api_config.get('port', 5000)
+    )
+
+
+def create_medication_detector(config: dict):
+    """
+    建立電腦視覺檢測（延遲導入 cv2 與 MediaPipe，建立 MediaPipe 圖需要數秒）
+
+    Returns:
+        MedicationDetector，無法導入時返回None
+    """
+    try:
+        from code.cv_medication_detector import MedicationDetector
+    except ImportError as e:
+        logger.warning(f"無法導入電腦視覺檢測: {e}")
+        return None
+    camera_config = config.get('camera', {})
+    medication_config = config.get('medication_detection', {})
+    medication_detector = MedicationDetector(
+        camera_id=camera_config.get('device_id', 0),
+        width=camera_config.get('width', 640),
+        height=camera_config.get('height', 480),
+        sensitivity=medication_config.get('sensitivity', 0.7),
+        timeout=medication_config.get('timeout', 30)
+    )
+    logger.info("電腦視覺檢測初始化完成")
+    return medication_detector
+
+
+def connect_api_status(api_server, bus: EventBus, communicator):
+    """
+    將模式切換與測量結果更新到API服務器的當前狀態
+
+    待機數據不經過回調：API直接讀取 communicator.latest['standby'] 的最新快照
+
+    Args:
+        api_server: APIServer
+        bus: 含 measurement_result 主題的事件匯流排
+        communicator: 串口通訊（或提供 register_callback 的遠端代理）
+    """
+    communicator.register_callback('working_start', lambda e: api_server.update_status('working'))
+    bus.subscribe(RESULT_TOPIC, lambda e: api_server.update_status('working_final', e._asdict()),
+                  subscriber='api_status')
+
+
+def create_warm_state(config: dict) -> Optional[WarmStateStore]:
+    """
+    熱重啟快照：讀入上次的快照（各子系統登記區段時還原）
+
+    Returns:
+        WarmStateStore，未啟用時返回None
+    """
+    warm_config = config.get('warm_state', {})
+    if not warm_config.get('enabled', False):
+        return None
+    store = WarmStateStore(
+        path=warm_config.get('path', 'data/warm_state.bin'),
+        interval=warm_config.get('interval', 10.0),
+        max_age=warm_config.get('max_age', 300.0)
+    )
+    store.load()
+    return store
+
+
+def register_warm_state(store: Optional[WarmStateStore], config: dict, communicator=None, state_machine=None,
+                        api_server=None, database=None):
+    """
+    登記熱重啟快照區段（子系統可以在就緒時分別登記；通訊模組須在API服務器之前登記）
+
+    Args:
+        store: create_warm_state() 的返回值，None時不做任何事
+        config: 配置字典（warm_state.session_max_age 為進行中流程的最長保存秒數）
+        communicator: 最新遙測數值
+        state_machine: 進行中的流程
+        api_server: API 模式狀態
+        database: 熱門查詢快取
+    """
+    if store is None:
+        return
+    if communicator is not None:
+        store.register('latest', communicator.snapshot_latest, communicator.restore_latest)
+    if state_machine is not None:
+        store.register('session', state_machine.snapshot, state_machine.restore,
+                       max_age=config.get('warm_state', {}).get('session_max_age', 30.0))
+    if api_server is not None:
+        store.register('api_status', api_server.snapshot_status, api_server.restore_status)
+    if database is not None:
+        store.register('queries', database.cache_snapshot, database.restore_cache)
+
+
+def create_thermal_governor(config: dict) -> Optional[ThermalGovernor]:
+    """
+    溫度與負載調節器（尚未啟動；各子系統以 connect_thermal 接上後再 start）
+
+    Returns:
+        ThermalGovernor，未啟用時返回None
+    """
+    thermal_config = config.get('thermal', {})
+    if not thermal_config.get('enabled', False):
+        return None
+    levels = [QualityLevel(**level) for level in thermal_config.get('levels', [])] or None
+    return ThermalGovernor(
+        levels=levels,
+        interval=thermal_config.get('interval', 5.0),
+        hysteresis=thermal_config.get('hysteresis', 3.0),
+        hold=thermal_config.get('hold', 30.0),
+        load_high=thermal_config.get('load_high', 0.9),
+        sysfs_root=thermal_config.get('sysfs_root', '/sys'),
+        proc_root=thermal_config.get('proc_root', '/proc')
+    )
+
+
+def connect_thermal(governor: Optional[ThermalGovernor], config: dict, communicator=None,
+                    medication_detector=None, main_ui=None):
+    """
+    讓子系統跟隨調節器的品質等級（子系統可以在就緒時分別接上，接上時立即套用目前等級）
+
+    Args:
+        governor: create_thermal_governor() 的返回值，None時不做任何事
+        config: 配置字典（serial.standby_rate / working_rate 為最高品質的遙測回報頻率）
+        communicator: 遙測回報頻率（沒有設定回報頻率的模式維持韌體預設值）
+        medication_detector: 電腦視覺檢測幀率與推論解析度
+        main_ui: 介面計時器間隔
+    """
+    if governor is None:
+        return
+    if communicator is not None:
+        serial_config = config.get('serial', {})
+        base_rates = {mode: serial_config.get(f'{mode}_rate') for mode in ('standby', 'working')}
+
+        def apply_telemetry(level: QualityLevel):
+            for mode, base_rate in base_rates.items():
+                if not base_rate:
+                    continue
+                hz = round(base_rate * level.telemetry_scale, 3)
+                if communicator.report_rates.get(mode.upper()) != hz:
+                    communicator.set_report_rate(mode, hz)
+
+        governor.add_listener(apply_telemetry)
+        governor.add_metrics('telemetry', lambda: {
+            'report_rates': dict(communicator.report_rates),
+            'report_intervals': dict(communicator.report_intervals),
+        })
+    if medication_detector is not None:
+        governor.add_listener(medication_detector.set_quality)
+        governor.add_metrics('cv', medication_detector.get_stats)
+    if main_ui is not None:
+        governor.add_listener(main_ui.apply_quality)
+
+
+def create_prefetcher(config: dict, user_mapper, database=None):
+    """
+    流程預取：指紋辨識成功後在背景準備取藥階段（使用者與繼電器、最近的測量記錄、攝影機）
+
+    Returns:
+        SessionPrefetcher，未啟用時返回None
+    """
+    prefetch_config = config.get('prefetch', {})
+    if not prefetch_config.get('enabled', False):
+        return None
+    from code.session_prefetch import SessionPrefetcher
+    return SessionPrefetcher(
+        user_mapper,
+        database=database,
+        history_limit=prefetch_config.get('history_limit', 10),
+        camera=prefetch_config.get('camera', True),
+        warm_frames=prefetch_config.get('warm_frames', 5),
+        camera_hold=prefetch_config.get('camera_hold', 120.0)
+    )
+
+
+def create_session_journal(config: dict, state_machine, database=None):
+    """
+    流程記錄：每次流程的狀態轉換、原因與各階段時間寫入數據庫的 sessions 表
+
+    Args:
+        config: 配置
+        state_machine: 狀態機物件（訂閱其狀態變更）
+        database: 數據庫物件，None表示稍後以 set_database 設定（之前的流程先暫存）
+
+    Returns:
+        SessionJournal，未啟用時返回None
+    """
+    journal_config = config.get('session_journal', {})
+    if not journal_config.get('enabled', True):
+        return None
+    from code.session_journal import SessionJournal
+    journal = SessionJournal(database, clock=state_machine.clock, buffer_size=journal_config.get('buffer_size', 100))
+    journal.attach(state_machine)
+    return journal
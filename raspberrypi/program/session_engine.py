@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多裝置流程引擎
+一台樹莓派閘道器透過 SerialHub 連接多個藥盒時，每台裝置各自進行指紋辨識 -> 心律血氧 -> 出藥 -> 完成的流程。
+引擎以裝置ID標記的事件（SerialHub 的集線器回調參數 (device_id, event)）驅動，
+每台進行中的裝置只有一個輕量的 DeviceSession（__slots__，待機的裝置不佔用任何物件），
+狀態轉換以 program.state_machine.TRANSITIONS 查表驗證，延遲轉換以事件迴圈的計時器排程，
+所有操作都在事件迴圈線程中執行，不需要鎖；會阻塞的工作（數據庫寫入、串口寫入）不在此線程進行，
+否則一台裝置的寫入會延誤所有裝置的轉換與計時器
+
+流程與無介面模式沒有電腦視覺檢測時相同：繼電器回報 RELAY_OK（或超時）即完成流程；
+狀態變更（帶有裝置ID）發布到事件匯流排的 state_change 主題，流程記錄（code.session_journal）
+以工作線程訂閱並寫入數據庫
+"""
+
+from typing import Optional, Callable, Dict
+import logging
+
+from code.event_bus import EventBus, BLOCK
+from code.event_loop import EventLoop
+from program.state_machine import SystemState, StateChange, TRANSITIONS
+
+logger = logging.getLogger(__name__)
+
+# 引擎處理的事件類型
+ENGINE_EVENTS = ('detect_user', 'working_start', 'working_status', 'working_final', 'working_error',
+                 'relay_ok', 'relay_error')
+
+
+class DeviceSession:
+    """一台裝置進行中的流程"""
+
+    __slots__ = ('device_id', 'state', 'user_id', 'relay_num', 'started', 'entered', 'timer')
+
+    def __init__(self, device_id: str, now: float):
+        self.device_id = device_id
+        self.state = SystemState.STANDBY
+        self.user_id: Optional[int] = None
+        self.relay_num: Optional[int] = None
+        self.started = now
+        self.entered = now
+        self.timer = None
+
+    def to_dict(self, now: float) -> Dict:
+        return {
+            'state': self.state.value,
+            'user_id': self.user_id,
+            'relay_num': self.relay_num,
+            'elapsed': round(now - self.started, 1),
+            'in_state': round(now - self.entered, 1),
+        }
+
+
+class SessionEngine:
+    """每台裝置一個流程的狀態引擎"""
+
+    def __init__(self, loop: EventLoop, dispense: Callable[[str, int], bool], user_mapper,
+                 stage_delay: float = 2.0, complete_delay: float = 3.0, relay_timeout: float = 5.0,
+                 bus: Optional[EventBus] = None):
+        """
+        初始化引擎
+
+        Args:
+            loop: 事件迴圈（所有事件與延遲轉換在此線程執行）
+            dispense: 出藥函數，參數為 (device_id, relay_num)，返回是否已送出或排入寫入線程（不可阻塞；
+                      非同步寫入失敗時以 RelayErrorEvent 交給 handle()）
+            user_mapper: 使用者映射物件（指紋ID -> 繼電器編號）
+            stage_delay: 身份確認與測量完成後進入下一階段前的等待秒數
+            complete_delay: 流程完成後返回待機前的等待秒數
+            relay_timeout: 送出出藥命令後等待 RELAY_OK 的最長秒數（超時仍完成流程並記錄原因）
+            bus: 發布狀態變更的事件匯流排，None表示不發布
+        """
+        self.loop = loop
+        self.clock = loop.clock
+        self.dispense = dispense
+        self.user_mapper = user_mapper
+        self.stage_delay = stage_delay
+        self.complete_delay = complete_delay
+        self.relay_timeout = relay_timeout
+        # 狀態變更主題（與狀態機相同，轉換不可遺失）
+        self.topic = bus.declare('state_change', (StateChange,), BLOCK) if bus is not None else None
+
+        # 進行中的流程：裝置ID -> DeviceSession（返回待機時移除）
+        self.sessions: Dict[str, DeviceSession] = {}
+        self._handlers = {kind: getattr(self, f'_on_{kind}') for kind in ENGINE_EVENTS}
+
+        # 統計
+        self.events = 0
+        self.transitions = 0
+        self.rejected = 0
+        self.started = 0
+        self.completed = 0
+        self.errors = 0
+        self.peak_sessions = 0
+
+    def attach_hub(self, hub):
+        """訂閱集線器所有裝置的事件（集線器線程收到的事件交給事件迴圈線程處理）"""
+        for kind in ENGINE_EVENTS:
+            hub.register_callback(kind, lambda device_id, event: self.loop.call_soon(self.handle, device_id, event))
+
+    def handle(self, device_id: str, event):
+        """
+        處理一個裝置事件（在事件迴圈線程中呼叫）
+
+        Args:
+            device_id: 裝置ID
+            event: 協議事件物件
+        """
+        handler = self._handlers.get(event.kind)
+        if handler is None:
+            return
+        self.events += 1
+        try:
+            handler(device_id, event)
+        except Exception as e:
+            logger.error(f"裝置 {device_id} 處理 {event.kind} 錯誤: {e}", exc_info=True)
+
+    # ========== 狀態轉換 ==========
+
+    def _transition(self, session: DeviceSession, state: SystemState, cause: str) -> bool:
+        """轉換狀態（查表驗證），返回待機時移除流程"""
+        if state == session.state:
+            return False
+        if state not in TRANSITIONS[session.state]:
+            self.rejected += 1
+            logger.warning(f"裝置 {session.device_id} 拒絕無效的狀態轉換: "
+                           f"{session.state.value} -> {state.value}（原因: {cause}）")
+            return False
+
+        self._cancel_timer(session)
+        previous = session.state
+        now = self.clock.monotonic()
+        session.state = state
+        session.entered = now
+        self.transitions += 1
+        if self.topic is not None:
+            data = {'fingerprint_id': session.user_id} if session.user_id else None
+            self.topic.publish(StateChange(state, previous, data, cause, now, session.device_id))
+        logger.debug(f"裝置 {session.device_id} 狀態轉換: {previous.value} -> {state.value}（{cause}）")
+
+        if state == SystemState.STANDBY:
+            del self.sessions[session.device_id]
+        elif state == SystemState.FINGERPRINT_OK:
+            self._schedule(session, self.stage_delay, SystemState.VITAL_SIGNS)
+        elif state == SystemState.VITAL_SIGNS_OK:
+            session.relay_num = self.user_mapper.get_user_relay(session.user_id) if session.user_id else None
+            if session.relay_num:
+                self._schedule(session, self.stage_delay, SystemState.MEDICATION)
+            else:
+                logger.error(f"裝置 {session.device_id} 未找到使用者 {session.user_id} 的繼電器，無法進入取藥階段")
+                self._schedule(session, self.complete_delay, SystemState.STANDBY, 'no_relay')
+        elif state == SystemState.MEDICATION:
+            self._dispense(session)
+        elif state == SystemState.COMPLETE:
+            self.completed += 1
+            self._schedule(session, self.complete_delay, SystemState.STANDBY)
+        return True
+
+    def _session(self, device_id: str, create: bool = False) -> Optional[DeviceSession]:
+        session = self.sessions.get(device_id)
+        if session is None and create:
+            session = self.sessions[device_id] = DeviceSession(device_id, self.clock.monotonic())
+            self.started += 1
+            if len(self.sessions) > self.peak_sessions:
+                self.peak_sessions = len(self.sessions)
+        return session
+
+    def _discard_if_idle(self, session: DeviceSession):
+        """新建立但未能轉換的流程不保留"""
+        if session.state == SystemState.STANDBY:
+            self.sessions.pop(session.device_id, None)
+            self.started -= 1
+
+    def _schedule(self, session: DeviceSession, delay: float, state: SystemState, cause: str = 'delay'):
+        session.timer = self.loop.call_later(delay, self._timer_fired, session, state, cause)
+
+    def _timer_fired(self, session: DeviceSession, state: SystemState, cause: str):
+        session.timer = None
+        if self.sessions.get(session.device_id) is session:
+            self._transition(session, state, cause)
+
+    @staticmethod
+    def _cancel_timer(session: DeviceSession):
+        if session.timer is not None:
+            session.timer.cancel()
+            session.timer = None
+
+    def _dispense(self, session: DeviceSession):
+        """送出出藥命令並等待 RELAY_OK"""
+        if self.dispense(session.device_id, session.relay_num):
+            logger.info(f"裝置 {session.device_id} 繼電器 {session.relay_num} 出藥命令已送出")
+            self._schedule(session, self.relay_timeout, SystemState.COMPLETE, 'relay_timeout')
+        else:
+            logger.error(f"裝置 {session.device_id} 繼電器 {session.relay_num} 出藥命令送出失敗")
+            self._schedule(session, 0, SystemState.COMPLETE, 'dispense_failed')
+
+    # ========== 事件 ==========
+
+    def _on_detect_user(self, device_id: str, event):
+        if not event.fingerprint_id:
+            logger.warning(f"裝置 {device_id} 未找到指紋ID: {event}")
+            return
+        session = self._session(device_id, create=True)
+        previous_user = session.user_id
+        session.user_id = event.fingerprint_id
+        if not self._transition(session, SystemState.FINGERPRINT_OK, 'detect_user'):
+            session.user_id = previous_user
+            self._discard_if_idle(session)
+
+    def _on_working_start(self, device_id: str, event):
+        session = self._session(device_id, create=True)
+        if session.state == SystemState.STANDBY:
+            self._transition(session, SystemState.FINGERPRINT, 'working_start')
+
+    def _on_working_status(self, device_id: str, event):
+        session = self._session(device_id)
+        if session is not None and session.state in (SystemState.FINGERPRINT, SystemState.FINGERPRINT_OK):
+            self._transition(session, SystemState.VITAL_SIGNS, 'working_status')
+
+    def _on_working_final(self, device_id: str, event):
+        session = self._session(device_id)
+        if session is None:
+            self.rejected += 1
+            logger.warning(f"裝置 {device_id} 沒有進行中的流程，忽略測量結果")
+            return
+        if event.fingerprint_id and not session.user_id:
+            session.user_id = event.fingerprint_id
+        self._transition(session, SystemState.VITAL_SIGNS_OK, 'working_final')
+
+    def _on_working_error(self, device_id: str, event):
+        session = self._session(device_id)
+        if session is not None:
+            self.errors += 1
+            logger.warning(f"裝置 {device_id} 測量錯誤: {event.error}，返回待機模式")
+            self._transition(session, SystemState.STANDBY, f'working_error:{event.error}')
+
+    def _on_relay_ok(self, device_id: str, event):
+        session = self._session(device_id)
+        if session is not None and session.state == SystemState.MEDICATION:
+            self._transition(session, SystemState.COMPLETE, 'relay_done')
+
+    def _on_relay_error(self, device_id: str, event):
+        # INVALID_COMMAND 是韌體對其他未知命令的回應，不是出藥結果
+        if event.error == 'INVALID_COMMAND':
+            return
+        session = self._session(device_id)
+        if session is not None and session.state == SystemState.MEDICATION:
+            logger.error(f"裝置 {device_id} 繼電器 {session.relay_num} 出藥失敗: {event.error}")
+            self._transition(session, SystemState.COMPLETE, 'relay_error')
+
+    # ========== 查詢 ==========
+
+    def get_session(self, device_id: str) -> Optional[Dict]:
+        """裝置進行中的流程（待機時返回None）"""
+        session = self.sessions.get(device_id)
+        return session.to_dict(self.clock.monotonic()) if session is not None else None
+
+    def get_stats(self) -> Dict:
+        """獲取統計（進行中的流程與各狀態的數量、轉換與事件次數）"""
+        now = self.clock.monotonic()
+        sessions = list(self.sessions.values())
+        states: Dict[str, int] = {}
+        for session in sessions:
+            states[session.state.value] = states.get(session.state.value, 0) + 1
+        return {
+            'active': len(sessions),
+            'peak': self.peak_sessions,
+            'states': states,
+            'started': self.started,
+            'completed': self.completed,
+            'errors': self.errors,
+            'events': self.events,
+            'transitions': self.transitions,
+            'rejected': self.rejected,
+            'sessions': {session.device_id: session.to_dict(now) for session in sessions},
+        }
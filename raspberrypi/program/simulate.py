@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+加速流程模擬
+以虛擬時鐘（code.clock.VirtualClock）驅動無介面模式的流程控制（HeadlessController）與狀態機，
+BMduino 與服藥動作檢測由 code.simulation 在同一個事件迴圈上模擬：所有等待（狀態回報間隔、
+階段之間的延遲、服藥檢測超時、45 秒工作模式時限）都不佔用實際時間，
+數千次完整流程可以在數秒內跑完，用於驗證長時間運行的流程邏輯與統計各階段的時間分布
+
+用法:
+    python3 program/simulate.py                              # 1000 次流程
+    python3 program/simulate.py --sessions 5000 --seed 1
+    python3 program/simulate.py --outcomes final=0.8,no_finger=0.1,timeout=0.1 --detect 0.7
+    python3 program/simulate.py --json                       # 以 JSON 輸出結果
+    python3 program/simulate.py --journal :memory:           # 寫入流程記錄並輸出各階段時間分析
+"""
+
+import sys
+import time
+import json
+import random
+import argparse
+import logging
+from pathlib import Path
+from typing import Optional, Dict, List
+
+# 添加專案根目錄到Python路徑
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from code.clock import VirtualClock
+from code.event_bus import EventBus, SYNC
+from code.event_loop import EventLoop
+from code.simulation import SimulatedBMduino, SimulatedDetector
+from code.bmduino_emulator import OUTCOMES
+from code.user_mapper import UserMapper
+from code.database import Database
+from code.session_journal import SessionJournal, latency_report
+from program.state_machine import StateMachine, SystemState
+from program.headless import HeadlessController
+
+
+def parse_outcomes(text: str) -> Dict[str, float]:
+    """解析流程結果權重（例如 final=0.9,no_finger=0.05,timeout=0.05）"""
+    weights = {}
+    for item in text.split(','):
+        name, _, weight = item.partition('=')
+        name = name.strip()
+        if name not in OUTCOMES:
+            raise argparse.ArgumentTypeError(f"未知的流程結果: {name}（可用: {', '.join(OUTCOMES)}）")
+        weights[name] = float(weight or 1.0)
+    return weights
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+class Simulation:
+    """連續執行指定次數的流程並記錄各狀態的停留時間"""
+
+    def __init__(self, sessions: int, seed: int, gap: float, outcomes: Dict[str, float],
+                 detect_probability: float, user_config: str, journal_path: Optional[str] = None):
+        self.clock = VirtualClock()
+        self.loop = EventLoop(self.clock)
+        self.bus = EventBus()
+        self.state_machine = StateMachine(self.bus, self.clock)
+        self.firmware = SimulatedBMduino(self.loop, self.bus, seed=seed)
+        self.detector = SimulatedDetector(self.loop, detect_probability=detect_probability, seed=seed + 1)
+        self.user_mapper = UserMapper(user_config)
+        self.controller = HeadlessController(self.state_machine, self.firmware, self.user_mapper, self.loop,
+                                             medication_detector=self.detector)
+        # 流程記錄（與實際運行相同的寫入，在迴圈線程同步記錄）
+        self.database = Database(journal_path) if journal_path else None
+        if self.database is not None:
+            SessionJournal(self.database, self.clock).attach(self.state_machine, SYNC)
+
+        self.sessions = sessions
+        self.gap = gap
+        self.random = random.Random(seed)
+        self.outcome_names = list(outcomes)
+        self.outcome_weights = list(outcomes.values())
+        self.fingerprint_ids = [int(user_id) for user_id in self.user_mapper.users] or [1]
+
+        self.triggered = 0
+        self.session_started = None
+        self.session_times: List[float] = []
+        self.state_times: Dict[str, List[float]] = {}
+        self.state_machine.register_state_change_callback(self._on_state_changed)
+
+    def _on_state_changed(self, new_state, previous_state, data):
+        """記錄上一個狀態的停留時間；返回待機後排程下一次流程"""
+        now = self.clock.monotonic()
+        if previous_state is not None and previous_state != SystemState.STANDBY:
+            self.state_times.setdefault(previous_state.value, []).append(now - self._entered_at)
+        self._entered_at = now
+        if new_state == SystemState.STANDBY and self.session_started is not None:
+            self.session_times.append(now - self.session_started)
+            self.session_started = None
+            self.loop.call_later(self.gap, self._trigger)
+
+    def _trigger(self):
+        """開始下一次流程（韌體仍在忙碌時稍後重試）"""
+        if self.triggered >= self.sessions:
+            return
+        if not self.firmware.is_idle():
+            self.loop.call_later(1.0, self._trigger)
+            return
+        outcome = self.random.choices(self.outcome_names, self.outcome_weights)[0]
+        self.triggered += 1
+        self.session_started = self.clock.monotonic()
+        self.firmware.trigger_fingerprint(self.random.choice(self.fingerprint_ids), outcome)
+
+    def run(self) -> Dict:
+        """執行全部流程（事件迴圈沒有排程時返回）"""
+        self._entered_at = self.clock.monotonic()
+        start = time.perf_counter()
+        self.loop.call_soon(self._trigger)
+        self.loop.run()
+        wall = time.perf_counter() - start
+        virtual = self.clock.monotonic()
+
+        controller = self.controller.get_stats()
+        result = {
+            'sessions': self.triggered,
+            'completed': controller['completed'],
+            'errors': controller['errors'],
+            'outcomes': self.firmware.outcomes,
+            'detector': self.detector.get_stats(),
+            'virtual_s': round(virtual, 1),
+            'wall_s': round(wall, 3),
+            'speedup': round(virtual / wall, 1) if wall > 0 else None,
+            'sessions_per_wall_s': round(self.triggered / wall, 1) if wall > 0 else None,
+            'session_s': self._summary(self.session_times),
+            'states': {state: self._summary(values) for state, values in self.state_times.items()},
+        }
+        if self.database is not None:
+            report = latency_report(self.database.get_sessions())
+            result['latency'] = {'overall': report['overall'], 'by_user': report['by_user']}
+        return result
+
+    @staticmethod
+    def _summary(values: List[float]) -> Dict:
+        if not values:
+            return {'count': 0}
+        return {
+            'count': len(values),
+            'mean': round(sum(values) / len(values), 2),
+            'p95': round(percentile(values, 0.95), 2),
+            'max': round(max(values), 2),
+        }
+
+
+def main():
+    """主函數"""
+    parser = argparse.ArgumentParser(description="以虛擬時鐘加速執行完整的藥盒流程")
+    parser.add_argument('--sessions', type=int, default=1000, help="流程次數")
+    parser.add_argument('--seed', type=int, default=1, help="亂數種子")
+    parser.add_argument('--gap', type=float, default=5.0, help="返回待機後到下一次指紋辨識的秒數（虛擬時間）")
+    parser.add_argument('--outcomes', type=parse_outcomes, default={'final': 1.0},
+                        help="流程結果權重，例如 final=0.9,no_finger=0.05,timeout=0.05")
+    parser.add_argument('--detect', type=float, default=0.9, help="服藥動作檢測在超時前成功的機率")
+    parser.add_argument('--users', default=str(project_root / 'data' / 'user_config.json'), help="使用者配置檔案")
+    parser.add_argument('--journal', help="流程記錄的數據庫路徑（:memory: 表示記憶體數據庫），輸出各階段時間分析")
+    parser.add_argument('--json', action='store_true', help="以 JSON 輸出結果")
+    parser.add_argument('--log-level', default='ERROR', help="日誌級別（測量錯誤為 WARNING）")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=getattr(logging, args.log_level.upper(), logging.ERROR),
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    result = Simulation(args.sessions, args.seed, args.gap, args.outcomes, args.detect, args.users,
+                        args.journal).run()
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+        return
+
+    print(f"流程: {result['sessions']}（完成 {result['completed']}，測量錯誤 {result['errors']}）")
+    print(f"韌體結果: {', '.join(f'{name} {count}' for name, count in result['outcomes'].items())}")
+    print(f"服藥檢測: 成功 {result['detector']['detections']}，超時 {result['detector']['timeouts']}")
+    print(f"虛擬時間 {result['virtual_s']:.0f} 秒，實際時間 {result['wall_s']:.2f} 秒，"
+          f"加速 {result['speedup']:g} 倍（每秒 {result['sessions_per_wall_s']:g} 次流程）")
+    print(f"{'狀態':<16}{'次數':>8}{'平均秒數':>10}{'P95':>8}{'最大':>8}")
+    for state, summary in [('session', result['session_s'])] + list(result['states'].items()):
+        if summary['count']:
+            print(f"{state:<16}{summary['count']:>8}{summary['mean']:>10.2f}{summary['p95']:>8.2f}{summary['max']:>8.2f}")
+
+    if 'latency' in result:
+        print()
+        print(f"流程記錄（毫秒）: {'狀態':<14}{'次數':>8}{'P50':>8}{'P90':>8}{'P95':>8}")
+        overall = result['latency']['overall']
+        for state, summary in [('session', overall['session'])] + list(overall['phases'].items()):
+            print(f"{'':<10}{state:<16}{summary['count']:>8}{summary['p50_ms']:>8}{summary['p90_ms']:>8}{summary['p95_ms']:>8}")
+        for user, group in result['latency']['by_user'].items():
+            session = group['session']
+            print(f"使用者 {user}: {group['sessions']} 次流程，P50 {session['p50_ms']} ms，P95 {session['p95_ms']} ms")
+
+
+
+if __name__ == "__main__":
+    main()
@@ -2,13 +2,17 @@
 # -*- coding: utf-8 -*-
 """
 狀態機模組
-管理UI流程的狀態轉換
+管理UI流程的狀態轉換：可以轉換的下一個狀態由 TRANSITIONS 表宣告（查表驗證），
+不在表中的轉換會被拒絕並記錄，每次轉換附帶原因（cause）與時間，供流程記錄（code.session_journal）使用
 """
 
 from enum import Enum
-from typing import Optional, Callable
+from typing import Optional, Callable, NamedTuple, Dict, FrozenSet
 import logging
 
+from code.event_bus import EventBus, BLOCK, SYNC
+from code.clock import Clock, REAL_CLOCK
+
 logger = logging.getLogger(__name__)
 
 
@@ -24,16 +28,69 @@ class SystemState(Enum):
     COMPLETE = "complete"                  # 完成流程
 
 
+# 熱重啟後可以接續的狀態：之後的 WORKING 事件會推進流程；
+# 測量完成之後的狀態（出藥、服藥確認）不接續，避免重啟後重複出藥
+RESUMABLE_STATES = (SystemState.FINGERPRINT, SystemState.FINGERPRINT_OK, SystemState.VITAL_SIGNS)
+
+# 測量已完成的狀態：提前穩定判定完成後韌體仍在工作模式，之後回報的測量錯誤（如移開手指的 NO_FINGER）不中斷流程
+MEASURED_STATES = (SystemState.VITAL_SIGNS_OK, SystemState.MEDICATION, SystemState.MEDICATION_OK,
+                   SystemState.COMPLETE)
+
+# 各狀態可以轉換到的狀態（任何狀態都可以返回待機：測量錯誤、重置）
+# - 待機可直接進入測量：熱重啟接續的流程
+# - 指紋辨識與測量期間可再次辨識到使用者：韌體重啟後的新流程
+# - 尚未收到第一筆狀態回報即收到測量結果：提前穩定判定或韌體只送出 FINAL
+TRANSITIONS: Dict[SystemState, FrozenSet[SystemState]] = {
+    SystemState.STANDBY: frozenset({
+        SystemState.FINGERPRINT, SystemState.FINGERPRINT_OK, SystemState.VITAL_SIGNS}),
+    SystemState.FINGERPRINT: frozenset({
+        SystemState.STANDBY, SystemState.FINGERPRINT_OK, SystemState.VITAL_SIGNS, SystemState.VITAL_SIGNS_OK}),
+    SystemState.FINGERPRINT_OK: frozenset({
+        SystemState.STANDBY, SystemState.VITAL_SIGNS, SystemState.VITAL_SIGNS_OK}),
+    SystemState.VITAL_SIGNS: frozenset({
+        SystemState.STANDBY, SystemState.FINGERPRINT_OK, SystemState.VITAL_SIGNS_OK}),
+    SystemState.VITAL_SIGNS_OK: frozenset({
+        SystemState.STANDBY, SystemState.MEDICATION}),
+    SystemState.MEDICATION: frozenset({
+        SystemState.STANDBY, SystemState.MEDICATION_OK, SystemState.COMPLETE}),
+    SystemState.MEDICATION_OK: frozenset({
+        SystemState.STANDBY, SystemState.COMPLETE}),
+    SystemState.COMPLETE: frozenset({
+        SystemState.STANDBY}),
+}
+
+
+class StateChange(NamedTuple):
+    """狀態變更事件（發布到 state_change 主題）"""
+    state: SystemState
+    previous: Optional[SystemState]
+    data: Optional[dict]
+    cause: Optional[str] = None  # 轉換原因（例如 detect_user、working_error:TIMEOUT、delay）
+    at: float = 0.0              # 轉換時間（狀態機時鐘的 monotonic 秒數）
+    device_id: Optional[str] = None  # 多裝置流程引擎的裝置ID（單一藥盒為None）
+
+
 class StateMachine:
     """狀態機類別"""
     
-    def __init__(self):
-        """初始化狀態機"""
+    def __init__(self, bus: Optional[EventBus] = None, clock: Optional[Clock] = None):
+        """
+        初始化狀態機
+        
+        Args:
+            bus: 發布狀態變更的事件匯流排，None表示建立專用的匯流排
+            clock: 記錄狀態停留時間的時鐘，None表示實際時間（加速模擬使用虛擬時鐘）
+        """
         self.current_state = SystemState.STANDBY
         self.previous_state: Optional[SystemState] = None
+        self.clock = clock if clock is not None else REAL_CLOCK
+        self.state_entered_at = self.clock.monotonic()
+        self.transitions = 0
+        self.rejected = 0
         
-        # 狀態轉換回調
-        self.state_change_callbacks: list[Callable] = []
+        # 狀態變更主題（狀態轉換不可遺失）
+        self.bus = bus if bus is not None else EventBus()
+        self.topic = self.bus.declare('state_change', (StateChange,), BLOCK)
         
         # 當前數據
         self.current_data = {
@@ -44,28 +101,48 @@ class StateMachine:
             'final_data': None
         }
     
-    def register_state_change_callback(self, callback: Callable):
+    def register_state_change_callback(self, callback: Callable, delivery: str = SYNC):
         """
         註冊狀態變更回調
         
         Args:
-            callback: 回調函數，參數為 (new_state, previous_state)
+            callback: 回調函數，參數為 (new_state, previous_state, data)
+            delivery: 'sync' 在呼叫 set_state 的線程直接呼叫；'thread' 由專用工作線程呼叫
+        
+        Returns:
+            訂閱
         """
-        self.state_change_callbacks.append(callback)
+        return self.bus.subscribe('state_change', lambda change: callback(change.state, change.previous, change.data),
+                                  delivery, subscriber=getattr(callback, '__qualname__', None))
+    
+    def can_transition(self, new_state: SystemState) -> bool:
+        """目前狀態是否可以轉換到 new_state"""
+        return new_state in TRANSITIONS[self.current_state]
     
-    def set_state(self, new_state: SystemState, data: Optional[dict] = None):
+    def set_state(self, new_state: SystemState, data: Optional[dict] = None, cause: Optional[str] = None) -> bool:
         """
         設置新狀態
         
         Args:
             new_state: 新狀態
             data: 狀態相關數據
+            cause: 轉換原因（記錄於流程記錄）
+        
+        Returns:
+            是否已轉換（與目前狀態相同或不在轉換表中時返回False）
         """
         if new_state == self.current_state:
-            return
+            return False
+        if new_state not in TRANSITIONS[self.current_state]:
+            self.rejected += 1
+            logger.warning(f"拒絕無效的狀態轉換: {self.current_state.value} -> {new_state.value}"
+                           f"（原因: {cause or '未指定'}）")
+            return False
         
         self.previous_state = self.current_state
         self.current_state = new_state
+        self.state_entered_at = self.clock.monotonic()
+        self.transitions += 1
         
         # 更新數據
         if data:
@@ -79,26 +156,37 @@ class StateMachine:
             elif new_state == SystemState.VITAL_SIGNS_OK:
                 self.current_data['final_data'] = data
         
-        logger.info(f"狀態轉換: {self.previous_state.value} -> {self.current_state.value}")
+        logger.info(f"狀態轉換: {self.previous_state.value} -> {self.current_state.value}"
+                    f"{f'（{cause}）' if cause else ''}")
         
-        # 觸發回調
-        for callback in self.state_change_callbacks:
-            try:
-                callback(self.current_state, self.previous_state, data)
-            except Exception as e:
-                logger.error(f"狀態變更回調錯誤: {e}")
+        # 發布狀態變更
+        self.topic.publish(StateChange(self.current_state, self.previous_state, data, cause, self.state_entered_at))
+        return True
     
     def get_state(self) -> SystemState:
         """獲取當前狀態"""
         return self.current_state
     
+    def time_in_state(self) -> float:
+        """目前狀態已停留的秒數"""
+        return self.clock.monotonic() - self.state_entered_at
+    
     def get_previous_state(self) -> Optional[SystemState]:
         """獲取上一個狀態"""
         return self.previous_state
+
+    def get_stats(self) -> dict:
+        """獲取統計（目前狀態與停留秒數、已轉換與被拒絕的轉換次數）"""
+        return {
+            'state': self.current_state.value,
+            'time_in_state': round(self.time_in_state(), 1),
+            'transitions': self.transitions,
+            'rejected': self.rejected,
+        }
     
     def reset(self):
         """重置狀態機到待機模式"""
-        self.set_state(SystemState.STANDBY)
+        self.set_state(SystemState.STANDBY, cause='reset')
         self.current_data = {
             'standby_data': None,
             'fingerprint_id': None,
@@ -107,4 +195,30 @@ class StateMachine:
             'final_data': None
         }
         logger.info("狀態機已重置")
-
+    
+    def snapshot(self) -> dict:
+        """目前狀態與流程數據（熱重啟快照用）"""
+        return {
+            'state': self.current_state.value,
+            'data': dict(self.current_data)
+        }
+    
+    def restore(self, snapshot: dict):
+        """
+        以熱重啟快照還原流程數據；快照狀態可以接續時轉換到該狀態（發布狀態變更，介面隨之更新）
+        
+        Args:
+            snapshot: snapshot() 的返回值
+        """
+        self.current_data.update(snapshot.get('data', {}))
+        state = SystemState(snapshot.get('state', SystemState.STANDBY.value))
+        if state not in RESUMABLE_STATES:
+            return
+        data = None
+        if state == SystemState.FINGERPRINT_OK:
+            data = {'fingerprint_id': self.current_data['fingerprint_id'],
+                    'user_name': self.current_data['user_name']}
+        elif state == SystemState.VITAL_SIGNS:
+            data = self.current_data['vital_signs_data']
+        logger.info(f"接續重啟前的流程: {state.value}")
+        self.set_state(state, data, cause='restore')
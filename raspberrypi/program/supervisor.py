@@ -0,0 +1,405 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多行程監督程式
+把單一行程的主程式拆成三個角色行程，各自擁有獨立的 GIL：
+
+- ingest：串口通訊、數據庫寫入、PPG 計算與提前穩定判定；最新遙測寫入共享記憶體快照，
+          事件與遠端呼叫經由 Unix socket 事件通道提供給其他行程
+- api：Flask API 服務器（數據庫以唯讀查詢使用自己的連線）
+- ui：PyQt6 介面與電腦視覺檢測
+
+監督程式建立共享記憶體區段後啟動各角色，任一角色結束時只重啟該角色（指數退避），
+其他角色繼續運行：擷取行程重啟時 API 與 UI 自動重新連接事件通道，API 或 UI 重啟時不影響串口讀取
+
+用法:
+    python3 program/supervisor.py                     # 監督模式（依 supervisor.roles 啟動所有角色）
+    python3 program/supervisor.py --role ingest       # 只執行一個角色（由監督程式呼叫）
+"""
+
+import sys
+import time
+import signal
+import argparse
+import subprocess
+import threading
+import logging
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# 添加專案根目錄到Python路徑
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from code import cpu_placement
+from code.reconnect import ReconnectBackoff
+from code.shared_snapshot import SharedSnapshot
+from program.runtime import setup_logging, load_config
+
+logger = logging.getLogger(__name__)
+
+ROLES = ('ingest', 'api', 'ui')
+
+# 寫入共享記憶體的最新值暫存器（與 BMduinoCommunicator.latest 相同）
+SNAPSHOT_KINDS = ('standby', 'working_status')
+
+# 角色運行超過此秒數後結束，視為正常運行後的故障，重新從最短等待時間開始重啟
+STABLE_SECONDS = 10.0
+
+
+def supervisor_config(config: dict) -> dict:
+    """監督程式配置（含預設值）"""
+    supervisor = config.get('supervisor', {})
+    return {
+        'roles': supervisor.get('roles', list(ROLES)),
+        'socket_path': supervisor.get('socket_path', 'data/channel.sock'),
+        'shm_prefix': supervisor.get('shm_prefix', 'smart_medicine_box'),
+        'snapshot_size': supervisor.get('snapshot_size', 4096),
+        'restart_initial': supervisor.get('restart_initial', 0.5),
+        'restart_max': supervisor.get('restart_max', 10.0),
+        'log_level': supervisor.get('log_level', 'INFO'),
+    }
+
+
+def snapshot_name(settings: dict, kind: str) -> str:
+    """共享記憶體區段名稱"""
+    return f"{settings['shm_prefix']}_{kind}"
+
+
+def attach_snapshots(settings: dict) -> Dict[str, SharedSnapshot]:
+    """連接監督程式建立的共享記憶體快照"""
+    return {kind: SharedSnapshot(snapshot_name(settings, kind)) for kind in SNAPSHOT_KINDS}
+
+
+def wait_for_stop() -> threading.Event:
+    """SIGTERM/SIGINT 時設定的停止事件"""
+    stop = threading.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *_: stop.set())
+    return stop
+
+
+def run_ingest(config: dict, settings: dict):
+    """擷取角色：串口、數據庫、PPG、提前穩定判定；提供共享記憶體快照與事件通道"""
+    from code.event_channel import EventChannelServer
+    from program.runtime import (create_bus, open_database, create_communicator, connect_serial, start_serial,
+                                 setup_ppg, setup_stabilizer, setup_results, create_thermal_governor,
+                                 connect_thermal)
+
+    stop = wait_for_stop()
+    database = open_database(config)
+    bus = create_bus(config)
+    communicator = create_communicator(config, bus)
+
+    # 最新遙測直接寫入共享記憶體（在串口線程中，每筆只序列化一次）
+    snapshots = attach_snapshots(settings)
+    for kind, snapshot in snapshots.items():
+        communicator.register_callback(kind, snapshot.publish)
+
+    connect_serial(config, communicator)
+    ppg_pipeline = setup_ppg(config, communicator)
+    stabilizer = setup_stabilizer(config, communicator)
+    setup_results(bus, communicator, stabilizer, database)
+
+    # 溫度調節：擷取行程調整遙測回報頻率（電腦視覺與介面由 UI 行程的調節器調整）
+    thermal = create_thermal_governor(config)
+    connect_thermal(thermal, config, communicator=communicator)
+
+    server = EventChannelServer(settings['socket_path'], bus, {
+        'communicator': (communicator, ('control_relay', 'read', 'get_relay_stats', 'get_link_stats',
+                                        'get_stamp_stats', 'get_reader_stats')),
+        'ppg_pipeline': (ppg_pipeline, ('get_stats',)),
+        'stabilizer': (stabilizer, ('get_stats',)),
+        'bus': (bus, ('get_stats',)),
+        'thermal': (thermal, ('get_stats',)),
+    })
+    if not server.start():
+        sys.exit(1)
+    start_serial(config, communicator)
+    if thermal is not None:
+        thermal.start()
+
+    stop.wait()
+    logger.info("擷取行程正在關閉...")
+    if thermal is not None:
+        thermal.stop()
+    server.stop()
+    communicator.stop_listening()
+    communicator.disconnect()
+    bus.close()  # 先處理完佇列中的測量結果再關閉數據庫
+    database.close()
+    for snapshot in snapshots.values():
+        snapshot.close()
+
+
+def connect_channel(config: dict, settings: dict):
+    """
+    連接擷取行程的事件通道
+
+    Returns:
+        (事件通道客戶端, 遠端通訊代理)
+    """
+    from code.event_channel import EventChannelClient, RemoteCommunicator
+    from program.runtime import create_bus, declare_result_topic
+
+    bus = create_bus(config)
+    declare_result_topic(bus)
+    client = EventChannelClient(settings['socket_path'], bus)
+    communicator = RemoteCommunicator(client, attach_snapshots(settings))
+    client.start()
+    if not client.wait_connected(timeout=5.0):
+        logger.warning("尚未連上擷取行程，將在背景持續重試")
+    return client, communicator
+
+
+def run_api(config: dict, settings: dict):
+    """API 角色：Flask 服務器，狀態由共享記憶體快照與事件通道提供"""
+    from code.event_channel import RemoteObject
+    from code.user_mapper import UserMapper
+    from program.runtime import open_database, create_api_server, connect_api_status
+
+    stop = wait_for_stop()
+    client, communicator = connect_channel(config, settings)
+    database = open_database(config)
+    user_mapper = UserMapper("data/user_config.json")
+
+    api_server = create_api_server(config)
+    api_server.set_database(database)
+    api_server.set_data_provider(type('DataProvider', (), {
+        'user_mapper': user_mapper,
+        'communicator': communicator,
+        'ppg_pipeline': RemoteObject(client, 'ppg_pipeline') if config.get('ppg', {}).get('stream_rate') else None,
+        'stabilizer': RemoteObject(client, 'stabilizer') if config.get('stabilization', {}).get('enabled') else None,
+        'bus': RemoteObject(client, 'bus'),
+        'thermal': RemoteObject(client, 'thermal') if config.get('thermal', {}).get('enabled') else None
+    })())
+    connect_api_status(api_server, client.bus, communicator)
+    api_server.start()
+
+    stop.wait()
+    logger.info("API行程正在關閉...")
+    api_server.stop()
+    client.stop()
+    database.close()
+
+
+def run_ui(config: dict, settings: dict):
+    """UI 角色：PyQt6 介面與電腦視覺檢測，經由事件通道接收事件、控制繼電器"""
+    from PyQt6.QtCore import QTimer
+    from PyQt6.QtWidgets import QApplication
+    from code.event_channel import RemoteTopic
+    from code.user_mapper import UserMapper
+    from program.state_machine import StateMachine
+    from program.main_ui import MainUI
+    from program.runtime import (RESULT_TOPIC, open_database, create_medication_detector, create_thermal_governor,
+                                 connect_thermal, create_prefetcher, create_session_journal)
+
+    client, communicator = connect_channel(config, settings)
+    user_mapper = UserMapper("data/user_config.json")
+    medication_detector = create_medication_detector(config)
+
+    state_machine = StateMachine(client.bus)
+    # 流程記錄以 UI 行程自己的數據庫連線寫入（API 行程讀取同一個數據庫）
+    journal = create_session_journal(config, state_machine, open_database(config))
+
+    app = QApplication(sys.argv)
+    app.setFont(app.font())
+    # 測量結果一律來自擷取行程的 measurement_result 主題（提前結果或韌體結果）
+    main_ui = MainUI(
+        state_machine=state_machine,
+        communicator=communicator,
+        user_mapper=user_mapper,
+        medication_detector=medication_detector,
+        config=config,
+        stabilizer=RemoteTopic(communicator, RESULT_TOPIC),
+        # UI 行程沒有開啟數據庫，預取不載入測量記錄
+        prefetcher=create_prefetcher(config, user_mapper)
+    )
+    main_ui.show()
+
+    thermal = create_thermal_governor(config)
+    connect_thermal(thermal, config, medication_detector=medication_detector, main_ui=main_ui)
+    if thermal is not None:
+        thermal.start()
+
+    # Qt 事件迴圈執行期間 Python 信號處理器只有在直譯器取得控制權時才會執行
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *_: app.quit())
+    signal_timer = QTimer()
+    signal_timer.timeout.connect(lambda: None)
+    signal_timer.start(200)
+
+    try:
+        app.exec()
+    finally:
+        logger.info("UI行程正在關閉...")
+        if thermal is not None:
+            thermal.stop()
+        if medication_detector is not None:
+            medication_detector.stop_detection()
+        client.stop()
+
+
+ROLE_RUNNERS = {
+    'ingest': run_ingest,
+    'api': run_api,
+    'ui': run_ui,
+}
+
+
+class RoleProcess:
+    """一個角色子行程及其重啟狀態"""
+
+    def __init__(self, role: str, command: List[str], backoff: ReconnectBackoff):
+        self.role = role
+        self.command = command
+        self.backoff = backoff
+        self.process: Optional[subprocess.Popen] = None
+        self.started_at = 0.0
+        self.restart_at: Optional[float] = None
+        self.restarts = 0
+        self.last_exit: Optional[int] = None
+
+    def start(self):
+        self.process = subprocess.Popen(self.command)
+        self.started_at = time.monotonic()
+        self.restart_at = None
+        logger.info(f"角色 {self.role} 已啟動 (pid {self.process.pid})")
+
+    def poll(self, now: float):
+        """檢查子行程；結束時排定重啟，到時間時重啟"""
+        if self.process is not None:
+            code = self.process.poll()
+            if code is None:
+                return
+            self.last_exit = code
+            self.process = None
+            if now - self.started_at >= STABLE_SECONDS:
+                self.backoff.reset()
+            delay = self.backoff.next_delay()
+            self.restart_at = now + delay
+            logger.warning(f"角色 {self.role} 已結束 (代碼 {code})，{delay:.1f} 秒後重啟")
+        elif self.restart_at is not None and now >= self.restart_at:
+            self.restarts += 1
+            self.start()
+
+    def stop(self, timeout: float):
+        """送出 SIGTERM，逾時後強制結束"""
+        process = self.process
+        if process is None:
+            return
+        process.terminate()
+        try:
+            process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            logger.warning(f"角色 {self.role} 未在 {timeout} 秒內結束，強制結束")
+            process.kill()
+            process.wait()
+        self.process = None
+
+    def get_stats(self) -> Dict:
+        return {
+            'pid': self.process.pid if self.process else None,
+            'restarts': self.restarts,
+            'last_exit': self.last_exit,
+            'uptime': time.monotonic() - self.started_at if self.process else 0.0,
+        }
+
+
+class Supervisor:
+    """角色行程監督程式"""
+
+    def __init__(self, config: dict, config_path: str, roles: Optional[List[str]] = None):
+        """
+        初始化監督程式
+
+        Args:
+            config: 配置字典
+            config_path: 配置檔案路徑（傳給角色行程）
+            roles: 要啟動的角色，None使用 supervisor.roles 配置
+        """
+        self.settings = supervisor_config(config)
+        self.roles = roles or self.settings['roles']
+        self.snapshots: Dict[str, SharedSnapshot] = {}
+        self.processes: Dict[str, RoleProcess] = {}
+        self.running = False
+        script = str(Path(__file__).resolve())
+        for role in self.roles:
+            self.processes[role] = RoleProcess(
+                role,
+                [sys.executable, script, '--role', role, '--config', config_path],
+                ReconnectBackoff(initial=self.settings['restart_initial'], maximum=self.settings['restart_max'])
+            )
+
+    def start(self):
+        """建立共享記憶體區段並啟動所有角色（擷取行程先啟動）"""
+        for kind in SNAPSHOT_KINDS:
+            self.snapshots[kind] = SharedSnapshot(snapshot_name(self.settings, kind),
+                                                  size=self.settings['snapshot_size'], create=True)
+        self.running = True
+        for role in ROLES:
+            if role in self.processes:
+                self.processes[role].start()
+
+    def run(self, poll_interval: float = 0.2):
+        """監督迴圈（直到 stop() 或收到 SIGTERM/SIGINT）"""
+        stop = wait_for_stop()
+        while self.running and not stop.is_set():
+            now = time.monotonic()
+            for process in self.processes.values():
+                process.poll(now)
+            stop.wait(poll_interval)
+        self.stop()
+
+    def restart(self, role: str):
+        """重啟一個角色（其他角色不受影響）"""
+        process = self.processes[role]
+        process.stop(timeout=5.0)
+        process.restarts += 1
+        process.start()
+
+    def stop(self, timeout: float = 5.0):
+        """依相反順序停止角色（擷取行程最後停止，處理完佇列中的測量結果），並刪除共享記憶體"""
+        self.running = False
+        for role in reversed(ROLES):
+            if role in self.processes:
+                self.processes[role].stop(timeout)
+        for snapshot in self.snapshots.values():
+            snapshot.close()
+            snapshot.unlink()
+        self.snapshots.clear()
+
+    def get_stats(self) -> Dict:
+        """獲取各角色狀態"""
+        return {role: process.get_stats() for role, process in self.processes.items()}
+
+
+def main():
+    """主函數"""
+    parser = argparse.ArgumentParser(description="智慧藥盒多行程監督程式")
+    parser.add_argument('--role', choices=ROLES, help="只執行一個角色（由監督程式呼叫）")
+    parser.add_argument('--config', default="data/config.json", help="配置檔案路徑")
+    args = parser.parse_args()
+
+    config = load_config(args.config)
+    settings = supervisor_config(config)
+    setup_logging(args.role or 'supervisor', settings['log_level'])
+
+    if args.role:
+        # 行程角色的 CPU 配置（之後建立的線程繼承，有線程角色的線程再套用自己的設定）
+        cpu_placement.configure(config)
+        cpu_placement.place_process(args.role)
+        ROLE_RUNNERS[args.role](config, settings)
+        return
+
+    logger.info("=" * 50)
+    logger.info(f"智慧藥盒系統啟動（多行程模式: {', '.join(settings['roles'])}）")
+    logger.info("=" * 50)
+    supervisor = Supervisor(config, args.config)
+    supervisor.start()
+    supervisor.run()
+    logger.info("系統已關閉")
+
+
+if __name__ == "__main__":
+    main()